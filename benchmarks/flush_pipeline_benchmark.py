@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Measures how long publishing the batches of one flush blocks the calling thread and how long the flush takes
+to complete, with the synchronous PutClient and with the AsyncPutClient of the asynchronous flush pipeline.
+The local keep-alive HTTP server delays every response by the given latency to simulate the CloudWatch endpoint.
+Requires Python 3.
+
+Usage (from the repository root):
+    python3 benchmarks/flush_pipeline_benchmark.py [--batches 100] [--latency-ms 20] [--concurrency 8]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from cloudwatch.modules.awscredentials import AWSCredentials
+from cloudwatch.modules.client.asyncputclient import AsyncPutClient
+from cloudwatch.modules.client.putclient import PutClient
+from cloudwatch.modules.metricdata import MetricDataStatistic
+
+DEFAULT_BATCHES = 100
+DEFAULT_LATENCY_MS = 20
+DEFAULT_CONCURRENCY = 8
+METRICS_PER_BATCH = 20
+
+
+class DelayedResponseHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = -1
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class BenchmarkConfig(object):
+    """ The subset of the ConfigHelper used by the put clients """
+
+    def __init__(self, endpoint):
+        self.credentials = AWSCredentials("access_key", "secret_key")
+        self.region = "localhost"
+        self.endpoint = endpoint
+        self.enable_high_resolution_metrics = False
+        self.proxy_server_name = None
+        self.proxy_server_port = None
+        self.debug = False
+
+
+def start_server(latency):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), DelayedResponseHandler)
+    server.latency = latency
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def create_metric_batches(batch_count):
+    return [[MetricDataStatistic("metric_" + str(batch) + "_" + str(index), statistic_values=MetricDataStatistic.Statistics(index))
+             for index in range(METRICS_PER_BATCH)] for batch in range(batch_count)]
+
+
+def measure_synchronous(config, metric_batches):
+    client = PutClient(config)
+    start = time.time()
+    for metric_batch in metric_batches:
+        client.put_metric_data(MetricDataStatistic.NAMESPACE, metric_batch)
+    elapsed = time.time() - start
+    client.transport.close()
+    return elapsed, elapsed
+
+
+def measure_asynchronous(config, metric_batches, concurrency):
+    client = AsyncPutClient(config, concurrency)
+    start = time.time()
+    flush = client.put_metric_batches(MetricDataStatistic.NAMESPACE, metric_batches)
+    blocked = time.time() - start
+    flush.result()
+    elapsed = time.time() - start
+    client.close(1)
+    return blocked, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--batches", type=int, default=DEFAULT_BATCHES)
+    parser.add_argument("--latency-ms", type=float, default=DEFAULT_LATENCY_MS)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    args = parser.parse_args()
+    server = start_server(args.latency_ms / 1000.0)
+    config = BenchmarkConfig("http://127.0.0.1:" + str(server.server_address[1]) + "/")
+    metric_batches = create_metric_batches(args.batches)
+    results = [("PutClient", measure_synchronous(config, metric_batches)),
+               ("AsyncPutClient", measure_asynchronous(config, metric_batches, args.concurrency))]
+    for name, (blocked, elapsed) in results:
+        print("{:<16} {:>10.1f} ms caller blocked {:>10.1f} ms flush completed".format(name, blocked * 1000, elapsed * 1000))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
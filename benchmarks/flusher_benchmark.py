@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+"""
+Measures the throughput of Flusher.add_metric (values/sec) and the resident memory of the aggregation store
+for different numbers of series and write threads. Every combination is measured in a separate process, so that
+the reported memory is not affected by earlier measurements. No metrics are published, the flusher uses a no-op client.
+With several threads the series are split evenly between the threads, the same way collectd WriteThreads share
+the write queue. To include the cost of flushes, use a short --flush-interval and a --put-latency-ms simulating
+the PutMetricData round trip. With --batch-size the values are passed to Flusher.add_metrics in batches
+of the given size instead of one by one to Flusher.add_metric. With --blocked-percent the whitelist blocks the given
+share of the series (rounded to whole plugins, the series are spread over 50 plugins).
+
+Usage (from the repository root):
+    python benchmarks/flusher_benchmark.py [--series 2000 20000 200000] [--threads 1 4 8] [--rounds 5]
+                                           [--flush-interval 60] [--put-latency-ms 0] [--batch-size 0] [--blocked-percent 0]
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+from tempfile import gettempdir
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from cloudwatch.modules.awscredentials import AWSCredentials
+from cloudwatch.modules.configuration.rollup import Rollups
+from cloudwatch.modules.configuration.whitelist import Whitelist
+from cloudwatch.modules.flusher import Flusher
+
+DEFAULT_SERIES_COUNTS = [2000, 20000, 200000]
+DEFAULT_THREADS = [1]
+DEFAULT_ROUNDS = 5
+DEFAULT_FLUSH_INTERVAL = 60
+DEFAULT_PUT_LATENCY_MS = 0
+DEFAULT_BATCH_SIZE = 0
+DEFAULT_BLOCKED_PERCENT = 0
+PLUGIN_COUNT = 50
+
+
+class BenchmarkConfig(object):
+    """ Minimal replacement of ConfigHelper which does not require plugin.conf or the metadata service """
+
+    def __init__(self, flush_interval, blocked_percent):
+        self.credentials = AWSCredentials("access_key", "secret_key")
+        self.region = "localhost"
+        self.endpoint = "http://localhost/"
+        self.host = "benchmark"
+        self.asg_name = "NONE"
+        self.proxy_server_name = None
+        self.proxy_server_port = None
+        self.debug = False
+        self.push_asg = False
+        self.push_constant = False
+        self.constant_dimension_value = ""
+        self.enable_high_resolution_metrics = False
+        self.flush_interval_in_seconds = str(flush_interval)
+        self.max_series_per_plugin = 0
+        self.max_series_per_plugin_overrides = {}
+        self.suppress_unchanged_metrics = False
+        self.suppression_heartbeat_intervals = 10
+        self.cache_memory_budget_in_mb = 0
+        allowed_plugins = PLUGIN_COUNT - PLUGIN_COUNT * blocked_percent // 100
+        whitelist_regex = "^plugin(" + "|".join(str(index) for index in range(allowed_plugins)) + ")-.*$" if allowed_plugins else "^$"
+        self.whitelist = Whitelist([whitelist_regex], os.path.join(gettempdir(), "benchmark_blocked_metrics"))
+        self.rollups = Rollups([])
+
+
+class NullClient(object):
+
+    def __init__(self, put_latency_ms):
+        self.put_latency = put_latency_ms / 1000.0
+
+    def put_metric_data(self, namespace, metric_list):
+        if self.put_latency:
+            time.sleep(self.put_latency)
+        return True
+
+    def prewarm(self):
+        return True
+
+
+class NullDatasetResolver(object):
+
+    def get_dataset_names(self, ds_type):
+        return None
+
+
+class BenchmarkValueList(object):
+
+    def __init__(self, plugin, plugin_instance, type, type_instance, values, time=0, host="benchmark", interval=10, meta=None):
+        self.host = host
+        self.plugin = plugin
+        self.plugin_instance = plugin_instance
+        self.type = type
+        self.type_instance = type_instance
+        self.values = values
+        self.time = time
+        self.interval = interval
+        self.meta = meta
+
+
+def create_flusher(series_count, flush_interval, put_latency_ms, blocked_percent):
+    flusher = Flusher(config_helper=BenchmarkConfig(flush_interval, blocked_percent), dataset_resolver=NullDatasetResolver())
+    flusher.client = NullClient(put_latency_ms)
+    flusher.max_metrics_to_aggregate = series_count
+    return flusher
+
+
+def create_value_lists(series_count):
+    return [BenchmarkValueList("plugin" + str(index % PLUGIN_COUNT), str(index // PLUGIN_COUNT), "gauge", "value", [float(index)])
+            for index in range(series_count)]
+
+
+def get_resident_memory_in_kb():
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def write_values(add_metric, value_lists, rounds):
+    for _ in range(rounds):
+        for value_list in value_lists:
+            add_metric(value_list)
+
+
+def write_batches(add_metrics, value_lists, rounds, batch_size):
+    batches = [value_lists[index:index + batch_size] for index in range(0, len(value_lists), batch_size)]
+    for _ in range(rounds):
+        for batch in batches:
+            add_metrics(batch)
+
+
+def measure(series_count, thread_count, rounds, flush_interval, put_latency_ms, batch_size, blocked_percent):
+    value_lists = create_value_lists(series_count)
+    baseline_memory = get_resident_memory_in_kb()
+    flusher = create_flusher(series_count, flush_interval, put_latency_ms, blocked_percent)
+    if batch_size:
+        threads = [threading.Thread(target=write_batches, args=(flusher.add_metrics, value_lists[index::thread_count], rounds, batch_size))
+                   for index in range(thread_count)]
+    else:
+        threads = [threading.Thread(target=write_values, args=(flusher.add_metric, value_lists[index::thread_count], rounds))
+                   for index in range(thread_count)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    total_memory = get_resident_memory_in_kb()
+    return series_count * rounds / elapsed, total_memory - baseline_memory, total_memory
+
+
+def run_single(series_count, thread_count, rounds, flush_interval, put_latency_ms, batch_size, blocked_percent):
+    values_per_second, store_memory, total_memory = measure(series_count, thread_count, rounds, flush_interval, put_latency_ms, batch_size,
+                                                            blocked_percent)
+    print("{:>8} series {:>2} threads {:>12.0f} values/sec {:>10} kB store RSS {:>10} kB total RSS".format(
+        series_count, thread_count, values_per_second, store_memory, total_memory))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--series", type=int, nargs="+", default=DEFAULT_SERIES_COUNTS)
+    parser.add_argument("--threads", type=int, nargs="+", default=DEFAULT_THREADS)
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS)
+    parser.add_argument("--flush-interval", type=int, default=DEFAULT_FLUSH_INTERVAL)
+    parser.add_argument("--put-latency-ms", type=float, default=DEFAULT_PUT_LATENCY_MS)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--blocked-percent", type=int, default=DEFAULT_BLOCKED_PERCENT)
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.single:
+        run_single(args.series[0], args.threads[0], args.rounds, args.flush_interval, args.put_latency_ms, args.batch_size,
+                   args.blocked_percent)
+        return
+    for series_count in args.series:
+        for thread_count in args.threads:
+            sys.stdout.flush()
+            subprocess.check_call([sys.executable, os.path.abspath(__file__), "--single", "--series", str(series_count),
+                                   "--threads", str(thread_count), "--rounds", str(args.rounds),
+                                   "--flush-interval", str(args.flush_interval), "--put-latency-ms", str(args.put_latency_ms),
+                                   "--batch-size", str(args.batch_size), "--blocked-percent", str(args.blocked_percent)])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+Measures the per-request overhead of the HTTP transports used by PutClient against a local keep-alive HTTP server:
+the HTTPTransport on httplib and, when requests is installed, the requests.Session used before. The server returns
+an empty response immediately, so the reported time is dominated by the client side cost of building the request
+and parsing the response. The import time of every transport is measured in a separate process.
+
+Usage (from the repository root):
+    python benchmarks/transport_benchmark.py [--requests 5000] [--query-size 2000]
+"""
+import argparse
+import BaseHTTPServer
+import os
+import SocketServer
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from cloudwatch.modules.client.transport import HTTPTransport
+
+DEFAULT_REQUESTS = 5000
+DEFAULT_QUERY_SIZE = 2000
+IMPORTS = [("HTTPTransport", "from cloudwatch.modules.client.transport import HTTPTransport"),
+           ("requests.Session", "from requests.sessions import Session; from requests.adapters import HTTPAdapter")]
+
+
+class EmptyResponseHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = -1
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), EmptyResponseHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.setDaemon(True)
+    thread.start()
+    return server
+
+
+def create_requests_session():
+    from requests.adapters import HTTPAdapter
+    from requests.sessions import Session
+    session = Session()
+    session.mount("http://", HTTPAdapter(max_retries=1))
+    return session
+
+
+def measure(client, url, request_count):
+    headers = {"User-Agent": "benchmark"}
+    client.get(url, headers=headers, timeout=(1, 3))
+    start = time.time()
+    for _ in range(request_count):
+        client.get(url, headers=headers, timeout=(1, 3))
+    return (time.time() - start) / request_count * 1000000
+
+
+def measure_import_time(statement):
+    code = "import sys, time; sys.path.insert(0, 'src'); start = time.time(); " + statement + "; print(time.time() - start)"
+    try:
+        output = subprocess.check_output([sys.executable, "-c", code], stderr=subprocess.STDOUT)
+    except subprocess.CalledProcessError:
+        return None
+    return float(output.strip().splitlines()[-1]) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--requests", type=int, default=DEFAULT_REQUESTS)
+    parser.add_argument("--query-size", type=int, default=DEFAULT_QUERY_SIZE)
+    args = parser.parse_args()
+    server = start_server()
+    url = "http://127.0.0.1:" + str(server.server_address[1]) + "/?" + "a" * args.query_size
+    clients = [("HTTPTransport", HTTPTransport(max_retries=1))]
+    try:
+        clients.append(("requests.Session", create_requests_session()))
+    except ImportError:
+        print("requests is not installed, measuring HTTPTransport only")
+    for name, client in clients:
+        print("{:<18} {:>10.1f} us/request".format(name, measure(client, url, args.requests)))
+    for name, statement in IMPORTS:
+        import_time = measure_import_time(statement)
+        if import_time is not None:
+            print("{:<18} {:>10.1f} ms import".format(name, import_time))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
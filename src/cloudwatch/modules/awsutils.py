@@ -1,13 +1,16 @@
-from datetime import datetime
+from . import clock
 
 
-def get_aws_timestamp():
+def get_aws_timestamp(epoch_time=None):
     """
     Returns timestamp expressed in the format YYYYMMDDThhmmssZ,
-    as specified in the ISO 8601 standard.
+    as specified in the ISO 8601 standard. The formatting is memoized per second by the clock module.
+
+    Keyword arguments:
+    epoch_time -- the time in seconds since the epoch to be formatted (default current date-time)
     """
-    return datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+    return clock.get_aws_timestamp(epoch_time)
 
 
-def get_datestamp():
-    return datetime.utcnow().strftime('%Y%m%d') 
\ No newline at end of file
+def get_datestamp(epoch_time=None):
+    return clock.get_datestamp(epoch_time)
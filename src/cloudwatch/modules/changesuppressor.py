@@ -0,0 +1,81 @@
+import threading
+
+
+class ChangeSuppressor(object):
+    """
+    The change suppressor skips publishing of series whose statistics did not change since they were
+    last published, e.g. df_complex, memory or idle interface series reporting the same value for hours.
+    An unchanged series is still published every heartbeat_intervals flush intervals, so that CloudWatch
+    alarms do not treat it as missing data. A series is identified by its namespace, metric name and dimensions.
+
+    The statistics are recorded when the series is added to a batch. If the batch is not published, the flusher
+    rolls them back, so the series is published again with the next flush instead of being suppressed until
+    the heartbeat. Rollbacks may come from the worker threads of the flush pipeline, so the records are guarded by a lock.
+
+    Keyword arguments:
+    enabled -- whether unchanged series are suppressed (default False)
+    heartbeat_intervals -- the series is published at least once per this number of flush intervals (default 10)
+    """
+    DEFAULT_HEARTBEAT_INTERVALS = 10
+
+    def __init__(self, enabled=False, heartbeat_intervals=DEFAULT_HEARTBEAT_INTERVALS):
+        self.enabled = enabled
+        self.heartbeat_intervals = heartbeat_intervals
+        self.suppressed_series_count = 0
+        self.last_suppressed_series_count = 0
+        self._published_series = {}
+        self._flush_count = 0
+        self._lock = threading.Lock()
+
+    def start_flush(self):
+        """
+        Starts a new flush interval. Series due for a heartbeat are periodically forgotten, so that series
+        which are no longer reported do not accumulate.
+        """
+        self._flush_count += 1
+        self.last_suppressed_series_count = 0
+        if self._flush_count % self.heartbeat_intervals == 0:
+            expired_flush_count = self._flush_count - self.heartbeat_intervals
+            with self._lock:
+                for series in [series for series, entry in self._published_series.items() if entry[1] <= expired_flush_count]:
+                    del self._published_series[series]
+
+    def should_publish(self, metric):
+        """
+        Returns False if the statistics of the metric are equal to the last published statistics of its series
+        and the heartbeat is not due yet, True otherwise.
+        """
+        if not self.enabled:
+            return True
+        series = self._get_series(metric)
+        statistics = self._get_statistics_state(metric.statistics)
+        with self._lock:
+            entry = self._published_series.get(series)
+            if entry and entry[0] == statistics and self._flush_count - entry[1] < self.heartbeat_intervals:
+                self.suppressed_series_count += 1
+                self.last_suppressed_series_count += 1
+                return False
+            self._published_series[series] = [statistics, self._flush_count]
+        return True
+
+    def rollback(self, metrics):
+        """
+        Forgets the statistics recorded for the metrics of a batch which was not published. A series is forgotten
+        only while its record still holds the statistics of the metric, so a newer record is kept.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            for metric in metrics:
+                series = self._get_series(metric)
+                entry = self._published_series.get(series)
+                if entry and entry[0] == self._get_statistics_state(metric.statistics):
+                    del self._published_series[series]
+
+    def _get_series(self, metric):
+        return metric.namespace, metric.metric_name, tuple(sorted(metric.dimensions.items()))
+
+    def _get_statistics_state(self, statistics):
+        if not statistics:
+            return None
+        return statistics.min, statistics.max, statistics.sum, statistics.sample_count
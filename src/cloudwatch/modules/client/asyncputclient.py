@@ -0,0 +1,247 @@
+"""
+The asynchronous put client of the flush pipeline. The module uses the asyncio syntax of Python 3
+and is imported only when the plugin runs on Python 3.
+"""
+import asyncio
+import threading
+from concurrent import futures
+
+from .asynctransport import AsyncHTTPTransport
+from .putclient import PutClient
+from .circuitbreaker import EndpointPool, CircuitOpenException
+
+
+class AsyncPutClient(PutClient):
+    """
+    The asynchronous put client publishes metric batches from an asyncio event loop running on a dedicated thread.
+    put_metric_batches hands the batches of a flush over to the event loop and returns at once, so the collectd
+    thread which triggered the flush goes back to aggregating values. The event loop encodes and signs every batch
+    and sends up to max_concurrent_requests PutMetricData requests at the same time over keep-alive connections.
+    With a congestion controller, the number of requests in flight follows the window of the controller instead.
+
+    Keyword arguments:
+    config_helper -- the ConfigHelper object with configuration loaded
+    max_concurrent_requests -- the maximum number of PutMetricData requests in flight (default 8)
+    connection_timeout -- the amount of time in seconds to wait for establishing server connection
+    response_timeout -- the amount of time in seconds to wait for the server response
+    transport -- the asynchronous transport used to send requests (default AsyncHTTPTransport)
+    congestion_controller -- the AIMDController pacing the requests and retrying the throttled ones (default None)
+    endpoint_pool -- the EndpointPool with the circuit breakers of the endpoints (default the endpoint of the configuration)
+    metric_quarantine -- the MetricQuarantine of the series rejected by the endpoints, which are not sent (default MetricQuarantine reporting to the plugin log)
+    request_tracer -- the RequestTracer recording a sample of the requests (default None)
+    """
+    DEFAULT_MAX_CONCURRENT_REQUESTS = 8
+    _THREAD_NAME = "cloudwatch-flush-pipeline"
+
+    def __init__(self, config_helper, max_concurrent_requests=DEFAULT_MAX_CONCURRENT_REQUESTS, connection_timeout=PutClient._DEFAULT_CONNECTION_TIMEOUT,
+                 response_timeout=PutClient._DEFAULT_RESPONSE_TIMEOUT, transport=None, congestion_controller=None,
+                 endpoint_pool=None, metric_quarantine=None, request_tracer=None):
+        super(AsyncPutClient, self).__init__(config_helper, connection_timeout, response_timeout, transport, congestion_controller, endpoint_pool,
+                                             metric_quarantine, request_tracer=request_tracer)
+        self.max_concurrent_requests = max_concurrent_requests
+        self._pending_flushes = set()
+        self._queued_batches = {}
+        self._pending_lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._slots = None
+        self._requests_in_flight = 0
+        self._thread = threading.Thread(target=self._run_loop, name=self._THREAD_NAME)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _prepare_transport(self):
+        return AsyncHTTPTransport(max_retries=self._TOTAL_RETRIES, proxy_server=self._get_proxy_server())
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._slots = asyncio.Condition()
+        self._loop.run_forever()
+
+    def put_metric_batches(self, namespace, metric_batches, on_failure=None):
+        """
+        Queues the metric batches for publishing without waiting for the requests.
+        The on_failure function, if any, is called from the event loop thread with every batch which is not published.
+
+        Returns:
+            the future resolved with True once all batches were accepted by the endpoint, False otherwise
+        """
+        with self._pending_lock:
+            for metric_batch in metric_batches:
+                self._queued_batches[id(metric_batch)] = (namespace, metric_batch, None)
+        flush = asyncio.run_coroutine_threadsafe(self._put_batches(namespace, metric_batches, on_failure), self._loop)
+        with self._pending_lock:
+            self._pending_flushes.add(flush)
+        flush.add_done_callback(self._discard_pending_flush)
+        return flush
+
+    def put_metric_data(self, namespace, metric_list, timeout=None):
+        """
+        Publishes metric data to the endpoint and waits up to timeout seconds for the request, see PutClient.put_metric_data.
+        The request is cancelled if it is not done within the timeout.
+
+        Returns:
+            True if the metric data was accepted by the endpoint, False otherwise
+        """
+        if not self._is_namespace_consistent(namespace, metric_list):
+            raise ValueError("Metric list contains metrics with namespace different than the one passed as argument.")
+        flush = self.put_metric_batches(namespace, [metric_list])
+        try:
+            return flush.result(timeout)
+        except futures.TimeoutError:
+            flush.cancel()
+            self._discard_queued_batch(metric_list)
+            self._LOGGER.warning("Could not put metric data within " + str(timeout) + " seconds, the request was cancelled")
+            return False
+
+    def prewarm(self):
+        """
+        Schedules opening or validating the connection to the first endpoint with a closed circuit breaker on the event loop.
+
+        Returns:
+            True if the connection is opened in the background, False if the circuit breakers of all endpoints are open
+        """
+        endpoint = self.endpoint_pool.get_preferred_endpoint()
+        if endpoint is None:
+            return False
+        asyncio.run_coroutine_threadsafe(self.transport.prewarm(endpoint.url, self._PREWARM_CONNECTION_TIMEOUT), self._loop)
+        return True
+
+    def wait_for_pending_flushes(self, timeout=None):
+        """
+        Waits until the batches queued by put_metric_batches are published.
+
+        Returns:
+            True if all queued batches were handled within the timeout, False otherwise
+        """
+        with self._pending_lock:
+            pending_flushes = list(self._pending_flushes)
+        if not pending_flushes:
+            return True
+        _, not_done = futures.wait(pending_flushes, timeout)
+        return not not_done
+
+    def close(self, timeout=None):
+        """
+        Waits up to timeout seconds for the queued batches, then closes the connections and stops the event loop.
+
+        Returns:
+            the list of (namespace, metric_batch, None) tuples of the batches whose requests were not finished, like SinkFanout.close
+        """
+        self.wait_for_pending_flushes(timeout)
+        if self._loop.is_running():
+            self._loop.call_soon_threadsafe(self.transport.close)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout)
+        with self._pending_lock:
+            unsent_batches = list(self._queued_batches.values())
+            self._queued_batches.clear()
+        if unsent_batches:
+            self._LOGGER.warning("The flush pipeline stopped with " + str(len(unsent_batches)) + " unpublished metric batch(es)")
+        return unsent_batches
+
+    def _discard_pending_flush(self, flush):
+        with self._pending_lock:
+            self._pending_flushes.discard(flush)
+
+    def _discard_queued_batch(self, metric_batch):
+        with self._pending_lock:
+            self._queued_batches.pop(id(metric_batch), None)
+
+    async def _put_batches(self, namespace, metric_batches, on_failure=None):
+        try:
+            credentials = await self._loop.run_in_executor(None, lambda: self.config.credentials)
+        except Exception:
+            for metric_batch in metric_batches:
+                self._discard_queued_batch(metric_batch)
+                if on_failure is not None:
+                    on_failure(metric_batch)
+            raise
+        results = await asyncio.gather(*[self._put_queued_batch(namespace, metric_batch, credentials, on_failure) for metric_batch in metric_batches])
+        return all(results)
+
+    async def _put_queued_batch(self, namespace, metric_batch, credentials, on_failure=None):
+        """ Puts the batch and removes it from the queued batches once its request is finished, whether it succeeded or not """
+        published = False
+        try:
+            published = await self._put_batch(namespace, metric_batch, credentials)
+            return published
+        finally:
+            self._discard_queued_batch(metric_batch)
+            if not published and on_failure is not None:
+                on_failure(metric_batch)
+
+    def _get_concurrency_limit(self):
+        if self.congestion_controller:
+            return self.congestion_controller.get_concurrency_limit()
+        return self.max_concurrent_requests
+
+    async def _acquire_slot(self):
+        async with self._slots:
+            await self._slots.wait_for(lambda: self._requests_in_flight < self._get_concurrency_limit())
+            self._requests_in_flight += 1
+
+    async def _release_slot(self):
+        async with self._slots:
+            self._requests_in_flight -= 1
+            self._slots.notify_all()
+
+    async def _put_batch(self, namespace, metric_batch, credentials):
+        """ Encodes and signs the batch once a request slot is free, so the signature is fresh when the request is sent """
+        if not self._is_namespace_consistent(namespace, metric_batch):
+            self._LOGGER.error("Metric list contains metrics with namespace different than the one passed as argument.")
+            return False
+        metric_batch = self._get_unquarantined_metrics(metric_batch)
+        if not metric_batch:
+            return True
+        for attempt in range(self._MAX_CONGESTION_RETRIES + 1):
+            await self._acquire_slot()
+            try:
+                if self.congestion_controller:
+                    await asyncio.sleep(self.congestion_controller.reserve())
+                self.request_builder.credentials = credentials
+                self.request_builder.signer.credentials = credentials
+                error, endpoint, request = await self._put_with_failover_async(namespace, metric_batch)
+            finally:
+                await self._release_slot()
+            if error is None:
+                if self.congestion_controller:
+                    self.congestion_controller.on_success()
+                return True
+            if self._should_retry(error, attempt):
+                self._LOGGER.info("Retrying throttled PutMetricData request. [Exception: " + str(error) + "]")
+                continue
+            rejected_index = self._get_rejected_metric_index(error, len(metric_batch))
+            if rejected_index is not None:
+                remaining_metrics = self._quarantine_rejected_metric(metric_batch, rejected_index, error)
+                return bool(remaining_metrics) and await self._put_batch(namespace, remaining_metrics, credentials)
+            self._log_put_failure(error, endpoint, request)
+            return False
+
+    async def _put_with_failover_async(self, namespace, metric_batch):
+        """ Sends the request to the available endpoints in order, see PutClient._put_with_failover """
+        tried_endpoints = []
+        error, request = CircuitOpenException("The circuit breakers of all endpoints are open"), ""
+        endpoint = self.endpoint_pool.select()
+        while endpoint is not None:
+            tried_endpoints.append(endpoint)
+            trace = self._start_trace(endpoint, namespace, metric_batch)
+            try:
+                request = self.request_builder.create_signed_request(self.namespace or namespace, metric_batch, endpoint.signing_host, trace)
+                result = await self.transport.get(endpoint.url + "?" + request, headers=self._get_custom_headers(), timeout=self.timeout)
+                result.raise_for_status()
+            except Exception as e:
+                if trace:
+                    trace.finish(request, error=e)
+                self.endpoint_pool.report(endpoint, e)
+                if not EndpointPool.is_endpoint_failure(e):
+                    return e, endpoint, request
+                error = e
+                endpoint = self.endpoint_pool.select(tried_endpoints)
+                if endpoint is not None:
+                    self._LOGGER.warning("Endpoint '" + tried_endpoints[-1].url + "' failed, failing over to '" + endpoint.url + "'. [Exception: " + str(e) + "]")
+                continue
+            if trace:
+                trace.finish(request, result)
+            self.endpoint_pool.report(endpoint)
+            return None, endpoint, request
+        return error, tried_endpoints[-1] if tried_endpoints else None, request
@@ -0,0 +1,248 @@
+"""
+The asynchronous HTTP transport used by the flush pipeline. The module uses the asyncio syntax of Python 3
+and is imported only when the plugin runs on Python 3.
+"""
+import asyncio
+import socket
+import ssl
+
+from ..clock import monotonic
+from ..compat import httplib, to_bytes
+from .transport import BaseHTTPTransport, Response, ConnectionException
+
+
+class AsyncHTTPTransport(BaseHTTPTransport):
+    """
+    The asynchronous HTTP transport sends HTTP/1.1 requests from an asyncio event loop, so that many requests
+    are in flight at the same time without a thread per request. Connections are kept alive and reused by later
+    requests, routes, proxies and TLS verification are the same as for the HTTPTransport.
+    All methods have to be called from the thread running the event loop.
+
+    Keyword arguments:
+    max_retries -- the number of times a request failing with a connection error or timeout is retried (default 0)
+    proxy_server -- the 'host[:port]' or URL of the proxy server used for HTTPS requests,
+                    if not set the https_proxy and http_proxy environment variables are used (default None)
+    """
+    _MAX_IDLE_CONNECTIONS_PER_HOST = 32
+    _MAX_LINE_LENGTH = 65536
+    _READ_BUFFER_SIZE = 4096
+    _NO_BODY_STATUSES = (httplib.NO_CONTENT, httplib.NOT_MODIFIED)
+
+    async def get(self, url, headers=None, timeout=None):
+        return await self.request("GET", url, headers=headers, timeout=timeout)
+
+    async def request(self, method, url, headers=None, body=None, timeout=None):
+        """
+        Sends the request and reads the whole response.
+
+        Keyword arguments:
+        method -- the HTTP method
+        url -- the absolute URL of the request
+        headers -- the dictionary of request headers (default None)
+        body -- the request body (default None)
+        timeout -- the (connection timeout, response timeout) tuple or a single timeout in seconds for both (default None)
+
+        Returns:
+            the Response object
+
+        Raises:
+            ConnectionException if the request still fails after all retries
+        """
+        route = self._get_route(url)
+        connect_timeout, response_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        request = self._encode_request(route, method, url, headers, body)
+        attempt = 0
+        while True:
+            start_time = monotonic()
+            connection = self._acquire_connection(route)
+            reused = connection is not None
+            try:
+                if not reused:
+                    connection = await asyncio.wait_for(self._open_connection(route), connect_timeout)
+                connect_time = monotonic() - start_time if not reused else 0.0
+                result, will_close = await asyncio.wait_for(self._exchange(connection, request, method), response_timeout)
+                result.connect_time = connect_time
+            except ssl.CertificateError as e:
+                self._close_connection(connection)
+                raise ConnectionException("Certificate of " + route.host + " is not valid: " + str(e))
+            except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, httplib.HTTPException) as e:
+                self._close_connection(connection)
+                if reused and not isinstance(e, asyncio.TimeoutError):
+                    # the server closed the idle keep-alive connection, which does not count as a retry
+                    continue
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise ConnectionException("Request to " + route.host + " failed after " + str(attempt) + " attempt(s): " + repr(e))
+                continue
+            self._release_connection(route, connection, will_close)
+            return result
+
+    async def prewarm(self, url, timeout=None):
+        """
+        Makes sure that an idle connection to the endpoint of the URL is open, so the next request does not wait
+        for name resolution and the TCP and TLS handshakes. Idle connections closed by the server are replaced.
+
+        Returns:
+            True if an open connection is ready, False if the connection could not be opened
+        """
+        try:
+            route = self._get_route(url)
+            connections = self._idle_connections.get(route.key, [])
+            for connection in [connection for connection in connections if not self._is_open(connection)]:
+                connections.remove(connection)
+                self._close_connection(connection)
+            if not connections:
+                connection = await asyncio.wait_for(self._open_connection(route), timeout)
+                self._release_connection(route, connection, False)
+            return True
+        except (OSError, asyncio.TimeoutError, httplib.HTTPException, ssl.CertificateError, ConnectionException) as e:
+            self._LOGGER.warning("Cannot open connection to " + url + " ahead of the request. Cause: " + repr(e))
+            return False
+
+    def close(self):
+        """ Closes all idle connections """
+        idle_connections, self._idle_connections = self._idle_connections, {}
+        for connections in idle_connections.values():
+            for connection in connections:
+                self._close_connection(connection)
+
+    def _acquire_connection(self, route):
+        """ Returns an idle connection to the route, or None if there is none """
+        connections = self._idle_connections.get(route.key)
+        while connections:
+            connection = connections.pop()
+            if self._is_open(connection):
+                return connection
+            self._close_connection(connection)
+        return None
+
+    def _release_connection(self, route, connection, will_close):
+        if not will_close:
+            connections = self._idle_connections.setdefault(route.key, [])
+            if len(connections) < self._MAX_IDLE_CONNECTIONS_PER_HOST:
+                connections.append(connection)
+                return
+        self._close_connection(connection)
+
+    def _is_open(self, connection):
+        """ An idle connection whose stream reached the end was closed by the server """
+        reader, writer = connection
+        return not writer.transport.is_closing() and not reader.at_eof()
+
+    def _close_connection(self, connection):
+        if connection is not None:
+            connection[1].close()
+
+    async def _open_connection(self, route):
+        """ Connects to the endpoint of the route, through the CONNECT tunnel of the proxy for proxied HTTPS routes """
+        sock = await self._open_socket(route)
+        try:
+            if route.tunnel_headers is not None:
+                await self._open_tunnel(sock, route)
+            if route.scheme != "https":
+                return await asyncio.open_connection(sock=sock, limit=self._MAX_LINE_LENGTH)
+            return await asyncio.open_connection(sock=sock, ssl=self._get_ssl_context(), server_hostname=route.host, limit=self._MAX_LINE_LENGTH)
+        except BaseException:
+            sock.close()
+            raise
+
+    async def _open_socket(self, route):
+        """ Connects a non-blocking socket to the first reachable address of the endpoint or the proxy of the route """
+        loop = asyncio.get_event_loop()
+        host, port = route.proxy or (route.host, route.port)
+        addresses = await loop.run_in_executor(None, self.address_cache.resolve, host, port)
+        error = OSError("No address found for " + str(host))
+        for family, socket_type, protocol, _, socket_address in addresses:
+            sock = socket.socket(family, socket_type, protocol)
+            sock.setblocking(False)
+            try:
+                await loop.sock_connect(sock, socket_address)
+            except OSError as e:
+                error = e
+                sock.close()
+                continue
+            # like urllib3, do not delay small writes waiting for the ACK of the previous segment
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return sock
+        self.address_cache.expire(host, port)
+        raise error
+
+    async def _open_tunnel(self, sock, route):
+        loop = asyncio.get_event_loop()
+        target = route.host + ":" + str(route.port)
+        lines = ["CONNECT " + target + " HTTP/1.1", "Host: " + target]
+        lines.extend(name + ": " + value for name, value in route.tunnel_headers.items())
+        await loop.sock_sendall(sock, to_bytes("\r\n".join(lines) + "\r\n\r\n"))
+        response = b""
+        while b"\r\n\r\n" not in response:
+            chunk = await loop.sock_recv(sock, self._READ_BUFFER_SIZE)
+            if not chunk or len(response) > self._MAX_LINE_LENGTH:
+                raise ConnectionException("Proxy " + route.proxy[0] + " closed the tunnel to " + target)
+            response += chunk
+        status_line = response.split(b"\r\n", 1)[0].decode("latin-1")
+        if status_line.split(" ")[1:2] != [str(httplib.OK)]:
+            raise ConnectionException("Proxy " + route.proxy[0] + " refused the tunnel to " + target + ": " + status_line)
+
+    def _encode_request(self, route, method, url, headers, body):
+        body = to_bytes(body) if body else b""
+        lines = [method + " " + route.get_request_target(url) + " HTTP/1.1", "Host: " + route.host_header, "Accept-Encoding: identity"]
+        if body or method in ("PUT", "POST"):
+            lines.append("Content-Length: " + str(len(body)))
+        request_headers = dict(headers or {})
+        request_headers.update(route.extra_headers)
+        lines.extend(name + ": " + str(value) for name, value in request_headers.items())
+        return to_bytes("\r\n".join(lines) + "\r\n\r\n") + body
+
+    async def _exchange(self, connection, request, method):
+        """ Sends the encoded request and reads the response, returns the Response and whether the connection has to be closed """
+        reader, writer = connection
+        sent_time = monotonic()
+        writer.write(request)
+        await writer.drain()
+        status_line = await reader.readline()
+        first_byte_time = monotonic() - sent_time
+        if not status_line:
+            raise httplib.BadStatusLine("connection closed by the server")
+        parts = status_line.decode("latin-1").rstrip("\r\n").split(" ", 2)
+        if len(parts) < 2 or not parts[0].startswith("HTTP/") or not parts[1].isdigit():
+            raise httplib.BadStatusLine(status_line)
+        version, status = parts[0], int(parts[1])
+        reason = parts[2] if len(parts) > 2 else ""
+        headers = await self._read_headers(reader)
+        header_map = dict((name.lower(), value) for name, value in headers)
+        connection_header = header_map.get("connection", "").lower()
+        will_close = connection_header == "close" or (version == "HTTP/1.0" and connection_header != "keep-alive")
+        if method == "HEAD" or status in self._NO_BODY_STATUSES or 100 <= status < 200:
+            content = b""
+        elif "chunked" in header_map.get("transfer-encoding", "").lower():
+            content = await self._read_chunked(reader)
+        elif "content-length" in header_map:
+            content = await reader.readexactly(int(header_map["content-length"]))
+        else:
+            content = await reader.read()
+            will_close = True
+        response = Response(status, reason, headers, content)
+        response.first_byte_time = first_byte_time
+        return response, will_close
+
+    async def _read_headers(self, reader):
+        headers = []
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise httplib.IncompleteRead(b"")
+            if line in (b"\r\n", b"\n"):
+                return headers
+            name, _, value = line.decode("latin-1").partition(":")
+            headers.append((name.strip(), value.strip()))
+
+    async def _read_chunked(self, reader):
+        chunks = []
+        while True:
+            size_line = await reader.readline()
+            size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+            if size == 0:
+                await self._read_headers(reader)
+                return b"".join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
@@ -1,6 +1,6 @@
-from ..awsutils import get_aws_timestamp, get_datestamp
-from signer import Signer
-from querystringbuilder import QuerystringBuilder
+from ..awsutils import get_aws_timestamp
+from .signer import Signer
+from .querystringbuilder import QuerystringBuilder
 
 class BaseRequestBuilder(object):
     """
@@ -30,9 +30,9 @@ class BaseRequestBuilder(object):
         self.signer = Signer(credentials, region, self.service, self._ALGORITHM)
 
     def _init_timestamps(self):
-        """ Initializes timestamp and datestamp values """ 
-        self.datestamp = get_datestamp()
+        """ Initializes timestamp and datestamp values, the datestamp is taken from the timestamp so both refer to the same day """ 
         self.aws_timestamp = get_aws_timestamp()
+        self.datestamp = self.aws_timestamp[:8]
     
     def _get_credential_scope(self):
         """ Builds credential scope string used in querystring and signing """
@@ -0,0 +1,172 @@
+import threading
+
+from .. import clock
+from ..compat import urlsplit
+from ..logger.logger import get_logger
+from .transport import ConnectionException, HTTPStatusException
+
+
+class CircuitBreaker(object):
+    """
+    The circuit breaker of a single endpoint. The breaker opens after failure_threshold consecutive failed
+    requests, so requests to an unreachable endpoint fail at once instead of waiting out the connection
+    and response timeouts. Once probe_interval_in_seconds have passed, the open breaker lets a single
+    probe request through. A successful probe closes the breaker, a failed probe keeps it open for
+    another probe interval.
+
+    Keyword arguments:
+    name -- the name of the protected endpoint used in log messages
+    failure_threshold -- the number of consecutive failures opening the breaker, 0 disables the breaker (default 5)
+    probe_interval_in_seconds -- the time between probe requests of the open breaker (default 30)
+    """
+    _LOGGER = get_logger(__name__)
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+    DEFAULT_FAILURE_THRESHOLD = 5
+    DEFAULT_PROBE_INTERVAL_IN_SECONDS = 30
+
+    def __init__(self, name, failure_threshold=DEFAULT_FAILURE_THRESHOLD, probe_interval_in_seconds=DEFAULT_PROBE_INTERVAL_IN_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.probe_interval_in_seconds = probe_interval_in_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._opened_time = None
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """
+        Checks if a request can be sent to the endpoint. The first caller after the probe interval of the open
+        breaker gets the probe request, other callers are rejected until the probe finishes.
+
+        Returns:
+            True if the request can be sent, False if the breaker rejects it
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and clock.monotonic() - self._opened_time >= self.probe_interval_in_seconds:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def is_closed(self):
+        return self.state == self.CLOSED
+
+    def on_success(self):
+        """ Closes the breaker after the endpoint answered a request """
+        with self._lock:
+            previous_state = self.state
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+        if previous_state != self.CLOSED:
+            self._LOGGER.info("Endpoint " + self.name + " is available again, the circuit breaker is closed")
+
+    def on_failure(self):
+        """ Counts a failed request and opens the breaker after a failed probe or failure_threshold consecutive failures """
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.OPEN or self.failure_threshold <= 0:
+                return
+            if self.state == self.CLOSED and self.consecutive_failures < self.failure_threshold:
+                return
+            previous_state = self.state
+            self.state = self.OPEN
+            self._opened_time = clock.monotonic()
+        if previous_state == self.CLOSED:
+            self._LOGGER.warning("Endpoint " + self.name + " failed " + str(self.consecutive_failures) + " consecutive requests, the circuit breaker is open, " +
+                                 "probing every " + str(self.probe_interval_in_seconds) + " seconds")
+
+    def release(self):
+        """ Ends a request which failed before the endpoint answered, the probe of a half-open breaker can be sent again """
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+
+class Endpoint(object):
+    """
+    The endpoint URL with the host name the requests to it are signed with and its circuit breaker.
+
+    Keyword arguments:
+    url -- the URL of the endpoint, e.g. https://monitoring.us-east-1.amazonaws.com/
+    circuit_breaker -- the CircuitBreaker object of the endpoint
+    """
+    _DEFAULT_PORTS = {"http": 80, "https": 443}
+
+    def __init__(self, url, circuit_breaker):
+        self.url = url
+        self.circuit_breaker = circuit_breaker
+        self.signing_host = self._get_signing_host(url)
+
+    def _get_signing_host(self, url):
+        """ Returns the host:port of the URL as sent in the Host header, the default port of the scheme is omitted """
+        parts = urlsplit(url)
+        host = parts.hostname
+        if ":" in host:
+            host = "[" + host + "]"
+        if parts.port and parts.port != self._DEFAULT_PORTS.get(parts.scheme):
+            host += ":" + str(parts.port)
+        return host
+
+
+class EndpointPool(object):
+    """
+    The ordered list of endpoints of the PutMetricData requests, e.g. a VPC interface endpoint followed by the public
+    regional endpoint. Requests go to the first endpoint whose circuit breaker accepts them and fail over to the
+    following endpoints when the endpoint is unreachable or answers with a server error. The open breakers of the
+    preferred endpoints are probed, so requests return to them once they recover.
+
+    Keyword arguments:
+    urls -- the ordered list of endpoint URLs
+    failure_threshold -- the number of consecutive failures opening the circuit breaker of an endpoint (default 5)
+    probe_interval_in_seconds -- the time between probe requests to an endpoint with an open circuit breaker (default 30)
+    """
+
+    def __init__(self, urls, failure_threshold=CircuitBreaker.DEFAULT_FAILURE_THRESHOLD,
+                 probe_interval_in_seconds=CircuitBreaker.DEFAULT_PROBE_INTERVAL_IN_SECONDS):
+        self.endpoints = [Endpoint(url, CircuitBreaker(url, failure_threshold, probe_interval_in_seconds)) for url in urls]
+
+    def select(self, excluded=()):
+        """
+        Returns the first endpoint which is not excluded and whose circuit breaker accepts a request, or None if there is
+        no such endpoint. Every selected endpoint must be reported back with report.
+        """
+        for endpoint in self.endpoints:
+            if endpoint not in excluded and endpoint.circuit_breaker.try_acquire():
+                return endpoint
+        return None
+
+    def get_preferred_endpoint(self):
+        """ Returns the first endpoint with a closed circuit breaker, or None if all breakers are open """
+        for endpoint in self.endpoints:
+            if endpoint.circuit_breaker.is_closed():
+                return endpoint
+        return None
+
+    def report(self, endpoint, exception=None):
+        """
+        Updates the circuit breaker of the endpoint with the outcome of a request.
+
+        Keyword arguments:
+        endpoint -- the Endpoint returned by select
+        exception -- the exception raised by the request, None if the request succeeded (default None)
+        """
+        if exception is None or isinstance(exception, HTTPStatusException) and not self.is_endpoint_failure(exception):
+            endpoint.circuit_breaker.on_success()
+        elif self.is_endpoint_failure(exception):
+            endpoint.circuit_breaker.on_failure()
+        else:
+            endpoint.circuit_breaker.release()
+
+    @staticmethod
+    def is_endpoint_failure(exception):
+        """ Checks if the request failed because the endpoint is unreachable or answered with a server error """
+        if isinstance(exception, HTTPStatusException):
+            return exception.response is not None and exception.response.status_code >= 500
+        return isinstance(exception, ConnectionException)
+
+
+class CircuitOpenException(Exception):
+    pass
@@ -0,0 +1,112 @@
+import threading
+
+from .. import clock
+from ..logger.logger import get_logger
+from .transport import HTTPStatusException
+
+
+class AIMDController(object):
+    """
+    The AIMD controller adapts the number of PutMetricData requests in flight and the request rate to the throttling
+    of the CloudWatch endpoint, like the congestion window of TCP. Every accepted request increases both limits
+    additively, by about one request in flight and one request per second for every window of accepted requests.
+    A throttled request or a server error cuts both limits multiplicatively, at most once per decrease interval,
+    so the concurrent failures of a single burst count as one congestion event.
+
+    The controller starts at the maximum limits, so the plugin publishes as fast as without the controller
+    until CloudWatch throttles it.
+
+    Keyword arguments:
+    min_concurrency -- the lower bound of the number of requests in flight (default 1)
+    max_concurrency -- the upper bound of the number of requests in flight (default 8)
+    min_rate -- the lower bound of the request rate in requests per second (default 1)
+    max_rate -- the upper bound of the request rate in requests per second (default 50)
+    """
+    _LOGGER = get_logger(__name__)
+    DEFAULT_MIN_CONCURRENCY = 1
+    DEFAULT_MAX_CONCURRENCY = 8
+    DEFAULT_MIN_RATE = 1
+    DEFAULT_MAX_RATE = 50
+    _DECREASE_FACTOR = 0.5
+    _DECREASE_INTERVAL_IN_SECONDS = 1
+    _THROTTLING_ERROR_CODE = "Throttling"
+    _TOO_MANY_REQUESTS = 429
+
+    def __init__(self, min_concurrency=DEFAULT_MIN_CONCURRENCY, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 min_rate=DEFAULT_MIN_RATE, max_rate=DEFAULT_MAX_RATE):
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max(min_concurrency, max_concurrency)
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max(min_rate, max_rate))
+        self.window = float(self.max_concurrency)
+        self.rate = self.max_rate
+        self.congestion_event_count = 0
+        self._lock = threading.Lock()
+        self._next_send_time = clock.monotonic()
+        self._last_decrease_time = None
+
+    def get_concurrency_limit(self):
+        """ Returns the number of requests which can be in flight at the same time """
+        return max(self.min_concurrency, int(self.window))
+
+    def reserve(self):
+        """
+        Reserves the send time of the next request according to the current rate. Up to a window of requests
+        can be sent at once after an idle period.
+
+        Returns:
+            the number of seconds to wait before sending the request
+        """
+        with self._lock:
+            now = clock.monotonic()
+            self._next_send_time = max(self._next_send_time, now - (self.window - 1) / self.rate)
+            send_time = max(now, self._next_send_time)
+            self._next_send_time += 1.0 / self.rate
+            return send_time - now
+
+    def on_success(self):
+        """ Increases the limits additively after a request was accepted """
+        with self._lock:
+            self.window = min(self.max_concurrency, self.window + 1.0 / self.window)
+            self.rate = min(self.max_rate, self.rate + 1.0 / self.window)
+
+    def on_congestion(self):
+        """ Cuts the limits multiplicatively after a request was throttled or failed with a server error """
+        with self._lock:
+            now = clock.monotonic()
+            if self._last_decrease_time is not None and now - self._last_decrease_time < self._DECREASE_INTERVAL_IN_SECONDS:
+                return
+            self._last_decrease_time = now
+            self.window = max(float(self.min_concurrency), self.window * self._DECREASE_FACTOR)
+            self.rate = max(self.min_rate, self.rate * self._DECREASE_FACTOR)
+            self.congestion_event_count += 1
+        self._LOGGER.info("PutMetricData requests are throttled, limited to " + str(self.get_concurrency_limit()) +
+                          " request(s) in flight and " + str(round(self.rate, 2)) + " request(s) per second")
+
+    def on_failure(self, exception):
+        """
+        Cuts the limits if the failed request was throttled or failed with a server error.
+
+        Returns:
+            True if the failure is a congestion signal and the request can be retried, False otherwise
+        """
+        if not self.is_congestion_signal(exception):
+            return False
+        self.on_congestion()
+        return True
+
+    @classmethod
+    def is_congestion_signal(cls, exception):
+        """ Checks if the exception is a Throttling error, a 429 response or a 5xx response of the endpoint """
+        if not isinstance(exception, HTTPStatusException) or exception.response is None:
+            return False
+        status_code = exception.response.status_code
+        if status_code >= 500 or status_code == cls._TOO_MANY_REQUESTS:
+            return True
+        return status_code == 400 and cls._THROTTLING_ERROR_CODE in exception.response.text
+
+    def get_state(self):
+        """ Returns the current window, concurrency limit, request rate and the number of congestion events """
+        with self._lock:
+            return {"window": self.window, "concurrency_limit": max(self.min_concurrency, int(self.window)),
+                    "rate": self.rate, "congestion_events": self.congestion_event_count}
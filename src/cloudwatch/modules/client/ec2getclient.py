@@ -1,10 +1,9 @@
 import re
 
 from ..plugininfo import PLUGIN_NAME, PLUGIN_VERSION
-from ec2requestbuilder import EC2RequestBuilder
+from .ec2requestbuilder import EC2RequestBuilder
 from ..logger.logger import get_logger
-from requests.adapters import HTTPAdapter
-from requests.sessions import Session
+from .transport import HTTPTransport
 import xml.etree.ElementTree as ET
 
 
@@ -17,6 +16,7 @@ class EC2GetClient(object):
     config_helper -- the helper that holds our configuration
     connection_timeout -- the amount of time in seconds to wait for extablishing server connection
     response_timeout -- the amount of time in seconds to wait for the server response 
+    transport -- the transport used to send requests (default HTTPTransport with persistent connections)
     """
     
     _LOGGER = get_logger(__name__)
@@ -24,10 +24,11 @@ class EC2GetClient(object):
     _DEFAULT_RESPONSE_TIMEOUT = 3
     _TOTAL_RETRIES = 1
 
-    def __init__(self, config_helper, connection_timeout=_DEFAULT_CONNECTION_TIMEOUT, response_timeout=_DEFAULT_RESPONSE_TIMEOUT):
+    def __init__(self, config_helper, connection_timeout=_DEFAULT_CONNECTION_TIMEOUT, response_timeout=_DEFAULT_RESPONSE_TIMEOUT, transport=None):
         self.request_builder = EC2RequestBuilder(config_helper.credentials, config_helper.region)
         self._validate_and_set_endpoint(config_helper.ec2_endpoint)
         self.timeout = (connection_timeout, response_timeout)
+        self.transport = transport or HTTPTransport(max_retries=self._TOTAL_RETRIES)
     
     def _validate_and_set_endpoint(self, endpoint):
         pattern = re.compile("http[s]?://*/")
@@ -62,10 +63,7 @@ class EC2GetClient(object):
         """
         Executes HTTP GET request with timeout using the endpoint defined upon client creation.
         """
-        session = Session()
-        session.mount("http://", HTTPAdapter(max_retries=self._TOTAL_RETRIES))
-        session.mount("https://", HTTPAdapter(max_retries=self._TOTAL_RETRIES))
-        result = session.get(self.endpoint + "?" + request, headers=self._get_custom_headers(), timeout=self.timeout)
+        result = self.transport.get(self.endpoint + "?" + request, headers=self._get_custom_headers(), timeout=self.timeout)
         result.raise_for_status()
         return result
     
@@ -0,0 +1,121 @@
+import calendar
+import json
+import time
+
+from .. import clock
+from ..logger.logger import get_logger
+
+
+class EMFBuilder(object):
+    """
+    The EMF builder is responsible for translating MetricData objects into CloudWatch Embedded Metric Format
+    documents, the JSON log events ingested by the CloudWatch agent. Metrics sharing the time stamp, storage
+    resolution and dimensions are published by a single document. EMF metric values are numbers or arrays of
+    at most 100 numbers, so the aggregated statistics are published as the minimum, the maximum and the values
+    which make up the rest of the sum. The agent then publishes the same minimum, maximum, sum and sample count
+    as a PutMetricData request with StatisticValues. Statistics of more than 100 values keep the minimum, the
+    maximum and the average, but the sum and the sample count are those of the 100 published values.
+
+    Keyword arguments:
+    enable_high_resolution_metrics -- the storage resolution of metrics which do not declare one (default False)
+    """
+    _LOGGER = get_logger(__name__)
+    _AWS_KEY = "_aws"
+    _TIMESTAMP_KEY = "Timestamp"
+    _CLOUDWATCH_METRICS_KEY = "CloudWatchMetrics"
+    _NAMESPACE_KEY = "Namespace"
+    _DIMENSIONS_KEY = "Dimensions"
+    _METRICS_KEY = "Metrics"
+    _NAME_KEY = "Name"
+    _UNIT_KEY = "Unit"
+    _STORAGE_RESOLUTION_KEY = "StorageResolution"
+    _HIGH_STORAGE_RESOLUTION = 1
+    _MAX_METRICS_PER_DOCUMENT = 100
+    _MAX_VALUES_PER_METRIC = 100
+
+    def __init__(self, enable_high_resolution_metrics=False):
+        self.enable_high_resolution_metrics = enable_high_resolution_metrics
+
+    def build_documents(self, namespace, metric_list):
+        """
+        Creates the EMF documents of the metric list.
+
+        Returns:
+            the list of EMF documents serialized as single line JSON strings
+        """
+        documents = []
+        open_documents = {}
+        epoch_times = {}
+        for metric in metric_list:
+            self._check_values(metric)
+            storage_resolution = self._get_storage_resolution(metric)
+            dimensions = dict((str(name), str(value)) for name, value in metric.dimensions.items())
+            group_key = (metric.timestamp, storage_resolution, tuple(sorted(dimensions.items())))
+            document = open_documents.get(group_key)
+            if document is None or metric.metric_name in document or len(self._get_metric_definitions(document)) >= self._MAX_METRICS_PER_DOCUMENT:
+                if metric.timestamp not in epoch_times:
+                    epoch_times[metric.timestamp] = self._get_epoch_milliseconds(metric.timestamp)
+                document = self._create_document(namespace, epoch_times[metric.timestamp], dimensions)
+                open_documents[group_key] = document
+                documents.append(document)
+            self._add_metric(document, metric, storage_resolution)
+        return [json.dumps(document, separators=(",", ":"), sort_keys=True) for document in documents]
+
+    def _create_document(self, namespace, epoch_milliseconds, dimensions):
+        document = dict(dimensions)
+        document[self._AWS_KEY] = {
+            self._TIMESTAMP_KEY: epoch_milliseconds,
+            self._CLOUDWATCH_METRICS_KEY: [{
+                self._NAMESPACE_KEY: namespace,
+                self._DIMENSIONS_KEY: [sorted(dimensions.keys())],
+                self._METRICS_KEY: []
+            }]
+        }
+        return document
+
+    def _get_metric_definitions(self, document):
+        return document[self._AWS_KEY][self._CLOUDWATCH_METRICS_KEY][0][self._METRICS_KEY]
+
+    def _add_metric(self, document, metric, storage_resolution):
+        definition = {self._NAME_KEY: metric.metric_name}
+        if metric.unit:
+            definition[self._UNIT_KEY] = metric.unit
+        if storage_resolution == self._HIGH_STORAGE_RESOLUTION:
+            definition[self._STORAGE_RESOLUTION_KEY] = self._HIGH_STORAGE_RESOLUTION
+        self._get_metric_definitions(document).append(definition)
+        document[metric.metric_name] = self._get_values(metric.statistics)
+
+    def _get_values(self, statistics):
+        """
+        Returns the value of the metric as a single number or as the list of values whose minimum, maximum,
+        sum and count are those of the statistics. The values between the minimum and the maximum are all set
+        to their average, which lies between the two.
+        """
+        if statistics.sample_count == 1:
+            return statistics.sum
+        value_count = min(statistics.sample_count, self._MAX_VALUES_PER_METRIC)
+        if statistics.sample_count == value_count:
+            rest_sum = statistics.sum - statistics.min - statistics.max
+        else:
+            rest_sum = (statistics.sum / float(statistics.sample_count)) * value_count - statistics.min - statistics.max
+        rest_values = [rest_sum / float(value_count - 2)] * (value_count - 2) if value_count > 2 else []
+        return [statistics.min, statistics.max] + rest_values
+
+    def _get_storage_resolution(self, metric):
+        """
+        Returns the storage resolution declared by the metric itself or, if the metric does not declare one,
+        the storage resolution defined by the plugin configuration.
+        """
+        if metric.storage_resolution:
+            return metric.storage_resolution
+        return self._HIGH_STORAGE_RESOLUTION if self.enable_high_resolution_metrics else None
+
+    def _get_epoch_milliseconds(self, timestamp):
+        """ Translates the YYYYMMDDThhmmssZ time stamp of the metric to milliseconds since the epoch """
+        return calendar.timegm(time.strptime(timestamp, clock.AWS_TIMESTAMP_FORMAT)) * 1000
+
+    def _check_values(self, metric):
+        if not metric.statistics:
+            msg = "Missing value for metric " + metric.metric_name
+            self._LOGGER.warning(msg)
+            raise ValueError(msg)
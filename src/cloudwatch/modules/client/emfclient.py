@@ -0,0 +1,180 @@
+import select
+import socket
+import threading
+
+from .emfbuilder import EMFBuilder
+from ..compat import to_bytes, urlsplit
+from ..logger.logger import get_logger
+
+
+class EMFClient(object):
+    """
+    The EMF client publishes metric data as CloudWatch Embedded Metric Format documents to the local CloudWatch agent
+    over TCP or UDP, or appends them to a file collected by the agent. The agent batches the documents and publishes
+    the metrics itself, so no request is signed and no AWS credentials are needed by the plugin.
+
+    Supported endpoints:
+    tcp://host:port -- one JSON document per line over a persistent TCP connection
+    udp://host:port -- one JSON document per datagram
+    file:///path -- one JSON document per line appended to the file
+
+    Keyword arguments:
+    config_helper -- the ConfigHelper object with configuration loaded
+    connection_timeout -- the amount of time in seconds to wait for establishing the connection and for writes
+    """
+
+    _LOGGER = get_logger(__name__)
+    _DEFAULT_CONNECTION_TIMEOUT = 1
+    TCP_SCHEME = "tcp"
+    UDP_SCHEME = "udp"
+    FILE_SCHEME = "file"
+
+    def __init__(self, config_helper, connection_timeout=_DEFAULT_CONNECTION_TIMEOUT):
+        self.builder = EMFBuilder(config_helper.enable_high_resolution_metrics)
+        self.endpoint = config_helper.emf_endpoint
+        self.scheme, self.address = self.parse_endpoint(self.endpoint)
+        self.timeout = connection_timeout
+        self._lock = threading.Lock()
+        self._socket = None
+
+    @classmethod
+    def parse_endpoint(cls, endpoint):
+        """
+        Returns the (scheme, address) pair of the EMF endpoint, the address is the (host, port) pair
+        of socket endpoints and the path of file endpoints.
+
+        Raises:
+            EMFClient.InvalidEndpointException if the endpoint is not supported
+        """
+        parts = urlsplit(endpoint or "")
+        try:
+            if parts.scheme in (cls.TCP_SCHEME, cls.UDP_SCHEME) and parts.hostname and parts.port:
+                return parts.scheme, (parts.hostname, parts.port)
+        except ValueError:
+            pass
+        if parts.scheme == cls.FILE_SCHEME and parts.path and not parts.netloc:
+            return parts.scheme, parts.path
+        raise cls.InvalidEndpointException("Provided EMF endpoint '" + str(endpoint) + "' is not a valid tcp://host:port, udp://host:port or file:///path URL.")
+
+    def put_metric_data(self, namespace, metric_list, timeout=None):
+        """
+        Publishes metric data to the EMF endpoint with single namespace defined.
+        It is consumers responsibility to ensure that all metrics in the metric list
+        belong to the same namespace. The writes are bounded by the connection timeout,
+        which is not cut to the optional timeout of the call.
+
+        Returns:
+            True if the documents were written to the endpoint, False otherwise
+        """
+        if not self._is_namespace_consistent(namespace, metric_list):
+            raise ValueError("Metric list contains metrics with namespace different than the one passed as argument.")
+        try:
+            documents = self.builder.build_documents(namespace, metric_list)
+            with self._lock:
+                try:
+                    self._write(documents)
+                except (socket.error, OSError):
+                    self._close_socket()
+                    raise
+        except Exception as e:
+            self._LOGGER.warning("Could not put metric data using the following EMF endpoint: '" + self.endpoint + "'. [Exception: " + str(e) + "]")
+            return False
+        return True
+
+    def prewarm(self):
+        """
+        Opens or validates the TCP connection to the agent ahead of the next put_metric_data call.
+
+        Returns:
+            True if the endpoint is ready, False if the connection could not be opened
+        """
+        if self.scheme != self.TCP_SCHEME:
+            return True
+        with self._lock:
+            try:
+                self._get_socket()
+                return True
+            except (socket.error, OSError) as e:
+                self._LOGGER.warning("Cannot open connection to " + self.endpoint + " ahead of the request. Cause: " + str(e))
+                return False
+
+    def close(self):
+        """ Closes the connection to the agent """
+        with self._lock:
+            self._close_socket()
+
+    def _write(self, documents):
+        if self.scheme == self.FILE_SCHEME:
+            with open(self.address, "a") as emf_file:
+                emf_file.write("".join(document + "\n" for document in documents))
+        elif self.scheme == self.UDP_SCHEME:
+            sock = self._get_socket()
+            for document in documents:
+                sock.send(to_bytes(document))
+        else:
+            self._send_lines([to_bytes(document + "\n") for document in documents])
+
+    def _send_lines(self, lines):
+        """
+        Sends the lines over the persistent connection, a connection closed by the agent is replaced once.
+        Only the lines which were not completely sent are sent over the new connection, a line cut off by
+        the failure is sent again as a whole, so the agent never receives a document twice.
+        """
+        sock = self._get_socket()
+        sent_line_count = 0
+        reconnected = False
+        while sent_line_count < len(lines):
+            try:
+                sock.sendall(lines[sent_line_count])
+                sent_line_count += 1
+            except (socket.error, OSError):
+                if reconnected:
+                    raise
+                reconnected = True
+                self._close_socket()
+                sock = self._get_socket()
+
+    def _get_socket(self):
+        """ Returns the open socket to the agent, an idle TCP connection closed by the agent is replaced """
+        if self._socket is not None and self.scheme == self.TCP_SCHEME and not self._is_open(self._socket):
+            self._close_socket()
+        if self._socket is None:
+            self._socket = self._open_socket()
+        return self._socket
+
+    def _open_socket(self):
+        if self.scheme == self.TCP_SCHEME:
+            return socket.create_connection(self.address, self.timeout)
+        family, socket_type, protocol, _, socket_address = socket.getaddrinfo(self.address[0], self.address[1], 0, socket.SOCK_DGRAM)[0]
+        sock = socket.socket(family, socket_type, protocol)
+        sock.settimeout(self.timeout)
+        sock.connect(socket_address)
+        return sock
+
+    def _is_open(self, sock):
+        """ The agent never sends data, so a readable idle connection was closed by the agent """
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+        except (socket.error, OSError, ValueError):
+            return False
+        return not readable
+
+    def _close_socket(self):
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            finally:
+                self._socket = None
+
+    def _is_namespace_consistent(self, namespace, metric_list):
+        """
+        Checks if namespaces declared in MetricData objects in the metric list are consistent
+        with the defined namespace.
+        """
+        for metric in metric_list:
+            if metric.namespace != namespace:
+                return False
+        return True
+
+    class InvalidEndpointException(Exception):
+        pass
@@ -0,0 +1,68 @@
+import json
+import os
+import threading
+
+from ..logger.logger import get_logger
+
+
+class JSONLinesClient(object):
+    """
+    The JSON lines client appends every published metric as a single line JSON record to a local file,
+    e.g. to audit the metrics published by the other sinks. Once the file is larger than max_file_size
+    it is renamed to path.1, replacing the previous one, and a new file is started.
+
+    The record of a metric:
+    {"namespace": ..., "metric_name": ..., "dimensions": {...}, "timestamp": ..., "unit": ..., "storage_resolution": ...,
+     "statistics": {"min": ..., "max": ..., "sum": ..., "sample_count": ...}}
+
+    Keyword arguments:
+    config_helper -- the ConfigHelper object with configuration loaded
+    max_file_size -- the size in bytes after which the file is rotated (default 10 MB)
+    """
+
+    _LOGGER = get_logger(__name__)
+    _DEFAULT_MAX_FILE_SIZE = 10 * 1024 * 1024
+    _ROTATED_FILE_SUFFIX = ".1"
+
+    def __init__(self, config_helper, max_file_size=_DEFAULT_MAX_FILE_SIZE):
+        self.path = config_helper.jsonl_path
+        self.max_file_size = max_file_size
+        self._lock = threading.Lock()
+
+    def put_metric_data(self, namespace, metric_list, timeout=None):
+        """
+        Appends the records of the metric list to the file, the timeout is accepted like by the other clients and not used.
+
+        Returns:
+            True if the records were written, False otherwise
+        """
+        try:
+            records = "".join(json.dumps(self._to_record(namespace, metric), separators=(",", ":"), sort_keys=True) + "\n" for metric in metric_list)
+            with self._lock:
+                self._rotate_if_need()
+                with open(self.path, "a") as jsonl_file:
+                    jsonl_file.write(records)
+        except Exception as e:
+            self._LOGGER.warning("Could not write metric data to the following file: '" + self.path + "'. [Exception: " + str(e) + "]")
+            return False
+        return True
+
+    def prewarm(self):
+        """ Files need no connection, returns True """
+        return True
+
+    def _rotate_if_need(self):
+        if os.path.isfile(self.path) and os.path.getsize(self.path) > self.max_file_size:
+            os.rename(self.path, self.path + self._ROTATED_FILE_SUFFIX)
+
+    def _to_record(self, namespace, metric):
+        statistics = metric.statistics
+        return {
+            "namespace": namespace,
+            "metric_name": metric.metric_name,
+            "dimensions": metric.dimensions,
+            "timestamp": metric.timestamp,
+            "unit": metric.unit,
+            "storage_resolution": metric.storage_resolution,
+            "statistics": {"min": statistics.min, "max": statistics.max, "sum": statistics.sum, "sample_count": statistics.sample_count} if statistics else None
+        }
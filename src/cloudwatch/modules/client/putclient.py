@@ -1,12 +1,14 @@
 import re
-import os
+import time
 
+from .. import clock
 from ..plugininfo import PLUGIN_NAME, PLUGIN_VERSION
-from requestbuilder import RequestBuilder
+from .requestbuilder import RequestBuilder
 from ..logger.logger import get_logger
-from requests.adapters import HTTPAdapter
-from requests.sessions import Session
-from tempfile import gettempdir
+from .transport import HTTPTransport
+from .circuitbreaker import EndpointPool, CircuitOpenException
+from .transport import HTTPStatusException
+from ..quarantine import MetricQuarantine
 
 
 class PutClient(object):
@@ -20,38 +22,54 @@ class PutClient(object):
                 IAM Role token used for request signing
     connection_timeout -- the amount of time in seconds to wait for extablishing server connection
     response_timeout -- the amount of time in seconds to wait for the server response 
+    transport -- the transport used to send requests (default HTTPTransport with persistent connections)
+    congestion_controller -- the AIMDController pacing the requests and retrying the throttled ones (default None)
+    endpoint_pool -- the EndpointPool with the circuit breakers of the endpoints (default the endpoint of the configuration)
+    metric_quarantine -- the MetricQuarantine of the series rejected by this client's endpoints, which are not sent (default MetricQuarantine reporting to the plugin log)
+    metric_data_cache -- the EncodedMetricDataCache shared by the clients publishing the same batches to other regions or accounts (default None)
+    namespace -- the namespace the metrics are published to instead of the namespace of the metric list (default None)
+    request_tracer -- the RequestTracer recording a sample of the requests (default None)
     """
     
     _LOGGER = get_logger(__name__)
     _DEFAULT_CONNECTION_TIMEOUT = 1
     _DEFAULT_RESPONSE_TIMEOUT = 3
     _TOTAL_RETRIES = 1
-    _LOG_FILE_MAX_SIZE = 10*1024*1024
+    _PREWARM_CONNECTION_TIMEOUT = 3
+    _MAX_CONGESTION_RETRIES = 2
+    _INVALID_METRIC_DATA_ERROR_CODES = ("InvalidParameterValue", "InvalidParameterCombination")
+    _ERROR_MESSAGE_PATTERN = re.compile(r"<Message>(.*?)</Message>", re.DOTALL)
+    _REJECTED_METRIC_PATTERN = re.compile(r"MetricData\.member\.(\d+)\b")
 
-    def __init__(self, config_helper, connection_timeout=_DEFAULT_CONNECTION_TIMEOUT, response_timeout=_DEFAULT_RESPONSE_TIMEOUT):
-        self.request_builder = RequestBuilder(config_helper.credentials, config_helper.region, config_helper.enable_high_resolution_metrics)
+    def __init__(self, config_helper, connection_timeout=_DEFAULT_CONNECTION_TIMEOUT, response_timeout=_DEFAULT_RESPONSE_TIMEOUT, transport=None,
+                 congestion_controller=None, endpoint_pool=None, metric_quarantine=None, metric_data_cache=None, namespace=None, request_tracer=None):
+        self.request_builder = RequestBuilder(config_helper.credentials, config_helper.region, config_helper.enable_high_resolution_metrics, metric_data_cache)
         self._validate_and_set_endpoint(config_helper.endpoint)
         self.timeout = (connection_timeout, response_timeout)
         self.proxy_server_name = config_helper.proxy_server_name
         self.proxy_server_port = config_helper.proxy_server_port
-        self.debug = config_helper.debug
         self.config = config_helper
-        self._prepare_session()
+        self.congestion_controller = congestion_controller
+        self.endpoint_pool = endpoint_pool or EndpointPool([self.endpoint])
+        self.metric_quarantine = metric_quarantine or MetricQuarantine()
+        self.namespace = namespace
+        self.request_tracer = request_tracer
+        self.transport = transport or self._prepare_transport()
 
-    def _prepare_session(self):
-        self.session = Session()
+    def _prepare_transport(self):
+        return HTTPTransport(max_retries=self._TOTAL_RETRIES, proxy_server=self._get_proxy_server())
+
+    def _get_proxy_server(self):
+        proxy_server = None
         if self.proxy_server_name is not None:
             proxy_server = self.proxy_server_name
             self._LOGGER.info("Using proxy server: " + proxy_server)
             if self.proxy_server_port is not None:
                 proxy_server = proxy_server + ":" + self.proxy_server_port
                 self._LOGGER.info("Using proxy server port: " + self.proxy_server_port)
-            proxies = {'https': proxy_server}
-            self.session.proxies.update(proxies)
         else:
             self._LOGGER.info("No proxy server is in use")
-        self.session.mount("http://", HTTPAdapter(max_retries=self._TOTAL_RETRIES))
-        self.session.mount("https://", HTTPAdapter(max_retries=self._TOTAL_RETRIES))
+        return proxy_server
 
     def _validate_and_set_endpoint(self, endpoint):
         pattern = re.compile("http[s]?://*/")
@@ -62,24 +80,158 @@ class PutClient(object):
             self._LOGGER.error(msg)
             raise PutClient.InvalidEndpointException(msg)
         
-    def put_metric_data(self, namespace, metric_list):
+    def put_metric_data(self, namespace, metric_list, timeout=None):
         """
         Publishes metric data to the endpoint with single namespace defined. 
         It is consumers responsibility to ensure that all metrics in the metric list 
-        belong to the same namespace.
+        belong to the same namespace. With a congestion controller, the request is paced
+        and retried up to _MAX_CONGESTION_RETRIES times when it is throttled.
+        The request fails over to the next endpoint of the endpoint pool if the endpoint
+        is unreachable and fails at once if the circuit breakers of all endpoints are open.
+        If CloudWatch rejects a datum of the batch, only the rejected metric is quarantined
+        and the other metrics are published again. Quarantined metrics are not sent.
+        With a timeout, e.g. on shutdown, no request is started once timeout seconds have passed
+        and the connection and response timeouts of every request are cut to the remaining time.
+
+        Returns:
+            True if the metric data was accepted by the endpoint or all metrics are quarantined, False otherwise
         """
         
         if not self._is_namespace_consistent(namespace, metric_list):
             raise ValueError("Metric list contains metrics with namespace different than the one passed as argument.")
+        metric_list = self._get_unquarantined_metrics(metric_list)
+        if not metric_list:
+            return True
+        deadline = None if timeout is None else clock.monotonic() + timeout
         credentials = self.config.credentials
         self.request_builder.credentials = credentials
         self.request_builder.signer.credentials = credentials
-        request = self.request_builder.create_signed_request(namespace, metric_list)
-        try:
-            self._run_request(request) 
-        except Exception as e:
-            self._LOGGER.warning("Could not put metric data using the following endpoint: '" + self.endpoint +"'. [Exception: " + str(e) + "]")
-            self._LOGGER.warning("Request details: '" + request + "'")
+        for attempt in range(self._MAX_CONGESTION_RETRIES + 1):
+            if self.congestion_controller:
+                delay = self.congestion_controller.reserve()
+                if deadline is not None and clock.monotonic() + delay >= deadline:
+                    self._LOGGER.warning("Could not put metric data before the deadline, the request was paced for " + str(delay) + " seconds")
+                    return False
+                time.sleep(delay)
+            error, endpoint, request = self._put_with_failover(namespace, metric_list, deadline)
+            if error is None:
+                if self.congestion_controller:
+                    self.congestion_controller.on_success()
+                return True
+            if self._should_retry(error, attempt):
+                self._LOGGER.info("Retrying throttled PutMetricData request. [Exception: " + str(error) + "]")
+                continue
+            rejected_index = self._get_rejected_metric_index(error, len(metric_list))
+            if rejected_index is not None:
+                remaining_metrics = self._quarantine_rejected_metric(metric_list, rejected_index, error)
+                return bool(remaining_metrics) and self.put_metric_data(namespace, remaining_metrics, self._get_remaining_time(deadline))
+            self._log_put_failure(error, endpoint, request)
+            return False
+
+    def _quarantine_rejected_metric(self, metric_list, rejected_index, error):
+        """ Quarantines the rejected metric and returns the other metrics of the batch, which are published again """
+        self.metric_quarantine.quarantine(metric_list[rejected_index], "CloudWatch rejected the metric: " + self._get_error_message(error))
+        return metric_list[:rejected_index] + metric_list[rejected_index + 1:]
+
+    def _get_unquarantined_metrics(self, metric_list):
+        """ Returns the metric list itself if no metric is quarantined, so the encoded metric data shared with other clients is reused """
+        unquarantined_metrics = [metric for metric in metric_list if not self.metric_quarantine.is_quarantined(metric)]
+        return metric_list if len(unquarantined_metrics) == len(metric_list) else unquarantined_metrics
+
+    def _get_rejected_metric_index(self, error, batch_size):
+        """
+        Returns the index in the batch of the metric named by the MetricData.member.N parameter of the error message,
+        or None if the request was not rejected because of a datum, e.g. because the namespace is invalid.
+        """
+        if not self._is_metric_data_rejected(error):
+            return None
+        match = self._REJECTED_METRIC_PATTERN.search(self._get_error_message(error))
+        if not match or not 1 <= int(match.group(1)) <= batch_size:
+            return None
+        return int(match.group(1)) - 1
+
+    def _is_metric_data_rejected(self, error):
+        """ Checks if the request was rejected because the parameters of a datum are invalid """
+        if not isinstance(error, HTTPStatusException) or error.response is None or error.response.status_code != 400:
+            return False
+        text = error.response.text
+        return any(error_code in text for error_code in self._INVALID_METRIC_DATA_ERROR_CODES)
+
+    def _get_error_message(self, error):
+        match = self._ERROR_MESSAGE_PATTERN.search(error.response.text)
+        return match.group(1).strip() if match else str(error)
+
+    def _put_with_failover(self, namespace, metric_list, deadline=None):
+        """
+        Sends the request to the first available endpoint, then to the following ones while the endpoints are unreachable
+        and the deadline has not passed.
+
+        Returns:
+            the (exception, endpoint, request) tuple of the last request, the exception is None if the request succeeded
+        """
+        tried_endpoints = []
+        error, request = CircuitOpenException("The circuit breakers of all endpoints are open"), ""
+        endpoint = self.endpoint_pool.select()
+        while endpoint is not None:
+            request_timeout = self._get_request_timeout(deadline)
+            if request_timeout is None:
+                return PutClient.DeadlineExceededException("The deadline passed before the request could be sent"), endpoint, request
+            tried_endpoints.append(endpoint)
+            trace = self._start_trace(endpoint, namespace, metric_list)
+            try:
+                request = self.request_builder.create_signed_request(self.namespace or namespace, metric_list, endpoint.signing_host, trace)
+                self._run_request(request, endpoint.url, trace, request_timeout)
+            except Exception as e:
+                self.endpoint_pool.report(endpoint, e)
+                if not EndpointPool.is_endpoint_failure(e):
+                    return e, endpoint, request
+                error = e
+                endpoint = self.endpoint_pool.select(tried_endpoints)
+                if endpoint is not None:
+                    self._LOGGER.warning("Endpoint '" + tried_endpoints[-1].url + "' failed, failing over to '" + endpoint.url + "'. [Exception: " + str(e) + "]")
+                continue
+            self.endpoint_pool.report(endpoint)
+            return None, endpoint, request
+        return error, tried_endpoints[-1] if tried_endpoints else None, request
+
+    def _get_remaining_time(self, deadline):
+        return None if deadline is None else max(0, deadline - clock.monotonic())
+
+    def _get_request_timeout(self, deadline):
+        """ Returns the (connection, response) timeout of a request cut to the time left until the deadline, or None if it has passed """
+        remaining_time = self._get_remaining_time(deadline)
+        if remaining_time is None:
+            return self.timeout
+        if remaining_time <= 0:
+            return None
+        return tuple(min(timeout, remaining_time) for timeout in self.timeout)
+
+    def _log_put_failure(self, error, endpoint, request):
+        if endpoint is None:
+            self._LOGGER.warning("Could not put metric data, no endpoint is available. [Exception: " + str(error) + "]")
+            return
+        self._LOGGER.warning("Could not put metric data using the following endpoint: '" + endpoint.url +"'. [Exception: " + str(error) + "]")
+        self._LOGGER.warning("Request details: '" + request + "'")
+
+    def _should_retry(self, exception, attempt):
+        """ Reports the failure to the congestion controller and checks if the throttled request can be retried """
+        if not self.congestion_controller:
+            return False
+        return self.congestion_controller.on_failure(exception) and attempt < self._MAX_CONGESTION_RETRIES
+
+    def prewarm(self):
+        """
+        Opens or validates the connection to the endpoint ahead of the next put_metric_data call, so the put
+        does not pay for name resolution and the TCP and TLS handshakes within the connection timeout.
+        The connection is opened to the first endpoint with a closed circuit breaker.
+
+        Returns:
+            True if an open connection is ready, False otherwise
+        """
+        endpoint = self.endpoint_pool.get_preferred_endpoint()
+        if endpoint is None:
+            return False
+        return self.transport.prewarm(endpoint.url, self._PREWARM_CONNECTION_TIMEOUT)
 
     def _is_namespace_consistent(self, namespace, metric_list):
         """
@@ -87,25 +239,32 @@ class PutClient(object):
         with the defined namespace.
         """
         for metric in metric_list:
-            if metric.namespace is not namespace:
+            if metric.namespace != namespace:
                 return False
         return True
 
-    def _run_request(self, request):
+    def _run_request(self, request, endpoint=None, trace=None, timeout=None):
         """
-        Executes HTTP GET request with timeout using the endpoint defined upon client creation.
+        Executes HTTP GET request with the given (connection, response) timeout or the timeout of the client using the given endpoint
+        or the endpoint defined upon client creation. The outcome of a sampled request is recorded by its trace.
         """
-        if self.debug:
-            file_path = gettempdir() + "/collectd_plugin_request_trace_log"
-            if os.path.isfile(file_path) and os.path.getsize(file_path) > self._LOG_FILE_MAX_SIZE:
-                os.remove(file_path)
-            with open(file_path, "a") as logfile:
-                logfile.write("curl -i -v -connect-timeout 1 -m 3 -w %{http_code}:%{http_connect}:%{content_type}:%{time_namelookup}:%{time_redirect}:%{time_pretransfer}:%{time_connect}:%{time_starttransfer}:%{time_total}:%{speed_download} -A \"collectd/1.0\" \'" + self.endpoint + "?" + request + "\'")
-                logfile.write("\n\n")
-
-        result = self.session.get(self.endpoint + "?" + request, headers=self._get_custom_headers(), timeout=self.timeout)
-        result.raise_for_status()
+        endpoint = endpoint or self.endpoint
+        try:
+            result = self.transport.get(endpoint + "?" + request, headers=self._get_custom_headers(), timeout=timeout or self.timeout)
+            result.raise_for_status()
+        except Exception as e:
+            if trace:
+                trace.finish(request, error=e)
+            raise
+        if trace:
+            trace.finish(request, result)
         return result
+
+    def _start_trace(self, endpoint, namespace, metric_list):
+        """ Returns the RequestTrace of the request if the request is sampled by the request tracer, None otherwise """
+        if self.request_tracer is None:
+            return None
+        return self.request_tracer.start_trace(endpoint.url, self.namespace or namespace, len(metric_list))
     
     def _get_custom_headers(self):
         """ Returns dictionary of HTTP headers to be attached to each request """
@@ -117,3 +276,6 @@ class PutClient(object):
     
     class InvalidEndpointException(Exception):
         pass
+
+    class DeadlineExceededException(Exception):
+        pass
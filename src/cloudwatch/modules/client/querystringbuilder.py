@@ -1,7 +1,9 @@
 import operator
+import threading
+from collections import OrderedDict
 
 from ..logger.logger import get_logger
-from urllib import urlencode
+from ..compat import urlencode
 
 
 class QuerystringBuilder(object):
@@ -22,6 +24,7 @@ class QuerystringBuilder(object):
     _STAT_SUM = _STATISTICS_KEY + "Sum"
     _STAT_SAMPLE = _STATISTICS_KEY + "SampleCount"
     _STORAGE_RESOLUTION = "StorageResolution"
+    _HIGH_STORAGE_RESOLUTION = 1
 
     def __init__(self, enable_high_resolution_metrics=False):
         self.enable_high_resolution_metrics = enable_high_resolution_metrics
@@ -40,9 +43,28 @@ class QuerystringBuilder(object):
         """
         base_map.update(call_map)
         sorted_query_data = sorted(base_map.items(),key=operator.itemgetter(0))
+        return self._encode(sorted_query_data)
+
+    def encode_metric_data(self, metric_list):
+        """
+        Returns the sorted and encoded MetricData parameters of the metric list, which do not depend on the credentials
+        and can be shared by the requests publishing the same metrics to several regions or accounts.
+        """
+        return self._encode(sorted(self._build_metric_map(metric_list).items(), key=operator.itemgetter(0)))
+
+    def build_querystring_from_encoded_metric_data(self, encoded_metric_data, request_map):
+        """
+        Creates querystring from the MetricData parameters encoded by encode_metric_data and a map of request key value pairs.
+        The request keys are placed before or after the MetricData parameters, so all keys remain sorted in ascending order.
+        """
+        sorted_request_data = sorted(request_map.items(), key=operator.itemgetter(0))
+        leading_data = [item for item in sorted_request_data if item[0] < self._METRIC_PREFIX]
+        trailing_data = [item for item in sorted_request_data if item[0] >= self._METRIC_PREFIX]
+        return "&".join(part for part in (self._encode(leading_data), encoded_metric_data, self._encode(trailing_data)) if part)
+
+    def _encode(self, sorted_query_data):
         # by default urlencode replace spaces with '+' but CloudWatch requires them to be encoded to '%20'
-        url_string = urlencode(sorted_query_data).replace('+', '%20') 
-        return url_string
+        return urlencode(sorted_query_data).replace('+', '%20')
 
 
     def _build_metric_map(self, metric_list):
@@ -56,13 +78,22 @@ class QuerystringBuilder(object):
             metric_prefix = self._METRIC_PREFIX + str(metric_index) + "."
             metric_map[metric_prefix + self._METRIC_NAME_KEY] = metric.metric_name
             metric_map[metric_prefix + self._TIMESTAMP_KEY] = metric.timestamp
-            if self.enable_high_resolution_metrics:
-                metric_map[metric_prefix + self._STORAGE_RESOLUTION] = "1"
+            if self._get_storage_resolution(metric) == self._HIGH_STORAGE_RESOLUTION:
+                metric_map[metric_prefix + self._STORAGE_RESOLUTION] = str(self._HIGH_STORAGE_RESOLUTION)
             self._add_dimensions(metric, metric_map, metric_prefix)
             self._add_values(metric, metric_map, metric_prefix)
             metric_index += 1
         return metric_map
     
+    def _get_storage_resolution(self, metric):
+        """
+        Returns the storage resolution declared by the metric itself or, if the metric does not declare one,
+        the storage resolution defined by the plugin configuration.
+        """
+        if metric.storage_resolution:
+            return metric.storage_resolution
+        return self._HIGH_STORAGE_RESOLUTION if self.enable_high_resolution_metrics else None
+
     def _add_dimensions(self, metric, metric_map, metric_prefix):
         dimension_index = 1
         for dimension_key in metric.dimensions.keys():
@@ -80,3 +111,36 @@ class QuerystringBuilder(object):
         metric_map[metric_prefix + self._STAT_MIN] = metric.statistics.min
         metric_map[metric_prefix + self._STAT_SUM] = metric.statistics.sum
         metric_map[metric_prefix + self._STAT_SAMPLE] = metric.statistics.sample_count
+
+
+class EncodedMetricDataCache(object):
+    """
+    The cache of the encoded MetricData parameters of the most recent metric batches. It is shared by the PutClients
+    publishing the same batches to several regions or accounts, so every batch is encoded only once.
+    The batches are identified by the metric list object handed to every client, the cache keeps a reference to the
+    cached lists, so the identity of a cached list cannot be reused by another list.
+
+    Keyword arguments:
+    max_entries -- the maximum number of cached batches, the oldest batch is evicted first (default 256)
+    """
+    DEFAULT_MAX_ENTRIES = 256
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hit_count = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, metric_list, querystring_builder):
+        """ Returns the encoded MetricData parameters of the metric list, encoding them with the querystring builder if they are not cached """
+        with self._lock:
+            entry = self._entries.get(id(metric_list))
+            if entry is not None and entry[0] is metric_list:
+                self.hit_count += 1
+                return entry[1]
+        encoded_metric_data = querystring_builder.encode_metric_data(metric_list)
+        with self._lock:
+            self._entries[id(metric_list)] = (metric_list, encoded_metric_data)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return encoded_metric_data
@@ -1,4 +1,4 @@
-from baserequestbuilder import BaseRequestBuilder
+from .baserequestbuilder import BaseRequestBuilder
 
 class RequestBuilder(BaseRequestBuilder):
     """
@@ -8,31 +8,47 @@ class RequestBuilder(BaseRequestBuilder):
     credentials -- The AWSCredentials object containing access and secret keys
     region -- The region to which the data should be published
     namespace -- The namespace used for grouping of the published metrics.    
+    metric_data_cache -- The EncodedMetricDataCache shared by the request builders publishing the same batches (default None)
     """
     _SERVICE = "monitoring"
     _ACTION = "PutMetricData"
     _API_VERSION = "2010-08-01"
     
-    def __init__(self, credentials, region, enable_high_resolution_metrics):
+    def __init__(self, credentials, region, enable_high_resolution_metrics, metric_data_cache=None):
         super(self.__class__, self).__init__(credentials, region, self._SERVICE, self._ACTION, self._API_VERSION, enable_high_resolution_metrics)
         self.namespace = ""
+        self.host = None
+        self.metric_data_cache = metric_data_cache
 
-    def create_signed_request(self, namespace, metric_list):
-        """ Creates a ready to send request with metrics from the metric list passed as parameter """
+    def create_signed_request(self, namespace, metric_list, host=None, trace=None):
+        """
+        Creates a ready to send request with metrics from the metric list passed as parameter. The request is signed
+        for the host of the endpoint it is sent to, e.g. a VPC interface endpoint, or the regional endpoint if host is None.
+        The end of the encode and sign phases is marked in the RequestTrace of a sampled request.
+        """
         self.namespace = namespace
+        self.host = host
         self._init_timestamps()
         canonical_querystring = self._create_canonical_querystring(metric_list)
+        if trace:
+            trace.mark("encode")
         signature = self.signer.create_request_signature(canonical_querystring, self._get_credential_scope(),
                                             self.aws_timestamp, self.datestamp, self._get_canonical_headers(),
                                             self._get_signed_headers(), self.payload)
         canonical_querystring += '&X-Amz-Signature=' + signature
+        if trace:
+            trace.mark("sign")
         return canonical_querystring
     
     def _create_canonical_querystring(self, metric_list):
         """ 
         Creates a canonical querystring as defined in the official AWS API documentation: 
         http://docs.aws.amazon.com/general/latest/gr/sigv4-create-canonical-request.html 
+        With a metric data cache, the MetricData parameters are encoded once for all builders publishing the metric list.
         """
+        if self.metric_data_cache is not None:
+            encoded_metric_data = self.metric_data_cache.get(metric_list, self.querystring_builder)
+            return self.querystring_builder.build_querystring_from_encoded_metric_data(encoded_metric_data, self._get_namespace_request_map())
         return self.querystring_builder.build_querystring(metric_list, self._get_namespace_request_map())
     
     def _get_namespace_request_map(self):
@@ -46,7 +62,9 @@ class RequestBuilder(BaseRequestBuilder):
         return canonical_map
     
     def _get_host(self):
-        """ Returns the endpoint's hostname derived from the region """
+        """ Returns the endpoint's hostname, derived from the region unless the request is signed for another host """
+        if self.host:
+            return self.host
         if self.region == "localhost":
             return "localhost"
         elif self.region.startswith("cn-"):
@@ -0,0 +1,175 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+
+from .. import clock
+from ..logger.logger import get_logger
+
+
+class RequestTracer(object):
+    """
+    The request tracer records a sample of the PutMetricData requests as single line JSON records, e.g. to find out
+    where the time of slow flushes goes without tracing every request under production load. The records are written
+    by a background thread, so the flush path only takes the timings and queues the record. When the queue is full
+    new records are dropped. Once the file is larger than max_file_size it is renamed to path.1, replacing
+    the previous one, and a new file is started.
+
+    The record of a request:
+    {"time": ..., "endpoint": ..., "namespace": ..., "batch_size": ..., "status": ..., "error": ...,
+     "timings_ms": {"encode": ..., "sign": ..., "connect": ..., "ttfb": ..., "total": ...}, "request": ...}
+
+    The access key, the session token and the signature are redacted from the request, "connect" is 0 for requests
+    sent over a kept-alive connection and the timings not measured by the transport are null.
+
+    Keyword arguments:
+    path -- the path of the trace file
+    sample_rate -- the fraction of the requests which are traced, between 0 and 1
+    max_file_size -- the size in bytes after which the file is rotated (default 10 MB)
+    max_queued_records -- the maximum number of records waiting for the writer thread (default 1000)
+    """
+    _LOGGER = get_logger(__name__)
+    _DEFAULT_MAX_FILE_SIZE = 10 * 1024 * 1024
+    _DEFAULT_MAX_QUEUED_RECORDS = 1000
+    _ROTATED_FILE_SUFFIX = ".1"
+    _THREAD_NAME = "cloudwatch-request-tracer"
+    _REDACTED_PARAMETERS_PATTERN = re.compile(r"(X-Amz-Credential|X-Amz-Security-Token|X-Amz-Signature)=[^&]*")
+    _REDACTED_VALUE = "REDACTED"
+
+    def __init__(self, path, sample_rate, max_file_size=_DEFAULT_MAX_FILE_SIZE, max_queued_records=_DEFAULT_MAX_QUEUED_RECORDS):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.max_file_size = max_file_size
+        self.max_queued_records = max_queued_records
+        self.dropped_record_count = 0
+        self._random = random.Random()
+        self._queue = deque()
+        self._busy = False
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=self._THREAD_NAME)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def start_trace(self, endpoint, namespace, batch_size):
+        """
+        Starts the trace of a request with the probability defined by the sample rate.
+
+        Returns:
+            the RequestTrace of the request, or None if the request is not sampled
+        """
+        if self._closed or self._random.random() >= self.sample_rate:
+            return None
+        return RequestTrace(self, endpoint, namespace, batch_size)
+
+    def record(self, record):
+        """ Queues the record for the writer thread without waiting for the file """
+        with self._condition:
+            if self._closed:
+                return
+            if len(self._queue) >= self.max_queued_records:
+                self.dropped_record_count += 1
+                return
+            self._queue.append(record)
+            self._condition.notify_all()
+
+    def redact(self, request):
+        """ Returns the querystring of the request without the credentials and the signature """
+        return self._REDACTED_PARAMETERS_PATTERN.sub(r"\1=" + self._REDACTED_VALUE, request)
+
+    def wait_until_empty(self, timeout=None):
+        """ Returns True if all queued records were written within the timeout, False otherwise """
+        deadline = None if timeout is None else clock.monotonic() + timeout
+        with self._condition:
+            while self._queue or self._busy:
+                remaining = None if deadline is None else deadline - clock.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self, timeout=None):
+        """ Waits up to timeout seconds for the queued records to be written, then drops the remaining ones and stops the writer """
+        self.wait_until_empty(timeout)
+        with self._condition:
+            self._closed = True
+            self._queue.clear()
+            self._condition.notify_all()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                records = list(self._queue)
+                self._queue.clear()
+                self._busy = True
+            try:
+                self._write(records)
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
+
+    def _write(self, records):
+        try:
+            lines = "".join(json.dumps(record, separators=(",", ":"), sort_keys=True) + "\n" for record in records)
+            self._rotate_if_need()
+            with open(self.path, "a") as trace_file:
+                trace_file.write(lines)
+        except Exception as e:
+            self._LOGGER.warning("Could not write request traces to the following file: '" + self.path + "'. [Exception: " + str(e) + "]")
+
+    def _rotate_if_need(self):
+        if os.path.isfile(self.path) and os.path.getsize(self.path) > self.max_file_size:
+            os.rename(self.path, self.path + self._ROTATED_FILE_SUFFIX)
+
+
+class RequestTrace(object):
+    """
+    The trace of a single sampled request. The request builder marks the end of the encode and sign phases,
+    the connect and time to first byte timings are taken from the Response of the transport.
+    """
+
+    def __init__(self, tracer, endpoint, namespace, batch_size):
+        self.tracer = tracer
+        self.endpoint = endpoint
+        self.namespace = namespace
+        self.batch_size = batch_size
+        self.timings = {}
+        self._start_time = clock.monotonic()
+        self._mark_time = self._start_time
+
+    def mark(self, phase):
+        """ Records the time elapsed since the previous mark, or since the start of the trace, as the duration of the phase """
+        current_time = clock.monotonic()
+        self.timings[phase] = current_time - self._mark_time
+        self._mark_time = current_time
+
+    def finish(self, request, response=None, error=None):
+        """ Queues the record of the request with the status of the response, or of the HTTP error, to the tracer """
+        total_time = clock.monotonic() - self._start_time
+        response = response if response is not None else getattr(error, "response", None)
+        timings = {
+            "encode": self.timings.get("encode"),
+            "sign": self.timings.get("sign"),
+            "connect": getattr(response, "connect_time", None),
+            "ttfb": getattr(response, "first_byte_time", None),
+            "total": total_time
+        }
+        self.tracer.record({
+            "time": round(time.time(), 3),
+            "endpoint": self.endpoint,
+            "namespace": self.namespace,
+            "batch_size": self.batch_size,
+            "status": response.status_code if response is not None else None,
+            "error": str(error) if error is not None else None,
+            "timings_ms": dict((phase, round(value * 1000, 3) if value is not None else None) for phase, value in timings.items()),
+            "request": self.tracer.redact(request or "")
+        })
@@ -2,6 +2,8 @@ import hmac
 
 from hashlib import sha256
 
+from ..compat import to_bytes
+
 
 class Signer(object):
     """
@@ -44,7 +46,7 @@ class Signer(object):
         return self.algorithm + "\n" + aws_timestamp + '\n' + credential_scope + '\n' + self._hash(canonical_request)
 
     def _hash(self, data):
-        return sha256(data).hexdigest()
+        return sha256(to_bytes(data)).hexdigest()
     
     def _sign(self, key, msg):
         return hmac.new(key, msg.encode("utf-8"), sha256).digest()
@@ -0,0 +1,126 @@
+import calendar
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+from .. import clock
+from ..awscredentials import AWSCredentials
+from ..plugininfo import PLUGIN_NAME, PLUGIN_VERSION
+from ..logger.logger import get_logger
+from .stsrequestbuilder import STSRequestBuilder
+from .transport import HTTPTransport
+
+
+class STSClient(object):
+    """
+    This is a simple HTTPClient wrapper which supports the AssumeRole operation on regional STS endpoints.
+
+    Keyword arguments:
+    region -- the region of the STS endpoint
+    proxy_server -- the 'host[:port]' of the proxy server used for HTTPS requests (default None)
+    connection_timeout -- the amount of time in seconds to wait for extablishing server connection
+    response_timeout -- the amount of time in seconds to wait for the server response
+    transport -- the transport used to send requests (default HTTPTransport with persistent connections)
+    """
+
+    _LOGGER = get_logger(__name__)
+    _DEFAULT_CONNECTION_TIMEOUT = 1
+    _DEFAULT_RESPONSE_TIMEOUT = 3
+    _TOTAL_RETRIES = 1
+    _NAMESPACES = {"sts": "https://sts.amazonaws.com/doc/2011-06-15/"}
+    _CREDENTIALS_PATH = "sts:AssumeRoleResult/sts:Credentials/sts:"
+    _EXPIRATION_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+    def __init__(self, region, proxy_server=None, connection_timeout=_DEFAULT_CONNECTION_TIMEOUT,
+                 response_timeout=_DEFAULT_RESPONSE_TIMEOUT, transport=None):
+        self.request_builder = STSRequestBuilder(None, region)
+        self.endpoint = self.get_regional_endpoint(region)
+        self.timeout = (connection_timeout, response_timeout)
+        self.transport = transport or HTTPTransport(max_retries=self._TOTAL_RETRIES, proxy_server=proxy_server)
+
+    @staticmethod
+    def get_regional_endpoint(region):
+        """ Returns the URL of the regional STS endpoint """
+        if region == "localhost":
+            return "http://" + region + "/"
+        elif region.startswith("cn-"):
+            return "https://sts." + region + ".amazonaws.com.cn/"
+        return "https://sts." + region + ".amazonaws.com/"
+
+    def assume_role(self, credentials, role_arn, session_name, external_id=None):
+        """
+        Assumes the role with the credentials passed as parameter.
+
+        Returns:
+            the (AWSCredentials, expiration) tuple of the temporary credentials of the role, the expiration is
+            expressed in seconds since the epoch
+        """
+        request_map = {"RoleArn": role_arn, "RoleSessionName": session_name}
+        if external_id:
+            request_map["ExternalId"] = external_id
+        self.request_builder.credentials = credentials
+        self.request_builder.signer.credentials = credentials
+        request = self.request_builder.create_signed_request(request_map)
+        result = self.transport.get(self.endpoint + "?" + request, headers=self._get_custom_headers(), timeout=self.timeout)
+        result.raise_for_status()
+        return self._parse_credentials(result.content)
+
+    def _parse_credentials(self, xml_content):
+        xmldoc = ET.fromstring(xml_content)
+        values = {}
+        for key in ("AccessKeyId", "SecretAccessKey", "SessionToken", "Expiration"):
+            element = xmldoc.find(self._CREDENTIALS_PATH + key, self._NAMESPACES)
+            if element is None or not element.text:
+                raise ValueError("The AssumeRole response does not contain " + key)
+            values[key] = element.text.strip()
+        expiration = calendar.timegm(time.strptime(values["Expiration"][:19], self._EXPIRATION_FORMAT))
+        return AWSCredentials(values["AccessKeyId"], values["SecretAccessKey"], values["SessionToken"]), expiration
+
+    def _get_custom_headers(self):
+        """ Returns dictionary of HTTP headers to be attached to each request """
+        return {"User-Agent": PLUGIN_NAME + "/" + str(PLUGIN_VERSION)}
+
+
+class AssumedRoleCredentials(object):
+    """
+    The assumed role credentials keep the temporary credentials of a role and assume the role again shortly before
+    the credentials expire. If the role cannot be assumed, the previous credentials are used and the role is
+    assumed again after the retry interval.
+
+    Keyword arguments:
+    sts_client -- the STSClient sending the AssumeRole requests
+    role_arn -- the ARN of the assumed role
+    external_id -- the external ID required by the trust policy of the role (default None)
+    """
+    _LOGGER = get_logger(__name__)
+    SESSION_NAME = PLUGIN_NAME
+    _REFRESH_LEAD_IN_SECONDS = 300
+    _RETRY_INTERVAL_IN_SECONDS = 60
+
+    def __init__(self, sts_client, role_arn, external_id=None):
+        self.sts_client = sts_client
+        self.role_arn = role_arn
+        self.external_id = external_id
+        self._credentials = None
+        self._refresh_time = None
+        self._lock = threading.Lock()
+
+    def get_credentials(self, source_credentials):
+        """
+        Returns the temporary credentials of the role, assumed with the source credentials when the
+        current credentials are about to expire.
+        """
+        with self._lock:
+            if self._refresh_time is None or clock.monotonic() >= self._refresh_time:
+                self._assume_role(source_credentials)
+            return self._credentials
+
+    def _assume_role(self, source_credentials):
+        try:
+            self._credentials, expiration = self.sts_client.assume_role(source_credentials, self.role_arn, self.SESSION_NAME, self.external_id)
+            lifetime = expiration - time.time()
+            self._refresh_time = clock.monotonic() + max(lifetime - self._REFRESH_LEAD_IN_SECONDS, self._RETRY_INTERVAL_IN_SECONDS)
+        except Exception as e:
+            self._refresh_time = clock.monotonic() + self._RETRY_INTERVAL_IN_SECONDS
+            self._LOGGER.warning("Could not assume role '" + self.role_arn + "'" + (", using the previous credentials" if self._credentials else "") +
+                                 ". [Exception: " + str(e) + "]")
@@ -0,0 +1,365 @@
+import base64
+import select
+import socket
+import ssl
+import threading
+
+from ..clock import monotonic
+from ..compat import httplib, urlsplit, quote, unquote, getproxies, proxy_bypass, to_bytes, to_str
+from ..logger.logger import get_logger
+
+try:
+    import certifi
+except ImportError:
+    certifi = None
+
+
+class BaseHTTPTransport(object):
+    """
+    The base of the HTTP transports resolves the route of every endpoint, i.e. whether its requests are sent directly
+    or through a proxy, and provides the TLS context verifying server certificates. Routes are resolved once per
+    scheme and host. Subclasses send the requests.
+
+    HTTPS requests are sent through the proxy with CONNECT and server certificates are always verified,
+    using the certifi bundle when it is installed and the system certificates otherwise.
+
+    Keyword arguments:
+    max_retries -- the number of times a request failing with a connection error or timeout is retried (default 0)
+    proxy_server -- the 'host[:port]' or URL of the proxy server used for HTTPS requests,
+                    if not set the https_proxy and http_proxy environment variables are used (default None)
+    """
+    _LOGGER = get_logger(__name__)
+    _DEFAULT_PORTS = {"http": 80, "https": 443}
+    _DEFAULT_PROXY_PORT = 80
+    _MAX_IDLE_CONNECTIONS_PER_HOST = 4
+
+    def __init__(self, max_retries=0, proxy_server=None):
+        self.max_retries = max_retries
+        self.proxy_server = proxy_server
+        self._idle_connections = {}
+        self._routes = {}
+        self._ssl_context = None
+        self.address_cache = AddressCache()
+
+    def _get_ssl_context(self):
+        if self._ssl_context is None:
+            self._ssl_context = ssl.create_default_context(cafile=certifi.where() if certifi else None)
+        return self._ssl_context
+
+    def _get_route(self, url):
+        """ Returns the Route of the URL, routes are resolved once per scheme and host """
+        parts = urlsplit(url)
+        route = self._routes.get((parts.scheme, parts.netloc))
+        if route is None:
+            route = self._create_route(parts)
+            self._routes[(parts.scheme, parts.netloc)] = route
+        return route
+
+    def _create_route(self, parts):
+        if parts.scheme not in self._DEFAULT_PORTS:
+            raise ConnectionException("Unsupported URL scheme: '" + parts.scheme + "'")
+        port = parts.port or self._DEFAULT_PORTS[parts.scheme]
+        proxy_url = self._get_proxy_url(parts.scheme, parts.hostname)
+        if not proxy_url:
+            return Route(parts.scheme, parts.hostname, port)
+        if "://" not in proxy_url:
+            proxy_url = "http://" + proxy_url
+        proxy = urlsplit(proxy_url)
+        proxy_headers = {}
+        if proxy.username:
+            credentials = unquote(proxy.username) + ":" + unquote(proxy.password or "")
+            proxy_headers["Proxy-Authorization"] = "Basic " + to_str(base64.b64encode(to_bytes(credentials)))
+        self._LOGGER.info("Using proxy server " + proxy.hostname + " for " + parts.scheme + "://" + parts.netloc)
+        return Route(parts.scheme, parts.hostname, port, (proxy.hostname, proxy.port or self._DEFAULT_PROXY_PORT), proxy_headers)
+
+    def _get_proxy_url(self, scheme, host):
+        if scheme == "https" and self.proxy_server:
+            return self.proxy_server
+        if proxy_bypass(host):
+            return None
+        return getproxies().get(scheme)
+
+
+class HTTPTransport(BaseHTTPTransport):
+    """
+    The HTTP transport sends requests over persistent connections of the standard library httplib module.
+    It replaces requests.Session, which merges headers, prepares the request and resolves proxy settings again
+    for every request. The connection, the TLS context and the proxy of every endpoint are set up only once
+    and the connection is kept alive between requests.
+    Any object providing the request and prewarm methods can be passed to the clients instead of the HTTPTransport.
+
+    Endpoint addresses are resolved through the AddressCache, and prewarm opens or validates the connection
+    to an endpoint ahead of a request, so that the request itself starts on an established connection.
+
+    Keyword arguments:
+    max_retries -- the number of times a request failing with a connection error or timeout is retried (default 0)
+    proxy_server -- the 'host[:port]' or URL of the proxy server used for HTTPS requests,
+                    if not set the https_proxy and http_proxy environment variables are used (default None)
+    """
+
+    def __init__(self, max_retries=0, proxy_server=None):
+        super(HTTPTransport, self).__init__(max_retries, proxy_server)
+        self._lock = threading.Lock()
+
+    def get(self, url, headers=None, timeout=None):
+        return self.request("GET", url, headers=headers, timeout=timeout)
+
+    def put(self, url, headers=None, timeout=None):
+        return self.request("PUT", url, headers=headers, timeout=timeout)
+
+    def request(self, method, url, headers=None, body=None, timeout=None):
+        """
+        Sends the request and reads the whole response.
+
+        Keyword arguments:
+        method -- the HTTP method
+        url -- the absolute URL of the request
+        headers -- the dictionary of request headers (default None)
+        body -- the request body (default None)
+        timeout -- the (connection timeout, response timeout) tuple or a single timeout in seconds for both (default None)
+
+        Returns:
+            the Response object
+
+        Raises:
+            ConnectionException if the request still fails after all retries
+        """
+        route = self._get_route(url)
+        connect_timeout, response_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        headers = dict(headers or {})
+        headers.update(route.extra_headers)
+        attempt = 0
+        while True:
+            start_time = monotonic()
+            connection, reused = self._acquire_connection(route, connect_timeout)
+            try:
+                if not reused:
+                    self._connect(connection)
+                sent_time = monotonic()
+                connection.sock.settimeout(response_timeout)
+                connection.request(method, route.get_request_target(url), body, headers)
+                response = connection.getresponse()
+                first_byte_time = monotonic() - sent_time
+                result = Response(response.status, response.reason, response.getheaders(), response.read())
+                result.connect_time = sent_time - start_time if not reused else 0.0
+                result.first_byte_time = first_byte_time
+            except ssl.CertificateError as e:
+                connection.close()
+                raise ConnectionException("Certificate of " + route.host + " is not valid: " + str(e))
+            except (socket.error, httplib.HTTPException) as e:
+                connection.close()
+                if reused and not isinstance(e, socket.timeout):
+                    # the server closed the idle keep-alive connection, which does not count as a retry
+                    continue
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise ConnectionException("Request to " + route.host + " failed after " + str(attempt) + " attempt(s): " + repr(e))
+                continue
+            self._release_connection(route, connection, response.will_close)
+            return result
+
+    def prewarm(self, url, timeout=None):
+        """
+        Makes sure that an idle connection to the endpoint of the URL is open, so the next request does not wait
+        for name resolution and the TCP and TLS handshakes. Idle connections closed by the server are replaced.
+
+        Keyword arguments:
+        url -- the URL of the next request
+        timeout -- the connection timeout in seconds (default None)
+
+        Returns:
+            True if an open connection is ready, False if the connection could not be opened
+        """
+        try:
+            route = self._get_route(url)
+            with self._lock:
+                connections = self._idle_connections.get(route.key, [])
+                closed_connections = [connection for connection in connections if not self._is_open(connection)]
+                self._idle_connections[route.key] = [connection for connection in connections if connection not in closed_connections]
+                is_ready = bool(self._idle_connections[route.key])
+            for connection in closed_connections:
+                connection.close()
+            if not is_ready:
+                connection = self._create_connection(route, timeout)
+                self._connect(connection)
+                self._release_connection(route, connection, False)
+            return True
+        except (socket.error, httplib.HTTPException, ssl.CertificateError, ConnectionException) as e:
+            self._LOGGER.warning("Cannot open connection to " + url + " ahead of the request. Cause: " + str(e))
+            return False
+
+    def close(self):
+        """ Closes all idle connections """
+        with self._lock:
+            idle_connections, self._idle_connections = self._idle_connections, {}
+        for connections in idle_connections.values():
+            for connection in connections:
+                connection.close()
+
+    def _acquire_connection(self, route, connect_timeout):
+        """ Returns an idle connection to the route or a new, not yet connected one, and whether the connection is reused """
+        with self._lock:
+            connections = self._idle_connections.get(route.key)
+            if connections:
+                return connections.pop(), True
+        return self._create_connection(route, connect_timeout), False
+
+    def _connect(self, connection):
+        connection.connect()
+        # like urllib3, do not delay small writes waiting for the ACK of the previous segment
+        connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _is_open(self, connection):
+        """ An idle connection which became readable was closed by the server (or sent unexpected data) """
+        if connection.sock is None:
+            return False
+        try:
+            readable, _, _ = select.select([connection.sock], [], [], 0)
+        except (select.error, socket.error, ValueError):
+            return False
+        return not readable
+
+    def _release_connection(self, route, connection, will_close):
+        if not will_close:
+            with self._lock:
+                connections = self._idle_connections.setdefault(route.key, [])
+                if len(connections) < self._MAX_IDLE_CONNECTIONS_PER_HOST:
+                    connections.append(connection)
+                    return
+        connection.close()
+
+    def _create_connection(self, route, connect_timeout):
+        host, port = route.proxy or (route.host, route.port)
+        if route.scheme != "https":
+            connection = httplib.HTTPConnection(host, port, timeout=connect_timeout)
+        else:
+            connection = httplib.HTTPSConnection(host, port, timeout=connect_timeout, context=self._get_ssl_context())
+            if route.proxy:
+                connection.set_tunnel(route.host, route.port, route.tunnel_headers)
+        connection._create_connection = self._open_socket
+        return connection
+
+    def _open_socket(self, address, timeout=None, source_address=None):
+        """ Replaces socket.create_connection in the connections to connect to the addresses cached by the AddressCache """
+        host, port = address
+        error = socket.error("No address found for " + str(host))
+        for family, socket_type, protocol, _, socket_address in self.address_cache.resolve(host, port):
+            sock = None
+            try:
+                sock = socket.socket(family, socket_type, protocol)
+                if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                    sock.settimeout(timeout)
+                if source_address:
+                    sock.bind(source_address)
+                sock.connect(socket_address)
+                return sock
+            except socket.error as e:
+                error = e
+                if sock is not None:
+                    sock.close()
+        self.address_cache.expire(host, port)
+        raise error
+
+class AddressCache(object):
+    """
+    The address cache keeps the addresses resolved for every host for ttl_in_seconds, so connections do not wait
+    for the resolver each time they are opened. When the resolver fails, the last addresses resolved for the host
+    are used for up to max_stale_in_seconds.
+
+    Keyword arguments:
+    ttl_in_seconds -- the time in seconds for which resolved addresses are used without resolving them again (default 60)
+    max_stale_in_seconds -- the time in seconds for which resolved addresses are used while the resolver fails (default 3600)
+    """
+    _LOGGER = get_logger(__name__)
+
+    def __init__(self, ttl_in_seconds=60, max_stale_in_seconds=3600):
+        self.ttl_in_seconds = ttl_in_seconds
+        self.max_stale_in_seconds = max_stale_in_seconds
+        self._entries = {}
+
+    def resolve(self, host, port):
+        """ Returns the getaddrinfo entries of the host and port """
+        key = (host, port)
+        entry = self._entries.get(key)
+        current_time = monotonic()
+        if entry and current_time - entry[0] < self.ttl_in_seconds:
+            return entry[1]
+        try:
+            addresses = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        except socket.error as e:
+            if entry and current_time - entry[0] < self.max_stale_in_seconds:
+                self._LOGGER.warning("Cannot resolve " + str(host) + ", using the addresses resolved " +
+                                     str(int(current_time - entry[0])) + " seconds ago. Cause: " + str(e))
+                return entry[1]
+            raise
+        self._entries[key] = (current_time, addresses)
+        return addresses
+
+    def expire(self, host, port):
+        """ Makes the next connection resolve the host again, the expired addresses are still used if the resolver fails """
+        entry = self._entries.get((host, port))
+        if entry:
+            self._entries[(host, port)] = (min(entry[0], monotonic() - self.ttl_in_seconds), entry[1])
+
+
+class Route(object):
+    """
+    The route describes how requests reach a single endpoint: directly, through the proxy with CONNECT (HTTPS)
+    or as a request for the absolute URL sent to the proxy (HTTP).
+    """
+    _URL_SAFE_CHARACTERS = "!#$%&'()*+,/:;=?@[]~"
+
+    def __init__(self, scheme, host, port, proxy=None, proxy_headers=None):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.proxy = proxy
+        self.key = (scheme, host, port)
+        self.tunnel_headers = proxy_headers if proxy and scheme == "https" else None
+        self.extra_headers = proxy_headers if proxy and scheme == "http" else {}
+        self.host_header = host if port == HTTPTransport._DEFAULT_PORTS[scheme] else host + ":" + str(port)
+
+    def get_request_target(self, url):
+        """ Returns the request target with characters not allowed in URLs quoted, the same way requests does """
+        if self.proxy and self.scheme == "http":
+            return quote(url, safe=self._URL_SAFE_CHARACTERS)
+        parts = urlsplit(url)
+        target = (parts.path or "/") + ("?" + parts.query if parts.query else "")
+        return quote(target, safe=self._URL_SAFE_CHARACTERS)
+
+
+class Response(object):
+    """
+    The response of the HTTPTransport with the attributes used by the clients, following the requests.Response names.
+    The transports also set the time in seconds spent opening the connection, 0 for a kept-alive connection,
+    and the time from sending the request to receiving the response headers, None if they were not measured.
+    """
+
+    def __init__(self, status_code, reason, headers, content):
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = dict(headers)
+        self.content = content
+        self.connect_time = None
+        self.first_byte_time = None
+
+    @property
+    def text(self):
+        return to_str(self.content)
+
+    def raise_for_status(self):
+        """ Raises HTTPStatusException if the response has a client or server error status """
+        if 400 <= self.status_code < 600:
+            kind = "Client Error" if self.status_code < 500 else "Server Error"
+            raise HTTPStatusException(str(self.status_code) + " " + kind + ": " + str(self.reason), self)
+
+
+class ConnectionException(Exception):
+    pass
+
+
+class HTTPStatusException(Exception):
+
+    def __init__(self, message, response):
+        super(HTTPStatusException, self).__init__(message)
+        self.response = response
@@ -0,0 +1,96 @@
+"""
+The clock module provides the time sources used by the plugin: a monotonic clock for scheduling flushes,
+which is not affected when the wall clock is stepped by NTP, alignment of flushes to wall clock boundaries,
+and the AWS timestamp formatting memoized per second.
+"""
+import ctypes
+import ctypes.util
+import threading
+import time
+
+AWS_TIMESTAMP_FORMAT = '%Y%m%dT%H%M%SZ'
+_CLOCK_MONOTONIC = 1
+_MAX_CACHED_TIMESTAMPS = 256
+_timestamp_cache = {}
+
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+
+def _load_clock_gettime():
+    """ Returns the clock_gettime function of the C library, or None if it is not available """
+    for library_name in ("rt", "c"):
+        try:
+            clock_gettime = ctypes.CDLL(ctypes.util.find_library(library_name), use_errno=True).clock_gettime
+            clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_Timespec)]
+            if clock_gettime(_CLOCK_MONOTONIC, ctypes.byref(_Timespec())) == 0:
+                return clock_gettime
+        except (OSError, AttributeError, TypeError):
+            continue
+    return None
+
+
+class _NonDecreasingClock(object):
+    """ The last resort replacement of a monotonic clock, the wall clock which never goes backwards """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_time = time.time()
+
+    def __call__(self):
+        with self._lock:
+            self._last_time = max(self._last_time, time.time())
+            return self._last_time
+
+
+def _get_monotonic_clock():
+    if hasattr(time, "monotonic"):
+        return time.monotonic
+    clock_gettime = _load_clock_gettime()
+    if clock_gettime is None:
+        return _NonDecreasingClock()
+
+    def monotonic():
+        timespec = _Timespec()
+        clock_gettime(_CLOCK_MONOTONIC, ctypes.byref(timespec))
+        return timespec.tv_sec + timespec.tv_nsec * 1e-9
+    return monotonic
+
+
+monotonic = _get_monotonic_clock()
+
+
+def get_boundary_offset(interval, wall_time=None, phase=0):
+    """
+    Returns the signed number of seconds the wall time is past the nearest wall clock boundary,
+    which is a multiple of the interval shifted by the phase, e.g. the start of a minute for a 60 seconds interval.
+    The offset is in the range (-interval / 2, interval / 2].
+    """
+    if interval <= 0:
+        return 0
+    wall_time = time.time() if wall_time is None else wall_time
+    offset = (wall_time - phase) % interval
+    if offset > interval / 2.0:
+        offset -= interval
+    return offset
+
+
+def get_aws_timestamp(epoch_time=None):
+    """
+    Returns the time (default current date-time) in the format YYYYMMDDThhmmssZ.
+    The formatted timestamps of recently used seconds are memoized.
+    """
+    second = int(time.time() if epoch_time is None else epoch_time)
+    timestamp = _timestamp_cache.get(second)
+    if timestamp is None:
+        if len(_timestamp_cache) >= _MAX_CACHED_TIMESTAMPS:
+            _timestamp_cache.clear()
+        timestamp = time.strftime(AWS_TIMESTAMP_FORMAT, time.gmtime(second))
+        _timestamp_cache[second] = timestamp
+    return timestamp
+
+
+def get_datestamp(epoch_time=None):
+    """ Returns the date (default current date) in the format YYYYMMDD """
+    return get_aws_timestamp(epoch_time)[:8]
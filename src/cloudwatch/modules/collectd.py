@@ -11,6 +11,12 @@ def register_init(*args):
 def register_write(*args, **kwargs):
     pass
 
+def register_flush(*args, **kwargs):
+    pass
+
+def register_shutdown(*args, **kwargs):
+    pass
+
 def debug(msg):
     pass
 
@@ -0,0 +1,42 @@
+"""
+The compat module hides the differences between the Python 2 and Python 3 standard libraries,
+so that the plugin runs on both versions of the collectd python plugin.
+"""
+import sys
+
+PY3 = sys.version_info[0] >= 3
+
+if PY3:
+    import http.client as httplib
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlencode, urlsplit, quote, unquote
+    from urllib.request import getproxies, proxy_bypass
+
+    text_type = str
+
+    def iteritems(dictionary):
+        return iter(dictionary.items())
+else:
+    import httplib
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib import urlencode, quote, unquote, getproxies, proxy_bypass
+    from urlparse import urlsplit
+
+    text_type = unicode
+
+    def iteritems(dictionary):
+        return dictionary.iteritems()
+
+
+def to_bytes(value):
+    """ Returns the string encoded as UTF-8 bytes, byte strings are returned unchanged """
+    return value if isinstance(value, bytes) else value.encode("utf-8")
+
+
+def to_str(value):
+    """ Returns the native string of the UTF-8 bytes or text, native strings are returned unchanged """
+    if isinstance(value, str):
+        return value
+    return value.decode("utf-8", "replace") if PY3 else value.encode("utf-8")
@@ -1,10 +1,17 @@
 import os
+import re
 from ..logger.logger import get_logger
-from configreader import ConfigReader
-from metadatareader import MetadataReader
-from credentialsreader import CredentialsReader
-from whitelist import Whitelist, WhitelistConfigReader
+from .configreader import ConfigReader
+from .metadatareader import MetadataReader
+from .credentialsreader import CredentialsReader
+from .whitelist import Whitelist, WhitelistConfigReader
+from .rollup import Rollups, RollupConfigReader
+from .targets import TargetConfigReader
 from ..client.ec2getclient import EC2GetClient
+from ..client.emfclient import EMFClient
+from ..client.congestion import AIMDController
+from ..client.circuitbreaker import CircuitBreaker
+from ..changesuppressor import ChangeSuppressor
 import traceback
 
 class ConfigHelper(object):
@@ -30,6 +37,22 @@ class ConfigHelper(object):
     _METADATA_SERVICE_ADDRESS = 'http://169.254.169.254/' 
     WHITELIST_CONFIG_PATH = _DEFAULT_AGENT_ROOT_FOLDER + 'whitelist.conf'
     BLOCKED_METRIC_PATH = _DEFAULT_AGENT_ROOT_FOLDER + 'blocked_metrics'
+    ROLLUP_CONFIG_PATH = _DEFAULT_AGENT_ROOT_FOLDER + 'rollup.conf'
+    TARGETS_CONFIG_PATH = _DEFAULT_AGENT_ROOT_FOLDER + 'targets.conf'
+    SNAPSHOT_PATH = _DEFAULT_AGENT_ROOT_FOLDER + 'aggregation_snapshot'
+    QUARANTINED_METRIC_PATH = _DEFAULT_AGENT_ROOT_FOLDER + 'quarantined_metrics'
+    JSONL_PATH = _DEFAULT_AGENT_ROOT_FOLDER + 'published_metrics.jsonl'
+    TRACE_PATH = _DEFAULT_AGENT_ROOT_FOLDER + 'request_trace.jsonl'
+    _DEFAULT_SHUTDOWN_DRAIN_TIMEOUT_IN_SECONDS = 5
+    _DEFAULT_MAX_CONCURRENT_PUT_REQUESTS = 8
+    CLOUDWATCH_OUTPUT_MODE = "cloudwatch"
+    EMF_OUTPUT_MODE = "emf"
+    _DEFAULT_EMF_ENDPOINT = "tcp://127.0.0.1:25888"
+    JSONL_SINK = "jsonl"
+    _DEFAULT_MAX_QUEUED_BATCHES_PER_SINK = 1000
+    _DEFAULT_PROMETHEUS_LISTEN_HOST = "127.0.0.1"
+    _DEFAULT_TRACE_SAMPLE_RATE = 0.01
+    _ENDPOINT_URL_PATTERN = r"^https?://(\[[0-9a-fA-F:.]+\]|[^/?#\s:\[\]]+)(:\d+)?(/[^?#\s]*)?$"
 
     def __init__(self, config_path=_DEFAULT_CONFIG_PATH, metadata_server=_METADATA_SERVICE_ADDRESS):
         self._config_path = config_path
@@ -49,8 +72,37 @@ class ConfigHelper(object):
         self.constant_dimension_value = ''
         self.enable_high_resolution_metrics = False
         self.flush_interval_in_seconds = ''
+        self.max_series_per_plugin = 0
+        self.max_series_per_plugin_overrides = {}
+        self.suppress_unchanged_metrics = False
+        self.suppression_heartbeat_intervals = ChangeSuppressor.DEFAULT_HEARTBEAT_INTERVALS
+        self.shutdown_drain_timeout_in_seconds = self._DEFAULT_SHUTDOWN_DRAIN_TIMEOUT_IN_SECONDS
+        self.snapshot_path = self.SNAPSHOT_PATH
+        self.quarantined_metric_path = self.QUARANTINED_METRIC_PATH
+        self.cache_memory_budget_in_mb = 0
+        self.async_flush_pipeline = False
+        self.max_concurrent_put_requests = self._DEFAULT_MAX_CONCURRENT_PUT_REQUESTS
+        self.output_mode = self.CLOUDWATCH_OUTPUT_MODE
+        self.emf_endpoint = self._DEFAULT_EMF_ENDPOINT
+        self.sinks = []
+        self.jsonl_path = self.JSONL_PATH
+        self.max_queued_batches_per_sink = self._DEFAULT_MAX_QUEUED_BATCHES_PER_SINK
+        self.prometheus_listen_address = None
+        self.congestion_control = False
+        self.min_concurrent_put_requests = AIMDController.DEFAULT_MIN_CONCURRENCY
+        self.min_put_requests_per_second = AIMDController.DEFAULT_MIN_RATE
+        self.max_put_requests_per_second = AIMDController.DEFAULT_MAX_RATE
+        self.failover_endpoints = []
+        self.circuit_breaker_failure_threshold = CircuitBreaker.DEFAULT_FAILURE_THRESHOLD
+        self.circuit_breaker_probe_interval_in_seconds = CircuitBreaker.DEFAULT_PROBE_INTERVAL_IN_SECONDS
+        self.publish_targets = []
+        self.trace_sample_rate = self._DEFAULT_TRACE_SAMPLE_RATE
+        self.trace_path = self.TRACE_PATH
+        self._credentials = None
         self._load_configuration()
-        self.whitelist = Whitelist(WhitelistConfigReader(self.WHITELIST_CONFIG_PATH, self.pass_through).get_regex_list(), self.BLOCKED_METRIC_PATH)
+        whitelist_reader = WhitelistConfigReader(self.WHITELIST_CONFIG_PATH, self.pass_through)
+        self.whitelist = Whitelist(whitelist_reader.get_regex_list(), self.BLOCKED_METRIC_PATH, whitelist_reader.get_rule_options())
+        self.rollups = Rollups(RollupConfigReader(self.ROLLUP_CONFIG_PATH).get_rules())
 
     @property
     def credentials(self):
@@ -74,23 +126,62 @@ class ConfigHelper(object):
         self.config_reader = ConfigReader(self._config_path)
         self.credentials_reader = CredentialsReader(self._get_credentials_path())
         self.metadata_reader = MetadataReader(self._metadata_server)
-        self._load_credentials()
+        self._load_output_mode()
+        self._load_emf_endpoint()
+        self._load_sinks()
+        self._load_publish_targets()
+        self._load_prometheus_listen_address()
+        if self.publishes_to_cloudwatch() or self._publish_targets_use_plugin_credentials():
+            self._load_credentials()
         self._load_region()
         self._load_hostname()
         self._load_proxy_server_name()
         self._load_proxy_server_port()
         self.enable_high_resolution_metrics = self.config_reader.enable_high_resolution_metrics
         self._load_flush_interval_in_seconds()
+        self._load_max_series_per_plugin()
+        self._load_suppression_heartbeat_intervals()
+        self.suppress_unchanged_metrics = self.config_reader.suppress_unchanged_metrics
+        self._load_shutdown_drain_timeout_in_seconds()
+        self._load_cache_memory_budget_in_mb()
+        self._load_async_flush_pipeline()
+        self._load_max_concurrent_put_requests()
+        self.congestion_control = self.config_reader.congestion_control
+        self._load_congestion_control_bounds()
         self._set_endpoint()
+        self._load_endpoints()
+        self._load_circuit_breaker()
         self._set_ec2_endpoint()
-        self._load_autoscaling_group()
+        self.push_asg = self.config_reader.push_asg
+        if self.publishes_to_cloudwatch():
+            self._load_autoscaling_group()
+        elif self.push_asg:
+            self._LOGGER.warning("The auto scaling group cannot be retrieved without AWS credentials when no output publishes to CloudWatch, NONE is published instead")
         self.debug = self.config_reader.debug
+        self._load_request_trace()
         self.pass_through = self.config_reader.pass_through
-        self.push_asg = self.config_reader.push_asg
         self.push_constant = self.config_reader.push_constant
         self.constant_dimension_value = self.config_reader.constant_dimension_value
         self._check_configuration_integrity()
     
+    def is_emf_output_mode(self):
+        """ Returns True if metrics are published as Embedded Metric Format documents instead of PutMetricData requests """
+        return self.output_mode == self.EMF_OUTPUT_MODE
+
+    def is_request_trace_enabled(self):
+        """ Returns True if a sample of the PutMetricData requests is recorded to the request trace file """
+        return bool(self.debug) and self.trace_sample_rate > 0
+
+    def publishes_to_cloudwatch(self):
+        """ Returns True if metrics are published with signed PutMetricData requests, which require AWS credentials """
+        if self.sinks:
+            return self.CLOUDWATCH_OUTPUT_MODE in self.sinks
+        return not self.is_emf_output_mode()
+
+    def _publish_targets_use_plugin_credentials(self):
+        """ Returns True if a publish target signs its requests or assumes its role with the plugin credentials """
+        return any(target.uses_plugin_credentials() for target in self.publish_targets)
+
     def _get_credentials_path(self):
         credentials_path = self.config_reader.credentials_path
         if not self.config_reader.credentials_path:
@@ -140,7 +231,7 @@ class ConfigHelper(object):
 
     def _set_ec2_endpoint(self):
         """ Creates endpoint from region information """
-        if self.region is "localhost":
+        if self.region == "localhost":
             self.ec2_endpoint = "http://" + self.region + "/"
         elif self.region.startswith("cn-"):
             self.ec2_endpoint = "https://ec2." + self.region + ".amazonaws.com.cn/"
@@ -178,14 +269,269 @@ class ConfigHelper(object):
             self.flush_interval_in_seconds = "60"
             self._LOGGER.warning("flush_interval_in_seconds in configuration is invalid: " + str(self.config_reader.flush_interval_in_seconds) + " use the default value: " + self.flush_interval_in_seconds)
 
+    def _load_max_series_per_plugin(self):
+        """
+        Load max_series_per_plugin and its per plugin overrides from the configuration file.
+        Missing or invalid values disable the series budget for the affected plugins.
+        """
+        self.max_series_per_plugin = self._parse_series_budget(self.config_reader.max_series_per_plugin, ConfigReader.MAX_SERIES_PER_PLUGIN_KEY)
+        self.max_series_per_plugin_overrides = {}
+        for entry in self.config_reader.max_series_per_plugin_overrides.split(","):
+            plugin, separator, budget = entry.strip().partition(":")
+            if not entry.strip():
+                continue
+            if not separator or not plugin.strip():
+                self._LOGGER.warning(ConfigReader.MAX_SERIES_PER_PLUGIN_OVERRIDES_KEY + " entry is invalid: " + entry.strip())
+                continue
+            budget = self._parse_series_budget(budget.strip(), ConfigReader.MAX_SERIES_PER_PLUGIN_OVERRIDES_KEY)
+            if budget:
+                self.max_series_per_plugin_overrides[plugin.strip()] = budget
+
+    def _load_suppression_heartbeat_intervals(self):
+        """
+        Load suppression_heartbeat_intervals from the configuration file, use the default value if it is missing or invalid.
+        """
+        value = self.config_reader.suppression_heartbeat_intervals
+        if not value:
+            return
+        if value.isdigit() and int(value) > 0:
+            self.suppression_heartbeat_intervals = int(value)
+        else:
+            self._LOGGER.warning(ConfigReader.SUPPRESSION_HEARTBEAT_INTERVALS_KEY + " in configuration is invalid: " + value +
+                                 " use the default value: " + str(self.suppression_heartbeat_intervals))
+
+    def _load_shutdown_drain_timeout_in_seconds(self):
+        """
+        Load shutdown_drain_timeout_in_seconds from the configuration file, use the default value if it is missing or invalid.
+        The value 0 saves all aggregated metrics to the snapshot without publishing them on shutdown.
+        """
+        value = self.config_reader.shutdown_drain_timeout_in_seconds
+        if not value:
+            return
+        if value.isdigit():
+            self.shutdown_drain_timeout_in_seconds = int(value)
+        else:
+            self._LOGGER.warning(ConfigReader.SHUTDOWN_DRAIN_TIMEOUT_IN_SECONDS_KEY + " in configuration is invalid: " + value +
+                                 " use the default value: " + str(self.shutdown_drain_timeout_in_seconds))
+
+    def _load_cache_memory_budget_in_mb(self):
+        """
+        Load cache_memory_budget_in_mb from the configuration file. Missing or invalid values disable the memory budget.
+        """
+        value = self.config_reader.cache_memory_budget_in_mb
+        if not value:
+            return
+        if value.isdigit():
+            self.cache_memory_budget_in_mb = int(value)
+        else:
+            self._LOGGER.warning(ConfigReader.CACHE_MEMORY_BUDGET_IN_MB_KEY + " in configuration is invalid: " + value + " the memory budget is disabled")
+
+    def _load_async_flush_pipeline(self):
+        """
+        Load async_flush_pipeline from the configuration file. The pipeline publishes PutMetricData requests of the cloudwatch
+        output mode only, with sinks or publish targets every sink publishes from its own worker thread, so the option is ignored.
+        """
+        self.async_flush_pipeline = self.config_reader.async_flush_pipeline
+        if self.async_flush_pipeline and (self.sinks or self.is_emf_output_mode()):
+            self._LOGGER.warning(ConfigReader.ASYNC_FLUSH_PIPELINE_KEY + " is not used with sinks, publish targets or the " + self.EMF_OUTPUT_MODE +
+                                 " output mode, the option is ignored")
+            self.async_flush_pipeline = False
+
+    def _load_max_concurrent_put_requests(self):
+        """
+        Load max_concurrent_put_requests from the configuration file, use the default value if it is missing or invalid.
+        """
+        value = self.config_reader.max_concurrent_put_requests
+        if not value:
+            return
+        if value.isdigit() and int(value) > 0:
+            self.max_concurrent_put_requests = int(value)
+        else:
+            self._LOGGER.warning(ConfigReader.MAX_CONCURRENT_PUT_REQUESTS_KEY + " in configuration is invalid: " + value +
+                                 " use the default value: " + str(self.max_concurrent_put_requests))
+
+    def _load_congestion_control_bounds(self):
+        """
+        Load the lower bound of the requests in flight and the bounds of the request rate of the congestion control
+        from the configuration file, use the default values if they are missing or invalid. A lower bound above
+        the upper bound is lowered to the upper bound.
+        """
+        self.min_concurrent_put_requests = self._parse_positive_integer(self.config_reader.min_concurrent_put_requests,
+                                                                        ConfigReader.MIN_CONCURRENT_PUT_REQUESTS_KEY, self.min_concurrent_put_requests)
+        self.min_put_requests_per_second = self._parse_positive_integer(self.config_reader.min_put_requests_per_second,
+                                                                        ConfigReader.MIN_PUT_REQUESTS_PER_SECOND_KEY, self.min_put_requests_per_second)
+        self.max_put_requests_per_second = self._parse_positive_integer(self.config_reader.max_put_requests_per_second,
+                                                                        ConfigReader.MAX_PUT_REQUESTS_PER_SECOND_KEY, self.max_put_requests_per_second)
+        if self.min_concurrent_put_requests > self.max_concurrent_put_requests:
+            self._LOGGER.warning(ConfigReader.MIN_CONCURRENT_PUT_REQUESTS_KEY + " is above " + ConfigReader.MAX_CONCURRENT_PUT_REQUESTS_KEY +
+                                 " use the value: " + str(self.max_concurrent_put_requests))
+            self.min_concurrent_put_requests = self.max_concurrent_put_requests
+        if self.min_put_requests_per_second > self.max_put_requests_per_second:
+            self._LOGGER.warning(ConfigReader.MIN_PUT_REQUESTS_PER_SECOND_KEY + " is above " + ConfigReader.MAX_PUT_REQUESTS_PER_SECOND_KEY +
+                                 " use the value: " + str(self.max_put_requests_per_second))
+            self.min_put_requests_per_second = self.max_put_requests_per_second
+
+    def _load_endpoints(self):
+        """
+        Load the ordered list of endpoints from the configuration file. The first valid URL replaces the endpoint derived
+        from the region, the following ones are the failover endpoints. Invalid URLs are skipped.
+        """
+        value = self.config_reader.endpoints
+        if not value:
+            return
+        endpoints = []
+        for url in [url.strip() for url in value.split(",") if url.strip()]:
+            if re.match(self._ENDPOINT_URL_PATTERN, url):
+                if url not in endpoints:
+                    endpoints.append(url)
+            else:
+                self._LOGGER.warning(ConfigReader.ENDPOINTS_KEY + " in configuration contains an invalid URL: " + url + " the URL is skipped")
+        if endpoints:
+            self.endpoint = endpoints[0]
+            self.failover_endpoints = endpoints[1:]
+        else:
+            self._LOGGER.warning(ConfigReader.ENDPOINTS_KEY + " in configuration is invalid: " + value + " use the default endpoint: " + self.endpoint)
+
+    def _load_circuit_breaker(self):
+        """
+        Load the failure threshold and the probe interval of the endpoint circuit breakers from the configuration file,
+        use the default values if they are missing or invalid. The failure threshold 0 disables the circuit breakers.
+        """
+        value = self.config_reader.circuit_breaker_failure_threshold
+        if value.isdigit():
+            self.circuit_breaker_failure_threshold = int(value)
+        elif value:
+            self._LOGGER.warning(ConfigReader.CIRCUIT_BREAKER_FAILURE_THRESHOLD_KEY + " in configuration is invalid: " + value +
+                                 " use the default value: " + str(self.circuit_breaker_failure_threshold))
+        self.circuit_breaker_probe_interval_in_seconds = self._parse_positive_integer(self.config_reader.circuit_breaker_probe_interval_in_seconds,
+                                                                                      ConfigReader.CIRCUIT_BREAKER_PROBE_INTERVAL_IN_SECONDS_KEY,
+                                                                                      self.circuit_breaker_probe_interval_in_seconds)
+
+    def _load_request_trace(self):
+        """
+        Load trace_sample_rate and trace_path from the configuration file, use the default values if they are missing or invalid.
+        Requests are traced only in debug mode, the sample rate 0 disables the request trace.
+        """
+        value = self.config_reader.trace_sample_rate
+        if value:
+            try:
+                sample_rate = float(value)
+            except ValueError:
+                sample_rate = -1
+            if 0 <= sample_rate <= 1:
+                self.trace_sample_rate = sample_rate
+            else:
+                self._LOGGER.warning(ConfigReader.TRACE_SAMPLE_RATE_KEY + " in configuration is invalid: " + value +
+                                     " use the default value: " + str(self.trace_sample_rate))
+        if self.config_reader.trace_path:
+            self.trace_path = self.config_reader.trace_path
+
+    def _parse_positive_integer(self, value, key, default):
+        if not value:
+            return default
+        if value.isdigit() and int(value) > 0:
+            return int(value)
+        self._LOGGER.warning(key + " in configuration is invalid: " + value + " use the default value: " + str(default))
+        return default
+
+    def _load_output_mode(self):
+        """
+        Load output_mode from the configuration file, use the default value if it is missing or invalid.
+        """
+        value = self.config_reader.output_mode.lower()
+        if not value:
+            return
+        if value in (self.CLOUDWATCH_OUTPUT_MODE, self.EMF_OUTPUT_MODE):
+            self.output_mode = value
+        else:
+            self._LOGGER.warning(ConfigReader.OUTPUT_MODE_KEY + " in configuration is invalid: " + value + " use the default value: " + self.output_mode)
+
+    def _load_emf_endpoint(self):
+        """
+        Load emf_endpoint from the configuration file, use the default value if it is missing or invalid.
+        """
+        value = self.config_reader.emf_endpoint
+        if not value:
+            return
+        try:
+            EMFClient.parse_endpoint(value)
+            self.emf_endpoint = value
+        except EMFClient.InvalidEndpointException as e:
+            self._LOGGER.warning(str(e) + " use the default value: " + self.emf_endpoint)
+
+    def _load_sinks(self):
+        """
+        Load sinks, jsonl_path and max_queued_batches_per_sink from the configuration file. Unknown sinks are skipped,
+        if no valid sink is configured the metrics are published to the output selected by output_mode.
+        """
+        for sink in self.config_reader.sinks.split(","):
+            sink = sink.strip().lower()
+            if not sink:
+                continue
+            if sink not in (self.CLOUDWATCH_OUTPUT_MODE, self.EMF_OUTPUT_MODE, self.JSONL_SINK):
+                self._LOGGER.warning(ConfigReader.SINKS_KEY + " entry is invalid: " + sink)
+            elif sink not in self.sinks:
+                self.sinks.append(sink)
+        if self.config_reader.jsonl_path:
+            self.jsonl_path = self.config_reader.jsonl_path
+        value = self.config_reader.max_queued_batches_per_sink
+        if not value:
+            return
+        if value.isdigit() and int(value) > 0:
+            self.max_queued_batches_per_sink = int(value)
+        else:
+            self._LOGGER.warning(ConfigReader.MAX_QUEUED_BATCHES_PER_SINK_KEY + " in configuration is invalid: " + value +
+                                 " use the default value: " + str(self.max_queued_batches_per_sink))
+
+    def _load_publish_targets(self):
+        """
+        Load the additional regions or accounts receiving every flush from the targets configuration file. Targets with
+        an invalid endpoint are skipped. With publish targets, the output selected by output_mode becomes a sink
+        unless sinks are configured, so every target publishes from its own sink.
+        """
+        for target in TargetConfigReader(self.TARGETS_CONFIG_PATH, self).get_targets():
+            if target.endpoint is None:
+                target.endpoint = self._get_regional_endpoint(target.region)
+            elif not re.match(self._ENDPOINT_URL_PATTERN, target.endpoint):
+                self._LOGGER.warning("The endpoint of the publish target " + target.name + " is invalid: " + target.endpoint + " the target is skipped")
+                continue
+            self.publish_targets.append(target)
+        if self.publish_targets and not self.sinks:
+            self.sinks = [self.output_mode]
+
+    def _load_prometheus_listen_address(self):
+        """
+        Load prometheus_listen_address as the (host, port) pair, the host defaults to the loopback address if only
+        the port is given. Missing or invalid values disable the Prometheus listener.
+        """
+        value = self.config_reader.prometheus_listen_address
+        if not value:
+            return
+        host, _, port = value.rpartition(":")
+        if port.isdigit() and 0 < int(port) < 65536:
+            self.prometheus_listen_address = (host.strip("[]") or self._DEFAULT_PROMETHEUS_LISTEN_HOST, int(port))
+        else:
+            self._LOGGER.warning(ConfigReader.PROMETHEUS_LISTEN_ADDRESS_KEY + " in configuration is invalid: " + value + " the Prometheus listener is disabled")
+
+    def _parse_series_budget(self, value, key):
+        if not value:
+            return 0
+        if value.isdigit() and int(value) > 0:
+            return int(value)
+        self._LOGGER.warning(key + " in configuration is invalid: " + value + " the series budget is disabled")
+        return 0
+
     def _set_endpoint(self):
         """ Creates endpoint from region information """
-        if self.region is "localhost":
-            self.endpoint = "http://" + self.region + "/"
-        elif self.region.startswith("cn-"):
-            self.endpoint = "https://monitoring." + self.region + ".amazonaws.com.cn/"
-        else:
-            self.endpoint = "https://monitoring." + self.region + ".amazonaws.com/"
+        self.endpoint = self._get_regional_endpoint(self.region)
+
+    def _get_regional_endpoint(self, region):
+        """ Returns the CloudWatch endpoint of the region """
+        if region == "localhost":
+            return "http://" + region + "/"
+        elif region.startswith("cn-"):
+            return "https://monitoring." + region + ".amazonaws.com.cn/"
+        return "https://monitoring." + region + ".amazonaws.com/"
 
     def _load_autoscaling_group(self):
         """
@@ -202,12 +548,18 @@ class ConfigHelper(object):
             ConfigHelper._LOGGER.error(traceback.format_exc())
             
     def _check_configuration_integrity(self):
-        """ Check the state of this configuration helper object to ensure that all required values are loaded """
+        """
+        Check the state of this configuration helper object to ensure that all required values are loaded.
+        Credentials and region are required only if metrics are published with signed PutMetricData requests,
+        credentials are also required if a publish target uses the plugin credentials.
+        """
+        if not self.publishes_to_cloudwatch() and not self._publish_targets_use_plugin_credentials():
+            return
         if not self._credentials:
             raise ValueError("AWS _credentials are missing.")
         if not self._credentials.access_key:
             raise ValueError("AWS access key is missing.")
         if not self._credentials.secret_key:
             raise ValueError("AWS secret key is missing.") 
-        if not self.region:
+        if self.publishes_to_cloudwatch() and not self.region:
             raise ValueError("Region is missing")
@@ -1,5 +1,5 @@
 from ..logger.logger import get_logger
-from readerutils import ReaderUtils
+from .readerutils import ReaderUtils
 
 
 class ConfigReader(object):
@@ -16,6 +16,29 @@ class ConfigReader(object):
     host -- the host name or instance name injected to each metric as dimension
     debug -- the mode in which plugin performs verbose logging of its operations
     pass_through -- the mode in which whitelist allows use of .* on its own
+    max_series_per_plugin -- the maximum number of series each plugin can aggregate within a flush interval
+    max_series_per_plugin_overrides -- the comma separated list of plugin:budget pairs overriding max_series_per_plugin
+    suppress_unchanged_metrics -- the mode in which series with statistics unchanged since the last publish are not published
+    suppression_heartbeat_intervals -- the number of flush intervals after which a suppressed series is published anyway
+    shutdown_drain_timeout_in_seconds -- the time limit for publishing aggregated metrics when collectd stops
+    cache_memory_budget_in_mb -- the memory budget shared by the long-lived caches of the plugin
+    async_flush_pipeline -- the mode in which flushes are published by an asyncio event loop on a dedicated thread (Python 3 only)
+    max_concurrent_put_requests -- the maximum number of PutMetricData requests in flight in the asynchronous flush pipeline and under congestion control
+    output_mode -- the destination of published metrics, the CloudWatch API (cloudwatch) or the Embedded Metric Format endpoint (emf)
+    emf_endpoint -- the tcp://host:port, udp://host:port or file:///path endpoint receiving Embedded Metric Format documents
+    sinks -- the comma separated list of outputs (cloudwatch, emf, jsonl) which all receive every flush, overrides output_mode
+    jsonl_path -- the path of the file receiving one JSON record per published metric in the jsonl sink
+    max_queued_batches_per_sink -- the maximum number of metric batches waiting for each sink
+    prometheus_listen_address -- the host:port of the HTTP listener serving the most recently flushed metrics in the Prometheus text format
+    congestion_control -- the mode in which PutMetricData requests are paced and retried adaptively when CloudWatch throttles them
+    min_concurrent_put_requests -- the lower bound of the number of PutMetricData requests in flight under congestion control
+    min_put_requests_per_second -- the lower bound of the PutMetricData request rate under congestion control
+    max_put_requests_per_second -- the upper bound of the PutMetricData request rate under congestion control
+    endpoints -- the ordered comma separated list of CloudWatch endpoint URLs, the following endpoints are used when the preceding ones are unavailable
+    circuit_breaker_failure_threshold -- the number of consecutive failed requests after which an endpoint is only probed
+    circuit_breaker_probe_interval_in_seconds -- the time between probe requests to an unavailable endpoint
+    trace_sample_rate -- the fraction of PutMetricData requests recorded to the request trace file in debug mode
+    trace_path -- the path of the file receiving one JSON record per traced request
     
     Keyword arguments:
     config_path -- the path for the configuration file to be parsed (Required)
@@ -27,6 +50,9 @@ class ConfigReader(object):
     _PASS_THROUGH_DEFAULT_VALUE = False
     _PUSH_ASG_DEFAULT_VALUE = False
     _PUSH_CONSTANT_DEFAULT_VALUE = False
+    _SUPPRESS_UNCHANGED_METRICS_DEFAULT_VALUE = False
+    _ASYNC_FLUSH_PIPELINE_DEFAULT_VALUE = False
+    _CONGESTION_CONTROL_DEFAULT_VALUE = False
     REGION_CONFIG_KEY = "region"
     HOST_CONFIG_KEY = "host"
     CREDENTIALS_PATH_KEY = "credentials_path"
@@ -39,6 +65,29 @@ class ConfigReader(object):
     PROXY_SERVER_PORT_KEY = "proxy_server_port"
     ENABLE_HIGH_DEFINITION_METRICS = "enable_high_resolution_metrics"
     FLUSH_INTERVAL_IN_SECONDS = "flush_interval_in_seconds"
+    MAX_SERIES_PER_PLUGIN_KEY = "max_series_per_plugin"
+    MAX_SERIES_PER_PLUGIN_OVERRIDES_KEY = "max_series_per_plugin_overrides"
+    SUPPRESS_UNCHANGED_METRICS_KEY = "suppress_unchanged_metrics"
+    SUPPRESSION_HEARTBEAT_INTERVALS_KEY = "suppression_heartbeat_intervals"
+    SHUTDOWN_DRAIN_TIMEOUT_IN_SECONDS_KEY = "shutdown_drain_timeout_in_seconds"
+    CACHE_MEMORY_BUDGET_IN_MB_KEY = "cache_memory_budget_in_mb"
+    ASYNC_FLUSH_PIPELINE_KEY = "async_flush_pipeline"
+    MAX_CONCURRENT_PUT_REQUESTS_KEY = "max_concurrent_put_requests"
+    OUTPUT_MODE_KEY = "output_mode"
+    EMF_ENDPOINT_KEY = "emf_endpoint"
+    SINKS_KEY = "sinks"
+    JSONL_PATH_KEY = "jsonl_path"
+    MAX_QUEUED_BATCHES_PER_SINK_KEY = "max_queued_batches_per_sink"
+    PROMETHEUS_LISTEN_ADDRESS_KEY = "prometheus_listen_address"
+    CONGESTION_CONTROL_KEY = "congestion_control"
+    MIN_CONCURRENT_PUT_REQUESTS_KEY = "min_concurrent_put_requests"
+    MIN_PUT_REQUESTS_PER_SECOND_KEY = "min_put_requests_per_second"
+    MAX_PUT_REQUESTS_PER_SECOND_KEY = "max_put_requests_per_second"
+    ENDPOINTS_KEY = "endpoints"
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD_KEY = "circuit_breaker_failure_threshold"
+    CIRCUIT_BREAKER_PROBE_INTERVAL_IN_SECONDS_KEY = "circuit_breaker_probe_interval_in_seconds"
+    TRACE_SAMPLE_RATE_KEY = "trace_sample_rate"
+    TRACE_PATH_KEY = "trace_path"
 
     def __init__(self, config_path):
         self.config_path = config_path
@@ -54,6 +103,29 @@ class ConfigReader(object):
         self.proxy_server_port = ''
         self.enable_high_resolution_metrics = self._ENABLE_HIGH_DEFINITION_METRICS_DEFAULT_VALUE
         self.flush_interval_in_seconds = ''
+        self.max_series_per_plugin = ''
+        self.max_series_per_plugin_overrides = ''
+        self.suppress_unchanged_metrics = self._SUPPRESS_UNCHANGED_METRICS_DEFAULT_VALUE
+        self.suppression_heartbeat_intervals = ''
+        self.shutdown_drain_timeout_in_seconds = ''
+        self.cache_memory_budget_in_mb = ''
+        self.async_flush_pipeline = self._ASYNC_FLUSH_PIPELINE_DEFAULT_VALUE
+        self.max_concurrent_put_requests = ''
+        self.output_mode = ''
+        self.emf_endpoint = ''
+        self.sinks = ''
+        self.jsonl_path = ''
+        self.max_queued_batches_per_sink = ''
+        self.prometheus_listen_address = ''
+        self.congestion_control = self._CONGESTION_CONTROL_DEFAULT_VALUE
+        self.min_concurrent_put_requests = ''
+        self.min_put_requests_per_second = ''
+        self.max_put_requests_per_second = ''
+        self.endpoints = ''
+        self.circuit_breaker_failure_threshold = ''
+        self.circuit_breaker_probe_interval_in_seconds = ''
+        self.trace_sample_rate = ''
+        self.trace_path = ''
         try:
             self.reader_utils = ReaderUtils(config_path)
             self._parse_config_file()
@@ -73,6 +145,29 @@ class ConfigReader(object):
         self.proxy_server_port = self.reader_utils.get_string(self.PROXY_SERVER_PORT_KEY)
         self.enable_high_resolution_metrics = self.reader_utils.try_get_boolean(self.ENABLE_HIGH_DEFINITION_METRICS, self._ENABLE_HIGH_DEFINITION_METRICS_DEFAULT_VALUE)
         self.flush_interval_in_seconds = self.reader_utils.get_string(self.FLUSH_INTERVAL_IN_SECONDS)
+        self.max_series_per_plugin = self.reader_utils.get_string(self.MAX_SERIES_PER_PLUGIN_KEY)
+        self.max_series_per_plugin_overrides = self.reader_utils.get_string(self.MAX_SERIES_PER_PLUGIN_OVERRIDES_KEY)
+        self.suppress_unchanged_metrics = self.reader_utils.try_get_boolean(self.SUPPRESS_UNCHANGED_METRICS_KEY, self._SUPPRESS_UNCHANGED_METRICS_DEFAULT_VALUE)
+        self.suppression_heartbeat_intervals = self.reader_utils.get_string(self.SUPPRESSION_HEARTBEAT_INTERVALS_KEY)
+        self.shutdown_drain_timeout_in_seconds = self.reader_utils.get_string(self.SHUTDOWN_DRAIN_TIMEOUT_IN_SECONDS_KEY)
+        self.cache_memory_budget_in_mb = self.reader_utils.get_string(self.CACHE_MEMORY_BUDGET_IN_MB_KEY)
+        self.async_flush_pipeline = self.reader_utils.try_get_boolean(self.ASYNC_FLUSH_PIPELINE_KEY, self._ASYNC_FLUSH_PIPELINE_DEFAULT_VALUE)
+        self.max_concurrent_put_requests = self.reader_utils.get_string(self.MAX_CONCURRENT_PUT_REQUESTS_KEY)
+        self.output_mode = self.reader_utils.get_string(self.OUTPUT_MODE_KEY)
+        self.emf_endpoint = self.reader_utils.get_string(self.EMF_ENDPOINT_KEY)
+        self.sinks = self.reader_utils.get_string(self.SINKS_KEY)
+        self.jsonl_path = self.reader_utils.get_string(self.JSONL_PATH_KEY)
+        self.max_queued_batches_per_sink = self.reader_utils.get_string(self.MAX_QUEUED_BATCHES_PER_SINK_KEY)
+        self.prometheus_listen_address = self.reader_utils.get_string(self.PROMETHEUS_LISTEN_ADDRESS_KEY)
+        self.congestion_control = self.reader_utils.try_get_boolean(self.CONGESTION_CONTROL_KEY, self._CONGESTION_CONTROL_DEFAULT_VALUE)
+        self.min_concurrent_put_requests = self.reader_utils.get_string(self.MIN_CONCURRENT_PUT_REQUESTS_KEY)
+        self.min_put_requests_per_second = self.reader_utils.get_string(self.MIN_PUT_REQUESTS_PER_SECOND_KEY)
+        self.max_put_requests_per_second = self.reader_utils.get_string(self.MAX_PUT_REQUESTS_PER_SECOND_KEY)
+        self.endpoints = self.reader_utils.get_string(self.ENDPOINTS_KEY)
+        self.circuit_breaker_failure_threshold = self.reader_utils.get_string(self.CIRCUIT_BREAKER_FAILURE_THRESHOLD_KEY)
+        self.circuit_breaker_probe_interval_in_seconds = self.reader_utils.get_string(self.CIRCUIT_BREAKER_PROBE_INTERVAL_IN_SECONDS_KEY)
+        self.trace_sample_rate = self.reader_utils.get_string(self.TRACE_SAMPLE_RATE_KEY)
+        self.trace_path = self.reader_utils.get_string(self.TRACE_PATH_KEY)
         self.pass_through = self.reader_utils.try_get_boolean(self.PASS_THROUGH_CONFIG_KEY, self._PASS_THROUGH_DEFAULT_VALUE)
         self.debug = self.reader_utils.try_get_boolean(self.DEBUG_CONFIG_KEY, self._DEBUG_DEFAULT_VALUE)
         self.push_asg = self.reader_utils.try_get_boolean(self.PUSH_ASG_KEY, self._PUSH_ASG_DEFAULT_VALUE)
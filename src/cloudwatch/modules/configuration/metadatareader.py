@@ -1,8 +1,8 @@
 from json import loads
-from requests import Session, codes
-from requests.adapters import HTTPAdapter
+from ..client.transport import HTTPTransport
 from ..logger.logger import get_logger
 from ..awscredentials import AWSCredentials
+from ..compat import httplib
 
 
 
@@ -13,6 +13,7 @@ class MetadataReader(object):
     
     Accepted configuration parameters:
     metadata_server -- the address of the local metadata server (Required)
+    transport -- the transport used to send requests (default HTTPTransport with persistent connections)
     """
     _LOGGER = get_logger(__name__)
     _IDENTITY_DOCUMENT_REQUEST = "latest/dynamic/instance-identity/document"
@@ -27,10 +28,9 @@ class MetadataReader(object):
     _X_AWS_EC_METADATA_TOKEN = 'X-aws-ec2-metadata-token'
     _TTL_SECONDS = "X-aws-ec2-metadata-token-ttl-seconds"
 
-    def __init__(self, metadata_server):
+    def __init__(self, metadata_server, transport=None):
         self.metadata_server = metadata_server
-        self.session = Session()
-        self.session.mount("http://", HTTPAdapter(max_retries=self._TOTAL_RETRIES))
+        self.transport = transport or HTTPTransport(max_retries=self._TOTAL_RETRIES)
         self.token = ""
 
     def get_region(self):
@@ -67,11 +67,11 @@ class MetadataReader(object):
                    then the request part is 'latest/meta-data/placement/availability-zone/'.
         """
         result = self._v2_call(request)
-        if result and result.status_code is codes.ok:
+        if result and result.status_code == httplib.OK:
             return str(result.text)
 
         result = self._v1_call(request)
-        if result.status_code is codes.ok:
+        if result.status_code == httplib.OK:
             return str(result.text)
         else:
             self._LOGGER.error("The request: '" + str(request) + "' failed with status code: '" + str(result.status_code) + "' and message: '" + str(result.text) +"'.")
@@ -79,7 +79,7 @@ class MetadataReader(object):
 
     def _v1_call(self, request):
         self._LOGGER.info("[debug] Fallback to IMDSV1")
-        result = self.session.get(self.metadata_server + request, timeout=self._REQUEST_TIMEOUT)
+        result = self.transport.get(self.metadata_server + request, timeout=self._REQUEST_TIMEOUT)
         return result
 
     def _v2_call(self, request):
@@ -87,13 +87,13 @@ class MetadataReader(object):
             if not self.token:
                 self.token = self._get_metadata_token()
             headers = {self._X_AWS_EC_METADATA_TOKEN:self.token}
-            result = self.session.get(self.metadata_server + request, timeout=self._REQUEST_TIMEOUT, headers=headers)
+            result = self.transport.get(self.metadata_server + request, timeout=self._REQUEST_TIMEOUT, headers=headers)
             # In case that token expired, we need to try v2 again.
-            if result.status_code == codes.unauthorized:
+            if result.status_code == httplib.UNAUTHORIZED:
                 self._LOGGER.info("[debug] unauthorized token, try IMDSV2 again.")
                 self.token = self._get_metadata_token()
                 headers = {self._X_AWS_EC_METADATA_TOKEN:self.token}
-                result = self.session.get(self.metadata_server + request, timeout=self._REQUEST_TIMEOUT, headers=headers)
+                result = self.transport.get(self.metadata_server + request, timeout=self._REQUEST_TIMEOUT, headers=headers)
             return result
         except Exception as e:
             return False
@@ -104,10 +104,10 @@ class MetadataReader(object):
         """
         try:
             headers = {self._TTL_SECONDS:str(self._TOKEN_TTL_SECONDS)}
-            result = self.session.put(self.metadata_server + self._TOKEN_REQUEST, timeout=self._REQUEST_TIMEOUT, headers=headers)
+            result = self.transport.put(self.metadata_server + self._TOKEN_REQUEST, timeout=self._REQUEST_TIMEOUT, headers=headers)
         except Exception as e:
             raise MetadataRequestException("%s cannot access metadata service. url:%s, Cause: %s " %(self._get_metadata_token.__name__, self._TOKEN_REQUEST, str(e)) )
-        if result.status_code is not codes.ok:
+        if result.status_code != httplib.OK:
             raise MetadataRequestException("%s cannot retrieve configuration from metadata service. url:%s, Status code: %s"  %(self._get_metadata_token.__name__, self._TOKEN_REQUEST, str(result.status_code)))
         return str(result.text)
 
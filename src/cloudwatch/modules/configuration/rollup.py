@@ -0,0 +1,141 @@
+import re
+
+from ..logger.logger import get_logger
+from ..memorygovernor import GovernedCache
+
+
+class RollupConfigReader(object):
+    """
+    The RollupConfigReader is responsible for parsing the rollup.conf file into a list of RollupRule objects
+    used by the Rollups class. Each line of rollup.conf contains a regex matched against the metric key
+    (the same key that is used by the whitelist) followed by optional options separated with whitespace:
+
+    cpu-.*-cpu-.* collapse=plugin_instance drop_source=true
+
+    Accepted options:
+    collapse -- comma separated list of the metric key parts merged by the rule: plugin_instance, type_instance (default plugin_instance)
+    drop_source -- whether the matching series are published only as part of the rollup series (default false)
+
+    Any line that is not a valid rule will be logged and ignored.
+    """
+    _LOGGER = get_logger(__name__)
+    NO_SUCH_FILE = 2
+    COMMENT_CHARACTER = "#"
+    COLLAPSE_OPTION = "collapse"
+    DROP_SOURCE_OPTION = "drop_source"
+
+    def __init__(self, rollup_config_path):
+        self.rollup_config_path = rollup_config_path
+
+    def get_rules(self):
+        """
+        Reads rollup configuration file and returns the list of valid rollup rules.
+        A missing configuration file is not an error, rollups are simply disabled.
+        """
+        try:
+            with open(self.rollup_config_path) as rollup_file:
+                return self._get_valid_rules([line.strip() for line in rollup_file])
+        except IOError as e:
+            if e.errno is not self.NO_SUCH_FILE:
+                self._LOGGER.warning("Could not open rollup file '" + self.rollup_config_path + "'. Reason: " + str(e))
+            return []
+
+    def _get_valid_rules(self, lines):
+        rules = []
+        for line in lines:
+            if not line or line.startswith(self.COMMENT_CHARACTER):
+                continue
+            try:
+                rules.append(self._parse_rule(line))
+            except Exception as e:
+                self._LOGGER.warning("The rollup rule: '{}' is invalid, reason: {}".format(line, str(e)))
+        return rules
+
+    def _parse_rule(self, line):
+        parts = line.split()
+        options = {self.COLLAPSE_OPTION: RollupRule.PLUGIN_INSTANCE, self.DROP_SOURCE_OPTION: "false"}
+        for option in parts[1:]:
+            key, value = option.split("=", 1)
+            if key not in options:
+                raise ValueError("unknown option '" + key + "'")
+            options[key] = value
+        collapse = [part.strip() for part in options[self.COLLAPSE_OPTION].split(",")]
+        drop_source = options[self.DROP_SOURCE_OPTION].lower()
+        if drop_source not in ("true", "false"):
+            raise ValueError("'" + options[self.DROP_SOURCE_OPTION] + "' does not specify boolean value")
+        return RollupRule(parts[0], collapse, drop_source == "true")
+
+
+class RollupRule(object):
+    """
+    The RollupRule describes which series are merged into a single rollup series.
+    The collapsed parts of the metric key are replaced with ROLLUP_VALUE, so that e.g. all per-core
+    cpu-<N>-cpu-user series are merged into a single cpu.cpu.user series with PluginInstance=ALL.
+
+    Keyword arguments:
+    regex -- the regex matched against the whole metric key
+    collapse -- the list of metric key parts merged by the rule (plugin_instance, type_instance)
+    drop_source -- whether the matching series are dropped after being merged into the rollup series
+    """
+    PLUGIN_INSTANCE = "plugin_instance"
+    TYPE_INSTANCE = "type_instance"
+    ROLLUP_VALUE = "ALL"
+
+    def __init__(self, regex, collapse, drop_source=False):
+        for part in collapse:
+            if part not in (self.PLUGIN_INSTANCE, self.TYPE_INSTANCE):
+                raise ValueError("cannot collapse '" + part + "'")
+        self.regex = re.compile("^" + regex + "$")
+        self.collapse_plugin_instance = self.PLUGIN_INSTANCE in collapse
+        self.collapse_type_instance = self.TYPE_INSTANCE in collapse
+        self.drop_source = drop_source
+
+    def build_rollup_value_list(self, value_list):
+        """ Creates a copy of the value list with the collapsed parts replaced by ROLLUP_VALUE """
+        return value_list.__class__(
+            host=value_list.host,
+            plugin=value_list.plugin,
+            plugin_instance=self.ROLLUP_VALUE if self.collapse_plugin_instance else value_list.plugin_instance,
+            type=value_list.type,
+            type_instance=self.ROLLUP_VALUE if self.collapse_type_instance else value_list.type_instance,
+            time=value_list.time,
+            interval=value_list.interval,
+            meta=value_list.meta,
+            values=value_list.values
+        )
+
+
+class Rollups(object):
+    """
+    The Rollups object finds the rollup rule for a metric. Similarly to Whitelist, each unique metric key
+    is tested against the rules only once, after this a cached result will be used.
+    The cached results can be evicted by the MemoryGovernor, an evicted metric is tested again when it is reported.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self._metric_rules = GovernedCache()
+
+    def register_caches(self, memory_governor):
+        """ Adds the cache of matched rollup rules to the budget of the MemoryGovernor """
+        memory_governor.register("rollup_rules", self._metric_rules)
+
+    def get_rule(self, metric_key):
+        """
+        Returns the first rollup rule matching the metric key or None if the metric is not rolled up.
+        """
+        if not self.rules:
+            return None
+        rule = self._metric_rules.get(metric_key, GovernedCache.MISSING)
+        if rule is GovernedCache.MISSING:
+            rule = self._metric_rules.take_old(metric_key)
+            if rule is GovernedCache.MISSING:
+                rule = self._find_rule(metric_key)
+                self._metric_rules[metric_key] = rule
+        return rule
+
+    def _find_rule(self, metric_key):
+        for rule in self.rules:
+            if rule.regex.match(metric_key):
+                return rule
+        return None
@@ -0,0 +1,168 @@
+import re
+
+from ..logger.logger import get_logger
+from ..client.stsclient import STSClient, AssumedRoleCredentials
+from .credentialsreader import CredentialsReader
+from .whitelist import WhitelistConfigReader
+
+
+class TargetConfigReader(object):
+    """
+    The TargetConfigReader is responsible for parsing the targets.conf file into a list of PublishTarget objects.
+    Each line of targets.conf contains the unique name of the target followed by its options separated with whitespace:
+
+    dr region=us-west-2 namespace=collectd_dr role_arn=arn:aws:iam::123456789012:role/collectd-dr
+
+    Accepted options:
+    region -- the region the metrics are published to (Required)
+    namespace -- the namespace all metrics are published to (default the namespaces of the plugin and the whitelist rules)
+    endpoint -- the URL of the CloudWatch endpoint (default the regional endpoint)
+    credentials_path -- the file with the aws_access_key and aws_secret_key of the target (default the plugin credentials)
+    role_arn -- the ARN of the role assumed with the target or plugin credentials before publishing (default None)
+    external_id -- the external ID required by the trust policy of the role (default None)
+
+    Any line that is not a valid target will be logged and ignored.
+
+    Keyword arguments:
+    targets_config_path -- the path of the targets.conf file
+    config_helper -- the ConfigHelper providing the plugin credentials and the settings shared by all targets
+    """
+    _LOGGER = get_logger(__name__)
+    NO_SUCH_FILE = 2
+    COMMENT_CHARACTER = "#"
+    REGION_OPTION = "region"
+    NAMESPACE_OPTION = "namespace"
+    ENDPOINT_OPTION = "endpoint"
+    CREDENTIALS_PATH_OPTION = "credentials_path"
+    ROLE_ARN_OPTION = "role_arn"
+    EXTERNAL_ID_OPTION = "external_id"
+    _OPTIONS = (REGION_OPTION, NAMESPACE_OPTION, ENDPOINT_OPTION, CREDENTIALS_PATH_OPTION, ROLE_ARN_OPTION, EXTERNAL_ID_OPTION)
+    _NAME_PATTERN = re.compile(r"^[\w.-]+$")
+    _REGION_PATTERN = re.compile(r"^([a-z]{2}(-[a-z]+)+-\d+|localhost)$")
+    _ROLE_ARN_PATTERN = re.compile(r"^arn:aws[\w-]*:iam::\d{12}:role/\S+$")
+    _NAMESPACE_PATTERN = re.compile(WhitelistConfigReader.NAMESPACE_REGEX_STRING)
+
+    def __init__(self, targets_config_path, config_helper):
+        self.targets_config_path = targets_config_path
+        self.config_helper = config_helper
+
+    def get_targets(self):
+        """
+        Reads targets configuration file and returns the list of valid publish targets.
+        A missing configuration file is not an error, metrics are simply published to the plugin region only.
+        """
+        try:
+            with open(self.targets_config_path) as targets_file:
+                return self._get_valid_targets([line.strip() for line in targets_file])
+        except IOError as e:
+            if e.errno is not self.NO_SUCH_FILE:
+                self._LOGGER.warning("Could not open targets file '" + self.targets_config_path + "'. Reason: " + str(e))
+            return []
+
+    def _get_valid_targets(self, lines):
+        targets = []
+        for line in lines:
+            if not line or line.startswith(self.COMMENT_CHARACTER):
+                continue
+            try:
+                target = self._parse_target(line)
+                if target.name in [existing_target.name for existing_target in targets]:
+                    raise ValueError("the name '" + target.name + "' is already used")
+                targets.append(target)
+            except Exception as e:
+                self._LOGGER.warning("The publish target: '{}' is invalid, reason: {}".format(line, str(e)))
+        return targets
+
+    def _parse_target(self, line):
+        parts = line.split()
+        if not self._NAME_PATTERN.match(parts[0]) or "=" in parts[0]:
+            raise ValueError("the target must start with a name made of letters, digits, '.', '_' and '-'")
+        options = {}
+        for option in parts[1:]:
+            key, value = option.split("=", 1)
+            if key not in self._OPTIONS:
+                raise ValueError("unknown option '" + key + "'")
+            options[key] = value
+        region = options.get(self.REGION_OPTION)
+        if not region or not self._REGION_PATTERN.match(region):
+            raise ValueError("the region '" + str(region) + "' is missing or invalid")
+        namespace = options.get(self.NAMESPACE_OPTION)
+        if namespace is not None and not self._NAMESPACE_PATTERN.match(namespace):
+            raise ValueError("the namespace '" + namespace + "' is invalid")
+        role_arn = options.get(self.ROLE_ARN_OPTION)
+        if role_arn is not None and not self._ROLE_ARN_PATTERN.match(role_arn):
+            raise ValueError("the role ARN '" + role_arn + "' is invalid")
+        return PublishTarget(parts[0], region, self.config_helper, namespace=namespace,
+                             endpoint=options.get(self.ENDPOINT_OPTION), credentials=self._read_credentials(options.get(self.CREDENTIALS_PATH_OPTION)),
+                             role_arn=role_arn, external_id=options.get(self.EXTERNAL_ID_OPTION))
+
+    def _read_credentials(self, credentials_path):
+        if credentials_path is None:
+            return None
+        credentials = CredentialsReader(credentials_path).credentials
+        if not credentials:
+            raise ValueError("the credentials file '" + credentials_path + "' cannot be read")
+        return credentials
+
+
+class PublishTarget(object):
+    """
+    The PublishTarget is an additional region or account receiving every flush. It provides the configuration
+    attributes read by the PutClient, the settings which are not specific to the target are taken from the plugin
+    configuration. The requests are signed with the static credentials of the target or, without them, with the
+    plugin credentials. If a role ARN is set, these credentials are only used to assume the role.
+
+    Keyword arguments:
+    name -- the unique name of the target used in log messages
+    region -- the region the metrics are published to
+    config_helper -- the ConfigHelper providing the plugin credentials and the settings shared by all targets
+    namespace -- the namespace all metrics are published to, None to keep the namespaces of the metrics (default None)
+    endpoint -- the URL of the CloudWatch endpoint, None to use the regional endpoint (default None)
+    credentials -- the static AWSCredentials of the target, None to use the plugin credentials (default None)
+    role_arn -- the ARN of the role assumed before publishing (default None)
+    external_id -- the external ID required by the trust policy of the role (default None)
+    """
+
+    def __init__(self, name, region, config_helper, namespace=None, endpoint=None, credentials=None, role_arn=None, external_id=None):
+        self.name = name
+        self.region = region
+        self.namespace = namespace
+        self.endpoint = endpoint
+        self.static_credentials = credentials
+        self.role_arn = role_arn
+        self.external_id = external_id
+        self._config_helper = config_helper
+        self._assumed_role_credentials = None
+
+    def uses_plugin_credentials(self):
+        return self.static_credentials is None
+
+    @property
+    def credentials(self):
+        """ Returns the credentials signing the requests, the role is assumed again when its credentials are about to expire """
+        source_credentials = self.static_credentials or self._config_helper.credentials
+        if not self.role_arn:
+            return source_credentials
+        if self._assumed_role_credentials is None:
+            sts_client = STSClient(self.region, proxy_server=self._get_proxy_server())
+            self._assumed_role_credentials = AssumedRoleCredentials(sts_client, self.role_arn, self.external_id)
+        return self._assumed_role_credentials.get_credentials(source_credentials)
+
+    @property
+    def enable_high_resolution_metrics(self):
+        return self._config_helper.enable_high_resolution_metrics
+
+    @property
+    def proxy_server_name(self):
+        return self._config_helper.proxy_server_name
+
+    @property
+    def proxy_server_port(self):
+        return self._config_helper.proxy_server_port
+
+    def _get_proxy_server(self):
+        if not self.proxy_server_name:
+            return None
+        if self.proxy_server_port:
+            return self.proxy_server_name + ":" + self.proxy_server_port
+        return self.proxy_server_name
@@ -1,10 +1,10 @@
 import re
 from os import path
-from string import strip
 from threading import Lock
 
-from configreader import ConfigReader
+from .configreader import ConfigReader
 from ..logger.logger import get_logger
+from ..memorygovernor import GovernedCache
 
 
 class WhitelistConfigReader(object):
@@ -19,19 +19,31 @@ class WhitelistConfigReader(object):
     END_STRING = "$"
     EMPTY_REGEX = START_STRING + END_STRING
 
-    PASS_THROUGH_REGEX_STRING = "^\.[\*\+]?\s.*$|^.*?\s\.[\*\+]|^\.[\*\+]$"  # matches single .*, .+ strings
+    PASS_THROUGH_REGEX_STRING = r"^\.[\*\+]?\s.*$|^.*?\s\.[\*\+]|^\.[\*\+]$"  # matches single .*, .+ strings
     # as well as  strings with .* or .+ preceded or followed by whitespace.
+    STORAGE_RESOLUTION_OPTION = "storage_resolution"
+    FLUSH_INTERVAL_OPTION = "flush_interval_in_seconds"
+    NAMESPACE_OPTION = "namespace"
+    RULE_OPTION_REGEX_STRING = r"\s+(" + STORAGE_RESOLUTION_OPTION + "|" + FLUSH_INTERVAL_OPTION + "|" + NAMESPACE_OPTION + r")\s*=\s*(\S+)\s*$"  # matches
+    # a single trailing option such as ' storage_resolution=1' at the end of a whitelist rule.
+    NAMESPACE_REGEX_STRING = r"^(?!AWS/|:)[0-9A-Za-z.\-_/#:]{1,255}$"  # matches custom CloudWatch namespaces, the AWS/ prefix is reserved
+    _VALID_STORAGE_RESOLUTIONS = ["1", "60"]
+    _VALID_FLUSH_INTERVALS = [str(x) for x in range(1, 61)]
 
     def __init__(self, whitelist_config_path, pass_through_allowed):
         self.whitelist_config_path = whitelist_config_path
         self.pass_through_allowed = pass_through_allowed
         self.pass_through_regex = re.compile(self.PASS_THROUGH_REGEX_STRING)
+        self.rule_option_regex = re.compile(self.RULE_OPTION_REGEX_STRING)
+        self.namespace_regex = re.compile(self.NAMESPACE_REGEX_STRING)
+        self._rule_options = {}
 
     def get_regex_list(self):
         """
         Reads whitelist configuration file and returns a single string with compound regex.
         :return: regex string used to test if metric is whitelisted
         """
+        self._rule_options = {}
         try:
             return self._get_whitelisted_names_from_file(self.whitelist_config_path)
         except IOError as e:
@@ -41,9 +53,48 @@ class WhitelistConfigReader(object):
                 self._LOGGER.warning("Could not open whitelist file '" + self.whitelist_config_path + "'. Reason: " + str(e))
             return [self.EMPTY_REGEX]
 
+    def get_rule_options(self):
+        """
+        Returns the options declared at the end of whitelist rules read by the last get_regex_list call.
+        :return: dictionary mapping decorated regex strings to dictionaries of validated rule options
+        """
+        return dict(self._rule_options)
+
     def _get_whitelisted_names_from_file(self, whitelist_path):
         with open(whitelist_path) as whitelist_file:
-            return self._filter_valid_regexes(map(strip, whitelist_file))
+            return self._filter_valid_regexes([self._strip_rule_options(line.strip()) for line in whitelist_file])
+
+    def _strip_rule_options(self, line):
+        """
+        Removes trailing rule options (e.g. 'cpu-.*-cpu-user storage_resolution=1 flush_interval_in_seconds=10 namespace=collectd/cpu')
+        from the whitelist line and stores the valid ones under the decorated regex of the rule.
+        """
+        options = {}
+        match = self.rule_option_regex.search(line)
+        while match:
+            key, value = match.group(1), match.group(2)
+            if key not in options:
+                options[key] = value
+            line = line[:match.start()]
+            match = self.rule_option_regex.search(line)
+        options = self._filter_valid_options(line, options)
+        if options:
+            self._rule_options[self._decorate_regex_line(line)] = options
+        return line
+
+    def _filter_valid_options(self, regex_string, options):
+        valid_options = {}
+        for key, value in options.items():
+            if key == self.NAMESPACE_OPTION and self.namespace_regex.match(value):
+                valid_options[key] = value
+            elif key != self.NAMESPACE_OPTION and value in self._get_valid_values(key):
+                valid_options[key] = int(value)
+            else:
+                self._LOGGER.warning("The option '{}={}' of whitelist rule: '{}' is invalid and will be ignored.".format(key, value, regex_string))
+        return valid_options
+
+    def _get_valid_values(self, key):
+        return self._VALID_STORAGE_RESOLUTIONS if key == self.STORAGE_RESOLUTION_OPTION else self._VALID_FLUSH_INTERVALS
 
     def _create_whitelist_file(self, whitelist_path):
         if not path.exists(whitelist_path):
@@ -63,7 +114,7 @@ class WhitelistConfigReader(object):
                 return True
             return False
         except Exception as e:
-            self._LOGGER.warning("The whitelist rule: '{}' is invalid, reason: {}".format(str(regex_string), str(e.message)))
+            self._LOGGER.warning("The whitelist rule: '{}' is invalid, reason: {}".format(str(regex_string), str(e)))
             return False
 
     def _is_allowed_regex(self, regex_string):
@@ -116,14 +167,22 @@ class Whitelist(object):
     """
     The Whitelist is responsible for testing whether a metric should be published or not.
     Whitelist object will run regex test against each unique metric only once, after this a cached result will be used.
+    The cached results can be evicted by the MemoryGovernor, an evicted metric is tested again when it is reported.
     Blocked metrics are also automatically written to a separate log file.
     """
     _LOGGER = get_logger(__name__)
 
-    def __init__(self, whitelist_regex_list, blocked_metric_log_path):
+    def __init__(self, whitelist_regex_list, blocked_metric_log_path, rule_options=None):
         self.blocked_metric_log = BlockedMetricLogger(blocked_metric_log_path)
         self._whitelist_regex = re.compile("|".join(whitelist_regex_list))
-        self._allowed_metrics = {}
+        self._allowed_metrics = GovernedCache()
+        self._rules = [(re.compile(regex), rule_options.get(regex, {})) for regex in whitelist_regex_list] if rule_options else []
+        self._metric_options = GovernedCache()
+
+    def register_caches(self, memory_governor):
+        """ Adds the caches of whitelist decisions and rule options to the budget of the MemoryGovernor """
+        memory_governor.register("whitelist", self._allowed_metrics)
+        memory_governor.register("whitelist_options", self._metric_options)
 
     def is_whitelisted(self, metric_key):
         """
@@ -131,13 +190,33 @@ class Whitelist(object):
         :param metric_key: string describing all parts that make the actual name of a collectd metric
         :return: True if test is positive, False otherwise.
         """
-        if metric_key not in self._allowed_metrics:
-            if self._whitelist_regex.match(metric_key):
-                self._allowed_metrics[metric_key] = True
-            else:
-                self._allowed_metrics[metric_key] = False
-                self.blocked_metric_log.log_metric(metric_key)
-        return self._allowed_metrics[metric_key]
-
-
-
+        allowed = self._allowed_metrics.get(metric_key)
+        if allowed is None:
+            allowed = self._allowed_metrics.take_old(metric_key)
+            if allowed is GovernedCache.MISSING:
+                allowed = self._whitelist_regex.match(metric_key) is not None
+                self._allowed_metrics[metric_key] = allowed
+                if not allowed:
+                    self.blocked_metric_log.log_metric(metric_key)
+        return allowed
+
+    def get_metric_options(self, metric_key):
+        """
+        Returns the options (storage_resolution, flush_interval_in_seconds, namespace) of the first whitelist rule matching the metric.
+        Results are cached in the same way as whitelist decisions.
+        :param metric_key: string describing all parts that make the actual name of a collectd metric
+        :return: dictionary of rule options, empty if the matching rule does not declare any options
+        """
+        options = self._metric_options.get(metric_key)
+        if options is None:
+            options = self._metric_options.take_old(metric_key)
+            if options is GovernedCache.MISSING:
+                options = self._find_metric_options(metric_key)
+                self._metric_options[metric_key] = options
+        return options
+
+    def _find_metric_options(self, metric_key):
+        for regex, options in self._rules:
+            if regex.match(metric_key):
+                return options
+        return {}
@@ -1,11 +1,179 @@
 import threading
 import time
 import os
-import math
+from collections import namedtuple
+
+from . import awsutils
+from . import clock
+from .client.putclient import PutClient
+from .client.emfclient import EMFClient
+from .client.jsonlinesclient import JSONLinesClient
+from .client.congestion import AIMDController
+from .client.circuitbreaker import EndpointPool
+from .client.querystringbuilder import EncodedMetricDataCache
+from .client.requesttracer import RequestTracer
+from .logger.logger import get_logger
+from .metricdata import MetricDataStatistic, MetricDataBuilder
+from .seriesbudget import SeriesBudget
+from .changesuppressor import ChangeSuppressor
+from .compat import iteritems, PY3
+from .snapshot import AggregationSnapshot
+from .seriesstore import SeriesRegistry, StatisticsColumns, ColumnStatistics
+from .memorygovernor import MemoryGovernor, GovernedCache
+from .sinks import Sink, SinkFanout
+from .prometheus import PrometheusExposition, PrometheusServer
+from .quarantine import MetricQuarantine, MetricValidator
+
+if PY3:
+    from .client.asyncputclient import AsyncPutClient
+else:
+    AsyncPutClient = None
+
+
+class ValueRecord(namedtuple("ValueRecord", ["host", "plugin", "plugin_instance", "type", "type_instance", "time", "interval", "meta", "values"])):
+    """
+    The ValueRecord is a pre-parsed replacement of the collectd ValueList accepted by Flusher.add_metrics,
+    e.g. ValueRecord("host", "cpu", "0", "cpu", "user", 1500000000, 10, {}, [12.5]).
+    """
+    __slots__ = ()
+
+
+class AggregationShard(object):
+    """
+    The aggregation shard holds metrics aggregated by a single write thread within a flush schedule.
+    Only the owning thread adds metrics to the shard, so values are aggregated without taking a lock.
+    At flush time the flusher takes the metric map of every shard and merges them.
+
+    The owning thread marks the metric map it updates with begin_update and end_update. The flusher replaces
+    the metric map and waits until the owning thread no longer updates the previous map before reading it.
+    Every metric map has its own series budget, which is replaced together with the map, so the series
+    admitted while the flusher takes the map are counted by the budget of the map they are added to.
+    The budgets of all shards of a schedule are merged when their metric maps are merged, see SeriesBudget.merge.
+
+    Keyword arguments:
+    series_budget -- the SeriesBudget object limiting the number of entries per plugin in this shard
+    """
+
+    def __init__(self, series_budget):
+        self.statistics_columns = StatisticsColumns()
+        self._current = ({}, series_budget)
+        self._updated_metric_map = None
+
+    @property
+    def metric_map(self):
+        return self._current[0]
+
+    @metric_map.setter
+    def metric_map(self, metric_map):
+        self._current = (metric_map, self._current[1])
+
+    @property
+    def series_budget(self):
+        return self._current[1]
+
+    @series_budget.setter
+    def series_budget(self, series_budget):
+        self._current = (self._current[0], series_budget)
+
+    def begin_update(self):
+        """
+        Marks the start of an update by the owning thread.
+
+        Returns:
+            the (metric_map, series_budget) tuple to be updated
+        """
+        while True:
+            current = self._current
+            self._updated_metric_map = current[0]
+            if self._current is current:
+                return current
+
+    def end_update(self):
+        self._updated_metric_map = None
+
+    def take_metric_map(self):
+        """
+        Replaces the metric map of the shard with an empty map and its series budget with the budget of the next interval.
+
+        Returns:
+            the previous (metric_map, series_budget) tuple, once the owning thread has finished updating the metric map
+        """
+        metric_map, series_budget = self._current
+        self._current = ({}, series_budget.renew())
+        while self._updated_metric_map is metric_map:
+            time.sleep(0)
+        return metric_map, series_budget
+
+
+class FlushSchedule(object):
+    """
+    The flush schedule groups metrics that share the same storage resolution and flush interval.
+    Every schedule aggregates its metrics in a separate map and is flushed independently of other schedules.
+    Each write thread aggregates into its own AggregationShard of the schedule, the metric_map and series_budget
+    attributes refer to the shard of the calling thread.
+
+    Keyword arguments:
+    flush_interval_in_seconds -- the interval between two consecutive flushes of this schedule
+    enable_high_resolution_metrics -- whether metrics in this schedule are published with 1 second storage resolution
+    max_metrics_to_aggregate -- the maximum number of entries kept in the metric map of each shard of this schedule
+    series_budget -- the SeriesBudget object used as a template of the per shard budgets, the series of all shards
+                     are counted against it when the shards are merged (default unlimited)
+    change_suppressor -- the ChangeSuppressor object skipping unchanged series (default disabled)
+
+    The last_flush_time is read from the monotonic clock, so stepping the wall clock does not trigger or skip flushes.
+    The flush_offset is the number of seconds the last flush was late (or early, if negative) for its wall clock boundary
+    and is used to keep flushes aligned with the boundaries, it is None until the schedule is flushed for the first time.
+    """
+
+    def __init__(self, flush_interval_in_seconds, enable_high_resolution_metrics, max_metrics_to_aggregate, series_budget=None, change_suppressor=None):
+        self.flush_interval_in_seconds = flush_interval_in_seconds
+        self.enable_high_resolution_metrics = enable_high_resolution_metrics
+        self.max_metrics_to_aggregate = max_metrics_to_aggregate
+        self.change_suppressor = change_suppressor or ChangeSuppressor()
+        self.storage_resolution = MetricDataBuilder.HIGH_STORAGE_RESOLUTION if enable_high_resolution_metrics else MetricDataBuilder.STANDARD_STORAGE_RESOLUTION
+        self.last_flush_time = clock.monotonic()
+        self.flush_offset = None
+        self.retained_metric_map = {}
+        self._series_budget = series_budget or SeriesBudget()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+        self._local = threading.local()
+
+    def get_shard(self):
+        """ Returns the aggregation shard of the calling thread, the shard is created on first use """
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = AggregationShard(self._series_budget.renew())
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def get_shards(self):
+        with self._shards_lock:
+            return list(self._shards)
+
+    def merge_series_budgets(self, series_budgets, metric_map):
+        """ Counts the series of the shard budgets against the budget of the schedule, see SeriesBudget.merge """
+        return self._series_budget.merge(series_budgets, metric_map)
+
+    @property
+    def metric_map(self):
+        return self.get_shard().metric_map
+
+    @metric_map.setter
+    def metric_map(self, metric_map):
+        self.get_shard().metric_map = metric_map
+
+    @property
+    def series_budget(self):
+        return self.get_shard().series_budget
+
+    @series_budget.setter
+    def series_budget(self, series_budget):
+        self._series_budget = series_budget
+        self.get_shard().series_budget = series_budget
 
-from client.putclient import PutClient
-from logger.logger import get_logger
-from metricdata import MetricDataStatistic, MetricDataBuilder
 
 class Flusher(object):
     """
@@ -21,33 +189,215 @@ class Flusher(object):
     _FLUSH_DELTA_IN_SECONDS = 1 
     _MAX_METRICS_PER_PUT_REQUEST = 20
     _MAX_METRICS_TO_AGGREGATE = 2000 
+    _BULK_FLUSH_CHECK_INTERVAL = 1000
+    _MAX_SNAPSHOT_AGE_IN_SECONDS = 14 * 24 * 60 * 60
+    _MAX_SNAPSHOT_CLOCK_SKEW_IN_SECONDS = 2 * 60 * 60
+    _NO_FLUSH_CHECK_WINDOW = (0, 0)
+    _CONNECTION_PREWARM_LEAD_IN_SECONDS = 5
+    _TARGET_SINK_PREFIX = "cloudwatch:"
+    _UNSENT_BATCH_KEY_PREFIX = "unsent_batch"
 
     def __init__(self, config_helper, dataset_resolver):
         self.lock = threading.Lock()
         self.client = None
+        self.flush_pipeline = None
+        self._flush_check_window = self._NO_FLUSH_CHECK_WINDOW
+        self._prewarmed_flush_time = None
+        self._unsent_entries = []
         self.config = config_helper
-        self.metric_map = {}
-        self.last_flush_time = time.time()
-        self.nan_key_set = set()
-        self.enable_high_resolution_metrics = config_helper.enable_high_resolution_metrics
-        self.flush_interval_in_seconds = int(config_helper.flush_interval_in_seconds if config_helper.flush_interval_in_seconds else self._FLUSH_INTERVAL_IN_SECONDS)
-        self.max_metrics_to_aggregate = self._MAX_METRICS_PER_PUT_REQUEST if self.enable_high_resolution_metrics else self._MAX_METRICS_TO_AGGREGATE
-        self.client = PutClient(self.config)
+        self.nan_key_set = GovernedCache()
+        self.series_registry = SeriesRegistry()
+        self._whitelist_decisions = GovernedCache()
+        self.memory_governor = MemoryGovernor(config_helper.cache_memory_budget_in_mb * 1024 * 1024)
+        self.memory_governor.register("whitelist_decisions", self._whitelist_decisions)
+        self.memory_governor.register("series_registry", self.series_registry)
+        self.memory_governor.register("nan_keys", self.nan_key_set)
+        config_helper.whitelist.register_caches(self.memory_governor)
+        config_helper.rollups.register_caches(self.memory_governor)
+        flush_interval_in_seconds = int(config_helper.flush_interval_in_seconds if config_helper.flush_interval_in_seconds else self._FLUSH_INTERVAL_IN_SECONDS)
+        self.default_schedule = self._create_schedule(flush_interval_in_seconds, config_helper.enable_high_resolution_metrics)
+        self.schedules = {(self.default_schedule.storage_resolution, flush_interval_in_seconds): self.default_schedule}
+        self.congestion_controller = self._create_congestion_controller()
+        self.endpoint_pool = self._create_endpoint_pool()
+        self.metric_quarantine = MetricQuarantine(config_helper.quarantined_metric_path)
+        self.metric_data_cache = EncodedMetricDataCache()
+        self.request_tracer = self._create_request_tracer()
+        self.client = self._create_client()
+        self.prometheus_exposition = None
+        self._prometheus_server = None
+        if config_helper.prometheus_listen_address:
+            self._start_prometheus_server(config_helper.prometheus_listen_address)
         self._dataset_resolver = dataset_resolver
 
+    def _create_client(self):
+        """
+        Returns the SinkFanout publishing to every configured sink and publish target, the EMFClient in the emf output mode, the AsyncPutClient
+        of the flush pipeline if async_flush_pipeline is enabled and the plugin runs on Python 3, the synchronous PutClient otherwise
+        """
+        if self.config.sinks:
+            sinks = [Sink(name, self._create_sink_client(name), self.config.max_queued_batches_per_sink) for name in self.config.sinks]
+            sinks += [Sink(self._TARGET_SINK_PREFIX + target.name, self._create_target_client(target), self.config.max_queued_batches_per_sink)
+                      for target in self.config.publish_targets]
+            self.flush_pipeline = SinkFanout(sinks)
+            return self.flush_pipeline
+        if self.config.is_emf_output_mode():
+            return EMFClient(self.config)
+        if self.config.async_flush_pipeline:
+            if AsyncPutClient is not None:
+                self.flush_pipeline = AsyncPutClient(self.config, self.config.max_concurrent_put_requests, congestion_controller=self.congestion_controller,
+                                                     endpoint_pool=self.endpoint_pool, metric_quarantine=self.metric_quarantine,
+                                                     request_tracer=self.request_tracer)
+                return self.flush_pipeline
+            self._LOGGER.warning("The asynchronous flush pipeline requires Python 3, metrics are published synchronously")
+        return PutClient(self.config, congestion_controller=self.congestion_controller, endpoint_pool=self.endpoint_pool,
+                         metric_quarantine=self.metric_quarantine, request_tracer=self.request_tracer)
+
+    def _create_sink_client(self, name):
+        """ Returns the client of the sink, every sink publishes from its own worker thread, so the clients are synchronous """
+        if name == self.config.EMF_OUTPUT_MODE:
+            return EMFClient(self.config)
+        if name == self.config.JSONL_SINK:
+            return JSONLinesClient(self.config)
+        return PutClient(self.config, congestion_controller=self.congestion_controller, endpoint_pool=self.endpoint_pool,
+                         metric_quarantine=self.metric_quarantine, metric_data_cache=self.metric_data_cache, request_tracer=self.request_tracer)
+
+    def _create_target_client(self, target):
+        """
+        Returns the PutClient of the publish target. Every target has its own circuit breaker, congestion controller and quarantine,
+        so a failing, throttled or rejecting region or account does not affect the others, and shares the encoded metric data.
+        """
+        endpoint_pool = EndpointPool([target.endpoint], self.config.circuit_breaker_failure_threshold, self.config.circuit_breaker_probe_interval_in_seconds)
+        return PutClient(target, congestion_controller=self._create_congestion_controller(), endpoint_pool=endpoint_pool,
+                         metric_quarantine=MetricQuarantine(target_name=target.name), metric_data_cache=self.metric_data_cache, namespace=target.namespace,
+                         request_tracer=self.request_tracer)
+
+    def _create_endpoint_pool(self):
+        """ Returns the EndpointPool with the circuit breakers of the CloudWatch endpoints shared by the PutMetricData clients """
+        if not self.config.publishes_to_cloudwatch():
+            return None
+        return EndpointPool([self.config.endpoint] + self.config.failover_endpoints, self.config.circuit_breaker_failure_threshold,
+                            self.config.circuit_breaker_probe_interval_in_seconds)
+
+    def _create_congestion_controller(self):
+        """ Returns the AIMDController shared by the PutMetricData clients if congestion_control is enabled, None otherwise """
+        if not self.config.congestion_control:
+            return None
+        return AIMDController(self.config.min_concurrent_put_requests, self.config.max_concurrent_put_requests,
+                              self.config.min_put_requests_per_second, self.config.max_put_requests_per_second)
+
+    def _create_request_tracer(self):
+        """ Returns the RequestTracer shared by the PutMetricData clients if requests are traced in debug mode, None otherwise """
+        if not self.config.is_request_trace_enabled():
+            return None
+        return RequestTracer(self.config.trace_path, self.config.trace_sample_rate)
+
+    def _start_prometheus_server(self, address):
+        """ Starts the Prometheus listener, the plugin keeps publishing metrics if the listener cannot be started """
+        exposition = PrometheusExposition()
+        try:
+            self._prometheus_server = PrometheusServer(address, exposition)
+        except Exception as e:
+            self._LOGGER.error("Cannot start the Prometheus listener at " + address[0] + ":" + str(address[1]) + ". Cause: " + str(e))
+            return
+        self._prometheus_server.start()
+        self.prometheus_exposition = exposition
+
+    @property
+    def metric_map(self):
+        return self.default_schedule.metric_map
+
+    @metric_map.setter
+    def metric_map(self, metric_map):
+        self.default_schedule.metric_map = metric_map
+
+    @property
+    def last_flush_time(self):
+        return self.default_schedule.last_flush_time
+
+    @last_flush_time.setter
+    def last_flush_time(self, last_flush_time):
+        self.default_schedule.last_flush_time = last_flush_time
+        self._flush_check_window = self._NO_FLUSH_CHECK_WINDOW
+
+    @property
+    def flush_interval_in_seconds(self):
+        return self.default_schedule.flush_interval_in_seconds
+
+    @flush_interval_in_seconds.setter
+    def flush_interval_in_seconds(self, flush_interval_in_seconds):
+        self.default_schedule.flush_interval_in_seconds = flush_interval_in_seconds
+        self._flush_check_window = self._NO_FLUSH_CHECK_WINDOW
+
+    @property
+    def enable_high_resolution_metrics(self):
+        return self.default_schedule.enable_high_resolution_metrics
+
+    @enable_high_resolution_metrics.setter
+    def enable_high_resolution_metrics(self, enable_high_resolution_metrics):
+        self.default_schedule.enable_high_resolution_metrics = enable_high_resolution_metrics
+
+    @property
+    def max_metrics_to_aggregate(self):
+        return self.default_schedule.max_metrics_to_aggregate
+
+    @max_metrics_to_aggregate.setter
+    def max_metrics_to_aggregate(self, max_metrics_to_aggregate):
+        self.default_schedule.max_metrics_to_aggregate = max_metrics_to_aggregate
+
+    def _create_schedule(self, flush_interval_in_seconds, enable_high_resolution_metrics):
+        max_metrics_to_aggregate = self._MAX_METRICS_PER_PUT_REQUEST if enable_high_resolution_metrics else self._MAX_METRICS_TO_AGGREGATE
+        series_budget = SeriesBudget(self.config.max_series_per_plugin, self.config.max_series_per_plugin_overrides)
+        change_suppressor = ChangeSuppressor(self.config.suppress_unchanged_metrics, self.config.suppression_heartbeat_intervals)
+        return FlushSchedule(flush_interval_in_seconds, enable_high_resolution_metrics, max_metrics_to_aggregate, series_budget, change_suppressor)
+
+    def get_series_budget_usage(self):
+        """ Returns the number of series counted against the budget of each plugin in the current flush interval """
+        usage = {}
+        for schedule in self.schedules.values():
+            for shard in schedule.get_shards():
+                for plugin, series_count in shard.series_budget.get_usage().items():
+                    usage[plugin] = usage.get(plugin, 0) + series_count
+        return usage
+
+    def get_suppressed_series_count(self):
+        """ Returns the total number of series which were not published because their statistics did not change """
+        return sum(schedule.change_suppressor.suppressed_series_count for schedule in self.schedules.values())
+
+    def _get_schedule(self, metric_key):
+        """
+        Returns the flush schedule for the metric based on the options of the whitelist rule matching the metric.
+        Metrics matching rules without options use the default schedule defined by the plugin configuration.
+        """
+        options = self.config.whitelist.get_metric_options(metric_key)
+        if not options:
+            return self.default_schedule
+        storage_resolution = options.get("storage_resolution", self.default_schedule.storage_resolution)
+        flush_interval_in_seconds = options.get("flush_interval_in_seconds", self.default_schedule.flush_interval_in_seconds)
+        schedule_key = (storage_resolution, flush_interval_in_seconds)
+        schedule = self.schedules.get(schedule_key)
+        if schedule is None:
+            with self.lock:
+                if schedule_key not in self.schedules:
+                    enable_high_resolution_metrics = storage_resolution == MetricDataBuilder.HIGH_STORAGE_RESOLUTION
+                    self.schedules[schedule_key] = self._create_schedule(flush_interval_in_seconds, enable_high_resolution_metrics)
+                    self._flush_check_window = self._NO_FLUSH_CHECK_WINDOW
+                schedule = self.schedules[schedule_key]
+        return schedule
+
+    def _get_namespace(self, metric_key):
+        """ Returns the namespace of the whitelist rule matching the metric, or the namespace of the plugin if the rule does not set one """
+        return self.config.whitelist.get_metric_options(metric_key).get("namespace", MetricDataStatistic.NAMESPACE)
+
     def is_numerical_value(self, value):
         """
         Assume that the value from collectd to this plugin is float or Integer, if string transfer from collectd to this interface,
         we should modify the method  _add_values_to_metric, to convert the string type value to float type value.
 
         Returns:
-            True if the value is float and is not nan
-            False if the value is nan
+            True if the value is a finite float within the range accepted by CloudWatch
+            False if the value is nan, infinite or out of range
         """
-        try:
-            return not math.isnan(float(value))
-        except ValueError:
-            return False
+        return MetricValidator.is_valid_value(value)
 
     def _resolve_ds_names(self, value_list):
         ds_names = self._dataset_resolver.get_dataset_names(value_list.type)
@@ -62,21 +412,23 @@ class Flusher(object):
 
         expanded = []
         for ds_name, value in zip(self._resolve_ds_names(value_list), value_list.values):
-            new_value = value_list.__class__(
-                host=value_list.host,
-                plugin=value_list.plugin,
-                plugin_instance=value_list.plugin_instance,
-                type=value_list.type,
-                type_instance=value_list.type_instance + '.{}'.format(ds_name) if value_list.type_instance else ds_name,
-                time=value_list.time,
-                interval=value_list.interval,
-                meta=value_list.meta,
-                values=[value]
-            )
-            expanded.append(new_value)
+            expanded.append(self._expand_value(value_list, ds_name, value))
 
         return expanded
 
+    def _expand_value(self, value_list, ds_name, value):
+        return value_list.__class__(
+            host=value_list.host,
+            plugin=value_list.plugin,
+            plugin_instance=value_list.plugin_instance,
+            type=value_list.type,
+            type_instance=value_list.type_instance + '.{}'.format(ds_name) if value_list.type_instance else ds_name,
+            time=value_list.time,
+            interval=value_list.interval,
+            meta=value_list.meta,
+            values=[value]
+        )
+
     def add_metric(self, value_list):
         """
         Translates Collectd metrics to CloudWatch format and stores them in flusher for further processing
@@ -85,81 +437,284 @@ class Flusher(object):
         Keyword arguments:
         value_list -- The ValueList object passed by Collectd to the write callback
         """
-        with self.lock:
-            # The flush operation should take place before adding metric for a new minute.
-            # Together with flush delta this ensures that old metrics are flushed before or at the start of a new minute.
-            self._flush_if_need(time.time())
-            for value in self._expand_value_list(value_list):
-                if self.config.whitelist.is_whitelisted(self._get_metric_key(value)):
-                        self._aggregate_metric(value)
+        # The flush operation should take place before adding metric for a new minute.
+        # Together with flush delta this ensures that old metrics are flushed before or at the start of a new minute.
+        # Reading the monotonic clock is expensive on Python 2, so it is read only when the wall clock leaves the window
+        # in which no schedule can be due, which also happens when the wall clock is stepped in either direction.
+        window_start, window_end = self._flush_check_window
+        if not window_start <= time.time() < window_end:
+            self._flush_if_need(clock.monotonic())
+        self._add_value_list(value_list)
+
+    def add_metrics(self, value_lists):
+        """
+        Bulk version of add_metric used by ingestion paths that receive many value lists at once, such as replay or relay.
+        The clock is read and the flush time is checked once per _BULK_FLUSH_CHECK_INTERVAL value lists instead of
+        once per value list.
+
+        Keyword arguments:
+        value_lists -- The iterable of collectd ValueList objects or tuples with the fields of ValueRecord
+        """
+        for index, value_list in enumerate(value_lists):
+            if index % self._BULK_FLUSH_CHECK_INTERVAL == 0:
+                self._flush_if_need(clock.monotonic())
+            if type(value_list) is tuple:
+                value_list = ValueRecord(*value_list)
+            self._add_value_list(value_list)
+
+    def _add_value_list(self, value_list):
+        """
+        Aggregates the values of the value list allowed by the whitelist. The whitelist decision is cached per series,
+        so a blocked value list is rejected with a single dictionary lookup before it is expanded, and only the allowed
+        data sources of a multi-value list are expanded.
+        """
+        values = value_list.values
+        series = (value_list.plugin, value_list.plugin_instance, value_list.type, value_list.type_instance, len(values))
+        allowed_values = self._whitelist_decisions.get(series)
+        if allowed_values is None:
+            allowed_values = self._get_whitelist_decision(series, value_list)
+        if not allowed_values:
+            return
+        if len(values) == 1:
+            self._aggregate_whitelisted_metric(value_list, allowed_values[0][2])
+            return
+        for index, ds_name, metric_key in allowed_values:
+            self._aggregate_whitelisted_metric(self._expand_value(value_list, ds_name, values[index]), metric_key)
+
+    def _get_whitelist_decision(self, series, value_list):
+        """
+        Tests every data source of the value list against the whitelist and caches the result for the series.
+        Decisions evicted from the recent generation of the cache are reused if they are still in the old one.
+
+        Returns:
+            the tuple of (value index, data source name, metric key) entries of the allowed data sources
+        """
+        allowed_values = self._whitelist_decisions.take_old(series)
+        if allowed_values is not GovernedCache.MISSING:
+            return allowed_values
+        if len(value_list.values) == 1:
+            expanded = [(None, value_list)]
+        else:
+            expanded = zip(self._resolve_ds_names(value_list), self._expand_value_list(value_list))
+        allowed_values = []
+        for index, (ds_name, value) in enumerate(expanded):
+            metric_key = self._get_metric_key(value)
+            if self.config.whitelist.is_whitelisted(metric_key):
+                allowed_values.append((index, ds_name, metric_key))
+        allowed_values = tuple(allowed_values)
+        self._whitelist_decisions[series] = allowed_values
+        return allowed_values
+
+    def _aggregate_whitelisted_metric(self, value_list, metric_key):
+        """
+        Aggregates the value list with its own series and, if a rollup rule matches the metric,
+        with the rollup series. Series of rules with drop_source enabled are aggregated only as part of the rollup.
+        The rollup series is published to the namespace of the whitelist rule matching its source metrics.
+        """
+        schedule = self._get_schedule(metric_key)
+        namespace = self._get_namespace(metric_key)
+        rollup_rule = self.config.rollups.get_rule(metric_key)
+        if rollup_rule:
+            self._aggregate_metric(rollup_rule.build_rollup_value_list(value_list), schedule, namespace=namespace)
+            if rollup_rule.drop_source:
+                return
+        self._aggregate_metric(value_list, schedule, metric_key, namespace)
 
     def _flush_if_need(self, current_time):
         """ 
-        Checks if metrics should be flushed and starts the flush procedure
-        """
-        if self._is_flush_time(current_time):
-            if self.config.debug and self.metric_map:
-                state = ""
-                for dimension_metrics in self.metric_map:
-                    state += str(dimension_metrics) + "[" + str(self.metric_map[dimension_metrics][0].statistics.sample_count) + "] "
-                self._LOGGER.info("[debug] flushing metrics " + state)
-            self._flush()
+        Checks if metrics of any schedule should be flushed and starts the flush procedure.
+        Only one thread flushes at a time, the other threads keep aggregating in their shards.
+
+        Keyword arguments:
+        current_time -- the current time of the monotonic clock
+        """
+        schedules = list(self.schedules.values())
+        for schedule in schedules:
+            if self._is_flush_time(current_time, schedule):
+                with self.lock:
+                    if self._is_flush_time(current_time, schedule):
+                        self._flush(schedule)
+        next_flush_time = min(self._get_next_flush_time(schedule) for schedule in schedules)
+        self._prewarm_connection_if_need(current_time, next_flush_time)
+        self._update_flush_check_window(next_flush_time)
+
+    def _prewarm_connection_if_need(self, current_time, next_flush_time):
+        """
+        Opens or validates the connection of the client once per flush, _CONNECTION_PREWARM_LEAD_IN_SECONDS before
+        the flush, so the flush starts on an established connection instead of an idle one closed by the endpoint.
+        """
+        if current_time < next_flush_time - self._CONNECTION_PREWARM_LEAD_IN_SECONDS or next_flush_time == self._prewarmed_flush_time:
+            return
+        with self.lock:
+            if next_flush_time != self._prewarmed_flush_time:
+                self._prewarmed_flush_time = next_flush_time
+                self.client.prewarm()
+
+    def _update_flush_check_window(self, next_flush_time):
+        """
+        Sets the wall clock window in which no schedule is due and no connection needs to be prewarmed,
+        so add_metric does not need to read the monotonic clock
+        """
+        current_time = clock.monotonic()
+        wall_time = time.time()
+        window_end_time = next_flush_time
+        if next_flush_time - self._CONNECTION_PREWARM_LEAD_IN_SECONDS > current_time:
+            window_end_time = next_flush_time - self._CONNECTION_PREWARM_LEAD_IN_SECONDS
+        self._flush_check_window = (wall_time, wall_time + window_end_time - current_time)
+
+    def _log_flushed_metrics(self, schedule, metric_map):
+        if self.config.debug and metric_map:
+            state = ""
+            for dimension_metrics in metric_map:
+                state += str(dimension_metrics) + "[" + str(metric_map[dimension_metrics][0].statistics.sample_count) + "] "
+            self._LOGGER.info("[debug] flushing metrics " + state)
+
+    def _log_series_budget_usage(self, schedule):
+        if self.config.debug:
+            for shard in schedule.get_shards():
+                if shard.series_budget.enabled:
+                    self._LOGGER.info("[debug] series budget usage " + str(shard.series_budget.get_usage()) +
+                                      " folded series " + str(shard.series_budget.folded_series_count))
     
-    def _is_flush_time(self, current_time):
-        if self.enable_high_resolution_metrics:
-            return (current_time - self.last_flush_time) >= self.flush_interval_in_seconds + self._FLUSH_DELTA_IN_SECONDS
-        return (current_time - self.last_flush_time) + self._FLUSH_DELTA_IN_SECONDS >= self.flush_interval_in_seconds
+    def _log_cache_memory_usage(self):
+        if self.config.debug:
+            self._LOGGER.info("[debug] approximate cache memory usage in bytes " + str(self.get_cache_memory_usage()) +
+                              " evicted entries " + str(self.memory_governor.evicted_entry_count))
+
+    def get_cache_memory_usage(self):
+        """ Returns the approximate memory in bytes used by each long-lived cache of the plugin """
+        return self.memory_governor.get_usage()
+
+    def _is_flush_time(self, current_time, schedule=None):
+        schedule = schedule or self.default_schedule
+        return current_time >= self._get_next_flush_time(schedule)
+
+    def _get_flush_phase(self, schedule):
+        """
+        Returns the number of seconds after the wall clock boundary at which the schedule is flushed. Standard resolution
+        metrics are flushed just before the start of a new minute, high resolution metrics just after their last second.
+        """
+        return self._FLUSH_DELTA_IN_SECONDS if schedule.enable_high_resolution_metrics else -self._FLUSH_DELTA_IN_SECONDS
+
+    def _get_next_flush_time(self, schedule):
+        """ Returns the monotonic time of the next flush of the schedule, the first flush takes place a full interval after start """
+        flush_offset = schedule.flush_offset
+        if flush_offset is None:
+            flush_offset = -self._get_flush_phase(schedule)
+        return schedule.last_flush_time + schedule.flush_interval_in_seconds - flush_offset
 
     def record_nan_value(self, key, value_list):
         if key not in self.nan_key_set:
             self._LOGGER.warning(
                 "Adding Metric value is not numerical, key: " + key + " value: " + str(value_list.values))
-            self.nan_key_set.add(key)
+            self.nan_key_set[key] = True
 
-    def _aggregate_metric(self, value_list):
+    def _aggregate_metric(self, value_list, schedule=None, dimension_key=None, namespace=None):
         """
-        Selects existing metric or adds a new metric to the metric_map. Then aggregates values from ValueList with the selected metric.
+        Selects existing metric or adds a new metric to the metric_map of the schedule shard of the calling thread.
+        Then aggregates values from ValueList with the selected metric.
         If the size of metric_map is above the limit, new metric will not be added and the value_list will be dropped.
         """
+        schedule = schedule or self.default_schedule
         nan_value_count = 0
-        dimension_key = self._get_metric_key(value_list)
+        dimension_key = dimension_key or self._get_metric_key(value_list)
         adjusted_time = int(value_list.time)
 
         key = dimension_key
-        if self.enable_high_resolution_metrics:
+        if schedule.enable_high_resolution_metrics:
             key = dimension_key + "-" + str(adjusted_time)
-        if key in self.metric_map:
-            nan_value_count = self._add_values_to_metrics(self.metric_map[key], value_list)
-        else:
-            if len(self.metric_map) < self.max_metrics_to_aggregate:
-                nan_value_count = self._add_metric_to_queue(value_list, adjusted_time, key)
+        shard = schedule.get_shard()
+        if schedule.enable_high_resolution_metrics and key not in shard.metric_map and len(shard.metric_map) >= schedule.max_metrics_to_aggregate:
+            with self.lock:
+                self._flush(schedule)
+        metric_map, series_budget = shard.begin_update()
+        try:
+            if key in metric_map:
+                nan_value_count = self._add_values_to_metrics(metric_map[key], value_list)
+            elif len(metric_map) < schedule.max_metrics_to_aggregate:
+                nan_value_count = self._add_metric_to_queue(value_list, adjusted_time, key, schedule, shard, metric_map, series_budget, namespace)
             else:
-                if self.enable_high_resolution_metrics:
-                    if self.config.debug and self.metric_map:
-                        state = ""
-                        for dimension_metrics in self.metric_map:
-                            state += str(dimension_metrics) + "[" + str(self.metric_map[dimension_metrics][0].statistics.sample_count) + "] "
-                        self._LOGGER.info("[debug] flushing metrics " + state)
-                    self._flush()
-                    nan_value_count = self._add_metric_to_queue(value_list, adjusted_time, key)
-                else:
-                    self._LOGGER.warning("Batching queue overflow detected. Dropping metric.")
+                self._LOGGER.warning("Batching queue overflow detected. Dropping metric.")
+        finally:
+            shard.end_update()
         if nan_value_count:
             self.record_nan_value(dimension_key, value_list)
 
-    def _add_metric_to_queue(self, value_list, adjusted_time, key):
+    def _add_metric_to_queue(self, value_list, adjusted_time, key, schedule, shard, metric_map, series_budget, namespace=None):
         nan_value_count = 0
-        metrics = MetricDataBuilder(self.config, value_list, adjusted_time).build()
+        metrics = self._build_metrics(value_list, adjusted_time, schedule, shard, namespace)
         nan_value_count = self._add_values_to_metrics(metrics, value_list)
         if nan_value_count != len(value_list.values):
-            self.metric_map[key] = metrics
+            if series_budget.enabled:
+                self._admit_to_series_budget(value_list, key, metrics, schedule, shard, metric_map, series_budget)
+            metric_map[key] = metrics
+        else:
+            self._release_statistics(metrics)
         return nan_value_count
 
+    def _build_metrics(self, value_list, adjusted_time, schedule, shard, namespace=None):
+        """
+        Builds the metric of the value list with statistics aggregated in a slot of the shard statistics columns.
+        The dimension sets of push_asg and push_constant are expanded from this metric only when it is flushed.
+        Without a shard the metric is built without statistics.
+        """
+        metric = MetricDataBuilder(self.config, value_list, adjusted_time, schedule.storage_resolution, namespace).build_series()
+        if shard is not None:
+            metric.statistics = shard.statistics_columns.get_statistics(shard.statistics_columns.allocate())
+        return [metric]
+
+    def _release_statistics(self, metrics):
+        """
+        Replaces column statistics of the metrics with detached Statistics objects and releases their slots for reuse.
+        Metrics without any aggregated value are left without statistics.
+        """
+        for metric in metrics:
+            if isinstance(metric.statistics, ColumnStatistics):
+                metric.statistics = metric.statistics.columns.detach(metric.statistics.slot)
+
+    def _admit_to_series_budget(self, value_list, key, metrics, schedule, shard, metric_map, series_budget):
+        """
+        Counts the new series against the budget of its plugin. If the plugin is over budget,
+        the series evicted by the budget is removed from the metric_map and folded into the OTHER series.
+        """
+        evicted = series_budget.admit(value_list.plugin, key, metrics, value_list)
+        if evicted:
+            evicted_key, evicted_metrics, evicted_value_list = evicted
+            if metric_map.pop(evicted_key, None) is not None:
+                self._fold_into_other_series(evicted_metrics, evicted_value_list, schedule, shard, metric_map)
+                self._release_statistics(evicted_metrics)
+
+    def _fold_into_other_series(self, metrics, value_list, schedule, shard, metric_map):
+        """
+        Merges statistics of the series with the OTHER series of its plugin and type.
+        The OTHER series is never counted against the series budget. Without a shard the OTHER series is built
+        with detached statistics, e.g. when the series budgets of the shards are merged.
+        """
+        other_value_list = value_list.__class__(
+            host=value_list.host,
+            plugin=value_list.plugin,
+            plugin_instance=SeriesBudget.OTHER,
+            type=value_list.type,
+            type_instance=SeriesBudget.OTHER,
+            time=value_list.time,
+            interval=value_list.interval,
+            meta=value_list.meta,
+            values=[]
+        )
+        other_key = self._get_metric_key(other_value_list)
+        if schedule.enable_high_resolution_metrics:
+            other_key = other_key + "-" + str(int(value_list.time))
+        if other_key not in metric_map:
+            metric_map[other_key] = self._build_metrics(other_value_list, int(value_list.time), schedule, shard, metrics[0].namespace)
+        for other_metric, metric in zip(metric_map[other_key], metrics):
+            other_metric.merge_statistics(metric.statistics)
+
     def _get_metric_key(self, value_list):
         """
         Generates key for the metric. The key must use both metric_name and plugin instance to ensure uniqueness.
+        The key is built only once per series and then looked up by the series registry.
         """ 
-        return value_list.plugin + "-" + value_list.plugin_instance + "-" + value_list.type + "-" +value_list.type_instance
+        return self.series_registry.get_key(self.series_registry.get_id(value_list))
 
     def _add_values_to_metrics(self, dimension_metrics, value_list):
         """
@@ -169,49 +724,376 @@ class Flusher(object):
         Returns:
             return the count of the nan value in value_list
         """
-        
+        numerical_values = [value for value in value_list.values if self.is_numerical_value(value)]
         for metric in dimension_metrics:
-            nan_value_count = 0
-            for value in value_list.values:
-                if self.is_numerical_value(value):
+            if isinstance(metric.statistics, ColumnStatistics):
+                metric.statistics.columns.add_values(metric.statistics.slot, numerical_values)
+            else:
+                for value in numerical_values:
                     metric.add_value(value)
+        return len(value_list.values) - len(numerical_values)
+
+    def _flush(self, schedule=None):
+        """
+        Merges metrics of all shards of the schedule, then batches and puts them to CloudWatch
+        """
+        schedule = schedule or self.default_schedule
+        schedule.last_flush_time = clock.monotonic()
+        schedule.flush_offset = clock.get_boundary_offset(schedule.flush_interval_in_seconds, phase=self._get_flush_phase(schedule))
+        schedule.change_suppressor.start_flush()
+        self._log_series_budget_usage(schedule)
+        self.memory_governor.enforce()
+        self._log_cache_memory_usage()
+        metric_map = self._merge_shards(schedule)
+        self._log_flushed_metrics(schedule, metric_map)
+        self._expose_metric_map(schedule, metric_map)
+        self._put_metric_map(schedule, metric_map)
+        self._report_congestion_state()
+        if self.config.debug and schedule.change_suppressor.last_suppressed_series_count:
+            self._LOGGER.info("[debug] suppressed " + str(schedule.change_suppressor.last_suppressed_series_count) + " unchanged series")
+
+    def flush(self, timeout=-1, identifier=None):
+        """
+        Publishes aggregated metrics on demand, e.g. when collectd receives the FLUSH command, without waiting
+        for the end of the flush interval. Metrics which do not match the arguments are kept and published
+        with the next flush of their schedule. The flush interval of the schedules is not restarted.
+
+        collectd flushes all series with the timeout 0 before it calls the shutdown callbacks, so a flush of all series
+        with a non-positive timeout drains the metrics like shutdown: the batches are published within
+        shutdown_drain_timeout_in_seconds and the unpublished metrics are saved to the aggregation snapshot.
+
+        Keyword arguments:
+        timeout -- only metrics aggregated for at least timeout seconds are published, a non-positive value publishes all (default -1)
+        identifier -- the collectd identifier 'host/plugin[-plugin_instance]/type[-type_instance]' of the published series,
+                      None publishes all series (default None)
+        """
+        if identifier is None and (timeout is None or timeout <= 0):
+            deadline = clock.monotonic() + self.config.shutdown_drain_timeout_in_seconds
+            with self.lock:
+                self._save_unsent_entries(self._drain_schedules(deadline))
+            return
+        metric_keys = self._get_identifier_metric_keys(identifier) if identifier else None
+        oldest_timestamp = None
+        if timeout is not None and timeout > 0:
+            oldest_timestamp = awsutils.get_aws_timestamp(time.time() - timeout)
+        with self.lock:
+            for schedule in self.schedules.values():
+                metric_map = self._merge_shards(schedule)
+                for key, dimension_metrics in list(metric_map.items()):
+                    if not self._is_flush_requested(key, dimension_metrics, schedule, metric_keys, oldest_timestamp):
+                        schedule.retained_metric_map[key] = metric_map.pop(key)
+                self._log_flushed_metrics(schedule, metric_map)
+                self._expose_metric_map(schedule, metric_map, replace=False)
+                self._put_metric_map(schedule, metric_map)
+
+    def shutdown(self):
+        """
+        Publishes all aggregated metrics when collectd stops. Metrics which are not published within
+        shutdown_drain_timeout_in_seconds, or whose PutMetricData request fails, are saved to the aggregation snapshot.
+        Batches already handed over to the flush pipeline are published first, then the pipeline, the Prometheus listener
+        and the request tracer are stopped. The batches still queued by the pipeline when it is stopped are saved as well.
+        """
+        deadline = clock.monotonic() + self.config.shutdown_drain_timeout_in_seconds
+        with self.lock:
+            unsent_entries = self._drain_schedules(deadline)
+            if self.flush_pipeline is not None:
+                unsent_entries.extend(self._get_unsent_batch_entries(self.flush_pipeline.close(max(0, deadline - clock.monotonic()))))
+            self._save_unsent_entries(unsent_entries)
+        if self._prometheus_server is not None:
+            self._prometheus_server.stop()
+        if self.request_tracer is not None:
+            self.request_tracer.close(max(0, deadline - clock.monotonic()))
+
+    def _drain_schedules(self, deadline):
+        """
+        Waits for the batches handed over to the flush pipeline, then puts the metrics of all schedules until the deadline.
+
+        Returns:
+            the list of (key, dimension_metrics, sink_names) tuples which were not published, see _put_drained_batch
+        """
+        if self.flush_pipeline is not None:
+            self.flush_pipeline.wait_for_pending_flushes(max(0, deadline - clock.monotonic()))
+        unsent_entries = []
+        for schedule in self.schedules.values():
+            metric_map = self._merge_shards(schedule)
+            self._log_flushed_metrics(schedule, metric_map)
+            self._expose_metric_map(schedule, metric_map, replace=False)
+            unsent_entries.extend(self._drain_metric_map(metric_map, deadline))
+        return unsent_entries
+
+    def _get_unsent_batch_entries(self, unsent_batches):
+        """
+        Translates the batches which the flush pipeline did not publish to snapshot entries. The metrics of the batches are
+        already expanded, so every metric is saved without sibling dimensions under a key of its own, which keeps it from
+        being merged with another series when it is restored.
+        """
+        unsent_entries = []
+        for namespace, metric_batch, sink_names in unsent_batches:
+            for metric in metric_batch:
+                dimensions = ",".join(str(name) + "=" + str(value) for name, value in sorted(metric.dimensions.items()))
+                key = "-".join([self._UNSENT_BATCH_KEY_PREFIX, namespace, metric.metric_name, dimensions, metric.timestamp])
+                unsent_entries.append((key, [MetricDataStatistic(metric_name=metric.metric_name, unit=metric.unit, dimensions=metric.dimensions,
+                                                                 statistic_values=metric.statistics, timestamp=metric.timestamp,
+                                                                 namespace=namespace, storage_resolution=metric.storage_resolution)], sink_names))
+        return unsent_entries
+
+    def _save_unsent_entries(self, unsent_entries):
+        """
+        Saves the unpublished metrics to the aggregation snapshot. The snapshot replaces the previous one, so it holds
+        the metrics left unpublished by every drain since the plugin started.
+        """
+        self._unsent_entries.extend(unsent_entries)
+        if not self._unsent_entries:
+            return
+        try:
+            saved_count = AggregationSnapshot(self.config.snapshot_path).save(self._unsent_entries)
+            self._LOGGER.warning("Saved " + str(saved_count) + " unsent metrics to the aggregation snapshot: " + self.config.snapshot_path)
+        except Exception as e:
+            self._LOGGER.error("Cannot save aggregation snapshot at: " + self.config.snapshot_path + ". Cause: " + str(e))
+
+    def _drain_metric_map(self, metric_map, deadline):
+        """
+        Puts metrics of the metric_map to CloudWatch in per namespace batches which never split the dimension sets of a series,
+        so that every series is either published or returned as unsent as a whole.
+
+        Returns:
+            the list of (key, dimension_metrics, sink_names) tuples which were not published, see _put_drained_batch
+        """
+        unsent_entries = []
+        pending_batches = {}
+        for key, dimension_metrics in iteritems(metric_map):
+            metrics = [metric for metric in self._expand_metrics(dimension_metrics) if self.metric_quarantine.is_valid(metric)]
+            if not metrics:
+                continue
+            namespace = metrics[0].namespace
+            metric_batch, batch_entries = pending_batches.setdefault(namespace, ([], []))
+            if metric_batch and len(metric_batch) + len(metrics) > self._MAX_METRICS_PER_PUT_REQUEST:
+                unsent_entries.extend(self._put_drained_batch(namespace, metric_batch, batch_entries, deadline))
+                metric_batch, batch_entries = pending_batches[namespace] = ([], [])
+            batch_entries.append((key, dimension_metrics))
+            metric_batch.extend(metrics)
+        for namespace, (metric_batch, batch_entries) in iteritems(pending_batches):
+            if metric_batch:
+                unsent_entries.extend(self._put_drained_batch(namespace, metric_batch, batch_entries, deadline))
+        return unsent_entries
+
+    def _put_drained_batch(self, namespace, metric_batch, batch_entries, deadline):
+        """
+        Puts the batch with the time left until the deadline, the entries of a batch which is not published in time are returned as unsent.
+        With sinks, the unsent entries name the sinks which did not publish the batch, so they are restored only to those sinks
+        and the sinks which published the batch do not count its values twice. The sink names are None if no output published the batch.
+        """
+        remaining_time = deadline - clock.monotonic()
+        if remaining_time <= 0:
+            sink_names = None
+        elif isinstance(self.client, SinkFanout):
+            sink_names = self.client.put_metric_data_to_sinks(namespace, metric_batch, timeout=remaining_time)
+            if not sink_names:
+                return []
+            if len(sink_names) == len(self.client.sinks):
+                sink_names = None
+        elif self.client.put_metric_data(namespace, metric_batch, timeout=remaining_time):
+            return []
+        else:
+            sink_names = None
+        return [(key, dimension_metrics, sink_names) for key, dimension_metrics in batch_entries]
+
+    def restore_snapshot(self):
+        """
+        Merges metrics saved to the aggregation snapshot by the previous shutdown back into the flush schedules,
+        they are published with the next flush. Metrics aggregated within the current flush interval are merged
+        with new values of their series, older metrics are published with their original time stamp.
+        Metrics with time stamps no longer accepted by CloudWatch are discarded. Metrics of the batches left unpublished
+        by the flush pipeline keep the namespace of their batch, other metrics get the namespace of their whitelist rule.
+        Metrics which only some of the sinks did not publish are queued at once to these sinks only.
+        """
+        current_time = time.time()
+        oldest_timestamp = awsutils.get_aws_timestamp(current_time - self._MAX_SNAPSHOT_AGE_IN_SECONDS)
+        newest_timestamp = awsutils.get_aws_timestamp(current_time + self._MAX_SNAPSHOT_CLOCK_SKEW_IN_SECONDS)
+        restored_count = 0
+        sink_batches = {}
+        for key, dimension_metrics, sink_names in AggregationSnapshot(self.config.snapshot_path).load():
+            timestamp = dimension_metrics[0].timestamp
+            if not oldest_timestamp <= timestamp <= newest_timestamp:
+                continue
+            high_resolution = dimension_metrics[0].storage_resolution == MetricDataBuilder.HIGH_STORAGE_RESOLUTION
+            metric_key = key.rsplit("-", 1)[0] if high_resolution else key
+            if not key.startswith(self._UNSENT_BATCH_KEY_PREFIX + "-"):
+                namespace = self._get_namespace(metric_key)
+                for metric in dimension_metrics:
+                    metric.namespace = namespace
+            if sink_names is not None:
+                metrics = list(self._expand_metrics(dimension_metrics))
+                sink_batches.setdefault((dimension_metrics[0].namespace, tuple(sorted(sink_names))), []).extend(metrics)
+                restored_count += 1
+                continue
+            schedule = self._get_schedule(metric_key)
+            if not high_resolution and timestamp < awsutils.get_aws_timestamp(current_time - schedule.flush_interval_in_seconds):
+                key = key + "-" + timestamp
+            with self.lock:
+                if key in schedule.retained_metric_map:
+                    for metric, restored_metric in zip(schedule.retained_metric_map[key], dimension_metrics):
+                        metric.merge_statistics(restored_metric.statistics)
                 else:
-                    nan_value_count += 1
-        return nan_value_count
+                    schedule.retained_metric_map[key] = dimension_metrics
+            restored_count += 1
+        for (namespace, sink_names), metrics in iteritems(sink_batches):
+            self._restore_to_sinks(namespace, metrics, sink_names)
+        if restored_count:
+            self._LOGGER.info("Restored " + str(restored_count) + " metrics from the aggregation snapshot: " + self.config.snapshot_path)
+
+    def _restore_to_sinks(self, namespace, metrics, sink_names):
+        """ Queues the restored metrics to the named sinks, the metrics are discarded if none of the sinks is configured any more """
+        if isinstance(self.client, SinkFanout):
+            configured_sink_names = [sink.name for sink in self.client.sinks if sink.name in sink_names]
+        else:
+            configured_sink_names = []
+        if not configured_sink_names:
+            self._LOGGER.warning("Discarded " + str(len(metrics)) + " metrics of the aggregation snapshot saved for sinks which are not configured: " +
+                                 ", ".join(sink_names))
+            return
+        metric_batches = [metrics[index:index + self._MAX_METRICS_PER_PUT_REQUEST] for index in range(0, len(metrics), self._MAX_METRICS_PER_PUT_REQUEST)]
+        self.client.put_metric_batches(namespace, metric_batches, sink_names=configured_sink_names)
+
+    def _get_identifier_metric_keys(self, identifier):
+        """
+        Translates the collectd identifier to the metric keys of its series. The host part is ignored,
+        since all series aggregated by the plugin are reported by the local collectd instance.
+        Multi-value types are expanded to one metric key per data source, as in _expand_value_list.
+        """
+        parts = identifier.split("/")
+        if len(parts) != 3:
+            self._LOGGER.warning("Cannot flush metrics of invalid identifier: " + str(identifier))
+            return set()
+        plugin, _, plugin_instance = parts[1].partition("-")
+        type, _, type_instance = parts[2].partition("-")
+        metric_keys = set(["-".join([plugin, plugin_instance, type, type_instance])])
+        try:
+            ds_names = self._dataset_resolver.get_dataset_names(type) or []
+        except (TypeError, ValueError):
+            ds_names = []
+        for ds_name in ds_names:
+            expanded_type_instance = type_instance + "." + ds_name if type_instance else ds_name
+            metric_keys.add("-".join([plugin, plugin_instance, type, expanded_type_instance]))
+        return metric_keys
+
+    def _is_flush_requested(self, key, dimension_metrics, schedule, metric_keys, oldest_timestamp):
+        if metric_keys is not None:
+            dimension_key = key.rsplit("-", 1)[0] if schedule.enable_high_resolution_metrics else key
+            if dimension_key not in metric_keys:
+                return False
+        if oldest_timestamp is not None:
+            return dimension_metrics[0].timestamp <= oldest_timestamp
+        return True
+
+    def _expose_metric_map(self, schedule, metric_map, replace=True):
+        """
+        Rebuilds the Prometheus exposition with the flushed metrics, including series skipped by the change suppressor.
+        An on demand flush adds its metrics to the metrics of the last flush of the schedule.
+        """
+        if self.prometheus_exposition is not None:
+            metrics = [metric for dimension_metrics in metric_map.values() for metric in self._expand_metrics(dimension_metrics)]
+            self.prometheus_exposition.update(schedule, metrics, replace)
 
-    def _flush(self):
-        """
-        Batches and puts metrics to CloudWatch
-        """
-        self.last_flush_time = time.time()
-        metric_map_size = len(self.metric_map)
-        if self.metric_map:
-            prepare_batch = self._prepare_batch()
-            try:
-                while True:
-                    metric_batch = prepare_batch.next()
-                    if not metric_batch:
-                        break
-                    self.client.put_metric_data(MetricDataStatistic.NAMESPACE, metric_batch)
-                    if len(metric_batch) < self._MAX_METRICS_PER_PUT_REQUEST:
-                        break
-            except StopIteration, e:
-                if metric_map_size % self._MAX_METRICS_PER_PUT_REQUEST != 0 or len(self.metric_map) != 0:
-                    self._LOGGER.error("_flush error: " + str(e) + "  Original map size: " + str(metric_map_size))
-
-    def _prepare_batch(self):
-        """
-        Removes metrics from the metric_map and adds them to the batch. 
-        The batch size is defined by _MAX_METRICS_PER_PUT_REQUEST.
-        """
-        metric_batch = []
-        while self.metric_map:
-            key, dimension_metrics = self.metric_map.popitem()
-            for metric in dimension_metrics:
-                if len(metric_batch) < self._MAX_METRICS_PER_PUT_REQUEST:
-                    metric_batch.append(metric)
+    def _report_congestion_state(self):
+        """
+        Exposes the window and the request rate of the congestion controller as internal metrics of the Prometheus
+        exposition and logs them in debug mode. The state reflects the requests finished before the flush.
+        """
+        if self.congestion_controller is None:
+            return
+        state = self.congestion_controller.get_state()
+        if self.prometheus_exposition is not None:
+            self.prometheus_exposition.update_internal_gauges({
+                "collectd_cloudwatch_put_congestion_window": state["window"],
+                "collectd_cloudwatch_put_concurrency_limit": state["concurrency_limit"],
+                "collectd_cloudwatch_put_request_rate": state["rate"],
+                "collectd_cloudwatch_put_congestion_events": state["congestion_events"]})
+        if self.config.debug:
+            self._LOGGER.info("[debug] PutMetricData congestion window: " + str(round(state["window"], 2)) + ", request rate: " +
+                              str(round(state["rate"], 2)) + " per second, congestion events: " + str(state["congestion_events"]))
+
+    def _put_metric_map(self, schedule, metric_map):
+        """
+        Batches metrics of the metric_map and puts them to CloudWatch, the metric_map is emptied.
+        Every batch holds metrics of a single namespace, so the request is sent with the namespace of its metrics.
+        With the flush pipeline the batches are handed over to its event loop without waiting for the requests.
+        The change suppressor forgets the series of the batches which are not published, so they are not suppressed next time.
+        """
+        if metric_map and self.flush_pipeline is not None:
+            namespace_batches = {}
+            for metric_batch in self._prepare_batch(schedule, metric_map):
+                if metric_batch:
+                    namespace_batches.setdefault(metric_batch[0].namespace, []).append(metric_batch)
+            for namespace, metric_batches in iteritems(namespace_batches):
+                self.flush_pipeline.put_metric_batches(namespace, metric_batches, on_failure=schedule.change_suppressor.rollback)
+        elif metric_map:
+            for metric_batch in self._prepare_batch(schedule, metric_map):
+                if metric_batch and not self.client.put_metric_data(metric_batch[0].namespace, metric_batch):
+                    schedule.change_suppressor.rollback(metric_batch)
+
+    def _merge_shards(self, schedule):
+        """
+        Takes the metric maps of all shards of the schedule and merges statistics of the series aggregated by several shards.
+        The statistics are detached from the shard statistics columns, so the merged map is independent of the shards.
+        Metrics retained by the previous on demand flush are merged as well. If several shards hold series of a plugin
+        with a series budget, the series over the budget of the plugin are folded into its OTHER series.
+        """
+        metric_map = schedule.retained_metric_map
+        schedule.retained_metric_map = {}
+        series_budgets = []
+        for shard in schedule.get_shards():
+            shard_metric_map, series_budget = shard.take_metric_map()
+            if series_budget.enabled:
+                series_budgets.append(series_budget)
+            for key, dimension_metrics in iteritems(shard_metric_map):
+                self._release_statistics(dimension_metrics)
+                if key in metric_map:
+                    for metric, shard_metric in zip(metric_map[key], dimension_metrics):
+                        metric.merge_statistics(shard_metric.statistics)
                 else:
+                    metric_map[key] = dimension_metrics
+        if len(series_budgets) > 1:
+            for key, dimension_metrics, value_list in schedule.merge_series_budgets(series_budgets, metric_map):
+                if metric_map.pop(key, None) is not None:
+                    self._fold_into_other_series(dimension_metrics, value_list, schedule, None, metric_map)
+        return metric_map
+
+    def _prepare_batch(self, schedule=None, metric_map=None):
+        """
+        Removes metrics from the metric_map (by default the metric map of the schedule shard of the calling thread)
+        and adds them to the batch of their namespace. The batch size is defined by _MAX_METRICS_PER_PUT_REQUEST.
+        Full batches are yielded as soon as they are filled, the partially filled batches of all namespaces are
+        yielded once the metric_map is empty, so metrics routed to different namespaces do not split each other's batches.
+        An empty batch is yielded if there is nothing to publish.
+        Series skipped by the change suppressor and invalid metrics are not added, quarantined series are skipped by each client.
+        """
+        schedule = schedule or self.default_schedule
+        if metric_map is None:
+            metric_map = schedule.metric_map
+        metric_batches = {}
+        yielded = False
+        while metric_map:
+            key, dimension_metrics = metric_map.popitem()
+            self._release_statistics(dimension_metrics)
+            dimension_metrics = [metric for metric in dimension_metrics if schedule.change_suppressor.should_publish(metric)]
+            for metric in self._expand_metrics(dimension_metrics):
+                if not self.metric_quarantine.is_valid(metric):
+                    continue
+                metric_batch = metric_batches.setdefault(metric.namespace, [])
+                metric_batch.append(metric)
+                if len(metric_batch) == self._MAX_METRICS_PER_PUT_REQUEST:
+                    del metric_batches[metric.namespace]
+                    yielded = True
                     yield metric_batch
-                    metric_batch = []
-                    metric_batch.append(metric)
-        yield metric_batch
+        for metric_batch in metric_batches.values():
+            yielded = True
+            yield metric_batch
+        if not yielded:
+            yield []
+
+    def _expand_metrics(self, dimension_metrics):
+        """ Expands the aggregated metrics into metrics of all published dimension sets """
+        for series_metric in dimension_metrics:
+            for metric in series_metric.expand():
+                yield metric
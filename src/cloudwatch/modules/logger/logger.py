@@ -12,12 +12,10 @@ def get_logger(channel=None):
     return _CollectdLogger(channel)
 
 
-class _Logger(object):
+class _Logger(abc.ABCMeta("_AbstractLogger", (object,), {})):
     """
     The base class for logger, all loggers have to extend this class and provide implementation for the basic logging methods.
     """
-    __metaclass__ = abc.ABCMeta
-
     @abc.abstractmethod    
     def debug(self, msg):
         pass
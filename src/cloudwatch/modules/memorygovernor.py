@@ -0,0 +1,130 @@
+import sys
+from itertools import islice
+
+from .compat import iteritems
+from .logger.logger import get_logger
+
+_MISSING = object()
+
+
+class GovernedCache(dict):
+    """
+    The governed cache is a dictionary whose least recently used entries can be evicted by the MemoryGovernor.
+    Entries are kept in two generations: the dictionary itself holds entries used since the last rotation
+    and a separate dictionary holds the older ones. Looking up a recent entry costs a plain dictionary lookup,
+    an old entry is moved back to the recent generation when it is looked up with [] or 'in'.
+    Rotation drops the old generation and turns the recent one into the old one, which approximates LRU eviction
+    without any bookkeeping on the lookup path. Rotation runs on the flushing thread while other threads add entries,
+    so callers must use the value they looked up or computed rather than reading the entry again.
+    """
+    MISSING = _MISSING
+    _DICT_ENTRY_SIZE = 40
+    _SAMPLE_SIZE = 32
+
+    def __init__(self):
+        super(GovernedCache, self).__init__()
+        self._old = {}
+        self._entry_size = 0
+
+    def __missing__(self, key):
+        value = self.take_old(key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or self.take_old(key) is not _MISSING
+
+    def take_old(self, key):
+        """ Moves the entry from the old generation back to the recent one and returns its value, or MISSING if there is no such entry """
+        value = self._old.pop(key, _MISSING)
+        if value is not _MISSING:
+            self[key] = value
+        return value
+
+    def rotate(self):
+        """
+        Evicts entries which were not used since the previous rotation. The recent generation is copied in a single step
+        and only the copied entries are removed from it, so entries added by other threads during the rotation are kept.
+
+        Returns:
+            the dictionary of evicted entries
+        """
+        evicted = self._old
+        self._old = recent = dict(self)
+        for key in recent:
+            dict.pop(self, key, None)
+        return evicted
+
+    def get_entry_count(self):
+        return len(self) + len(self._old)
+
+    def get_approximate_size(self):
+        """ Returns the approximate memory used by the entries in bytes, estimated from a sample of entries """
+        for generation in (self, self._old):
+            try:
+                sample = list(islice(iteritems(generation), self._SAMPLE_SIZE))
+            except RuntimeError:
+                continue
+            if sample:
+                self._entry_size = sum(get_object_size(key) + get_object_size(value) for key, value in sample) // len(sample) + self._DICT_ENTRY_SIZE
+                break
+        return self.get_entry_count() * self._entry_size
+
+
+def get_object_size(value, depth=2):
+    """ Returns the size of the object in bytes including the items of (nested) tuples up to the given depth """
+    size = sys.getsizeof(value)
+    if depth and isinstance(value, tuple):
+        size += sum(get_object_size(item, depth - 1) for item in value)
+    return size
+
+
+class MemoryGovernor(object):
+    """
+    The memory governor keeps the long-lived caches of the plugin (whitelist decisions, rollup rules, series keys,
+    NaN warnings) within a single memory budget. The size of every registered cache is estimated at flush time and,
+    while the total is over budget, the largest caches evict their least recently used entries.
+
+    Keyword arguments:
+    budget_in_bytes -- the memory budget shared by all registered caches, 0 disables eviction (default 0)
+    """
+    _LOGGER = get_logger(__name__)
+    _MAX_ROTATIONS_PER_CACHE = 2
+
+    def __init__(self, budget_in_bytes=0):
+        self.budget_in_bytes = budget_in_bytes
+        self.evicted_entry_count = 0
+        self._caches = []
+
+    def register(self, name, cache):
+        """
+        Adds the cache to the budget. The cache must provide rotate, get_entry_count and get_approximate_size
+        like the GovernedCache does.
+        """
+        self._caches.append((name, cache))
+        return cache
+
+    def get_usage(self):
+        """ Returns the approximate memory in bytes used by each registered cache """
+        return dict((name, cache.get_approximate_size()) for name, cache in self._caches)
+
+    def enforce(self):
+        """ Evicts least recently used entries of the largest caches until the total approximate size fits into the budget """
+        if not self.budget_in_bytes:
+            return
+        usage = self.get_usage()
+        total_size = sum(usage.values())
+        evicted_entry_count = 0
+        for _ in range(self._MAX_ROTATIONS_PER_CACHE):
+            for name, cache in sorted(self._caches, key=lambda entry: usage[entry[0]], reverse=True):
+                if total_size <= self.budget_in_bytes:
+                    break
+                evicted_entry_count += len(cache.rotate())
+                size = cache.get_approximate_size()
+                total_size += size - usage[name]
+                usage[name] = size
+        if evicted_entry_count:
+            self.evicted_entry_count += evicted_entry_count
+            self._LOGGER.info("Evicted " + str(evicted_entry_count) + " least recently used cache entries to fit into the memory budget of " +
+                              str(self.budget_in_bytes) + " bytes. Cache sizes: " + str(usage))
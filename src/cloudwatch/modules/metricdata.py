@@ -1,6 +1,6 @@
-import awsutils as awsutils
-import plugininfo
-import datetime
+from . import awsutils
+from . import plugininfo
+import copy
 
 class MetricDataStatistic(object):
     """
@@ -12,17 +12,21 @@ class MetricDataStatistic(object):
     timestamp -- the time stamp in AWS format (default current date-time)
     value -- the raw metric value (default None)
     statistics -- the MetricDataStatistic.Statistics object used to aggregate raw values (default None)
+    storage_resolution -- the storage resolution in seconds, 1 or 60 (default None - defined by plugin configuration)
+    sibling_dimensions -- the list of additional dimension sets published with the same statistics (default None)
     """
     NAMESPACE = plugininfo.NAMESPACE
     
     def __init__(self, metric_name='', unit="", dimensions={}, statistic_values=None,
-                 timestamp=None, namespace=NAMESPACE):
+                 timestamp=None, namespace=NAMESPACE, storage_resolution=None, sibling_dimensions=None):
         """ Constructor """
         self.namespace = namespace
         self.metric_name = metric_name
         self.unit = unit
         self.dimensions = dimensions
         self.statistics = statistic_values
+        self.storage_resolution = storage_resolution
+        self.sibling_dimensions = sibling_dimensions or []
         if timestamp:
             self.timestamp = timestamp
         else:
@@ -33,6 +37,27 @@ class MetricDataStatistic(object):
             self.statistics = self.Statistics(value) 
         else:
             self.statistics._add_value(value)
+
+    def expand(self):
+        """
+        Returns the list of metrics to be published: this metric followed by one metric per sibling dimension set.
+        The sibling metrics share the statistics object of this metric, so values are aggregated only once.
+        """
+        metrics = [self]
+        for dimensions in self.sibling_dimensions:
+            metrics.append(MetricDataStatistic(metric_name=self.metric_name, unit=self.unit, dimensions=dimensions,
+                                               statistic_values=self.statistics, timestamp=self.timestamp,
+                                               namespace=self.namespace, storage_resolution=self.storage_resolution))
+        return metrics
+
+    def merge_statistics(self, statistics):
+        """ Merges statistics aggregated by a different metric with the statistics of this metric """
+        if not statistics:
+            return
+        if not self.statistics:
+            self.statistics = copy.copy(statistics)
+        else:
+            self.statistics._merge(statistics)
         
     class Statistics:
         """
@@ -67,6 +92,20 @@ class MetricDataStatistic(object):
             self.sum += value
             self.sample_count += 1
 
+        def _merge(self, statistics):
+            """
+            Merge statistics aggregated separately and recalculate the statistics
+
+            Keyword arguments:
+            statistics -- the Statistics object to be included in these statistics
+            """
+            if statistics.max > self.max:
+                self.max = statistics.max
+            if statistics.min < self.min:
+                self.min = statistics.min
+            self.sum += statistics.sum
+            self.sample_count += statistics.sample_count
+
 
 class MetricDataBuilder(object):
     """
@@ -77,24 +116,49 @@ class MetricDataBuilder(object):
     config_helper -- The ConfigHelper object with configuration loaded
     vl -- The Collectd ValueList object with metric information
     adjusted_time - The adjusted_time is the time adjusted according to storage resolution
+    storage_resolution - The storage resolution of the metric, 1 or 60 (default None - defined by plugin configuration)
+    namespace - The namespace the metric is published to (default None - MetricDataStatistic.NAMESPACE)
     """
-    
-    def __init__(self, config_helper, vl, adjusted_time=None):
+    HIGH_STORAGE_RESOLUTION = 1
+    STANDARD_STORAGE_RESOLUTION = 60
+
+    def __init__(self, config_helper, vl, adjusted_time=None, storage_resolution=None, namespace=None):
         self.config = config_helper
         self.vl = vl
         self.adjusted_time = adjusted_time
+        self.storage_resolution = storage_resolution
+        self.namespace = namespace or MetricDataStatistic.NAMESPACE
 
     def build(self):
-        """ Builds metric data object with name and dimensions but without value or statistics """
-        metric_array = [MetricDataStatistic(metric_name=self._build_metric_name(), dimensions=self._build_metric_dimensions(), timestamp=self._build_timestamp())]
+        """ Builds metric data objects with name and dimensions but without value or statistics, one per published dimension set """
+        series = self.build_series()
+        return [MetricDataStatistic(metric_name=series.metric_name, dimensions=dimensions, timestamp=series.timestamp, namespace=series.namespace,
+                                    storage_resolution=series.storage_resolution)
+                for dimensions in [series.dimensions] + series.sibling_dimensions]
+
+    def build_series(self):
+        """
+        Builds a single metric data object without value or statistics. The dimension sets added by push_asg
+        and push_constant are kept as sibling dimensions and expanded with MetricDataStatistic.expand when published.
+        """
+        sibling_dimensions = []
         if self.config.push_asg:
-            metric_array.append(MetricDataStatistic(metric_name=self._build_metric_name(), dimensions=self._build_asg_dimension(), timestamp=self._build_timestamp()))
+            sibling_dimensions.append(self._build_asg_dimension())
         if self.config.push_constant:
-            metric_array.append(MetricDataStatistic(metric_name=self._build_metric_name(), dimensions=self._build_constant_dimension(), timestamp=self._build_timestamp()))
-        return metric_array
+            sibling_dimensions.append(self._build_constant_dimension())
+        return MetricDataStatistic(metric_name=self._build_metric_name(), dimensions=self._build_metric_dimensions(), timestamp=self._build_timestamp(),
+                                   namespace=self.namespace, storage_resolution=self._build_storage_resolution(), sibling_dimensions=sibling_dimensions)
         
     def _build_timestamp(self):
-        return datetime.datetime.utcfromtimestamp(self.adjusted_time).strftime('%Y%m%dT%H%M%SZ') if self.config.enable_high_resolution_metrics else None
+        return awsutils.get_aws_timestamp(self.adjusted_time) if self._is_high_resolution() else None
+
+    def _build_storage_resolution(self):
+        return self.HIGH_STORAGE_RESOLUTION if self._is_high_resolution() else self.STANDARD_STORAGE_RESOLUTION
+
+    def _is_high_resolution(self):
+        if self.storage_resolution:
+            return self.storage_resolution == self.HIGH_STORAGE_RESOLUTION
+        return bool(self.config.enable_high_resolution_metrics)
 
     def _build_metric_name(self): 
         """
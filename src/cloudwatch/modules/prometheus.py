@@ -0,0 +1,162 @@
+"""
+The local Prometheus exposition endpoint serves the statistics of the most recently flushed metrics
+in the Prometheus text format, for on-host debugging and for scraping by Prometheus.
+"""
+import math
+import re
+import threading
+
+from .compat import BaseHTTPRequestHandler, HTTPServer, ThreadingMixIn, to_bytes
+from .logger.logger import get_logger
+
+
+class PrometheusExposition(object):
+    """
+    The Prometheus exposition keeps the statistics of the most recently flushed metrics of every flush schedule
+    and the Prometheus text format rendering of all of them. The rendering is rebuilt once per flush, so serving
+    a scrape only returns the pre-rendered buffer.
+
+    Every MetricDataStatistic is exposed as the _sum, _count, _min and _max gauges named after the namespace and
+    the metric name, e.g. collectd_cpu_percent_active_sum{Host="i-1",PluginInstance="0"}. The statistics cover a single
+    flush interval and start over with every flush, so they are not exposed as a summary, whose _sum and _count must
+    be monotonic counters.
+    The internal metrics of the plugin, e.g. the congestion window of the PutMetricData requests, are exposed as gauges.
+    """
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+    _INVALID_NAME_CHARACTERS = re.compile(r"[^a-zA-Z0-9_:]")
+    _INVALID_LABEL_CHARACTERS = re.compile(r"[^a-zA-Z0-9_]")
+    _STATISTICS = ("_sum", "_count", "_min", "_max")
+
+    def __init__(self):
+        self._series = {}
+        self._internal_gauges = {}
+        self._lock = threading.Lock()
+        self._buffer = b""
+
+    def update(self, schedule, metrics, replace=True):
+        """
+        Records the statistics of the flushed metrics of the schedule and rebuilds the rendering.
+
+        Keyword arguments:
+        schedule -- the flush schedule which flushed the metrics
+        metrics -- the list of flushed MetricDataStatistic objects, one per dimension set
+        replace -- True to replace the metrics of the previous flush of the schedule, False to add to them (default True)
+        """
+        with self._lock:
+            series = {} if replace else dict(self._series.get(schedule, {}))
+            for metric in metrics:
+                statistics = metric.statistics
+                if not statistics:
+                    continue
+                key = (self._get_family_name(metric), self._get_labels(metric))
+                previous = series.get(key)
+                if previous is None or previous[0] <= metric.timestamp:
+                    series[key] = (metric.timestamp, statistics.sum, statistics.sample_count, statistics.min, statistics.max)
+            self._series[schedule] = series
+            self._buffer = self._render()
+
+    def update_internal_gauges(self, gauges):
+        """
+        Records the current values of internal metrics of the plugin and rebuilds the rendering.
+
+        Keyword arguments:
+        gauges -- the dictionary of gauge names and values, e.g. {"collectd_cloudwatch_put_request_rate": 50.0}
+        """
+        with self._lock:
+            self._internal_gauges.update(gauges)
+            self._buffer = self._render()
+
+    def get_buffer(self):
+        """ Returns the pre-rendered exposition of the most recently flushed metrics as UTF-8 bytes """
+        return self._buffer
+
+    def _render(self):
+        families = {}
+        for series in self._series.values():
+            for (family, labels), values in series.items():
+                families.setdefault(family, []).append((labels,) + values[1:])
+        lines = []
+        for family in sorted(families):
+            samples = sorted(families[family])
+            for value_index, statistic in enumerate(self._STATISTICS, 1):
+                lines.append("# TYPE " + family + statistic + " gauge")
+                lines.extend(self._render_samples(family + statistic, samples, value_index))
+        for name in sorted(self._internal_gauges):
+            lines.append("# TYPE " + name + " gauge")
+            lines.append(name + " " + self._format_value(self._internal_gauges[name]))
+        return to_bytes("\n".join(lines) + "\n") if lines else b""
+
+    def _render_samples(self, name, samples, value_index):
+        return [name + sample[0] + " " + self._format_value(sample[value_index]) for sample in samples]
+
+    def _get_family_name(self, metric):
+        name = self._INVALID_NAME_CHARACTERS.sub("_", str(metric.namespace) + "_" + str(metric.metric_name))
+        return "_" + name if name[0].isdigit() else name
+
+    def _get_labels(self, metric):
+        labels = []
+        for name in sorted(metric.dimensions):
+            label = self._INVALID_LABEL_CHARACTERS.sub("_", str(name))
+            if label[:1].isdigit():
+                label = "_" + label
+            value = str(metric.dimensions[name]).replace("\\", "\\\\").replace("\n", "\\n").replace("\"", "\\\"")
+            labels.append(label + "=\"" + value + "\"")
+        return "{" + ",".join(labels) + "}" if labels else ""
+
+    def _format_value(self, value):
+        if isinstance(value, float):
+            if math.isnan(value):
+                return "NaN"
+            if math.isinf(value):
+                return "+Inf" if value > 0 else "-Inf"
+            return repr(value)
+        return str(value)
+
+
+class PrometheusServer(ThreadingMixIn, HTTPServer):
+    """
+    The HTTP listener serving the pre-rendered buffer of the PrometheusExposition at /metrics from a daemon thread.
+
+    Keyword arguments:
+    address -- the (host, port) pair the listener binds to
+    exposition -- the PrometheusExposition object
+    """
+    _LOGGER = get_logger(__name__)
+    _THREAD_NAME = "cloudwatch-prometheus-listener"
+    METRICS_PATH = "/metrics"
+    daemon_threads = True
+    allow_reuse_address = True
+
+    class RequestHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != PrometheusServer.METRICS_PATH:
+                self.send_error(404)
+                return
+            body = self.server.exposition.get_buffer()
+            self.send_response(200)
+            self.send_header("Content-Type", PrometheusExposition.CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    def __init__(self, address, exposition):
+        HTTPServer.__init__(self, address, self.RequestHandler)
+        self.exposition = exposition
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name=self._THREAD_NAME)
+        self._thread.daemon = True
+        self._thread.start()
+        self._LOGGER.info("Serving Prometheus metrics at http://" + self.server_address[0] + ":" + str(self.server_address[1]) + self.METRICS_PATH)
+
+    def stop(self):
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server_close()
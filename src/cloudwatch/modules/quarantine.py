@@ -0,0 +1,147 @@
+import math
+import threading
+
+from . import clock
+from .logger.logger import get_logger
+
+
+class MetricValidator(object):
+    """
+    The metric validator checks metrics against the constraints of the PutMetricData API before they are serialized,
+    since CloudWatch rejects the whole request with HTTP 400 if a single datum is invalid.
+    """
+    MAX_VALUE = 2.0 ** 360
+    MAX_DIMENSIONS = 30
+    MAX_NAME_LENGTH = 255
+    MAX_DIMENSION_VALUE_LENGTH = 1024
+
+    @classmethod
+    def is_valid_value(cls, value):
+        """ Checks if the value is a finite number within the range of values accepted by CloudWatch """
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return False
+        return not math.isnan(value) and not math.isinf(value) and abs(value) <= cls.MAX_VALUE
+
+    @classmethod
+    def get_violation(cls, metric):
+        """
+        Returns the description of the first constraint violated by the metric, or None if the metric is valid.
+        """
+        if not metric.metric_name or len(metric.metric_name) > cls.MAX_NAME_LENGTH:
+            return "metric name must have 1 to " + str(cls.MAX_NAME_LENGTH) + " characters"
+        if len(metric.dimensions) > cls.MAX_DIMENSIONS:
+            return "metric has " + str(len(metric.dimensions)) + " dimensions, at most " + str(cls.MAX_DIMENSIONS) + " are allowed"
+        for name, value in metric.dimensions.items():
+            if not name or len(name) > cls.MAX_NAME_LENGTH:
+                return "dimension name '" + str(name) + "' must have 1 to " + str(cls.MAX_NAME_LENGTH) + " characters"
+            value = str(value)
+            if not value.strip() or len(value) > cls.MAX_DIMENSION_VALUE_LENGTH:
+                return "value of dimension '" + name + "' must have 1 to " + str(cls.MAX_DIMENSION_VALUE_LENGTH) + " characters and not only whitespace"
+        statistics = metric.statistics
+        if not statistics or statistics.sample_count <= 0:
+            return "metric has no values"
+        for statistic_name, value in (("minimum", statistics.min), ("maximum", statistics.max), ("sum", statistics.sum)):
+            if not cls.is_valid_value(value):
+                return statistic_name + " " + str(value) + " is not a finite number between -2^360 and 2^360"
+        return None
+
+
+class MetricQuarantine(object):
+    """
+    The metric quarantine keeps series which CloudWatch rejected on their own out of the published batches for
+    the quarantine duration, so a single poison series does not cause the rejection of the other metrics of every flush.
+    Quarantined series and metrics which fail the client side validation are reported once per quarantine duration
+    in the plugin log and in the list of quarantined metrics, which is created with the first reported metric.
+    Every publish target has its own quarantine, so a series rejected by one target is still published to the others.
+
+    Keyword arguments:
+    log_path -- the path of the list of quarantined metrics, None to report them in the plugin log only (default None)
+    quarantine_duration_in_seconds -- the time for which a rejected series is not published (default 3600)
+    target_name -- the name of the publish target reported with the quarantined series, None for the plugin region (default None)
+    """
+    _LOGGER = get_logger(__name__)
+    DEFAULT_QUARANTINE_DURATION_IN_SECONDS = 3600
+    QUARANTINE_LOG_HEADER = "# This file is automatically generated - do not modify this file.\
+    \n# Use this file to find metrics rejected by CloudWatch or by the validation of the plugin.\n"
+
+    def __init__(self, log_path=None, quarantine_duration_in_seconds=DEFAULT_QUARANTINE_DURATION_IN_SECONDS, target_name=None):
+        self._log_path = log_path
+        self.quarantine_duration_in_seconds = quarantine_duration_in_seconds
+        self.target_name = target_name
+        self._quarantined_series = {}
+        self._reported_series = {}
+        self._log_created = False
+        self._lock = threading.Lock()
+
+    def accepts(self, metric):
+        """
+        Checks if the metric can be published. Quarantined series and invalid metrics are not published,
+        invalid metrics are reported.
+        """
+        return not self.is_quarantined(metric) and self.is_valid(metric)
+
+    def is_valid(self, metric):
+        """ Checks the metric against the constraints of the PutMetricData API, invalid metrics are reported """
+        violation = MetricValidator.get_violation(metric)
+        if violation is not None:
+            self.report(metric, violation)
+            return False
+        return True
+
+    def quarantine(self, metric, reason):
+        """ Stops publishing the series of the metric for the quarantine duration and reports it """
+        series_key = self.get_series_key(metric)
+        with self._lock:
+            self._quarantined_series[series_key] = clock.monotonic() + self.quarantine_duration_in_seconds
+        self.report(metric, "quarantined for " + str(self.quarantine_duration_in_seconds) + " seconds: " + reason)
+
+    def is_quarantined(self, metric):
+        return bool(self._quarantined_series) and self._is_quarantined(self.get_series_key(metric))
+
+    def report(self, metric, reason):
+        """ Reports the metric in the plugin log and in the list of quarantined metrics, once per quarantine duration """
+        series_key = self.get_series_key(metric)
+        now = clock.monotonic()
+        with self._lock:
+            if self._reported_series.get(series_key, now) > now:
+                return
+            self._expire(self._reported_series, now)
+            self._reported_series[series_key] = now + self.quarantine_duration_in_seconds
+        target = " to publish target '" + self.target_name + "'" if self.target_name else ""
+        self._LOGGER.warning("Metric " + series_key + " is not published" + target + ", " + reason)
+        self._write_log(series_key + " " + reason)
+
+    @staticmethod
+    def get_series_key(metric):
+        """ Returns the metric name with the sorted dimensions, e.g. cpu.percent.active{Host=i-1,PluginInstance=0} """
+        dimensions = ",".join(str(name) + "=" + str(metric.dimensions[name]) for name in sorted(metric.dimensions))
+        return str(metric.metric_name) + "{" + dimensions + "}"
+
+    def _is_quarantined(self, series_key):
+        with self._lock:
+            release_time = self._quarantined_series.get(series_key)
+            if release_time is None:
+                return False
+            if release_time > clock.monotonic():
+                return True
+            del self._quarantined_series[series_key]
+            return False
+
+    def _expire(self, series, now):
+        for series_key in [series_key for series_key, expiry_time in series.items() if expiry_time <= now]:
+            del series[series_key]
+
+    def _write_log(self, line):
+        if not self._log_path:
+            return
+        try:
+            with self._lock:
+                with open(self._log_path, "a" if self._log_created else "w") as quarantine_file:
+                    if not self._log_created:
+                        quarantine_file.write(self.QUARANTINE_LOG_HEADER)
+                        self._log_created = True
+                    quarantine_file.write(line + "\n")
+        except IOError as e:
+            self._LOGGER.warning("Could not update list of quarantined metrics '" + self._log_path + "'. Reason: " + str(e))
@@ -0,0 +1,152 @@
+from heapq import heappop, heappush, heapreplace
+
+from .logger.logger import get_logger
+
+
+class SeriesBudget(object):
+    """
+    The series budget limits the number of series each plugin can aggregate within a single flush interval,
+    so that a single plugin with unbounded instances (e.g. processes or tail) cannot fill the whole metric map.
+
+    Once a plugin is over its budget the series of this plugin are tracked using the Space-Saving algorithm:
+    a new series replaces the series with the smallest weight and inherits its weight as an error term.
+    The weight of a series is the absolute sum of its aggregated values, so the heaviest series are retained
+    while the replaced series are folded into the OTHER series of the plugin by the Flusher.
+
+    The series of each plugin are kept in a min-heap ordered by their weight when it was last checked.
+    Values aggregated after that only increase the weight, so the heap weight is a lower bound: the top series
+    is reweighed and pushed back until its weight is current, which finds the lightest series in logarithmic
+    time. Negative values can lower the absolute sum, in which case a slightly heavier series may be replaced.
+
+    Keyword arguments:
+    default_budget -- the maximum number of series per plugin, 0 disables the budget (default 0)
+    plugin_budgets -- the dictionary of plugin specific budgets overriding the default budget (default None)
+    """
+    _LOGGER = get_logger(__name__)
+    OTHER = "OTHER"
+
+    def __init__(self, default_budget=0, plugin_budgets=None):
+        self.default_budget = default_budget
+        self.plugin_budgets = plugin_budgets or {}
+        self.enabled = bool(default_budget or self.plugin_budgets)
+        self.folded_series_count = {}
+        self._series = {}
+        self._heaps = {}
+        self._exceeded_plugins = set()
+
+    def get_budget(self, plugin):
+        """ Returns the budget of the plugin, 0 means that the plugin is not limited """
+        return self.plugin_budgets.get(plugin, self.default_budget)
+
+    def admit(self, plugin, key, metrics, value_list):
+        """
+        Registers a new series of the plugin. If the plugin is over budget the series with the smallest weight
+        is removed from the budget to make room for the new one.
+
+        Keyword arguments:
+        plugin -- the name of the plugin reporting the series
+        key -- the metric map key of the series
+        metrics -- the list of MetricDataStatistic objects aggregating the series
+        value_list -- the ValueList used to build the metrics, kept to build the OTHER series later
+
+        Returns:
+            the (key, metrics, value_list) tuple of the evicted series or None if nothing was evicted
+        """
+        budget = self.get_budget(plugin)
+        if not budget:
+            return None
+        series = self._series.setdefault(plugin, {})
+        heap = self._heaps.setdefault(plugin, [])
+        error = 0
+        evicted = None
+        if len(series) >= budget:
+            evicted_key, evicted_entry, error = self._pop_lightest(series, heap)
+            evicted = (evicted_key, evicted_entry[1], evicted_entry[2])
+            self._record_folded_series(plugin, budget)
+        entry = [error, metrics, value_list]
+        series[key] = entry
+        heappush(heap, (self._get_weight(entry), key))
+        return evicted
+
+    def _pop_lightest(self, series, heap):
+        """
+        Removes the series with the smallest weight from the budget.
+
+        Returns:
+            the (key, entry, weight) tuple of the removed series
+        """
+        while True:
+            weight, key = heap[0]
+            entry = series.get(key)
+            if entry is None:
+                heappop(heap)
+                continue
+            current_weight = self._get_weight(entry)
+            if current_weight > weight:
+                heapreplace(heap, (current_weight, key))
+                continue
+            heappop(heap)
+            del series[key]
+            return key, entry, current_weight
+
+    def _get_weight(self, entry):
+        error, metrics = entry[0], entry[1]
+        statistics = metrics[0].statistics
+        return error + (abs(statistics.sum) if statistics else 0)
+
+    def _record_folded_series(self, plugin, budget):
+        self.folded_series_count[plugin] = self.folded_series_count.get(plugin, 0) + 1
+        if plugin not in self._exceeded_plugins:
+            self._exceeded_plugins.add(plugin)
+            self._LOGGER.warning("Plugin '" + plugin + "' exceeded its budget of " + str(budget) +
+                                 " series. The lightest series will be folded into the " + self.OTHER + " series.")
+
+    def merge(self, series_budgets, metric_map):
+        """
+        Counts the series of the budgets of all shards of a flush interval against this budget. Every write thread
+        admits series to the budget of its own shard, so a plugin reported by several threads could keep its budget
+        of series per thread. Once the shards are merged only the heaviest series of the plugin are kept, the weight
+        of a series is the absolute sum of its merged values plus the largest error term of its shards.
+
+        Keyword arguments:
+        series_budgets -- the SeriesBudget objects of the shards
+        metric_map -- the merged metric map of the shards
+
+        Returns:
+            the list of (key, metrics, value_list) tuples of the series over budget, the metrics are taken from the metric_map
+        """
+        merged_series = {}
+        for series_budget in series_budgets:
+            for plugin, series in series_budget._series.items():
+                plugin_series = merged_series.setdefault(plugin, {})
+                for key, entry in series.items():
+                    metrics = metric_map.get(key)
+                    if metrics is None:
+                        continue
+                    previous = plugin_series.get(key)
+                    error = max(entry[0], previous[0]) if previous else entry[0]
+                    plugin_series[key] = [error, metrics, entry[2]]
+        evicted = []
+        for plugin, series in merged_series.items():
+            budget = self.get_budget(plugin)
+            if not budget or len(series) <= budget:
+                continue
+            for key in sorted(series, key=lambda key: self._get_weight(series[key]), reverse=True)[budget:]:
+                entry = series[key]
+                evicted.append((key, entry[1], entry[2]))
+                self._record_folded_series(plugin, budget)
+        return evicted
+
+    def get_usage(self):
+        """ Returns the dictionary with the number of series currently counted against the budget of each plugin """
+        return dict((plugin, len(series)) for plugin, series in self._series.items())
+
+    def renew(self):
+        """
+        Returns the budget of the next flush interval. The new budget counts no series yet, but it shares
+        the folded series counts and the logged plugins with this budget, so they are kept across intervals.
+        """
+        budget = SeriesBudget(self.default_budget, self.plugin_budgets)
+        budget.folded_series_count = self.folded_series_count
+        budget._exceeded_plugins = self._exceeded_plugins
+        return budget
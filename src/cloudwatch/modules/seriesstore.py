@@ -0,0 +1,229 @@
+import threading
+from array import array
+
+from .metricdata import MetricDataStatistic
+from .memorygovernor import GovernedCache, get_object_size
+
+_NOT_LOADED = object()
+numpy = _NOT_LOADED
+
+
+def _get_numpy():
+    """
+    Imports NumPy on first use, so that the memory used by NumPy is not paid unless a batch large enough
+    for the NumPy kernel is aggregated. Returns None if NumPy is not installed.
+    """
+    global numpy
+    if numpy is _NOT_LOADED:
+        try:
+            import numpy as numpy_module
+        except ImportError:
+            numpy_module = None
+        numpy = numpy_module
+    return numpy
+
+
+class SeriesRegistry(object):
+    """
+    The series registry assigns a stable integer ID to every series identified by the
+    (plugin, plugin_instance, type, type_instance) tuple of a collectd ValueList.
+    The metric key used by the whitelist and the metric map is built only once per series.
+    Looking up a registered series does not take a lock, only the registration of a new series does.
+
+    Series which are no longer reported can be evicted by the MemoryGovernor. The IDs of evicted series are
+    reused only after the next rotation, so an ID obtained just before the eviction still resolves to its key.
+    """
+
+    def __init__(self):
+        self._ids = GovernedCache()
+        self._keys = []
+        self._free_ids = []
+        self._released_ids = []
+        self._lock = threading.Lock()
+
+    def get_id(self, value_list):
+        """ Returns the ID of the series of the value list, registering the series if it is seen for the first time """
+        series = (value_list.plugin, value_list.plugin_instance, value_list.type, value_list.type_instance)
+        series_id = self._ids.get(series)
+        if series_id is None:
+            with self._lock:
+                series_id = self._ids.get(series)
+                if series_id is None:
+                    series_id = self._ids.take_old(series)
+                    if series_id is GovernedCache.MISSING:
+                        series_id = self._register(series)
+        return series_id
+
+    def _register(self, series):
+        if self._free_ids:
+            series_id = self._free_ids.pop()
+            self._keys[series_id] = "-".join(series)
+        else:
+            self._keys.append("-".join(series))
+            series_id = len(self._keys) - 1
+        self._ids[series] = series_id
+        return series_id
+
+    def rotate(self):
+        """
+        Evicts series which were not looked up since the previous rotation.
+
+        Returns:
+            the dictionary of evicted series
+        """
+        with self._lock:
+            for series_id in self._released_ids:
+                self._keys[series_id] = None
+            self._free_ids.extend(self._released_ids)
+            evicted = self._ids.rotate()
+            self._released_ids = list(evicted.values())
+        return evicted
+
+    def get_entry_count(self):
+        return self._ids.get_entry_count()
+
+    def get_approximate_size(self):
+        """ Returns the approximate memory used by the registered series and their metric keys in bytes """
+        sample = [get_object_size(key) for key in self._keys[:32] if key is not None]
+        key_size = sum(sample) // len(sample) if sample else 0
+        return self._ids.get_approximate_size() + self._ids.get_entry_count() * key_size + len(self._keys) * 8
+
+    def get_key(self, series_id):
+        """ Returns the metric key in format 'plugin-plugin_instance-type-type_instance' of the series """
+        return self._keys[series_id]
+
+    def __len__(self):
+        return self._ids.get_entry_count()
+
+
+class StatisticsColumns(object):
+    """
+    The statistics columns keep minimum, maximum, sum and sample count of aggregated metrics in parallel
+    array('d') columns instead of a separate Statistics object per metric. Every aggregated metric occupies
+    a single slot of the columns. Released slots are reset in place and reused in the next flush interval,
+    so the columns grow only up to the highest number of metrics aggregated at the same time.
+
+    Batches of raw values are reduced with NumPy when it is installed and the batch is large enough
+    to benefit from it, otherwise the Python builtins are used. NumPy is imported only when the first such batch arrives.
+    """
+    _NUMPY_MIN_BATCH_SIZE = 64
+    _EMPTY_MIN = float("inf")
+    _EMPTY_MAX = float("-inf")
+
+    def __init__(self):
+        self.min = array('d')
+        self.max = array('d')
+        self.sum = array('d')
+        self.count = array('d')
+        self._free_slots = []
+
+    def allocate(self):
+        """ Returns an empty slot """
+        if self._free_slots:
+            return self._free_slots.pop()
+        self.min.append(self._EMPTY_MIN)
+        self.max.append(self._EMPTY_MAX)
+        self.sum.append(0.0)
+        self.count.append(0.0)
+        return len(self.count) - 1
+
+    def release(self, slot):
+        """ Resets the slot in place and makes it available for reuse """
+        self.min[slot] = self._EMPTY_MIN
+        self.max[slot] = self._EMPTY_MAX
+        self.sum[slot] = 0.0
+        self.count[slot] = 0.0
+        self._free_slots.append(slot)
+
+    def detach(self, slot):
+        """
+        Copies the statistics of the slot to a MetricDataStatistic.Statistics object and releases the slot.
+
+        Returns:
+            the Statistics object or None if no value was aggregated in the slot
+        """
+        statistics = None
+        if self.count[slot]:
+            statistics = MetricDataStatistic.Statistics(self.min[slot])
+            statistics.max = self.max[slot]
+            statistics.sum = self.sum[slot]
+            statistics.sample_count = int(self.count[slot])
+        self.release(slot)
+        return statistics
+
+    def add_value(self, slot, value):
+        value = float(value)
+        if value < self.min[slot]:
+            self.min[slot] = value
+        if value > self.max[slot]:
+            self.max[slot] = value
+        self.sum[slot] += value
+        self.count[slot] += 1
+
+    def add_values(self, slot, values):
+        """ Reduces a batch of numerical values and aggregates the result with the slot """
+        if not values:
+            return
+        if len(values) == 1:
+            self.add_value(slot, values[0])
+            return
+        numpy_module = _get_numpy() if len(values) >= self._NUMPY_MIN_BATCH_SIZE else None
+        if numpy_module is not None:
+            batch = numpy_module.asarray(values, dtype=numpy_module.float64)
+            self._merge_values(slot, float(batch.min()), float(batch.max()), float(batch.sum()), len(values))
+        else:
+            batch = [float(value) for value in values]
+            self._merge_values(slot, min(batch), max(batch), sum(batch), len(batch))
+
+    def merge(self, slot, statistics):
+        """ Merges statistics aggregated separately (any object with min, max, sum and sample_count) with the slot """
+        self._merge_values(slot, float(statistics.min), float(statistics.max), float(statistics.sum), statistics.sample_count)
+
+    def _merge_values(self, slot, min_value, max_value, sum_value, sample_count):
+        if min_value < self.min[slot]:
+            self.min[slot] = min_value
+        if max_value > self.max[slot]:
+            self.max[slot] = max_value
+        self.sum[slot] += sum_value
+        self.count[slot] += sample_count
+
+    def get_statistics(self, slot):
+        """ Returns a ColumnStatistics view of the slot """
+        return ColumnStatistics(self, slot)
+
+    def __len__(self):
+        return len(self.count) - len(self._free_slots)
+
+
+class ColumnStatistics(object):
+    """
+    The ColumnStatistics is a view of a single StatisticsColumns slot which can be used in place of
+    MetricDataStatistic.Statistics during aggregation. The view must not be used after its slot is released.
+    """
+    __slots__ = ("columns", "slot")
+
+    def __init__(self, columns, slot):
+        self.columns = columns
+        self.slot = slot
+
+    @property
+    def min(self):
+        return self.columns.min[self.slot]
+
+    @property
+    def max(self):
+        return self.columns.max[self.slot]
+
+    @property
+    def sum(self):
+        return self.columns.sum[self.slot]
+
+    @property
+    def sample_count(self):
+        return int(self.columns.count[self.slot])
+
+    def _add_value(self, value):
+        self.columns.add_value(self.slot, value)
+
+    def _merge(self, statistics):
+        self.columns.merge(self.slot, statistics)
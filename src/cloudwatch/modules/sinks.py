@@ -0,0 +1,290 @@
+"""
+The sinks publish the batches of every flush to several outputs at once, e.g. CloudWatch, a local JSON lines
+audit file and the EMF socket of the CloudWatch agent. Every sink has its own bounded queue and worker thread,
+so a slow or failing output delays neither the collectd write path nor the other sinks.
+"""
+import threading
+from collections import deque
+
+from . import clock
+from .logger.logger import get_logger
+
+
+class QueuedBatch(object):
+    """
+    The metric batch queued for publishing by a sink. The publishing result is set once the worker
+    of the sink has published the batch, or once the batch is dropped from a full queue.
+    The on_failure callback, if any, is called with the metric batch when the batch is not published.
+    """
+
+    def __init__(self, namespace, metric_batch, on_failure=None):
+        self.namespace = namespace
+        self.metric_batch = metric_batch
+        self.on_failure = on_failure
+        self.published = None
+        self._done = threading.Event()
+
+    def set_result(self, published):
+        self.published = published
+        self._done.set()
+        if not published and self.on_failure is not None:
+            self.on_failure(self.metric_batch)
+
+    def wait(self, timeout=None):
+        """ Returns True if the batch was published within the timeout, False otherwise """
+        self._done.wait(timeout)
+        return bool(self.published)
+
+
+class Sink(object):
+    """
+    The sink publishes queued metric batches with its client from a dedicated worker thread. The client is any object
+    with the put_metric_data and prewarm methods of the PutClient. When the queue is full the oldest batch is dropped,
+    so the collectd write path never waits for the sink and the most recent metrics are kept.
+
+    Keyword arguments:
+    name -- the name of the sink used in log messages and as the worker thread name
+    client -- the client publishing the metric batches
+    max_queued_batches -- the maximum number of batches waiting for the worker (default 1000)
+    """
+    _LOGGER = get_logger(__name__)
+    DEFAULT_MAX_QUEUED_BATCHES = 1000
+    _THREAD_NAME_PREFIX = "cloudwatch-sink-"
+    _PREWARM = object()
+
+    def __init__(self, name, client, max_queued_batches=DEFAULT_MAX_QUEUED_BATCHES):
+        self.name = name
+        self.client = client
+        self.max_queued_batches = max_queued_batches
+        self.published_batch_count = 0
+        self.failed_batch_count = 0
+        self.dropped_batch_count = 0
+        self._queue = deque()
+        self._busy = False
+        self._closed = False
+        self._prewarm_queued = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=self._THREAD_NAME_PREFIX + name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, namespace, metric_batch, on_failure=None):
+        """
+        Queues the metric batch without waiting for the worker.
+
+        Keyword arguments:
+        namespace -- the namespace of the metric batch
+        metric_batch -- the list of metrics to be published
+        on_failure -- the function called with the metric batch if it is not published (default None)
+
+        Returns:
+            the QueuedBatch object
+        """
+        queued_batch = QueuedBatch(namespace, metric_batch, on_failure)
+        dropped_batch = None
+        with self._condition:
+            if self._closed:
+                queued_batch.set_result(False)
+                return queued_batch
+            if self._get_queued_batch_count() >= self.max_queued_batches:
+                dropped_batch = self._drop_oldest_batch()
+                self.dropped_batch_count += 1
+            self._queue.append(queued_batch)
+            self._condition.notify_all()
+        if dropped_batch is not None:
+            dropped_batch.set_result(False)
+            self._LOGGER.warning("The queue of the " + self.name + " sink is full, dropped " + str(self.dropped_batch_count) + " metric batch(es) so far")
+        return queued_batch
+
+    def cancel(self, queued_batch):
+        """
+        Removes the batch from the queue if the worker has not started publishing it yet.
+
+        Returns:
+            True if the batch was removed from the queue, False otherwise
+        """
+        with self._condition:
+            if queued_batch not in self._queue:
+                return False
+            self._queue.remove(queued_batch)
+            self._condition.notify_all()
+        queued_batch.set_result(False)
+        return True
+
+    def prewarm(self):
+        """ Asks the worker to prewarm the client unless a prewarm is already queued """
+        with self._condition:
+            if not self._closed and not self._prewarm_queued:
+                self._prewarm_queued = True
+                self._queue.append(self._PREWARM)
+                self._condition.notify_all()
+
+    def wait_until_empty(self, timeout=None):
+        """ Returns True if all queued batches were handled by the worker within the timeout, False otherwise """
+        deadline = None if timeout is None else clock.monotonic() + timeout
+        with self._condition:
+            while self._queue or self._busy:
+                remaining = None if deadline is None else deadline - clock.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self, timeout=None):
+        """
+        Waits up to timeout seconds for the queued batches, then removes the remaining ones from the queue and stops the worker.
+
+        Returns:
+            the list of QueuedBatch objects which were not published
+        """
+        self.wait_until_empty(timeout)
+        with self._condition:
+            self._closed = True
+            remaining_batches = [task for task in self._queue if task is not self._PREWARM]
+            self._queue.clear()
+            self._condition.notify_all()
+        for queued_batch in remaining_batches:
+            queued_batch.set_result(False)
+        if remaining_batches:
+            self._LOGGER.warning("The " + self.name + " sink stopped with " + str(len(remaining_batches)) + " unpublished metric batch(es)")
+        self._thread.join(timeout)
+        return remaining_batches
+
+    def _get_queued_batch_count(self):
+        return len(self._queue) - (1 if self._prewarm_queued else 0)
+
+    def _drop_oldest_batch(self):
+        for task in self._queue:
+            if task is not self._PREWARM:
+                self._queue.remove(task)
+                return task
+        return None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                task = self._queue.popleft()
+                if task is self._PREWARM:
+                    self._prewarm_queued = False
+                self._busy = True
+            try:
+                self._handle(task)
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
+
+    def _handle(self, task):
+        if task is self._PREWARM:
+            try:
+                self.client.prewarm()
+            except Exception as e:
+                self._LOGGER.warning("Could not prewarm the " + self.name + " sink. Cause: " + str(e))
+            return
+        try:
+            published = self.client.put_metric_data(task.namespace, task.metric_batch)
+        except Exception as e:
+            self._LOGGER.warning("Could not publish metric batch to the " + self.name + " sink. Cause: " + str(e))
+            published = False
+        if published:
+            self.published_batch_count += 1
+        else:
+            self.failed_batch_count += 1
+        task.set_result(published)
+
+
+class SinkFanout(object):
+    """
+    The sink fan-out hands the batches of every flush to all sinks. It is used by the Flusher in place of a single
+    client, like the asynchronous flush pipeline, so put_metric_batches returns without waiting for any sink.
+
+    Keyword arguments:
+    sinks -- the list of Sink objects
+    """
+
+    def __init__(self, sinks):
+        self.sinks = sinks
+
+    def put_metric_batches(self, namespace, metric_batches, sink_names=None, on_failure=None):
+        """
+        Queues the metric batches without waiting for the sinks.
+
+        Keyword arguments:
+        namespace -- the namespace of the metric batches
+        metric_batches -- the list of metric batches
+        sink_names -- the names of the sinks receiving the batches, None queues them to every sink (default None)
+        on_failure -- the function called with a metric batch each time a sink does not publish it (default None)
+        """
+        for sink in self._get_sinks(sink_names):
+            for metric_batch in metric_batches:
+                sink.put(namespace, metric_batch, on_failure)
+
+    def put_metric_data(self, namespace, metric_list, timeout=None):
+        """
+        Queues the metric list to every sink and waits up to timeout seconds until all sinks handled it, see put_metric_data_to_sinks.
+
+        Returns:
+            True if every sink published the metric list within the timeout, False otherwise
+        """
+        return not self.put_metric_data_to_sinks(namespace, metric_list, timeout)
+
+    def put_metric_data_to_sinks(self, namespace, metric_list, timeout=None):
+        """
+        Queues the metric list to every sink and waits up to timeout seconds until all sinks handled it, used to drain
+        metrics on shutdown. A batch which is still queued when the timeout expires is removed from the queue of its sink.
+
+        Returns:
+            the list of names of the sinks which did not publish the metric list within the timeout
+        """
+        deadline = None if timeout is None else clock.monotonic() + timeout
+        queued_batches = [(sink, sink.put(namespace, metric_list)) for sink in self.sinks]
+        unpublished_sink_names = []
+        for sink, queued_batch in queued_batches:
+            if not queued_batch.wait(None if deadline is None else max(0, deadline - clock.monotonic())):
+                sink.cancel(queued_batch)
+                unpublished_sink_names.append(sink.name)
+        return unpublished_sink_names
+
+    def _get_sinks(self, sink_names):
+        if sink_names is None:
+            return self.sinks
+        return [sink for sink in self.sinks if sink.name in sink_names]
+
+    def prewarm(self):
+        """ Asks every sink to prewarm its client in the background, returns True """
+        for sink in self.sinks:
+            sink.prewarm()
+        return True
+
+    def wait_for_pending_flushes(self, timeout=None):
+        """ Returns True if all sinks handled their queued batches within the timeout, False otherwise """
+        deadline = None if timeout is None else clock.monotonic() + timeout
+        handled = True
+        for sink in self.sinks:
+            handled = sink.wait_until_empty(None if deadline is None else max(0, deadline - clock.monotonic())) and handled
+        return handled
+
+    def close(self, timeout=None):
+        """
+        Waits up to timeout seconds for the queued batches of all sinks, then stops the sinks.
+
+        Returns:
+            the list of (namespace, metric_batch, sink_names) tuples of the batches which some sinks did not publish, sink_names
+            lists these sinks, or is None if no sink published the batch
+        """
+        deadline = None if timeout is None else clock.monotonic() + timeout
+        unsent_batches = {}
+        for sink in self.sinks:
+            for queued_batch in sink.close(None if deadline is None else max(0, deadline - clock.monotonic())):
+                unsent_batch = unsent_batches.setdefault(id(queued_batch.metric_batch), (queued_batch, []))
+                unsent_batch[1].append(sink.name)
+        return [(queued_batch.namespace, queued_batch.metric_batch, self._get_partial_sink_names(sink_names))
+                for queued_batch, sink_names in unsent_batches.values()]
+
+    def _get_partial_sink_names(self, sink_names):
+        """ Returns the sink names, or None if they name every sink """
+        return None if len(sink_names) == len(self.sinks) else sink_names
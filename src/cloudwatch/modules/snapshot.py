@@ -0,0 +1,103 @@
+import json
+import os
+
+from .compat import text_type
+from .logger.logger import get_logger
+from .metricdata import MetricDataStatistic
+
+
+class AggregationSnapshot(object):
+    """
+    The aggregation snapshot persists aggregated metrics which could not be published before collectd stopped,
+    so that they can be merged back into the flusher when the plugin is initialized again.
+
+    The snapshot is a JSON list with one compact row per aggregated metric:
+    [key, metric_name, dimensions, sibling_dimensions, timestamp, storage_resolution, min, max, sum, sample_count, namespace, sink_names]
+    The sink_names are the names of the sinks which did not publish the metric, None if no output published it.
+    The file is replaced atomically on save and removed once it is loaded, so metrics are never restored twice.
+    Rows saved by earlier versions of the plugin have no namespace and no sink names, their metrics are loaded
+    with the namespace None and restored to every output.
+
+    Keyword arguments:
+    path -- the path of the snapshot file
+    """
+
+    _LOGGER = get_logger(__name__)
+
+    def __init__(self, path):
+        self.path = path
+
+    def save(self, entries):
+        """
+        Writes the metrics to the snapshot file, replacing the previous snapshot.
+
+        Keyword arguments:
+        entries -- the list of (key, dimension_metrics, sink_names) tuples taken from the metric map, sink_names is None
+                   if the metrics were published by no output
+        """
+        rows = []
+        for key, dimension_metrics, sink_names in entries:
+            for metric in dimension_metrics:
+                if metric.statistics and metric.statistics.sample_count:
+                    rows.append(self._to_row(key, metric, sink_names))
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w") as snapshot_file:
+            json.dump(rows, snapshot_file, separators=(",", ":"))
+        os.rename(temporary_path, self.path)
+        return len(rows)
+
+    def load(self):
+        """
+        Reads the metrics from the snapshot file and removes the file.
+
+        Returns:
+            the list of (key, dimension_metrics, sink_names) tuples, empty if there is no valid snapshot
+        """
+        if not os.path.isfile(self.path):
+            return []
+        entries = {}
+        try:
+            with open(self.path) as snapshot_file:
+                for row in json.load(snapshot_file):
+                    key, metric, sink_names = self._from_row(self._encode(row))
+                    entries.setdefault((key, sink_names), []).append(metric)
+        except Exception as e:
+            self._LOGGER.warning("Cannot load aggregation snapshot at: " + self.path + ". Cause: " + str(e))
+            entries = {}
+        finally:
+            self._remove()
+        return [(key, dimension_metrics, list(sink_names) if sink_names is not None else None)
+                for (key, sink_names), dimension_metrics in entries.items()]
+
+    def _remove(self):
+        try:
+            os.remove(self.path)
+        except OSError as e:
+            self._LOGGER.warning("Cannot remove aggregation snapshot at: " + self.path + ". Cause: " + str(e))
+
+    def _to_row(self, key, metric, sink_names):
+        statistics = metric.statistics
+        return [key, metric.metric_name, metric.dimensions, metric.sibling_dimensions, metric.timestamp, metric.storage_resolution,
+                statistics.min, statistics.max, statistics.sum, statistics.sample_count, metric.namespace, sink_names]
+
+    def _from_row(self, row):
+        key, metric_name, dimensions, sibling_dimensions, timestamp, storage_resolution, min, max, sum, sample_count = row[:10]
+        namespace = row[10] if len(row) > 10 else None
+        sink_names = tuple(row[11]) if len(row) > 11 and row[11] is not None else None
+        statistics = MetricDataStatistic.Statistics(min)
+        statistics.max = max
+        statistics.sum = sum
+        statistics.sample_count = int(sample_count)
+        metric = MetricDataStatistic(metric_name=metric_name, dimensions=dimensions, statistic_values=statistics, timestamp=timestamp,
+                                     storage_resolution=storage_resolution, sibling_dimensions=sibling_dimensions, namespace=namespace)
+        return key, metric, sink_names
+
+    def _encode(self, value):
+        """ Converts unicode strings decoded by json to UTF-8 byte strings used by the rest of the plugin """
+        if isinstance(value, text_type) and not isinstance(value, str):
+            return value.encode("utf-8")
+        if isinstance(value, list):
+            return [self._encode(item) for item in value]
+        if isinstance(value, dict):
+            return dict((self._encode(item_key), self._encode(item)) for item_key, item in value.items())
+        return value
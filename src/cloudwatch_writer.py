@@ -23,7 +23,10 @@ def aws_init():
     try:
         config = ConfigHelper()
         flusher = Flusher(config_helper=config,  dataset_resolver=get_dataset_resolver())
+        flusher.restore_snapshot()
         collectd.register_write(aws_write, data = flusher)
+        collectd.register_flush(aws_flush, data = flusher)
+        collectd.register_shutdown(aws_shutdown, data = flusher)
         _LOGGER.info('Initialization finished successfully.')
     except Exception as e:
         _LOGGER.error("Cannot initialize plugin. Cause: " + str(e) + "\n" + traceback.format_exc())
@@ -34,5 +37,25 @@ def aws_write(vl, flusher):
     Collectd callback entry used to write metric data
     """
     flusher.add_metric(vl)
+
+
+def aws_flush(timeout, identifier, flusher):
+    """
+    Collectd callback entry used to flush metric data on the FLUSH command and before shutdown
+    """
+    try:
+        flusher.flush(timeout, identifier)
+    except Exception as e:
+        _LOGGER.error("Cannot flush metrics. Cause: " + str(e) + "\n" + traceback.format_exc())
+
+
+def aws_shutdown(flusher):
+    """
+    Collectd callback entry used to publish or save aggregated metric data before collectd stops
+    """
+    try:
+        flusher.shutdown()
+    except Exception as e:
+        _LOGGER.error("Cannot drain metrics on shutdown. Cause: " + str(e) + "\n" + traceback.format_exc())
     
 collectd.register_init(aws_init)
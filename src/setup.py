@@ -11,6 +11,7 @@ Depending on the version of collectd installed on the host we provide the follow
 2. version >= 5.0.0 - we will offer option to inject our plugin into the existing configuration (no metrics are whitelisted).
 3. any other version of collectd is not supported.
 """
+from __future__ import print_function
 
 import os
 import sys
@@ -30,6 +31,11 @@ from os import path, makedirs, chdir
 from subprocess import check_output, CalledProcessError, Popen, PIPE
 from tempfile import gettempdir
 
+try:
+    read_input = raw_input
+except NameError:
+    read_input = input
+
 ROOT_UID = 0
 TEMP_DIRECTORY = gettempdir() + "/collectd-cloudwatch-plugin/"
 TIMESTAMP_FORMAT = "%Y-%m-%d_%H_%M"
@@ -136,7 +142,7 @@ class Color(object):
 
 def get_collectd_info():
     exec_path = _get_collectd_exec()
-    output = check_output([exec_path, COLLECTD_HELP_ARGS])
+    output = _to_str(check_output([exec_path, COLLECTD_HELP_ARGS]))
     version = VERSION_REGEX.search(output).group(1)
     config_path = CONFIG_FILE_REGEX.search(output).group(1)
     return CollectdInfo(exec_path, config_path, version)
@@ -152,7 +158,12 @@ def _get_collectd_exec():
 
 
 def get_path_to_executable(command):
-    return check_output(FIND_COMMAND.format(command), shell=True).strip()
+    return _to_str(check_output(FIND_COMMAND.format(command), shell=True)).strip()
+
+
+def _to_str(output):
+    """ Returns the command output as a native string, the output of a command is bytes on Python 3 """
+    return output if isinstance(output, str) else output.decode("utf-8", "replace")
 
 
 class Command(object):
@@ -177,7 +188,7 @@ class Command(object):
         return self._process and self._process.returncode is self.SUCCESS
 
     def run(self):
-        print self.message,  # comma stops print from adding line break at the end
+        print(self.message, end=" ")  # end stops print from adding line break at the end
         try:
             self._process = self._get_process()
             self._capture_outputs()
@@ -196,14 +207,14 @@ class Command(object):
 
     def _capture_outputs(self):
         stdout, stderr = self._process.communicate()
-        self.stdout = str(stdout).strip()
-        self.stderr = str(stderr).strip()
+        self.stdout = _to_str(stdout).strip()
+        self.stderr = _to_str(stderr).strip()
 
     def _output_command_status(self):
         result = self.NOT_OK
         if self.was_successful:
             result = self.OK
-        print result
+        print(result)
 
 
 class MetadataReader(object):
@@ -579,9 +590,9 @@ class InteractiveConfigurator(object):
     def _configure_credentials_non_interactive(self):
         if self.access_key and self.secret_key:
             self.config.credentials_path = self._get_credentials_path()
-            print "self.config.credentials_path = ", self.config.credentials_path
+            print("self.config.credentials_path = ", self.config.credentials_path)
         self.config.credentials_file_exist = path.exists(str(self.config.credentials_path))
-        print "self.config.credentials_file_exist = ", self.config.credentials_file_exist
+        print("self.config.credentials_file_exist = ", self.config.credentials_file_exist)
         if not self.config.credentials_file_exist:
             self.config.access_key = self.access_key
             self.config.secret_key = self.secret_key
@@ -689,16 +700,16 @@ class Prompt(object):
 
     def run(self):
         if self.title:
-            print self.title
+            print(self.title)
         if self.options:
             for index, option in enumerate(self.options, start=1):
-                print "  {}. {}".format(index, option)
+                print("  {}. {}".format(index, option))
         return self._get_answer()
 
     def _get_answer(self):
-        value = raw_input(self.message).strip()
+        value = read_input(self.message).strip()
         while self._is_value_invalid(value):
-            value = raw_input(self.message).strip()
+            value = read_input(self.message).strip()
         return value or str(self.default)
 
     def _is_value_invalid(self, value):
@@ -964,7 +975,7 @@ def main():
             elif config.only_add_plugin:
                 _inject_plugin_configuration()
             else:
-                print Color.yellow("Please find instructions for the manual configuration of the plugin in the readme.md file.")
+                print(Color.yellow("Please find instructions for the manual configuration of the plugin in the readme.md file."))
         else:
             raise InstallationFailedException("The minimum supported version of collectd is " + CollectdInfo.MIN_SUPPORTED_VERSION + \
                                               ", and your version is " + COLLECTD_INFO.version + \
@@ -983,13 +994,13 @@ def main():
 
     def _inject_plugin_configuration():
         if _is_cloudwatch_plugin_configured():
-            print Color.yellow("CloudWatch collectd plugin is already configured in the existing collectd.conf file.")
+            print(Color.yellow("CloudWatch collectd plugin is already configured in the existing collectd.conf file."))
         elif _can_safely_add_python_plugin():
             with open(COLLECTD_INFO.config_path, "a") as config:
                 config.write(PLUGIN_CONFIGURATION_INCLUDE_LINE)
         else:
-            print Color.yellow("Cannot add CloudWatch collectd plugin automatically to the existing collectd configuration.\n"
-                               "Plugin must be configured manually, please find instructions in readme.md file.")
+            print(Color.yellow("Cannot add CloudWatch collectd plugin automatically to the existing collectd configuration.\n"
+                               "Plugin must be configured manually, please find instructions in readme.md file."))
 
     def _copy_recommended_configs():
         _run_command(BACKUP_COLLECTD_CONFIG_CMD)
@@ -1,11 +1,10 @@
-import BaseHTTPServer
 import json
 import os.path
 import socket
 import threading
 import time
-import urllib2
-from SimpleHTTPServer import SimpleHTTPRequestHandler
+
+from cloudwatch.modules.compat import BaseHTTPRequestHandler, HTTPServer, httplib, to_bytes, to_str
 
 
 class FakeServer(object):
@@ -31,7 +30,7 @@ class FakeServer(object):
     class ServerStateException(Exception):
         pass
 
-    class RequestHandler(SimpleHTTPRequestHandler):
+    class RequestHandler(BaseHTTPRequestHandler):
         def __init__(self, request, client_address, server):
             self._lock = threading.Lock()
             self._code = FakeServer.DEFAULT_RESPONSE_CODE
@@ -40,7 +39,7 @@ class FakeServer(object):
 
         def _start_request_handler(self, request, client_address, server):
             try:
-                SimpleHTTPRequestHandler.__init__(self, request, client_address, server)
+                BaseHTTPRequestHandler.__init__(self, request, client_address, server)
             except socket.error:
                 pass
 
@@ -48,7 +47,7 @@ class FakeServer(object):
             with self._lock:
                 self.log_message("POST: Command: %s Path: %s Headers: %s", self.command, self.path, self.headers.items())
                 with open(FakeServer.REQUEST_FILE, "w") as request_file:
-                    request_file.write(json.dumps({"headers": self.headers, "body": self._get_request_body()}))
+                    request_file.write(json.dumps({"headers": dict(self.headers.items()), "body": self._get_request_body()}))
                 self.write_response()
         
         def do_GET(self):
@@ -71,9 +70,10 @@ class FakeServer(object):
             self._update_response()
             self.send_response(self._code)
             self.send_header("Content-type", response_type)
-            self.send_header("Content-length", str(len(self._response)))
+            response = to_bytes(self._response)
+            self.send_header("Content-length", str(len(response)))
             self.end_headers()
-            self.wfile.write(self._response)
+            self.wfile.write(response)
 
         def _update_response(self):
             self._response = self.read_file_or_default_to(FakeServer.RESPONSE_FILE, FakeServer.DEFAULT_RESPONSE)
@@ -82,7 +82,7 @@ class FakeServer(object):
         def _get_request_body(self):
             if "content-length" in self.headers:
                 length = int(self.headers["content-length"])
-                return self.rfile.read(length)
+                return to_str(self.rfile.read(length))
             return ""
 
         def _execute_and_reset_delay(self):
@@ -92,7 +92,7 @@ class FakeServer(object):
 
     def start_server(self):
         if not self._server_started:
-            self._httpd = BaseHTTPServer.HTTPServer(("127.0.0.1", int(self.port)), self.RequestHandler)
+            self._httpd = HTTPServer(("127.0.0.1", int(self.port)), self.RequestHandler)
             self._server_started = True
         else:
             raise self.ServerStateException({"message": "The server is already running.", "state": "on"})
@@ -103,7 +103,7 @@ class FakeServer(object):
                 self._httpd.shutdown()
                 self._serve_in_loop = False
             elif self._ready_to_serve:
-                urllib2.urlopen(self.get_url()).read()  # generate empty request required to close listener
+                self._send_empty_request()  # generate empty request required to close listener
             self._ready_to_serve = False
             self._httpd.server_close() 
             self._server_started = False
@@ -111,6 +111,14 @@ class FakeServer(object):
         else:
             raise self.ServerStateException({"message": "The server is already stopped.", "state": "off"})
 
+    def _send_empty_request(self):
+        connection = httplib.HTTPConnection("127.0.0.1", int(self.port))
+        try:
+            connection.request("GET", "/")
+            connection.getresponse().read()
+        finally:
+            connection.close()
+
     def is_alive(self):
         return self._server_started
 
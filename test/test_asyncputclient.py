@@ -0,0 +1,295 @@
+import threading
+import time
+import unittest
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+from mock import MagicMock
+from cloudwatch.modules.awscredentials import AWSCredentials
+from cloudwatch.modules.compat import PY3
+from cloudwatch.modules.client.congestion import AIMDController
+from cloudwatch.modules.client.circuitbreaker import EndpointPool
+from cloudwatch.modules.client.transport import Response
+from cloudwatch.modules.quarantine import MetricQuarantine
+from cloudwatch.modules.metricdata import MetricDataStatistic
+
+if PY3:
+    import asyncio
+    from cloudwatch.modules.client.asyncputclient import AsyncPutClient
+    from cloudwatch.modules.client.asynctransport import AsyncHTTPTransport
+
+
+class ConcurrencyRecordingServer(ThreadingMixIn, HTTPServer):
+    """ HTTP/1.1 server recording the client addresses and the highest number of requests handled at the same time """
+
+    class RequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            server = self.server
+            with server.lock:
+                server.requests.append((self.client_address, self.path))
+                server.active_requests += 1
+                server.max_active_requests = max(server.max_active_requests, server.active_requests)
+            time.sleep(server.response_delay)
+            with server.lock:
+                server.active_requests -= 1
+            self.send_response(server.status_code)
+            if server.chunked:
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                self.wfile.write(b"2\r\nOK\r\n0\r\n\r\n")
+            else:
+                self.send_header("Content-Length", "2")
+                self.end_headers()
+                self.wfile.write(b"OK")
+
+        def log_message(self, format, *args):
+            pass
+
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), self.RequestHandler)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = []
+        self.active_requests = 0
+        self.max_active_requests = 0
+        self.response_delay = 0
+        self.status_code = 200
+        self.chunked = False
+
+    def get_url(self):
+        return "http://127.0.0.1:" + str(self.server_address[1]) + "/"
+
+
+@unittest.skipUnless(PY3, "the asynchronous flush pipeline requires Python 3")
+class AsyncPutClientTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ConcurrencyRecordingServer()
+        thread = threading.Thread(target=cls.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.reset()
+        self.config_helper = MagicMock()
+        self.config_helper.credentials = AWSCredentials("access", "secret")
+        self.config_helper.region = "localhost"
+        self.config_helper.endpoint = self.server.get_url()
+        self.config_helper.proxy_server_name = None
+        self.config_helper.debug = False
+        self.client = AsyncPutClient(self.config_helper, max_concurrent_requests=4)
+        self.client._LOGGER = MagicMock()
+
+    def tearDown(self):
+        self.client.close(1)
+
+    def _get_metric_batches(self, batch_count):
+        return [[MetricDataStatistic("metric_" + str(index), statistic_values=MetricDataStatistic.Statistics(20))] for index in range(batch_count)]
+
+    def test_batches_are_published_concurrently(self):
+        self.server.response_delay = 0.2
+        start = time.time()
+        flush = self.client.put_metric_batches(MetricDataStatistic.NAMESPACE, self._get_metric_batches(8))
+        self.assertTrue(flush.result(5))
+        self.assertTrue(time.time() - start < 8 * self.server.response_delay)
+        self.assertEquals(8, len(self.server.requests))
+        self.assertEquals(4, self.server.max_active_requests)
+
+    def test_put_metric_batches_does_not_wait_for_requests(self):
+        self.server.response_delay = 0.5
+        start = time.time()
+        flush = self.client.put_metric_batches(MetricDataStatistic.NAMESPACE, self._get_metric_batches(1))
+        self.assertTrue(time.time() - start < self.server.response_delay)
+        self.assertFalse(self.client.wait_for_pending_flushes(0))
+        self.assertTrue(self.client.wait_for_pending_flushes(5))
+        self.assertTrue(flush.done())
+
+    def test_connections_are_reused_between_flushes(self):
+        for _ in range(3):
+            self.assertTrue(self.client.put_metric_batches(MetricDataStatistic.NAMESPACE, self._get_metric_batches(2)).result(5))
+        self.assertEquals(6, len(self.server.requests))
+        self.assertTrue(len(set(address for address, _ in self.server.requests)) <= 2)
+
+    def test_congestion_window_limits_requests_in_flight(self):
+        self.server.response_delay = 0.2
+        client = AsyncPutClient(self.config_helper, max_concurrent_requests=4, congestion_controller=AIMDController(2, 2, 1000, 1000))
+        try:
+            self.assertTrue(client.put_metric_batches(MetricDataStatistic.NAMESPACE, self._get_metric_batches(6)).result(5))
+        finally:
+            client.close(1)
+        self.assertEquals(6, len(self.server.requests))
+        self.assertEquals(2, self.server.max_active_requests)
+
+    def test_throttled_requests_are_retried_and_cut_window(self):
+        self.server.status_code = 503
+        controller = AIMDController(1, 4, 1000, 1000)
+        controller._LOGGER = MagicMock()
+        client = AsyncPutClient(self.config_helper, congestion_controller=controller)
+        client._LOGGER = MagicMock()
+        try:
+            self.assertFalse(client.put_metric_data(MetricDataStatistic.NAMESPACE, self._get_metric_batches(1)[0]))
+        finally:
+            client.close(1)
+        self.assertEquals(AsyncPutClient._MAX_CONGESTION_RETRIES + 1, len(self.server.requests))
+        self.assertEquals(1, controller.congestion_event_count)
+        self.assertEquals(2, controller.get_concurrency_limit())
+
+    def test_unreachable_endpoint_fails_over_to_next_endpoint(self):
+        pool = EndpointPool(["http://127.0.0.1:1/", self.server.get_url()], failure_threshold=1)
+        pool.endpoints[0].circuit_breaker._LOGGER = MagicMock()
+        client = AsyncPutClient(self.config_helper, endpoint_pool=pool)
+        client._LOGGER = MagicMock()
+        try:
+            self.assertTrue(client.put_metric_batches(MetricDataStatistic.NAMESPACE, self._get_metric_batches(3)).result(10))
+        finally:
+            client.close(1)
+        self.assertEquals(3, len(self.server.requests))
+        self.assertTrue(pool.get_preferred_endpoint() is pool.endpoints[1])
+
+    def test_rejected_metric_is_quarantined_and_other_metrics_are_published(self):
+        rejection = Response(400, "Bad Request", {}, b"<Error><Code>InvalidParameterValue</Code>"
+                                                     b"<Message>The value for parameter MetricData.member.3.Value is invalid.</Message></Error>")
+        transport = MagicMock()
+        transport.get.side_effect = lambda url, **kwargs: asyncio.sleep(0, rejection if "MetricName=metric_2&" in url else Response(200, "OK", {}, b"OK"))
+        quarantine = MetricQuarantine()
+        quarantine._LOGGER = MagicMock()
+        client = AsyncPutClient(self.config_helper, transport=transport, metric_quarantine=quarantine)
+        client._LOGGER = MagicMock()
+        metric_batch = [metric_batch[0] for metric_batch in self._get_metric_batches(4)]
+        try:
+            self.assertTrue(client.put_metric_data(MetricDataStatistic.NAMESPACE, metric_batch))
+        finally:
+            client.close(1)
+        self.assertEquals([False, False, True, False], [quarantine.is_quarantined(metric) for metric in metric_batch])
+        self.assertEquals(2, transport.get.call_count)
+
+    def test_request_is_cancelled_after_timeout(self):
+        transport = MagicMock()
+        transport.get.side_effect = lambda url, **kwargs: asyncio.sleep(5, Response(200, "OK", {}, b"OK"))
+        client = AsyncPutClient(self.config_helper, transport=transport)
+        client._LOGGER = MagicMock()
+        try:
+            start = time.time()
+            self.assertFalse(client.put_metric_data(MetricDataStatistic.NAMESPACE, self._get_metric_batches(1)[0], timeout=0.2))
+            self.assertTrue(time.time() - start < 2)
+            self.assertTrue(client.wait_for_pending_flushes(1))
+        finally:
+            client.close(1)
+
+    def test_close_returns_batches_whose_requests_were_not_finished(self):
+        transport = MagicMock()
+        transport.get.side_effect = lambda url, **kwargs: asyncio.sleep(5, Response(200, "OK", {}, b"OK"))
+        client = AsyncPutClient(self.config_helper, transport=transport)
+        client._LOGGER = MagicMock()
+        metric_batches = self._get_metric_batches(2)
+        client.put_metric_batches(MetricDataStatistic.NAMESPACE, metric_batches)
+        self.assertEquals([(MetricDataStatistic.NAMESPACE, metric_batch, None) for metric_batch in metric_batches],
+                          sorted(client.close(0.2), key=lambda unsent_batch: unsent_batch[1][0].metric_name))
+        self.assertEquals([], self.client.close(1))
+
+    def test_requests_are_signed(self):
+        self.client.put_metric_data(MetricDataStatistic.NAMESPACE, self._get_metric_batches(1)[0])
+        path = self.server.requests[0][1]
+        self.assertTrue("Action=PutMetricData" in path)
+        self.assertTrue("MetricData.member.1.MetricName=metric_0" in path)
+        self.assertTrue("X-Amz-Signature=" in path)
+
+    def test_failed_request_is_reported(self):
+        self.server.status_code = 400
+        self.assertFalse(self.client.put_metric_data(MetricDataStatistic.NAMESPACE, self._get_metric_batches(1)[0]))
+        self.assertTrue(self.client._LOGGER.warning.called)
+
+    def test_failure_callback_is_called_with_unpublished_batches(self):
+        self.server.status_code = 500
+        failed_batches = []
+        metric_batches = self._get_metric_batches(2)
+        self.assertFalse(self.client.put_metric_batches(MetricDataStatistic.NAMESPACE, metric_batches, failed_batches.append).result(10))
+        self.assertEquals(2, len(failed_batches))
+        self.assertTrue(all(failed_batch in metric_batches for failed_batch in failed_batches))
+
+    def test_unreachable_endpoint_is_reported(self):
+        self.config_helper.endpoint = "http://127.0.0.1:1/"
+        client = AsyncPutClient(self.config_helper)
+        client._LOGGER = MagicMock()
+        try:
+            self.assertFalse(client.put_metric_batches(MetricDataStatistic.NAMESPACE, self._get_metric_batches(2)).result(5))
+            self.assertEquals(2, len([call for call in client._LOGGER.warning.call_args_list if "Could not put" in call[0][0]]))
+        finally:
+            client.close(1)
+
+    def test_inconsistent_namespace_raises_exception(self):
+        with self.assertRaises(ValueError):
+            self.client.put_metric_data("other_namespace", self._get_metric_batches(1)[0])
+
+    def test_close_stops_event_loop_thread(self):
+        self.client.close(1)
+        self.assertFalse(self.client._thread.is_alive())
+
+
+@unittest.skipUnless(PY3, "the asynchronous transport requires Python 3")
+class AsyncHTTPTransportTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ConcurrencyRecordingServer()
+        thread = threading.Thread(target=cls.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.reset()
+        self.loop = asyncio.new_event_loop()
+        self.transport = AsyncHTTPTransport(max_retries=1)
+
+    def tearDown(self):
+        self.transport.close()
+        self.loop.close()
+
+    def _run(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_chunked_response_is_read(self):
+        self.server.chunked = True
+        response = self._run(self.transport.get(self.server.get_url(), timeout=1))
+        self.assertEquals(200, response.status_code)
+        self.assertEquals("OK", response.text)
+
+    def test_stale_idle_connection_is_replaced(self):
+        self._run(self.transport.get(self.server.get_url(), timeout=1))
+        for connections in self.transport._idle_connections.values():
+            for _, writer in connections:
+                writer.transport.get_extra_info("socket").shutdown(2)
+        self.assertEquals(200, self._run(self.transport.get(self.server.get_url(), timeout=1)).status_code)
+        self.assertEquals(2, len(set(address for address, _ in self.server.requests)))
+
+    def test_prewarmed_connection_is_used_by_next_request(self):
+        self.assertTrue(self._run(self.transport.prewarm(self.server.get_url(), 1)))
+        self._run(self.transport.get(self.server.get_url(), timeout=1))
+        self.assertEquals(1, len(self.server.requests))
+        self.assertEquals(1, len(list(self.transport._idle_connections.values())[0]))
+
+    def test_request_is_encoded_with_host_header(self):
+        route = self.transport._get_route("http://localhost:8080/?a=b c")
+        request = self.transport._encode_request(route, "GET", "http://localhost:8080/?a=b c", {"User-Agent": "test"}, None)
+        self.assertEquals(b"GET /?a=b%20c HTTP/1.1\r\nHost: localhost:8080\r\nAccept-Encoding: identity\r\nUser-Agent: test\r\n\r\n", request)
@@ -0,0 +1,102 @@
+import unittest
+
+from cloudwatch.modules.changesuppressor import ChangeSuppressor
+from cloudwatch.modules.metricdata import MetricDataStatistic
+
+
+class ChangeSuppressorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.suppressor = ChangeSuppressor(enabled=True, heartbeat_intervals=3)
+
+    def test_suppression_is_disabled_by_default(self):
+        suppressor = ChangeSuppressor()
+        for _ in range(5):
+            suppressor.start_flush()
+            self.assertTrue(suppressor.should_publish(self._get_metric(10)))
+        self.assertEquals(0, suppressor.suppressed_series_count)
+
+    def test_unchanged_series_is_suppressed_until_heartbeat(self):
+        published = []
+        for _ in range(7):
+            self.suppressor.start_flush()
+            published.append(self.suppressor.should_publish(self._get_metric(10)))
+        self.assertEquals([True, False, False, True, False, False, True], published)
+        self.assertEquals(4, self.suppressor.suppressed_series_count)
+
+    def test_changed_series_is_published(self):
+        self.suppressor.start_flush()
+        self.assertTrue(self.suppressor.should_publish(self._get_metric(10)))
+        self.suppressor.start_flush()
+        self.assertTrue(self.suppressor.should_publish(self._get_metric(10, sample_count=2)))
+        self.suppressor.start_flush()
+        self.assertTrue(self.suppressor.should_publish(self._get_metric(20, sample_count=2)))
+        self.suppressor.start_flush()
+        self.assertFalse(self.suppressor.should_publish(self._get_metric(20, sample_count=2)))
+        self.assertEquals(1, self.suppressor.last_suppressed_series_count)
+
+    def test_series_are_identified_by_name_and_dimensions(self):
+        self.suppressor.start_flush()
+        self.assertTrue(self.suppressor.should_publish(self._get_metric(10)))
+        self.assertTrue(self.suppressor.should_publish(self._get_metric(10, metric_name="memory.memory.free")))
+        self.assertTrue(self.suppressor.should_publish(self._get_metric(10, plugin_instance="1")))
+        self.suppressor.start_flush()
+        self.assertFalse(self.suppressor.should_publish(self._get_metric(10, plugin_instance="1")))
+
+    def test_series_of_other_namespace_is_not_suppressed(self):
+        self.suppressor.start_flush()
+        self.assertTrue(self.suppressor.should_publish(self._get_metric(10)))
+        self.assertTrue(self.suppressor.should_publish(self._get_metric(10, namespace="collectd/disk")))
+        self.suppressor.start_flush()
+        self.assertFalse(self.suppressor.should_publish(self._get_metric(10, namespace="collectd/disk")))
+
+    def test_series_of_failed_put_is_published_with_next_flush(self):
+        self.suppressor.start_flush()
+        metric = self._get_metric(10)
+        self.assertTrue(self.suppressor.should_publish(metric))
+        self.suppressor.rollback([metric])
+        self.suppressor.start_flush()
+        self.assertTrue(self.suppressor.should_publish(self._get_metric(10)))
+        self.suppressor.start_flush()
+        self.assertFalse(self.suppressor.should_publish(self._get_metric(10)))
+
+    def test_rollback_keeps_newer_statistics(self):
+        self.suppressor.start_flush()
+        failed_metric = self._get_metric(10)
+        self.suppressor.should_publish(failed_metric)
+        self.suppressor.start_flush()
+        self.suppressor.should_publish(self._get_metric(20))
+        self.suppressor.rollback([failed_metric])
+        self.suppressor.start_flush()
+        self.assertFalse(self.suppressor.should_publish(self._get_metric(20)))
+
+    def test_last_suppressed_series_count_is_reset_on_flush(self):
+        self.suppressor.start_flush()
+        self.suppressor.should_publish(self._get_metric(10))
+        self.suppressor.start_flush()
+        self.suppressor.should_publish(self._get_metric(10))
+        self.assertEquals(1, self.suppressor.last_suppressed_series_count)
+        self.suppressor.start_flush()
+        self.assertEquals(0, self.suppressor.last_suppressed_series_count)
+        self.assertEquals(1, self.suppressor.suppressed_series_count)
+
+    def test_heartbeat_is_sent_for_series_reported_again_after_gap(self):
+        self.suppressor.start_flush()
+        self.suppressor.should_publish(self._get_metric(10))
+        for _ in range(3):
+            self.suppressor.start_flush()
+        self.assertTrue(self.suppressor.should_publish(self._get_metric(10)))
+
+    def test_series_missing_for_heartbeat_intervals_are_forgotten(self):
+        self.suppressor.start_flush()
+        self.suppressor.should_publish(self._get_metric(10))
+        for _ in range(5):
+            self.suppressor.start_flush()
+        self.assertEquals({}, self.suppressor._published_series)
+
+    def _get_metric(self, value, sample_count=1, metric_name="df.df_complex.free", plugin_instance="root", namespace=MetricDataStatistic.NAMESPACE):
+        statistics = MetricDataStatistic.Statistics(value)
+        for _ in range(sample_count - 1):
+            statistics._add_value(value)
+        return MetricDataStatistic(metric_name=metric_name, dimensions={"Host": "host", "PluginInstance": plugin_instance},
+                                   statistic_values=statistics, namespace=namespace)
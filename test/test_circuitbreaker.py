@@ -0,0 +1,120 @@
+import unittest
+
+from mock import MagicMock, patch
+from cloudwatch.modules.client.circuitbreaker import CircuitBreaker, Endpoint, EndpointPool
+from cloudwatch.modules.client.transport import ConnectionException, HTTPStatusException, Response
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.time = 1000.0
+        patch("cloudwatch.modules.client.circuitbreaker.clock.monotonic", side_effect=lambda: self.time).start()
+        self.breaker = CircuitBreaker("endpoint", failure_threshold=3, probe_interval_in_seconds=30)
+        self.breaker._LOGGER = MagicMock()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def _open_breaker(self):
+        for _ in range(3):
+            self.breaker.on_failure()
+
+    def test_breaker_opens_after_consecutive_failures(self):
+        self.breaker.on_failure()
+        self.breaker.on_failure()
+        self.assertTrue(self.breaker.try_acquire())
+        self.breaker.on_failure()
+        self.assertEquals(CircuitBreaker.OPEN, self.breaker.state)
+        self.assertFalse(self.breaker.try_acquire())
+        self.assertTrue(self.breaker._LOGGER.warning.called)
+
+    def test_success_resets_failure_count(self):
+        self.breaker.on_failure()
+        self.breaker.on_failure()
+        self.breaker.on_success()
+        self.breaker.on_failure()
+        self.assertEquals(CircuitBreaker.CLOSED, self.breaker.state)
+
+    def test_single_probe_is_sent_after_probe_interval(self):
+        self._open_breaker()
+        self.time += 29
+        self.assertFalse(self.breaker.try_acquire())
+        self.time += 1
+        self.assertTrue(self.breaker.try_acquire())
+        self.assertEquals(CircuitBreaker.HALF_OPEN, self.breaker.state)
+        self.assertFalse(self.breaker.try_acquire())
+
+    def test_successful_probe_closes_breaker(self):
+        self._open_breaker()
+        self.time += 30
+        self.assertTrue(self.breaker.try_acquire())
+        self.breaker.on_success()
+        self.assertEquals(CircuitBreaker.CLOSED, self.breaker.state)
+        self.assertTrue(self.breaker.try_acquire())
+
+    def test_failed_probe_reopens_breaker_for_probe_interval(self):
+        self._open_breaker()
+        self.time += 30
+        self.assertTrue(self.breaker.try_acquire())
+        self.breaker.on_failure()
+        self.assertEquals(CircuitBreaker.OPEN, self.breaker.state)
+        self.time += 29
+        self.assertFalse(self.breaker.try_acquire())
+        self.time += 1
+        self.assertTrue(self.breaker.try_acquire())
+
+    def test_released_probe_can_be_sent_again(self):
+        self._open_breaker()
+        self.time += 30
+        self.assertTrue(self.breaker.try_acquire())
+        self.breaker.release()
+        self.assertTrue(self.breaker.try_acquire())
+
+    def test_zero_failure_threshold_disables_breaker(self):
+        breaker = CircuitBreaker("endpoint", failure_threshold=0)
+        for _ in range(100):
+            breaker.on_failure()
+        self.assertTrue(breaker.try_acquire())
+
+
+class EndpointPoolTest(unittest.TestCase):
+
+    PRIMARY = "https://vpce-1234.monitoring.us-east-1.vpce.amazonaws.com/"
+    SECONDARY = "https://monitoring.us-east-1.amazonaws.com/"
+
+    def setUp(self):
+        self.pool = EndpointPool([self.PRIMARY, self.SECONDARY], failure_threshold=1)
+        for endpoint in self.pool.endpoints:
+            endpoint.circuit_breaker._LOGGER = MagicMock()
+        self.primary, self.secondary = self.pool.endpoints
+
+    def _get_status_exception(self, status_code):
+        return HTTPStatusException(str(status_code), Response(status_code, "reason", {}, b""))
+
+    def test_endpoints_are_selected_in_order(self):
+        self.assertTrue(self.pool.select() is self.primary)
+        self.assertTrue(self.pool.select([self.primary]) is self.secondary)
+        self.assertEquals(None, self.pool.select([self.primary, self.secondary]))
+
+    def test_unavailable_endpoint_is_skipped(self):
+        self.pool.report(self.primary, ConnectionException("timeout"))
+        self.assertTrue(self.pool.select() is self.secondary)
+        self.assertTrue(self.pool.get_preferred_endpoint() is self.secondary)
+
+    def test_server_error_is_endpoint_failure_and_client_error_is_not(self):
+        self.pool.report(self.primary, self._get_status_exception(400))
+        self.assertTrue(self.pool.select() is self.primary)
+        self.pool.report(self.primary, self._get_status_exception(500))
+        self.assertTrue(self.pool.select() is self.secondary)
+
+    def test_no_endpoint_is_selected_when_all_breakers_are_open(self):
+        self.pool.report(self.primary, ConnectionException("timeout"))
+        self.pool.report(self.secondary, ConnectionException("timeout"))
+        self.assertEquals(None, self.pool.select())
+        self.assertEquals(None, self.pool.get_preferred_endpoint())
+
+    def test_endpoint_is_signed_for_host_of_url(self):
+        self.assertEquals("vpce-1234.monitoring.us-east-1.vpce.amazonaws.com", self.primary.signing_host)
+        self.assertEquals("localhost:8080", Endpoint("http://localhost:8080/", None).signing_host)
+        self.assertEquals("localhost", Endpoint("http://localhost:80/", None).signing_host)
@@ -0,0 +1,39 @@
+import unittest
+from datetime import datetime
+
+from mock import patch
+from cloudwatch.modules import clock
+
+
+class ClockTest(unittest.TestCase):
+
+    def test_monotonic_clock_does_not_follow_wall_clock_steps(self):
+        start = clock.monotonic()
+        with patch.object(clock.time, "time", return_value=0):
+            self.assertTrue(clock.monotonic() >= start)
+
+    def test_non_decreasing_clock_ignores_backward_steps(self):
+        non_decreasing_clock = clock._NonDecreasingClock()
+        start = non_decreasing_clock()
+        with patch.object(clock.time, "time", return_value=start - 3600):
+            self.assertEquals(start, non_decreasing_clock())
+
+    def test_boundary_offset_is_signed_distance_to_nearest_boundary(self):
+        self.assertEquals(0.5, clock.get_boundary_offset(60, wall_time=1200.5))
+        self.assertEquals(-0.5, clock.get_boundary_offset(60, wall_time=1199.5))
+        self.assertEquals(0.5, clock.get_boundary_offset(60, wall_time=1199.5, phase=-1))
+        self.assertEquals(1, clock.get_boundary_offset(10, wall_time=1202, phase=1))
+        self.assertEquals(0, clock.get_boundary_offset(0, wall_time=1202))
+
+    def test_aws_timestamp_matches_datetime_formatting(self):
+        for epoch_time in (0, 86399.9, 1500000000, 1500000000.5):
+            expected = datetime.utcfromtimestamp(int(epoch_time)).strftime('%Y%m%dT%H%M%SZ')
+            self.assertEquals(expected, clock.get_aws_timestamp(epoch_time))
+        self.assertEquals("19700101", clock.get_datestamp(86399))
+        self.assertEquals("19700102", clock.get_datestamp(86400))
+
+    def test_aws_timestamp_cache_is_bounded(self):
+        for second in range(clock._MAX_CACHED_TIMESTAMPS * 2):
+            clock.get_aws_timestamp(second)
+        self.assertTrue(len(clock._timestamp_cache) <= clock._MAX_CACHED_TIMESTAMPS)
+        self.assertEquals("19700101T000001Z", clock.get_aws_timestamp(1))
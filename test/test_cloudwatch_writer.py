@@ -51,4 +51,32 @@ class CloudWatchWriter(unittest.TestCase):
         plugin.aws_init()
         vl = MagicMock()
         plugin.aws_write(vl, flusher)
-        flusher.add_metric.assert_called_with(vl)
\ No newline at end of file
+        flusher.add_metric.assert_called_with(vl)
+
+    @patch("cloudwatch_writer.ConfigHelper")
+    @patch("cloudwatch_writer.Flusher")
+    def test_initialize_plugin_restores_snapshot(self, flusher_class, config_helper):
+        plugin.aws_init()
+        self.assertTrue(flusher_class.return_value.restore_snapshot.called)
+
+    def test_shutdown_drains_flusher(self):
+        flusher = MagicMock()
+        plugin.aws_shutdown(flusher)
+        self.assertTrue(flusher.shutdown.called)
+
+    def test_shutdown_logs_flusher_exception(self):
+        flusher = MagicMock()
+        flusher.shutdown.side_effect = IOError("Cannot save snapshot.")
+        plugin.aws_shutdown(flusher)
+        self.assertTrue(plugin._LOGGER.error.called)
+
+    def test_flush_passes_timeout_and_identifier_to_flusher(self):
+        flusher = MagicMock()
+        plugin.aws_flush(10, "host/cpu-0/cpu-user", flusher)
+        flusher.flush.assert_called_with(10, "host/cpu-0/cpu-user")
+
+    def test_flush_logs_flusher_exception(self):
+        flusher = MagicMock()
+        flusher.flush.side_effect = Exception("Cannot flush metrics.")
+        plugin.aws_flush(-1, None, flusher)
+        self.assertTrue(plugin._LOGGER.error.called)
@@ -1,6 +1,6 @@
 import unittest
 
-from mock import Mock
+from mock import Mock, patch
 
 import cloudwatch.modules.collectd as collectd
 from cloudwatch.modules.configuration.confighelper import ConfigHelper
@@ -21,6 +21,26 @@ class ConfigHelperTest(unittest.TestCase):
     VALID_CONFIG_WITH_PROXY_SERVER_NAME = CONFIG_DIR + "valid_config_with_proxy_server_name"
     VALID_CONFIG_WITH_PROXY_SERVER_PORT = CONFIG_DIR + "valid_config_with_proxy_server_port"
     VALID_CONFIG_WITHOUT_CREDS = CONFIG_DIR + "valid_config_without_creds"
+    VALID_CONFIG_WITH_SERIES_BUDGET = CONFIG_DIR + "valid_config_with_series_budget"
+    VALID_CONFIG_WITH_CHANGE_SUPPRESSION = CONFIG_DIR + "valid_config_with_change_suppression"
+    INVALID_CONFIG_WITH_CHANGE_SUPPRESSION = CONFIG_DIR + "invalid_config_with_change_suppression"
+    VALID_CONFIG_WITH_CACHE_MEMORY_BUDGET = CONFIG_DIR + "valid_config_with_cache_memory_budget"
+    VALID_CONFIG_WITH_SHUTDOWN_DRAIN_TIMEOUT = CONFIG_DIR + "valid_config_with_shutdown_drain_timeout"
+    INVALID_CONFIG_WITH_SHUTDOWN_DRAIN_TIMEOUT = CONFIG_DIR + "invalid_config_with_shutdown_drain_timeout"
+    VALID_CONFIG_WITH_ASYNC_FLUSH_PIPELINE = CONFIG_DIR + "valid_config_with_async_flush_pipeline"
+    INVALID_CONFIG_WITH_ASYNC_FLUSH_PIPELINE = CONFIG_DIR + "invalid_config_with_async_flush_pipeline"
+    VALID_CONFIG_WITH_EMF_OUTPUT_MODE = CONFIG_DIR + "valid_config_with_emf_output_mode"
+    INVALID_CONFIG_WITH_EMF_OUTPUT_MODE = CONFIG_DIR + "invalid_config_with_emf_output_mode"
+    VALID_CONFIG_WITH_SINKS = CONFIG_DIR + "valid_config_with_sinks"
+    VALID_CONFIG_WITH_SINKS_AND_ASYNC_FLUSH_PIPELINE = CONFIG_DIR + "valid_config_with_sinks_and_async_flush_pipeline"
+    VALID_CONFIG_WITH_PROMETHEUS_LISTEN_ADDRESS = CONFIG_DIR + "valid_config_with_prometheus_listen_address"
+    VALID_CONFIG_WITH_CONGESTION_CONTROL = CONFIG_DIR + "valid_config_with_congestion_control"
+    INVALID_CONFIG_WITH_CONGESTION_CONTROL = CONFIG_DIR + "invalid_config_with_congestion_control"
+    VALID_CONFIG_WITH_ENDPOINTS = CONFIG_DIR + "valid_config_with_endpoints"
+    INVALID_CONFIG_WITH_ENDPOINTS = CONFIG_DIR + "invalid_config_with_endpoints"
+    VALID_CONFIG_WITH_REQUEST_TRACE = CONFIG_DIR + "valid_config_with_request_trace"
+    INVALID_CONFIG_WITH_REQUEST_TRACE = CONFIG_DIR + "invalid_config_with_request_trace"
+    TARGETS_CONFIG = CONFIG_DIR + "targets.conf"
     VALID_CREDENTIALS_FILE = CONFIG_DIR + "valid_credentials_file"
     MISSING_CONFIG = CONFIG_DIR + "no_config"
     PASS_THROUGH_WHITELIST_CONFIG = CONFIG_DIR + "pass_through_whitelist.conf"
@@ -95,6 +115,192 @@ class ConfigHelperTest(unittest.TestCase):
         self.assertEquals(False, self.config_helper.enable_high_resolution_metrics)
         self.assertEquals('60', self.config_helper.flush_interval_in_seconds)
 
+    def test_with_series_budget(self):
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.VALID_CONFIG_WITH_SERIES_BUDGET)
+        self.assertEquals(100, self.config_helper.max_series_per_plugin)
+        self.assertEquals({"processes": 20, "cpu": 5}, self.config_helper.max_series_per_plugin_overrides)
+
+    def test_series_budget_is_disabled_by_default(self):
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.VALID_CONFIG_FULL)
+        self.assertEquals(0, self.config_helper.max_series_per_plugin)
+        self.assertEquals({}, self.config_helper.max_series_per_plugin_overrides)
+
+    def test_with_change_suppression(self):
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.VALID_CONFIG_WITH_CHANGE_SUPPRESSION)
+        self.assertTrue(self.config_helper.suppress_unchanged_metrics)
+        self.assertEquals(30, self.config_helper.suppression_heartbeat_intervals)
+
+    def test_change_suppression_is_disabled_by_default(self):
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.VALID_CONFIG_FULL)
+        self.assertFalse(self.config_helper.suppress_unchanged_metrics)
+        self.assertEquals(10, self.config_helper.suppression_heartbeat_intervals)
+
+    def test_invalid_suppression_heartbeat_intervals_uses_default_value(self):
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.INVALID_CONFIG_WITH_CHANGE_SUPPRESSION)
+        self.assertTrue(self.config_helper.suppress_unchanged_metrics)
+        self.assertEquals(10, self.config_helper.suppression_heartbeat_intervals)
+
+    def test_with_cache_memory_budget(self):
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.VALID_CONFIG_WITH_CACHE_MEMORY_BUDGET)
+        self.assertEquals(64, self.config_helper.cache_memory_budget_in_mb)
+
+    def test_cache_memory_budget_is_disabled_by_default(self):
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.VALID_CONFIG_FULL)
+        self.assertEquals(0, self.config_helper.cache_memory_budget_in_mb)
+
+    def test_with_shutdown_drain_timeout(self):
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.VALID_CONFIG_WITH_SHUTDOWN_DRAIN_TIMEOUT)
+        self.assertEquals(20, self.config_helper.shutdown_drain_timeout_in_seconds)
+
+    def test_invalid_shutdown_drain_timeout_uses_default_value(self):
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.INVALID_CONFIG_WITH_SHUTDOWN_DRAIN_TIMEOUT)
+        self.assertEquals(5, self.config_helper.shutdown_drain_timeout_in_seconds)
+        self.assertEquals(ConfigHelper.SNAPSHOT_PATH, self.config_helper.snapshot_path)
+
+    def test_with_async_flush_pipeline(self):
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.VALID_CONFIG_WITH_ASYNC_FLUSH_PIPELINE)
+        self.assertTrue(self.config_helper.async_flush_pipeline)
+        self.assertEquals(16, self.config_helper.max_concurrent_put_requests)
+
+    def test_async_flush_pipeline_is_disabled_by_default(self):
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.VALID_CONFIG_FULL)
+        self.assertFalse(self.config_helper.async_flush_pipeline)
+        self.assertEquals(8, self.config_helper.max_concurrent_put_requests)
+
+    @patch.object(ConfigHelper._LOGGER, "warning")
+    def test_async_flush_pipeline_is_ignored_with_sinks(self, warning):
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.VALID_CONFIG_WITH_SINKS_AND_ASYNC_FLUSH_PIPELINE)
+        self.assertEquals(["cloudwatch", "jsonl"], self.config_helper.sinks)
+        self.assertFalse(self.config_helper.async_flush_pipeline)
+        self.assertTrue(any("async_flush_pipeline is not used" in call[0][0] for call in warning.call_args_list))
+
+    @patch.object(ConfigHelper, "TARGETS_CONFIG_PATH", TARGETS_CONFIG)
+    @patch.object(ConfigHelper._LOGGER, "warning")
+    def test_async_flush_pipeline_is_ignored_with_publish_targets(self, warning):
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.VALID_CONFIG_WITH_ASYNC_FLUSH_PIPELINE)
+        self.assertEquals(["cloudwatch"], self.config_helper.sinks)
+        self.assertFalse(self.config_helper.async_flush_pipeline)
+        self.assertTrue(any("async_flush_pipeline is not used" in call[0][0] for call in warning.call_args_list))
+
+    def test_invalid_max_concurrent_put_requests_uses_default_value(self):
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.INVALID_CONFIG_WITH_ASYNC_FLUSH_PIPELINE)
+        self.assertTrue(self.config_helper.async_flush_pipeline)
+        self.assertEquals(8, self.config_helper.max_concurrent_put_requests)
+
+    def test_emf_output_mode_does_not_load_credentials(self):
+        self.server.set_expected_response(FAKE_IDENTITY_DOCUMENT_STRING, 200)
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.VALID_CONFIG_WITH_EMF_OUTPUT_MODE, metadata_server=self.server.get_url())
+        self.assertTrue(self.config_helper.is_emf_output_mode())
+        self.assertEquals("udp://127.0.0.1:25888", self.config_helper.emf_endpoint)
+        self.assertEquals(None, self.config_helper.credentials)
+        self.assertFalse(self.config_helper._use_iam_role_credentials)
+        self.assertEquals("NONE", self.config_helper.asg_name)
+
+    def test_cloudwatch_output_mode_is_used_by_default(self):
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.VALID_CONFIG_FULL)
+        self.assertFalse(self.config_helper.is_emf_output_mode())
+        self.assertEquals("tcp://127.0.0.1:25888", self.config_helper.emf_endpoint)
+
+    def test_invalid_emf_endpoint_uses_default_value(self):
+        self.server.set_expected_response(FAKE_IDENTITY_DOCUMENT_STRING, 200)
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.INVALID_CONFIG_WITH_EMF_OUTPUT_MODE, metadata_server=self.server.get_url())
+        self.assertTrue(self.config_helper.is_emf_output_mode())
+        self.assertEquals("tcp://127.0.0.1:25888", self.config_helper.emf_endpoint)
+
+    def test_with_sinks(self):
+        self.server.set_expected_response(FAKE_IDENTITY_DOCUMENT_STRING, 200)
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.VALID_CONFIG_WITH_SINKS, metadata_server=self.server.get_url())
+        self.assertEquals(["jsonl", "emf"], self.config_helper.sinks)
+        self.assertEquals("/var/log/collectd/published_metrics.jsonl", self.config_helper.jsonl_path)
+        self.assertEquals(50, self.config_helper.max_queued_batches_per_sink)
+        self.assertFalse(self.config_helper.publishes_to_cloudwatch())
+        self.assertEquals(None, self.config_helper.credentials)
+
+    def test_sinks_are_not_used_by_default(self):
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.VALID_CONFIG_FULL)
+        self.assertEquals([], self.config_helper.sinks)
+        self.assertEquals(ConfigHelper.JSONL_PATH, self.config_helper.jsonl_path)
+        self.assertEquals(1000, self.config_helper.max_queued_batches_per_sink)
+        self.assertTrue(self.config_helper.publishes_to_cloudwatch())
+
+    def test_with_prometheus_listen_address(self):
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.VALID_CONFIG_WITH_PROMETHEUS_LISTEN_ADDRESS)
+        self.assertEquals(("127.0.0.1", 9103), self.config_helper.prometheus_listen_address)
+
+    def test_prometheus_listener_is_disabled_by_default(self):
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.VALID_CONFIG_FULL)
+        self.assertEquals(None, self.config_helper.prometheus_listen_address)
+
+    def test_with_congestion_control(self):
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.VALID_CONFIG_WITH_CONGESTION_CONTROL)
+        self.assertTrue(self.config_helper.congestion_control)
+        self.assertEquals((2, 16), (self.config_helper.min_concurrent_put_requests, self.config_helper.max_concurrent_put_requests))
+        self.assertEquals((5, 100), (self.config_helper.min_put_requests_per_second, self.config_helper.max_put_requests_per_second))
+
+    def test_congestion_control_is_disabled_by_default(self):
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.VALID_CONFIG_FULL)
+        self.assertFalse(self.config_helper.congestion_control)
+        self.assertEquals((1, 50), (self.config_helper.min_put_requests_per_second, self.config_helper.max_put_requests_per_second))
+
+    def test_invalid_congestion_control_bounds_use_valid_values(self):
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.INVALID_CONFIG_WITH_CONGESTION_CONTROL)
+        self.assertEquals((4, 4), (self.config_helper.min_concurrent_put_requests, self.config_helper.max_concurrent_put_requests))
+        self.assertEquals((1, 50), (self.config_helper.min_put_requests_per_second, self.config_helper.max_put_requests_per_second))
+
+    def test_with_endpoints(self):
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.VALID_CONFIG_WITH_ENDPOINTS)
+        self.assertEquals("https://vpce-1234.monitoring.us-east-1.vpce.amazonaws.com/", self.config_helper.endpoint)
+        self.assertEquals(["https://monitoring.us-east-1.amazonaws.com/"], self.config_helper.failover_endpoints)
+        self.assertEquals(0, self.config_helper.circuit_breaker_failure_threshold)
+        self.assertEquals(60, self.config_helper.circuit_breaker_probe_interval_in_seconds)
+
+    def test_invalid_endpoints_use_regional_endpoint_and_default_circuit_breaker(self):
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.INVALID_CONFIG_WITH_ENDPOINTS)
+        self.assertEquals("https://monitoring.us-east-1.amazonaws.com/", self.config_helper.endpoint)
+        self.assertEquals([], self.config_helper.failover_endpoints)
+        self.assertEquals(5, self.config_helper.circuit_breaker_failure_threshold)
+        self.assertEquals(30, self.config_helper.circuit_breaker_probe_interval_in_seconds)
+
+    def test_with_request_trace(self):
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.VALID_CONFIG_WITH_REQUEST_TRACE)
+        self.assertTrue(self.config_helper.is_request_trace_enabled())
+        self.assertEquals(0.25, self.config_helper.trace_sample_rate)
+        self.assertEquals("/tmp/collectd_request_trace.jsonl", self.config_helper.trace_path)
+
+    def test_request_trace_is_enabled_only_in_debug_mode(self):
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.VALID_CONFIG_FULL)
+        self.assertFalse(self.config_helper.is_request_trace_enabled())
+        self.assertEquals(0.01, self.config_helper.trace_sample_rate)
+        self.assertEquals(ConfigHelper.TRACE_PATH, self.config_helper.trace_path)
+
+    def test_invalid_trace_sample_rate_uses_default_value(self):
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.INVALID_CONFIG_WITH_REQUEST_TRACE)
+        self.assertEquals(0.01, self.config_helper.trace_sample_rate)
+        self.assertTrue(self.config_helper.is_request_trace_enabled())
+
+    @patch.object(ConfigHelper, "TARGETS_CONFIG_PATH", TARGETS_CONFIG)
+    def test_publish_targets_are_published_from_sinks(self):
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.VALID_CONFIG_FULL)
+        targets = self.config_helper.publish_targets
+        self.assertEquals(["dr", "audit", "vpc"], [target.name for target in targets])
+        self.assertEquals("https://monitoring.us-west-2.amazonaws.com/", targets[0].endpoint)
+        self.assertEquals("https://vpce-1234.monitoring.us-east-1.vpce.amazonaws.com/", targets[2].endpoint)
+        self.assertEquals(["cloudwatch"], self.config_helper.sinks)
+        self.assertTrue(self.config_helper.publishes_to_cloudwatch())
+        assert_credentials(targets[0].credentials)
+
+    @patch.object(ConfigHelper, "TARGETS_CONFIG_PATH", TARGETS_CONFIG)
+    def test_plugin_credentials_are_loaded_for_publish_targets(self):
+        self.server.set_expected_response(FAKE_IDENTITY_DOCUMENT_STRING, 200)
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.VALID_CONFIG_WITH_EMF_OUTPUT_MODE, metadata_server=self.server.get_url())
+        self.assertEquals(["emf"], self.config_helper.sinks)
+        self.assertFalse(self.config_helper.publishes_to_cloudwatch())
+        assert_credentials(self.config_helper.credentials)
+
+    def test_publish_targets_are_not_used_by_default(self):
+        self.config_helper = ConfigHelper(config_path=ConfigHelperTest.VALID_CONFIG_FULL)
+        self.assertEquals([], self.config_helper.publish_targets)
+
     def test_with_proxy_server_name(self):
         self.config_helper = ConfigHelper(config_path=ConfigHelperTest.VALID_CONFIG_WITH_PROXY_SERVER_NAME)
         self.assertEquals(self.VALID_PROXY_SERVER_NAME, self.config_helper.proxy_server_name)
@@ -0,0 +1,84 @@
+import unittest
+
+from mock import MagicMock, patch
+from cloudwatch.modules.client.congestion import AIMDController
+from cloudwatch.modules.client.transport import ConnectionException, HTTPStatusException, Response
+
+
+class AIMDControllerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.time = 1000.0
+        self.patcher = patch("cloudwatch.modules.client.congestion.clock.monotonic", side_effect=lambda: self.time)
+        self.patcher.start()
+        self.controller = AIMDController(min_concurrency=1, max_concurrency=8, min_rate=2, max_rate=40)
+        self.controller._LOGGER = MagicMock()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def _get_status_exception(self, status_code, content=b""):
+        response = Response(status_code, "reason", {}, content)
+        return HTTPStatusException(str(status_code), response)
+
+    def test_controller_starts_at_upper_bounds(self):
+        self.assertEquals(8, self.controller.get_concurrency_limit())
+        self.assertEquals(40, self.controller.rate)
+
+    def test_congestion_cuts_limits_multiplicatively(self):
+        self.controller.on_congestion()
+        self.assertEquals(4, self.controller.get_concurrency_limit())
+        self.assertEquals(20, self.controller.rate)
+        self.assertEquals(1, self.controller.congestion_event_count)
+
+    def test_congestion_is_counted_once_per_decrease_interval(self):
+        self.controller.on_congestion()
+        self.controller.on_congestion()
+        self.assertEquals(4, self.controller.get_concurrency_limit())
+        self.time += AIMDController._DECREASE_INTERVAL_IN_SECONDS
+        self.controller.on_congestion()
+        self.assertEquals(2, self.controller.get_concurrency_limit())
+        self.assertEquals(2, self.controller.congestion_event_count)
+
+    def test_limits_do_not_drop_below_lower_bounds(self):
+        for _ in range(10):
+            self.controller.on_congestion()
+            self.time += AIMDController._DECREASE_INTERVAL_IN_SECONDS
+        self.assertEquals(1, self.controller.get_concurrency_limit())
+        self.assertEquals(2, self.controller.rate)
+
+    def test_success_increases_limits_additively_up_to_upper_bounds(self):
+        self.controller.on_congestion()
+        for _ in range(4):
+            self.controller.on_success()
+        self.assertEquals(4, self.controller.get_concurrency_limit())
+        self.assertTrue(20 < self.controller.rate < 22)
+        for _ in range(1000):
+            self.controller.on_success()
+        self.assertEquals(8, self.controller.get_concurrency_limit())
+        self.assertEquals(40, self.controller.rate)
+
+    def test_reserve_paces_requests_after_burst_of_window(self):
+        self.time += 10
+        delays = [self.controller.reserve() for _ in range(10)]
+        self.assertEquals([0] * 8, delays[:8])
+        self.assertAlmostEquals(1.0 / 40, delays[8])
+        self.assertAlmostEquals(2.0 / 40, delays[9])
+
+    def test_throttling_and_server_errors_are_congestion_signals(self):
+        self.assertTrue(AIMDController.is_congestion_signal(self._get_status_exception(400, b"<Error><Code>Throttling</Code></Error>")))
+        self.assertTrue(AIMDController.is_congestion_signal(self._get_status_exception(429)))
+        self.assertTrue(AIMDController.is_congestion_signal(self._get_status_exception(503)))
+        self.assertFalse(AIMDController.is_congestion_signal(self._get_status_exception(400, b"<Error><Code>InvalidParameterValue</Code></Error>")))
+        self.assertFalse(AIMDController.is_congestion_signal(self._get_status_exception(403)))
+        self.assertFalse(AIMDController.is_congestion_signal(ConnectionException("timeout")))
+
+    def test_only_congestion_failures_cut_limits(self):
+        self.assertFalse(self.controller.on_failure(self._get_status_exception(403)))
+        self.assertEquals(8, self.controller.get_concurrency_limit())
+        self.assertTrue(self.controller.on_failure(self._get_status_exception(500)))
+        self.assertEquals(4, self.controller.get_concurrency_limit())
+
+    def test_state_reports_window_and_rate(self):
+        self.controller.on_congestion()
+        self.assertEquals({"window": 4.0, "concurrency_limit": 4, "rate": 20.0, "congestion_events": 1}, self.controller.get_state())
@@ -1,5 +1,4 @@
 import unittest
-import requests
 import time
 
 from mock import Mock, MagicMock
@@ -8,6 +7,7 @@ from cloudwatch.modules.plugininfo import PLUGIN_NAME, PLUGIN_VERSION
 from helpers.fake_http_server import FakeServer
 from cloudwatch.modules.awscredentials import AWSCredentials
 from cloudwatch.modules.metricdata import MetricDataStatistic
+from cloudwatch.modules.client.transport import ConnectionException
 
 
 class EC2GetClientTest(unittest.TestCase):
@@ -59,7 +59,7 @@ class EC2GetClientTest(unittest.TestCase):
         
     def test_get_request_timeout(self):
         self.server.set_timeout_delay(EC2GetClient._DEFAULT_RESPONSE_TIMEOUT * (EC2GetClient._TOTAL_RETRIES + 1))
-        with self.assertRaises(requests.ConnectionError):
+        with self.assertRaises(ConnectionException):
             self.client._run_request("request")
         self.server_restart()
         
@@ -0,0 +1,77 @@
+import json
+import unittest
+
+from cloudwatch.modules.client.emfbuilder import EMFBuilder
+from cloudwatch.modules.metricdata import MetricDataStatistic
+
+
+class EMFBuilderTest(unittest.TestCase):
+
+    TIMESTAMP = "20171204T120000Z"
+    EPOCH_MILLISECONDS = 1512388800000
+
+    def setUp(self):
+        self.builder = EMFBuilder()
+
+    def _get_metric(self, name, dimensions=None, timestamp=TIMESTAMP, storage_resolution=None, value=20):
+        metric = MetricDataStatistic(name, dimensions=dimensions or {"Host": "host", "PluginInstance": "0"}, timestamp=timestamp,
+                                     storage_resolution=storage_resolution)
+        metric.add_value(value)
+        return metric
+
+    def _build(self, metric_list, namespace=MetricDataStatistic.NAMESPACE):
+        return [json.loads(document) for document in self.builder.build_documents(namespace, metric_list)]
+
+    def test_document_contains_metadata_dimensions_and_values(self):
+        metric = self._get_metric("cpu.percent.active")
+        metric.add_value(10)
+        document = self._build([metric])[0]
+        self.assertEquals(self.EPOCH_MILLISECONDS, document["_aws"]["Timestamp"])
+        self.assertEquals([{"Namespace": "collectd", "Dimensions": [["Host", "PluginInstance"]], "Metrics": [{"Name": "cpu.percent.active"}]}],
+                          document["_aws"]["CloudWatchMetrics"])
+        self.assertEquals("host", document["Host"])
+        self.assertEquals("0", document["PluginInstance"])
+        self.assertEquals([10, 20], document["cpu.percent.active"])
+
+    def test_single_value_is_published_as_number(self):
+        self.assertEquals(20, self._build([self._get_metric("metric")])[0]["metric"])
+
+    def test_values_have_statistics_of_aggregated_values(self):
+        metric = self._get_metric("metric", value=5)
+        for value in (1, 2, 10):
+            metric.add_value(value)
+        values = self._build([metric])[0]["metric"]
+        self.assertEquals([1, 10, 3.5, 3.5], values)
+        self.assertEquals((1, 10, 18, 4), (min(values), max(values), sum(values), len(values)))
+
+    def test_values_of_more_than_100_samples_keep_min_max_and_average(self):
+        metric = self._get_metric("metric", value=0)
+        for value in range(1, 200):
+            metric.add_value(value)
+        values = self._build([metric])[0]["metric"]
+        self.assertEquals(100, len(values))
+        self.assertEquals((0, 199), (min(values), max(values)))
+        self.assertAlmostEquals(99.5, sum(values) / len(values))
+
+    def test_documents_are_single_lines(self):
+        for document in self.builder.build_documents(MetricDataStatistic.NAMESPACE, [self._get_metric("metric")]):
+            self.assertFalse("\n" in document)
+
+    def test_metrics_with_same_dimensions_share_document(self):
+        documents = self._build([self._get_metric("metric1"), self._get_metric("metric2"), self._get_metric("metric3", {"Host": "other"})])
+        self.assertEquals(2, len(documents))
+        self.assertEquals(["metric1", "metric2"], [metric["Name"] for metric in documents[0]["_aws"]["CloudWatchMetrics"][0]["Metrics"]])
+        self.assertEquals([["Host"]], documents[1]["_aws"]["CloudWatchMetrics"][0]["Dimensions"])
+
+    def test_metrics_with_different_timestamps_use_separate_documents(self):
+        documents = self._build([self._get_metric("metric"), self._get_metric("metric", timestamp="20171204T120100Z")])
+        self.assertEquals([self.EPOCH_MILLISECONDS, self.EPOCH_MILLISECONDS + 60000], [document["_aws"]["Timestamp"] for document in documents])
+
+    def test_high_resolution_metrics_declare_storage_resolution(self):
+        documents = self._build([self._get_metric("metric", storage_resolution=1), self._get_metric("metric", storage_resolution=60)])
+        self.assertEquals({"Name": "metric", "StorageResolution": 1}, documents[0]["_aws"]["CloudWatchMetrics"][0]["Metrics"][0])
+        self.assertEquals({"Name": "metric"}, documents[1]["_aws"]["CloudWatchMetrics"][0]["Metrics"][0])
+
+    def test_metric_without_value_raises_exception(self):
+        with self.assertRaises(ValueError):
+            self.builder.build_documents(MetricDataStatistic.NAMESPACE, [MetricDataStatistic("metric", timestamp=self.TIMESTAMP)])
@@ -0,0 +1,181 @@
+import json
+import os
+import socket
+import threading
+import time
+import unittest
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from mock import MagicMock
+from cloudwatch.modules.client.emfclient import EMFClient
+from cloudwatch.modules.metricdata import MetricDataStatistic
+
+
+class LineRecordingServer(object):
+    """ TCP server recording the lines received on every connection """
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(5)
+        self.connections = []
+        self.lines = []
+        self.received = threading.Condition()
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def get_url(self):
+        return "tcp://127.0.0.1:" + str(self.sock.getsockname()[1])
+
+    def wait_for_lines(self, count, timeout=5):
+        deadline = time.time() + timeout
+        with self.received:
+            while len(self.lines) < count and time.time() < deadline:
+                self.received.wait(deadline - time.time())
+            return list(self.lines)
+
+    def wait_for_connections(self, count, timeout=5):
+        deadline = time.time() + timeout
+        while len(self.connections) < count and time.time() < deadline:
+            time.sleep(0.01)
+
+    def close_connections(self):
+        for connection in self.connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except (socket.error, OSError):
+                pass
+            connection.close()
+
+    def close(self):
+        self.close_connections()
+        try:
+            # wakes up the accept call, a socket closed while another thread accepts on it keeps listening
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except (socket.error, OSError):
+            pass
+        self.sock.close()
+
+    def _accept(self):
+        while True:
+            try:
+                connection, _ = self.sock.accept()
+            except (socket.error, OSError):
+                return
+            self.connections.append(connection)
+            thread = threading.Thread(target=self._read, args=(connection,))
+            thread.daemon = True
+            thread.start()
+
+    def _read(self, connection):
+        stream = connection.makefile("rb")
+        try:
+            for line in stream:
+                with self.received:
+                    self.lines.append(json.loads(line.decode("utf-8")))
+                    self.received.notify_all()
+        except (socket.error, OSError, ValueError):
+            pass
+
+
+class EMFClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.config_helper = MagicMock()
+        self.config_helper.enable_high_resolution_metrics = False
+        self.server = LineRecordingServer()
+        self.config_helper.emf_endpoint = self.server.get_url()
+        self.client = EMFClient(self.config_helper)
+        self.client._LOGGER = MagicMock()
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+
+    def _get_metric_list(self, count=1):
+        return [MetricDataStatistic("metric_" + str(index), statistic_values=MetricDataStatistic.Statistics(20)) for index in range(count)]
+
+    def test_parse_endpoint(self):
+        self.assertEquals(("tcp", ("127.0.0.1", 25888)), EMFClient.parse_endpoint("tcp://127.0.0.1:25888"))
+        self.assertEquals(("udp", ("localhost", 25888)), EMFClient.parse_endpoint("udp://localhost:25888"))
+        self.assertEquals(("file", "/var/log/collectd/emf.log"), EMFClient.parse_endpoint("file:///var/log/collectd/emf.log"))
+
+    def test_parse_invalid_endpoint_raises_exception(self):
+        for endpoint in ["", "tcp://127.0.0.1", "http://127.0.0.1:25888", "file://host/path", "udp://127.0.0.1:port"]:
+            with self.assertRaises(EMFClient.InvalidEndpointException):
+                EMFClient.parse_endpoint(endpoint)
+
+    def test_put_metric_data_over_tcp(self):
+        self.assertTrue(self.client.put_metric_data(MetricDataStatistic.NAMESPACE, self._get_metric_list(2)))
+        lines = self.server.wait_for_lines(1)
+        self.assertEquals(1, len(lines))
+        self.assertEquals(["metric_0", "metric_1"], [metric["Name"] for metric in lines[0]["_aws"]["CloudWatchMetrics"][0]["Metrics"]])
+
+    def test_connection_is_reused(self):
+        for _ in range(3):
+            self.assertTrue(self.client.put_metric_data(MetricDataStatistic.NAMESPACE, self._get_metric_list()))
+        self.assertEquals(3, len(self.server.wait_for_lines(3)))
+        self.assertEquals(1, len(self.server.connections))
+
+    def test_connection_closed_by_agent_is_replaced(self):
+        self.assertTrue(self.client.prewarm())
+        self.server.wait_for_connections(1)
+        self.server.close_connections()
+        time.sleep(0.1)
+        self.assertTrue(self.client.put_metric_data(MetricDataStatistic.NAMESPACE, self._get_metric_list()))
+        self.assertEquals(1, len(self.server.wait_for_lines(1)))
+        self.assertEquals(2, len(self.server.connections))
+
+    def test_only_documents_not_sent_are_sent_over_new_connection(self):
+        open_socket = self.client._open_socket
+        failing_socket = MagicMock()
+        failing_socket.sendall.side_effect = [None, socket.error("Connection reset by peer")]
+        self.client._open_socket = MagicMock(side_effect=[failing_socket, open_socket()])
+        metric_list = [MetricDataStatistic("metric", statistic_values=MetricDataStatistic.Statistics(value)) for value in [1, 2, 3]]
+        self.assertTrue(self.client.put_metric_data(MetricDataStatistic.NAMESPACE, metric_list))
+        self.assertEquals(2, failing_socket.sendall.call_count)
+        self.assertEquals([2, 3], [line["metric"] for line in self.server.wait_for_lines(2)])
+
+    def test_unreachable_agent_is_reported(self):
+        self.server.close()
+        self.assertFalse(self.client.put_metric_data(MetricDataStatistic.NAMESPACE, self._get_metric_list()))
+        self.assertTrue(self.client._LOGGER.warning.called)
+        self.assertFalse(self.client.prewarm())
+
+    def test_put_metric_data_over_udp(self):
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.bind(("127.0.0.1", 0))
+        receiver.settimeout(5)
+        try:
+            self.config_helper.emf_endpoint = "udp://127.0.0.1:" + str(receiver.getsockname()[1])
+            client = EMFClient(self.config_helper)
+            metric_list = self._get_metric_list()
+            metric_list[0].dimensions = {"Host": "other"}
+            self.assertTrue(client.put_metric_data(MetricDataStatistic.NAMESPACE, metric_list + self._get_metric_list()))
+            documents = [json.loads(receiver.recv(65535).decode("utf-8")) for _ in range(2)]
+            self.assertEquals(["other", None], [document.get("Host") for document in documents])
+            client.close()
+        finally:
+            receiver.close()
+
+    def test_put_metric_data_to_file(self):
+        directory = mkdtemp()
+        try:
+            path = os.path.join(directory, "emf.log")
+            self.config_helper.emf_endpoint = "file://" + path
+            client = EMFClient(self.config_helper)
+            self.assertTrue(client.prewarm())
+            self.assertTrue(client.put_metric_data(MetricDataStatistic.NAMESPACE, self._get_metric_list()))
+            self.assertTrue(client.put_metric_data(MetricDataStatistic.NAMESPACE, self._get_metric_list()))
+            with open(path) as emf_file:
+                lines = emf_file.read().splitlines()
+            self.assertEquals(2, len(lines))
+            self.assertEquals(20, json.loads(lines[0])["metric_0"])
+        finally:
+            rmtree(directory)
+
+    def test_inconsistent_namespace_raises_exception(self):
+        with self.assertRaises(ValueError):
+            self.client.put_metric_data("other_namespace", self._get_metric_list())
@@ -1,5 +1,9 @@
 import unittest
 import os
+import threading
+
+from shutil import rmtree
+from tempfile import mkdtemp
 
 from time import time, sleep
 
@@ -7,9 +11,24 @@ from cloudwatch.modules.collectd_integration.dataset import CollectdDatasetResol
 from helpers.fake_http_server import FakeServer
 from mock import patch, MagicMock, Mock
 from cloudwatch.modules.configuration.confighelper import ConfigHelper
-from cloudwatch.modules.flusher import Flusher
-from cloudwatch.modules.metricdata import MetricDataBuilder
+from cloudwatch.modules.flusher import Flusher, AggregationShard, ValueRecord
+from cloudwatch.modules.client.putclient import PutClient
+from cloudwatch.modules.client.emfclient import EMFClient
+from cloudwatch.modules.client.jsonlinesclient import JSONLinesClient
+from cloudwatch.modules.client.congestion import AIMDController
+from cloudwatch.modules.client.transport import Response
+from cloudwatch.modules.configuration.targets import PublishTarget
+from cloudwatch.modules.sinks import Sink, SinkFanout
+from cloudwatch.modules.quarantine import MetricQuarantine
+from cloudwatch.modules.metricdata import MetricDataBuilder, MetricDataStatistic
 from cloudwatch.modules.configuration.whitelist import Whitelist
+from cloudwatch.modules.configuration.rollup import Rollups, RollupRule
+from cloudwatch.modules.seriesbudget import SeriesBudget
+from cloudwatch.modules.changesuppressor import ChangeSuppressor
+from cloudwatch.modules.snapshot import AggregationSnapshot
+from cloudwatch.modules import awsutils
+from cloudwatch.modules import clock
+from cloudwatch.modules.clock import monotonic
 
 
 _DS_data = {
@@ -48,6 +67,7 @@ class FlusherTest(unittest.TestCase):
         self.config_helper.endpoint = self.server.get_url()
         self.config_helper.enable_high_resolution_metrics = False
         self.config_helper.whitelist = Mock(spec=Whitelist)
+        self.config_helper.whitelist.get_metric_options.return_value = {}
         self.dataset_resolver = Mock(spec=CollectdDatasetResolver)
         self.dataset_resolver.get_dataset_names = Mock(side_effect=_get_mocked_ds)
         self.flusher = Flusher(config_helper=self.config_helper, dataset_resolver=self.dataset_resolver)
@@ -55,6 +75,10 @@ class FlusherTest(unittest.TestCase):
         self.client.put_metric_data = Mock()
         self.flusher.client = self.client
 
+    def tearDown(self):
+        # close connections opened ahead of flushes, the fake server handles one connection at a time
+        self.flusher.client.transport.close()
+
     def test_is_numerical_value(self):
         self.assertFalse(self.flusher.is_numerical_value(float('nan')))
         self.assertTrue(self.flusher.is_numerical_value(2))
@@ -67,6 +91,8 @@ class FlusherTest(unittest.TestCase):
         self.assertTrue(self.flusher.is_numerical_value(".211"))
         self.assertFalse(self.flusher.is_numerical_value("@.211"))
         self.assertFalse(self.flusher.is_numerical_value("2.("))
+        self.assertFalse(self.flusher.is_numerical_value(float('inf')))
+        self.assertFalse(self.flusher.is_numerical_value(-1e200))
 
     def test_numerical_value(self):
         key = self.add_value_list("plugin", "plugin_instance_0", "type", "type_instance", "host", [float('nan')])
@@ -112,9 +138,9 @@ class FlusherTest(unittest.TestCase):
 
     def test_is_flush_time(self):
         self.flusher.flush_interval_in_seconds = 10
-        self.assertFalse(self.flusher._is_flush_time(time()))
+        self.assertFalse(self.flusher._is_flush_time(monotonic()))
         self.flusher.flush_interval_in_seconds = 0.5
-        self.assertTrue(self.flusher._is_flush_time(time() + 1))
+        self.assertTrue(self.flusher._is_flush_time(monotonic() + 1))
 
     def test_get_metric_key_is_unique(self):
         vl1 = self._get_vl_mock("plugin", "plugin_instance", "type", "type_instance", "host", [10], 101.1)
@@ -154,6 +180,38 @@ class FlusherTest(unittest.TestCase):
         self.config_helper.whitelist.is_whitelisted.assert_called_with(key)
         self.assertFalse(key in self.flusher.metric_map)
 
+    def test_blocked_value_lists_are_rejected_from_cache_before_expansion(self):
+        self.config_helper.whitelist.is_whitelisted.return_value = False
+        self.flusher._expand_value_list = Mock(wraps=self.flusher._expand_value_list)
+        for value in range(3):
+            self.flusher.add_metric(self._get_vl_mock("plugin", "", "multivalue_type", "", "host", [value, value], 0))
+        self.assertEquals(2, self.config_helper.whitelist.is_whitelisted.call_count)
+        self.assertEquals(1, self.flusher._expand_value_list.call_count)
+        self.assertFalse(self.flusher.metric_map)
+
+    def test_only_allowed_data_sources_of_value_list_are_aggregated(self):
+        self.config_helper.whitelist.is_whitelisted.side_effect = lambda metric_key: metric_key.endswith("name2")
+        for value in range(3):
+            self.flusher.add_metric(self._get_vl_mock("plugin", "", "multivalue_type", "instance", "host", [value, value * 10], 0))
+        self.assertEquals(["plugin--multivalue_type-instance.name2"], list(self.flusher.metric_map.keys()))
+        self._assert_statistics(self.flusher.metric_map["plugin--multivalue_type-instance.name2"][0], min=0, max=20, sum=30, sample_count=3)
+        self.assertEquals(2, self.config_helper.whitelist.is_whitelisted.call_count)
+
+    def test_caches_over_memory_budget_are_evicted_on_flush(self):
+        self.flusher.memory_governor.budget_in_bytes = 1
+        self.config_helper.rollups.rules = [RollupRule("memory-.*", [RollupRule.PLUGIN_INSTANCE])]
+        self.flusher.add_metric(self._get_vl_mock("cpu", "0", "cpu", "user", "host", ["nan"], 0))
+        usage = self.flusher.get_cache_memory_usage()
+        self.assertTrue(usage["whitelist_decisions"] > 0 and usage["rollup_rules"] > 0)
+        self.flusher._flush()
+        self.flusher._flush()
+        usage = self.flusher.get_cache_memory_usage()
+        self.assertEquals((0, 0, 0), (usage["whitelist_decisions"], usage["rollup_rules"], usage["nan_keys"]))
+        self.assertEquals(0, len(self.flusher.series_registry))
+        self.flusher.add_metric(self._get_vl_mock("cpu", "0", "cpu", "user", "host", [10], 0))
+        self.assertEquals(["cpu-0-cpu-user"], list(self.flusher.metric_map.keys()))
+        self.assertEquals(2, self.config_helper.whitelist.is_whitelisted.call_count)
+
     def test_aggregate_metric_adds_new_metrics_to_map(self):
         vl = self._get_vl_mock("plugin", "plugin_instance", "type", "type_instance", "host", [10], 0)
         key = self.flusher._get_metric_key(vl)
@@ -203,9 +261,9 @@ class FlusherTest(unittest.TestCase):
         vl = self._get_vl_mock("plugin", "plugin_instance", "type", "type_instance", "host", [10], 0)
         self.flusher._aggregate_metric(vl)
         self.flusher.flush_interval_in_seconds = 10
-        self.flusher._flush_if_need(time())
+        self.flusher._flush_if_need(monotonic())
         self.assertFalse(self.client.put_metric_data.called)
-        self.flusher._flush_if_need(time() + 10)
+        self.flusher._flush_if_need(monotonic() + 10)
         self.assertTrue(self.client.put_metric_data.called)
 
     @patch('cloudwatch.modules.flusher.PutClient')
@@ -216,11 +274,11 @@ class FlusherTest(unittest.TestCase):
         self.flusher.max_metrics_to_aggregate = 10
         vl = self._get_vl_mock("plugin", "plugin_instance", "type", "type_instance", "host", [10], 0)
         self.flusher._aggregate_metric(vl)
-        self.flusher._flush_if_need(time())
+        self.flusher._flush_if_need(monotonic())
         self.assertFalse(self.client.put_metric_data.called)
-        self.flusher._flush_if_need(time() + 10)
+        self.flusher._flush_if_need(monotonic() + 10)
         self.assertFalse(self.client.put_metric_data.called)
-        self.flusher._flush_if_need(time() + 11)
+        self.flusher._flush_if_need(monotonic() + 11)
         self.assertTrue(self.client.put_metric_data.called)
         self.assertEquals(1, self.client.put_metric_data.call_count)
         self.flusher.max_metrics_to_aggregate = 20
@@ -228,10 +286,629 @@ class FlusherTest(unittest.TestCase):
             self.flusher._aggregate_metric(self._get_vl_mock("plugin" + str(i), "plugin_instance", "type", "type_instance", "host", [i], 0))
         self.assertEquals(2, self.client.put_metric_data.call_count)
 
+    def test_metrics_with_rule_options_are_aggregated_in_separate_schedule(self):
+        self.config_helper.whitelist.get_metric_options.side_effect = lambda key: {"storage_resolution": 1, "flush_interval_in_seconds": 10} if key.startswith("cpu") else {}
+        cpu_vl = self._get_vl_mock("cpu", "0", "cpu", "user", "host", [10], 20.1)
+        memory_vl = self._get_vl_mock("memory", "", "memory", "used", "host", [10], 20.1)
+        self.flusher.add_metric(cpu_vl)
+        self.flusher.add_metric(memory_vl)
+        self.assertEquals(2, len(self.flusher.schedules))
+        schedule = self.flusher.schedules[(1, 10)]
+        self.assertTrue(schedule.enable_high_resolution_metrics)
+        self.assertTrue(self.flusher._get_metric_key(cpu_vl) + "-20" in schedule.metric_map)
+        self.assertEquals(1, schedule.metric_map[self.flusher._get_metric_key(cpu_vl) + "-20"][0].storage_resolution)
+        self.assertTrue(self.flusher._get_metric_key(memory_vl) in self.flusher.metric_map)
+        self.assertEquals(60, self.flusher.metric_map[self.flusher._get_metric_key(memory_vl)][0].storage_resolution)
+
+    def test_connection_is_prewarmed_once_ahead_of_flush(self):
+        self.flusher.last_flush_time = monotonic() - 50
+        self.flusher._flush_if_need(monotonic())
+        self.assertFalse(self.client.prewarm.called)
+        self.flusher.last_flush_time = monotonic() - 56
+        self.flusher._flush_if_need(monotonic())
+        self.flusher._flush_if_need(monotonic())
+        self.assertEquals(1, self.client.prewarm.call_count)
+        self.assertFalse(self.client.put_metric_data.called)
+
+    @patch("cloudwatch.modules.flusher.time")
+    def test_wall_clock_step_does_not_trigger_flush(self, time_module):
+        time_module.time.return_value = time()
+        self.flusher.add_metric(self._get_vl_mock("cpu", "0", "cpu", "user", "host", [10], 0))
+        time_module.time.return_value = time() + 3600
+        self.flusher.add_metric(self._get_vl_mock("cpu", "0", "cpu", "user", "host", [20], 0))
+        time_module.time.return_value = time() - 3600
+        self.flusher.add_metric(self._get_vl_mock("cpu", "0", "cpu", "user", "host", [30], 0))
+        self.assertFalse(self.client.put_metric_data.called)
+        self.assertEquals(3, self.flusher.metric_map["cpu-0-cpu-user"][0].statistics.sample_count)
+
+    @patch.object(clock, "time")
+    def test_flushes_are_aligned_to_wall_clock_boundaries(self, time_module):
+        schedule = self.flusher.default_schedule
+        self.assertEquals(schedule.last_flush_time + 59, self.flusher._get_next_flush_time(schedule))
+        time_module.time.return_value = 1259.5
+        self.flusher._flush(schedule)
+        self.assertEquals(schedule.last_flush_time + 59.5, self.flusher._get_next_flush_time(schedule))
+        time_module.time.return_value = 1230
+        self.flusher._flush(schedule)
+        self.assertEquals(schedule.last_flush_time + 89, self.flusher._get_next_flush_time(schedule))
+        self.flusher.flush_interval_in_seconds = 10
+        self.flusher.enable_high_resolution_metrics = True
+        time_module.time.return_value = 1211.2
+        self.flusher._flush(schedule)
+        self.assertAlmostEquals(schedule.last_flush_time + 9.8, self.flusher._get_next_flush_time(schedule))
+
+    def test_schedules_are_flushed_independently(self):
+        self.config_helper.whitelist.get_metric_options.side_effect = lambda key: {"flush_interval_in_seconds": 10} if key.startswith("cpu") else {}
+        self.flusher.add_metric(self._get_vl_mock("cpu", "0", "cpu", "user", "host", [10], 0))
+        self.flusher.add_metric(self._get_vl_mock("memory", "", "memory", "used", "host", [10], 0))
+        schedule = self.flusher.schedules[(60, 10)]
+        self.flusher._flush_if_need(monotonic() + 10)
+        self.assertEquals(1, self.client.put_metric_data.call_count)
+        self.assertFalse(schedule.metric_map)
+        self.assertEquals(1, len(self.flusher.metric_map))
+        self.flusher._flush_if_need(monotonic() + 60)
+        self.assertEquals(2, self.client.put_metric_data.call_count)
+        self.assertFalse(self.flusher.metric_map)
+
+    def test_rollup_merges_series_and_keeps_source_series(self):
+        self.config_helper.rollups = Rollups([RollupRule("cpu-.*-cpu-user", [RollupRule.PLUGIN_INSTANCE])])
+        for core, value in enumerate([10, 20, 30]):
+            self.flusher.add_metric(self._get_vl_mock("cpu", str(core), "cpu", "user", "host", [value], 0))
+        self.assertEquals(4, len(self.flusher.metric_map))
+        rollup_metric = self.flusher.metric_map["cpu-ALL-cpu-user"][0]
+        self._assert_statistics(rollup_metric, min=10, max=30, sum=60, sample_count=3)
+        self.assertEquals("cpu.cpu.user", rollup_metric.metric_name)
+        self.assertEquals("ALL", rollup_metric.dimensions["PluginInstance"])
+        self._assert_statistics(self.flusher.metric_map["cpu-1-cpu-user"][0], min=20, max=20, sum=20, sample_count=1)
+
+    def test_rollup_with_drop_source_publishes_only_rollup_series(self):
+        self.config_helper.rollups = Rollups([RollupRule("cpu-.*-cpu-user", [RollupRule.PLUGIN_INSTANCE], drop_source=True)])
+        for core, value in enumerate([10, 20, 30]):
+            self.flusher.add_metric(self._get_vl_mock("cpu", str(core), "cpu", "user", "host", [value], 0))
+        self.flusher.add_metric(self._get_vl_mock("cpu", "0", "cpu", "system", "host", [5], 0))
+        self.assertEquals(["cpu-0-cpu-system", "cpu-ALL-cpu-user"], sorted(self.flusher.metric_map.keys()))
+        self._assert_statistics(self.flusher.metric_map["cpu-ALL-cpu-user"][0], min=10, max=30, sum=60, sample_count=3)
+
+    def test_series_over_plugin_budget_are_folded_into_other_series(self):
+        self.flusher.default_schedule.series_budget = SeriesBudget(default_budget=0, plugin_budgets={"processes": 3})
+        for pid, value in enumerate([50, 40, 30, 1, 2]):
+            self.flusher.add_metric(self._get_vl_mock("processes", str(pid), "ps_rss", "", "host", [value], 0))
+        self.flusher.add_metric(self._get_vl_mock("memory", "", "memory", "used", "host", [1], 0))
+        keys = sorted(self.flusher.metric_map.keys())
+        self.assertEquals(["memory--memory-used", "processes-0-ps_rss-", "processes-1-ps_rss-",
+                           "processes-4-ps_rss-", "processes-OTHER-ps_rss-OTHER"], keys)
+        self._assert_statistics(self.flusher.metric_map["processes-OTHER-ps_rss-OTHER"][0], min=1, max=30, sum=31, sample_count=2)
+        self.assertEquals("processes.ps_rss.OTHER", self.flusher.metric_map["processes-OTHER-ps_rss-OTHER"][0].metric_name)
+        self.assertEquals({"processes": 3}, self.flusher.get_series_budget_usage())
+        self.assertEquals({"processes": 2}, self.flusher.default_schedule.series_budget.folded_series_count)
+
+    def test_statistics_slots_are_released_and_published_on_flush(self):
+        for core, value in enumerate([10, 20, 30]):
+            self.flusher.add_metric(self._get_vl_mock("cpu", str(core), "cpu", "user", "host", [value], 0))
+        self.flusher.add_metric(self._get_vl_mock("cpu", "0", "cpu", "user", "host", [float('nan')], 0))
+        self.assertEquals(3, len(self.flusher.default_schedule.get_shard().statistics_columns))
+        self.flusher._flush()
+        self.assertEquals(0, len(self.flusher.default_schedule.get_shard().statistics_columns))
+        metrics = self.client.put_metric_data.call_args[0][1]
+        self.assertEquals([10, 20, 30], sorted(metric.statistics.sum for metric in metrics))
+        self.flusher.add_metric(self._get_vl_mock("cpu", "0", "cpu", "user", "host", [5], 0))
+        self.assertEquals(3, len(self.flusher.default_schedule.get_shard().statistics_columns.count))
+
+    def test_invalid_metrics_are_not_published(self):
+        self._use_snapshot_directory()
+        quarantine_path = os.path.join(os.path.dirname(self.config_helper.snapshot_path), "quarantined_metrics")
+        self.flusher.metric_quarantine = MetricQuarantine(quarantine_path)
+        self.flusher.metric_quarantine._LOGGER = MagicMock()
+        for plugin_instance in ["0", "1", "2" * 1025]:
+            self.flusher.add_metric(self._get_vl_mock("cpu", plugin_instance, "cpu", "user", "host", [10], 0))
+        self.flusher._flush()
+        metrics = self.client.put_metric_data.call_args[0][1]
+        self.assertEquals([{"Host": "valid_host", "PluginInstance": "0"}, {"Host": "valid_host", "PluginInstance": "1"}],
+                          sorted([metric.dimensions for metric in metrics], key=lambda dimensions: dimensions["PluginInstance"]))
+        self.assertEquals(1, len(self.flusher.metric_quarantine._reported_series))
+        self.assertTrue(os.path.exists(quarantine_path))
+
+    def test_sibling_metrics_share_statistics_and_are_expanded_on_flush(self):
+        self.config_helper.push_asg = True
+        self.config_helper.push_constant = True
+        self.config_helper.constant_dimension_value = "constant"
+        self.flusher.add_metric(self._get_vl_mock("cpu", "0", "cpu", "user", "host", [10], 0))
+        self.flusher.add_metric(self._get_vl_mock("cpu", "0", "cpu", "user", "host", [float('nan')], 0))
+        self.flusher.add_metric(self._get_vl_mock("cpu", "0", "cpu", "user", "host", [20], 0))
+        self.assertEquals(1, len(self.flusher.metric_map["cpu-0-cpu-user"]))
+        self.assertEquals(1, len(self.flusher.default_schedule.get_shard().statistics_columns))
+        self.flusher._flush()
+        metrics = self.client.put_metric_data.call_args[0][1]
+        self.assertEquals(3, len(metrics))
+        self.assertTrue("AutoScalingGroup" in metrics[1].dimensions)
+        self.assertTrue("FixedDimension" in metrics[2].dimensions)
+        for metric in metrics:
+            self._assert_statistics(metric, min=10, max=20, sum=30, sample_count=2)
+
+    def test_unchanged_series_are_suppressed_when_enabled(self):
+        self.flusher.default_schedule.change_suppressor = ChangeSuppressor(enabled=True, heartbeat_intervals=10)
+        for value in [50, 50, 51]:
+            self.flusher.add_metric(self._get_vl_mock("df", "root", "df_complex", "free", "host", [value], 0))
+            self.flusher.add_metric(self._get_vl_mock("memory", "", "memory", "used", "host", [10], 0))
+            self.flusher._flush()
+        published = [[metric.metric_name for metric in call[0][1]] for call in self.client.put_metric_data.call_args_list]
+        self.assertEquals([["df.df_complex.free", "memory.memory.used"], ["df.df_complex.free"]],
+                          [sorted(names) for names in published])
+        self.assertEquals(3, self.flusher.get_suppressed_series_count())
+
+    def test_unchanged_series_of_failed_put_is_published_with_next_flush(self):
+        self.flusher.default_schedule.change_suppressor = ChangeSuppressor(enabled=True, heartbeat_intervals=10)
+        self.client.put_metric_data.side_effect = [False, True, True]
+        for _ in range(3):
+            self.flusher.add_metric(self._get_vl_mock("memory", "", "memory", "used", "host", [10], 0))
+            self.flusher._flush()
+        self.assertEquals(2, self.client.put_metric_data.call_count)
+        self.assertEquals(1, self.flusher.get_suppressed_series_count())
+
+    def test_metrics_aggregated_by_write_threads_are_merged_on_flush(self):
+        def write_values(thread_index):
+            for value in range(1, 11):
+                self.flusher.add_metric(self._get_vl_mock("cpu", "0", "cpu", "user", "host", [value * thread_index], 0))
+            self.flusher.add_metric(self._get_vl_mock("cpu", str(thread_index), "cpu", "system", "host", [thread_index], 0))
+        threads = [threading.Thread(target=write_values, args=(thread_index,)) for thread_index in range(1, 5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(4, len(self.flusher.default_schedule.get_shards()))
+        self.assertFalse(self.flusher.metric_map)
+        self.flusher._flush()
+        metrics = dict((metric.metric_name + "-" + metric.dimensions["PluginInstance"], metric)
+                       for call in self.client.put_metric_data.call_args_list for metric in call[0][1])
+        self.assertEquals(5, len(metrics))
+        self._assert_statistics(metrics["cpu.cpu.user-0"], min=1, max=40, sum=550, sample_count=40)
+        self._assert_statistics(metrics["cpu.cpu.system-3"], min=3, max=3, sum=3, sample_count=1)
+        for shard in self.flusher.default_schedule.get_shards():
+            self.assertFalse(shard.metric_map)
+            self.assertEquals(0, len(shard.statistics_columns))
+
+    def test_series_budget_is_shared_by_write_threads(self):
+        self.flusher.default_schedule.series_budget = SeriesBudget(default_budget=0, plugin_budgets={"processes": 3})
+
+        def write_values(thread_index):
+            self.flusher.add_metric(self._get_vl_mock("processes", "shared", "ps_rss", "", "host", [100], 0))
+            self.flusher.add_metric(self._get_vl_mock("processes", str(thread_index), "ps_rss", "", "host", [thread_index], 0))
+        threads = [threading.Thread(target=write_values, args=(thread_index,)) for thread_index in range(1, 5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals({"processes": 8}, self.flusher.get_series_budget_usage())
+        self.flusher._flush()
+        metrics = dict((metric.dimensions["PluginInstance"], metric)
+                       for call in self.client.put_metric_data.call_args_list for metric in call[0][1])
+        self.assertEquals(["3", "4", "OTHER", "shared"], sorted(metrics.keys()))
+        self._assert_statistics(metrics["shared"], min=100, max=100, sum=400, sample_count=4)
+        self._assert_statistics(metrics["OTHER"], min=1, max=2, sum=3, sample_count=2)
+        self.assertEquals({"processes": 2}, self.flusher.default_schedule.series_budget.folded_series_count)
+
+    def test_shard_metric_map_is_taken_after_update_of_owning_thread(self):
+        shard_budget = SeriesBudget()
+        shard = AggregationShard(shard_budget)
+        update_started = threading.Event()
+
+        def update():
+            metric_map, series_budget = shard.begin_update()
+            update_started.set()
+            sleep(0.1)
+            metric_map["key"] = "value"
+            shard.end_update()
+        thread = threading.Thread(target=update)
+        thread.start()
+        update_started.wait()
+        self.assertEquals(({"key": "value"}, shard_budget), shard.take_metric_map())
+        self.assertEquals({}, shard.metric_map)
+        thread.join()
+
+    def test_shard_series_budget_is_replaced_with_metric_map(self):
+        shard = AggregationShard(SeriesBudget(default_budget=1))
+        metric_map, series_budget = shard.begin_update()
+        series_budget.admit("processes", "processes-0", [MetricDataStatistic("metric", statistic_values=MetricDataStatistic.Statistics(1))], Mock())
+        shard.end_update()
+        self.assertEquals((metric_map, series_budget), shard.take_metric_map())
+        new_metric_map, new_series_budget = shard.begin_update()
+        shard.end_update()
+        self.assertFalse(new_series_budget is series_budget)
+        self.assertEquals({"processes": 1}, series_budget.get_usage())
+        self.assertEquals({}, new_series_budget.get_usage())
+        self.assertEquals(1, new_series_budget.get_budget("processes"))
+
+    def test_add_metrics_aggregates_value_lists_and_tuples(self):
+        self.flusher.add_metrics([self._get_vl_mock("cpu", "0", "cpu", "user", "host", [10], 0),
+                                  ("host", "cpu", "0", "cpu", "user", 0, 10, {}, [20]),
+                                  ValueRecord("host", "cpu", "1", "cpu", "user", 0, 10, {}, [30]),
+                                  ("host", "plugin", "", "multivalue_type", "", 0, 10, {}, [1, 2])])
+        self.assertEquals(["cpu-0-cpu-user", "cpu-1-cpu-user", "plugin--multivalue_type-name1", "plugin--multivalue_type-name2"],
+                          sorted(self.flusher.metric_map.keys()))
+        self._assert_statistics(self.flusher.metric_map["cpu-0-cpu-user"][0], min=10, max=20, sum=30, sample_count=2)
+        self._assert_statistics(self.flusher.metric_map["plugin--multivalue_type-name2"][0], min=2, max=2, sum=2, sample_count=1)
+
+    def test_add_metrics_checks_flush_time_once_per_batch(self):
+        self.flusher._BULK_FLUSH_CHECK_INTERVAL = 2
+        self.flusher._flush_if_need = Mock()
+        self.flusher.add_metrics(ValueRecord("host", "cpu", str(core), "cpu", "user", 0, 10, {}, [core]) for core in range(5))
+        self.assertEquals(3, self.flusher._flush_if_need.call_count)
+        self.assertEquals(5, len(self.flusher.metric_map))
+
+    def test_flush_publishes_only_series_of_identifier(self):
+        self.flusher.add_metric(self._get_vl_mock("cpu", "0", "cpu", "user", "host", [10], 0))
+        self.flusher.add_metric(self._get_vl_mock("cpu", "1", "cpu", "user", "host", [20], 0))
+        self.flusher.add_metric(self._get_vl_mock("plugin", "", "multivalue_type", "", "host", [1, 2], 0))
+        self.flusher.flush(identifier="host/plugin/multivalue_type")
+        self.flusher.flush(identifier="host/cpu-0/cpu-user")
+        published = [sorted(metric.metric_name + "-" + metric.dimensions["PluginInstance"] for metric in call[0][1])
+                     for call in self.client.put_metric_data.call_args_list]
+        self.assertEquals([["plugin.multivalue_type.name1-NONE", "plugin.multivalue_type.name2-NONE"], ["cpu.cpu.user-0"]], published)
+        self.assertEquals(["cpu-1-cpu-user"], list(self.flusher.default_schedule.retained_metric_map.keys()))
+        self.flusher.add_metric(self._get_vl_mock("cpu", "1", "cpu", "user", "host", [30], 0))
+        self.flusher._flush()
+        metric = self.client.put_metric_data.call_args[0][1][0]
+        self._assert_statistics(metric, min=20, max=30, sum=50, sample_count=2)
+        self.assertEquals({}, self.flusher.default_schedule.retained_metric_map)
+
+    def test_flush_with_timeout_publishes_only_old_metrics(self):
+        self.flusher.add_metric(self._get_vl_mock("cpu", "0", "cpu", "user", "host", [10], 0))
+        self.flusher.flush(timeout=60)
+        self.assertFalse(self.client.put_metric_data.called)
+        self.flusher.flush(timeout=0)
+        self.assertEquals(1, self.client.put_metric_data.call_count)
+
+    def test_flush_matches_high_resolution_series_and_keeps_flush_interval(self):
+        self.flusher.enable_high_resolution_metrics = True
+        self.flusher.add_metric(self._get_vl_mock("cpu", "0", "cpu", "user", "host", [10], 1500000000))
+        self.flusher.add_metric(self._get_vl_mock("cpu", "0", "cpu", "user", "host", [20], 1500000001))
+        last_flush_time = self.flusher.last_flush_time
+        self.flusher.flush(identifier="host/cpu-0/cpu-user")
+        self.assertEquals(1, self.client.put_metric_data.call_count)
+        self.assertEquals(2, len(self.client.put_metric_data.call_args[0][1]))
+        self.assertEquals(last_flush_time, self.flusher.last_flush_time)
+
+    def test_flush_with_invalid_identifier_publishes_nothing(self):
+        self.flusher.add_metric(self._get_vl_mock("cpu", "0", "cpu", "user", "host", [10], 0))
+        self.flusher.flush(identifier="cpu-0")
+        self.assertFalse(self.client.put_metric_data.called)
+        self.assertEquals(1, len(self.flusher.default_schedule.retained_metric_map))
+
+    def test_shutdown_publishes_aggregated_metrics(self):
+        self._use_snapshot_directory()
+        for i in range(self.flusher._MAX_METRICS_PER_PUT_REQUEST + 1):
+            self.flusher.add_metric(self._get_vl_mock("plugin" + str(i), "0", "type", "", "host", [i], 0))
+        self.flusher.shutdown()
+        self.assertEquals(2, self.client.put_metric_data.call_count)
+        self.assertFalse(os.path.exists(self.config_helper.snapshot_path))
+
+    def test_shutdown_saves_metrics_unsent_after_deadline_or_failure(self):
+        self._use_snapshot_directory()
+        self.config_helper.shutdown_drain_timeout_in_seconds = 0
+        self.flusher.add_metric(self._get_vl_mock("cpu", "0", "cpu", "user", "host", [10], 0))
+        self.flusher.shutdown()
+        self.assertFalse(self.client.put_metric_data.called)
+        self.assertEquals(["cpu-0-cpu-user"], [key for key, _, _ in AggregationSnapshot(self.config_helper.snapshot_path).load()])
+        self.config_helper.shutdown_drain_timeout_in_seconds = 5
+        self.client.put_metric_data.return_value = False
+        self.flusher.add_metric(self._get_vl_mock("cpu", "1", "cpu", "user", "host", [20], 0))
+        self.flusher.shutdown()
+        self.assertEquals(1, self.client.put_metric_data.call_count)
+        self.assertEquals(["cpu-0-cpu-user", "cpu-1-cpu-user"], sorted(key for key, _, _ in AggregationSnapshot(self.config_helper.snapshot_path).load()))
+
+    def test_flush_before_shutdown_drains_metrics_to_snapshot(self):
+        self._use_snapshot_directory()
+        self.client.put_metric_data.return_value = False
+        self.flusher.add_metric(self._get_vl_mock("cpu", "0", "cpu", "user", "host", [10], 0))
+        self.flusher.flush(0)
+        self.assertTrue(0 < self.client.put_metric_data.call_args[1]["timeout"] <= self.config_helper.shutdown_drain_timeout_in_seconds)
+        self.flusher.shutdown()
+        self.assertEquals(1, self.client.put_metric_data.call_count)
+        self.assertEquals(["cpu-0-cpu-user"], [key for key, _, _ in AggregationSnapshot(self.config_helper.snapshot_path).load()])
+
+    def test_batches_queued_by_flush_pipeline_at_shutdown_are_saved_and_restored(self):
+        self._use_snapshot_directory()
+        self.flusher.flush_pipeline = self.client
+        metric = self._get_metric("cpu.cpu.user", 10, awsutils.get_aws_timestamp(time() - 600))
+        metric.dimensions = {"Host": "host", "PluginInstance": "0"}
+        metric.sibling_dimensions = [{"Host": "host"}]
+        self.client.close.return_value = [("collectd/cpu", list(metric.expand()), None)]
+        self.flusher.shutdown()
+        self.flusher.flush_pipeline = None
+        self.flusher.restore_snapshot()
+        self.flusher._flush()
+        namespace, metric_batch = self.client.put_metric_data.call_args[0]
+        self.assertEquals("collectd/cpu", namespace)
+        self.assertEquals([{"Host": "host"}, {"Host": "host", "PluginInstance": "0"}],
+                          sorted((restored.dimensions for restored in metric_batch), key=len))
+        for restored in metric_batch:
+            self.assertEquals(metric.timestamp, restored.timestamp)
+            self.assertEquals(10, restored.statistics.sum)
+
+    def test_batch_rejected_by_one_sink_is_restored_only_to_that_sink(self):
+        self._use_snapshot_directory()
+        failing_client, publishing_client = MagicMock(), MagicMock()
+        failing_client.put_metric_data.return_value = False
+        self.flusher.client = self.flusher.flush_pipeline = SinkFanout([Sink("failing", failing_client), Sink("publishing", publishing_client)])
+        self.flusher.add_metric(self._get_vl_mock("cpu", "0", "cpu", "user", "host", [10], 0))
+        try:
+            self.flusher.shutdown()
+        finally:
+            self.flusher.client = self.client
+        self.assertEquals(1, publishing_client.put_metric_data.call_count)
+        failing_client.put_metric_data.return_value = True
+        restored_fanout = SinkFanout([Sink("failing", failing_client), Sink("publishing", publishing_client)])
+        self.flusher.client = self.flusher.flush_pipeline = restored_fanout
+        try:
+            self.flusher.restore_snapshot()
+            self.assertTrue(restored_fanout.wait_for_pending_flushes(5))
+        finally:
+            self.flusher.client = self.client
+            restored_fanout.close(1)
+        self.assertEquals(2, failing_client.put_metric_data.call_count)
+        self.assertEquals(1, publishing_client.put_metric_data.call_count)
+        self.assertEquals({}, self.flusher.default_schedule.retained_metric_map)
+
+    def test_drained_batches_are_put_with_the_time_left_until_the_deadline(self):
+        self._use_snapshot_directory()
+        self.flusher.add_metric(self._get_vl_mock("cpu", "0", "cpu", "user", "host", [10], 0))
+        self.flusher.shutdown()
+        timeout = self.client.put_metric_data.call_args[1]["timeout"]
+        self.assertTrue(0 < timeout <= self.config_helper.shutdown_drain_timeout_in_seconds)
+
+    def test_shutdown_does_not_wait_for_slow_sink_past_the_deadline(self):
+        self._use_snapshot_directory()
+        self.config_helper.shutdown_drain_timeout_in_seconds = 0.5
+        released = threading.Event()
+        self.addCleanup(released.set)
+        slow_client = MagicMock()
+        slow_client.put_metric_data.side_effect = lambda namespace, metric_list: released.wait(5)
+        self.flusher.client = self.flusher.flush_pipeline = SinkFanout([Sink("slow", slow_client)])
+        self.flusher.add_metric(self._get_vl_mock("cpu", "0", "cpu", "user", "host", [10], 0))
+        start = time()
+        try:
+            self.flusher.shutdown()
+        finally:
+            self.flusher.client = self.client
+        self.assertTrue(time() - start < 2)
+        self.assertEquals(["cpu-0-cpu-user"], [key for key, _, _ in AggregationSnapshot(self.config_helper.snapshot_path).load()])
+
+    def test_flush_pipeline_receives_all_batches_of_a_flush(self):
+        self.flusher.flush_pipeline = self.client
+        for i in range(self.flusher._MAX_METRICS_PER_PUT_REQUEST + 1):
+            self.flusher.add_metric(self._get_vl_mock("plugin" + str(i), "0", "type", "", "host", [i], 0))
+        self.flusher._flush()
+        self.assertFalse(self.client.put_metric_data.called)
+        self.assertEquals(1, self.client.put_metric_batches.call_count)
+        namespace, metric_batches = self.client.put_metric_batches.call_args[0]
+        self.assertEquals(MetricDataStatistic.NAMESPACE, namespace)
+        self.assertEquals([1, 20], sorted(len(metric_batch) for metric_batch in metric_batches))
+        self.assertEquals({}, self.flusher.metric_map)
+
+    def test_metrics_are_routed_to_namespace_of_whitelist_rule_and_batched_per_namespace(self):
+        self.config_helper.whitelist.get_metric_options.side_effect = lambda key: {"namespace": "collectd/disk"} if key.startswith("disk") else {}
+        for i in range(25):
+            self.flusher.add_metric(self._get_vl_mock("plugin" + str(i), "0", "type", "", "host", [i], 0))
+        for i in range(15):
+            self.flusher.add_metric(self._get_vl_mock("disk" + str(i), "0", "type", "", "host", [i], 0))
+        self.flusher._flush()
+        batches = sorted((call[0][0], len(call[0][1])) for call in self.client.put_metric_data.call_args_list)
+        self.assertEquals([(MetricDataStatistic.NAMESPACE, 5), (MetricDataStatistic.NAMESPACE, 20), ("collectd/disk", 15)], batches)
+        for call in self.client.put_metric_data.call_args_list:
+            self.assertEquals([call[0][0]], list(set(metric.namespace for metric in call[0][1])))
+
+    def test_flush_pipeline_receives_batches_grouped_by_namespace(self):
+        self.config_helper.whitelist.get_metric_options.side_effect = lambda key: {"namespace": "collectd/disk"} if key.startswith("disk") else {}
+        self.flusher.flush_pipeline = self.client
+        self.flusher.add_metric(self._get_vl_mock("plugin", "0", "type", "", "host", [1], 0))
+        self.flusher.add_metric(self._get_vl_mock("disk", "0", "type", "", "host", [2], 0))
+        self.flusher._flush()
+        namespaces = sorted(call[0][0] for call in self.client.put_metric_batches.call_args_list)
+        self.assertEquals(sorted(["collectd/disk", MetricDataStatistic.NAMESPACE]), namespaces)
+
+    def test_drained_batches_and_restored_metrics_keep_namespace_of_whitelist_rule(self):
+        self.config_helper.whitelist.get_metric_options.side_effect = lambda key: {"namespace": "collectd/cpu"} if key.startswith("cpu") else {}
+        self.flusher.add_metric(self._get_vl_mock("plugin", "0", "type", "", "host", [1], 0))
+        self.flusher.add_metric(self._get_vl_mock("cpu", "0", "cpu", "user", "host", [2], 0))
+        self.flusher._drain_metric_map(self.flusher._merge_shards(self.flusher.default_schedule), monotonic() + 5)
+        self.assertEquals(sorted(["collectd/cpu", MetricDataStatistic.NAMESPACE]), sorted(call[0][0] for call in self.client.put_metric_data.call_args_list))
+        self._use_snapshot_directory()
+        AggregationSnapshot(self.config_helper.snapshot_path).save([
+            ("cpu-1-cpu-user", [self._get_metric("cpu.cpu.user", 10, awsutils.get_aws_timestamp(time()))], None)])
+        self.flusher.restore_snapshot()
+        self.client.put_metric_data.reset_mock()
+        self.flusher._flush()
+        self.assertEquals("collectd/cpu", self.client.put_metric_data.call_args[0][0])
+
+    def test_shutdown_waits_for_flush_pipeline_and_stops_it(self):
+        self._use_snapshot_directory()
+        self.flusher.flush_pipeline = self.client
+        self.flusher.add_metric(self._get_vl_mock("cpu", "0", "cpu", "user", "host", [10], 0))
+        self.flusher.shutdown()
+        self.assertTrue(self.client.wait_for_pending_flushes.called)
+        self.assertEquals(1, self.client.put_metric_data.call_count)
+        self.assertTrue(self.client.close.called)
+
+    @patch("cloudwatch.modules.flusher.AsyncPutClient")
+    def test_async_flush_pipeline_is_used_when_enabled(self, async_client_class):
+        self.config_helper.async_flush_pipeline = True
+        self.config_helper.max_concurrent_put_requests = 16
+        flusher = Flusher(config_helper=self.config_helper, dataset_resolver=self.dataset_resolver)
+        async_client_class.assert_called_once_with(self.config_helper, 16, congestion_controller=None, endpoint_pool=flusher.endpoint_pool,
+                                                   metric_quarantine=flusher.metric_quarantine, request_tracer=None)
+        self.assertTrue(flusher.client is async_client_class.return_value)
+        self.assertTrue(flusher.flush_pipeline is flusher.client)
+
+    @patch("cloudwatch.modules.flusher.AsyncPutClient", None)
+    def test_async_flush_pipeline_falls_back_to_synchronous_client_without_python_3(self):
+        self.config_helper.async_flush_pipeline = True
+        flusher = Flusher(config_helper=self.config_helper, dataset_resolver=self.dataset_resolver)
+        self.assertTrue(isinstance(flusher.client, PutClient))
+        self.assertEquals(None, flusher.flush_pipeline)
+
+    def test_emf_client_is_used_in_emf_output_mode(self):
+        self.config_helper.output_mode = ConfigHelper.EMF_OUTPUT_MODE
+        self.config_helper.async_flush_pipeline = True
+        flusher = Flusher(config_helper=self.config_helper, dataset_resolver=self.dataset_resolver)
+        self.assertTrue(isinstance(flusher.client, EMFClient))
+        self.assertEquals(None, flusher.flush_pipeline)
+
+    def test_sink_fanout_is_used_when_sinks_are_configured(self):
+        self.config_helper.sinks = ["cloudwatch", "jsonl"]
+        self.config_helper.max_queued_batches_per_sink = 10
+        flusher = Flusher(config_helper=self.config_helper, dataset_resolver=self.dataset_resolver)
+        self.assertTrue(isinstance(flusher.client, SinkFanout))
+        self.assertTrue(flusher.flush_pipeline is flusher.client)
+        self.assertEquals(["cloudwatch", "jsonl"], [sink.name for sink in flusher.client.sinks])
+        self.assertTrue(isinstance(flusher.client.sinks[0].client, PutClient))
+        self.assertTrue(isinstance(flusher.client.sinks[1].client, JSONLinesClient))
+        self.assertEquals(10, flusher.client.sinks[0].max_queued_batches)
+        flusher.client.close(1)
+
+    def test_publish_targets_are_published_from_own_sinks_with_shared_encoding(self):
+        self.config_helper.sinks = ["cloudwatch"]
+        self.config_helper.congestion_control = True
+        self.config_helper.publish_targets = [PublishTarget("dr", "us-west-2", self.config_helper, namespace="collectd_dr",
+                                                            endpoint="https://monitoring.us-west-2.amazonaws.com/")]
+        flusher = Flusher(config_helper=self.config_helper, dataset_resolver=self.dataset_resolver)
+        try:
+            self.assertEquals(["cloudwatch", "cloudwatch:dr"], [sink.name for sink in flusher.client.sinks])
+            primary_client, target_client = [sink.client for sink in flusher.client.sinks]
+            self.assertEquals(["https://monitoring.us-west-2.amazonaws.com/"], [endpoint.url for endpoint in target_client.endpoint_pool.endpoints])
+            self.assertFalse(target_client.congestion_controller is flusher.congestion_controller)
+            for client in (primary_client, target_client):
+                client.transport = MagicMock()
+                client.transport.get.return_value = Response(200, "OK", {}, b"OK")
+            metric = MetricDataStatistic("metric", statistic_values=MetricDataStatistic.Statistics(10))
+            self.assertTrue(flusher.client.put_metric_data(MetricDataStatistic.NAMESPACE, [metric]))
+            self.assertTrue("Namespace=collectd&" in primary_client.transport.get.call_args[0][0])
+            self.assertTrue("Namespace=collectd_dr&" in target_client.transport.get.call_args[0][0])
+            self.assertTrue("%2Fus-west-2%2Fmonitoring%2F" in target_client.transport.get.call_args[0][0])
+            self.assertEquals(1, flusher.metric_data_cache.hit_count)
+        finally:
+            flusher.client.close(1)
+
+    def test_series_rejected_by_publish_target_is_still_published_to_other_sinks(self):
+        self.config_helper.sinks = ["cloudwatch"]
+        self.config_helper.publish_targets = [PublishTarget("dr", "us-west-2", self.config_helper, endpoint="https://monitoring.us-west-2.amazonaws.com/")]
+        flusher = Flusher(config_helper=self.config_helper, dataset_resolver=self.dataset_resolver)
+        try:
+            primary_client, target_client = [sink.client for sink in flusher.client.sinks]
+            self.assertFalse(target_client.metric_quarantine is flusher.metric_quarantine)
+            target_client.metric_quarantine._LOGGER = MagicMock()
+            primary_client.transport, target_client.transport = MagicMock(), MagicMock()
+            primary_client.transport.get.return_value = Response(200, "OK", {}, b"OK")
+            target_client.transport.get.return_value = Response(400, "Bad Request", {}, b"<Error><Code>InvalidParameterValue</Code>"
+                                                                b"<Message>The value for parameter MetricData.member.1.Value is invalid.</Message></Error>")
+            metric = MetricDataStatistic("metric", statistic_values=MetricDataStatistic.Statistics(10))
+            for _ in range(2):
+                flusher.client.put_metric_data(MetricDataStatistic.NAMESPACE, [metric])
+                flusher.client.wait_for_pending_flushes(5)
+            self.assertEquals(2, primary_client.transport.get.call_count)
+            self.assertEquals(1, target_client.transport.get.call_count)
+            self.assertTrue(target_client.metric_quarantine.is_quarantined(metric))
+            self.assertFalse(flusher.metric_quarantine.is_quarantined(metric))
+            self.assertTrue("to publish target 'dr'" in target_client.metric_quarantine._LOGGER.warning.call_args[0][0])
+        finally:
+            flusher.client.close(1)
+
+    def test_flush_rebuilds_prometheus_exposition(self):
+        self.config_helper.prometheus_listen_address = ("127.0.0.1", 0)
+        flusher = Flusher(config_helper=self.config_helper, dataset_resolver=self.dataset_resolver)
+        flusher.client = self.client
+        try:
+            flusher.add_metric(self._get_vl_mock("cpu", "0", "cpu", "user", "host", [10], 0))
+            flusher._flush()
+            lines = flusher.prometheus_exposition.get_buffer().decode("utf-8").splitlines()
+            self.assertTrue("collectd_cpu_cpu_user_sum{Host=\"valid_host\",PluginInstance=\"0\"} 10.0" in lines)
+            self.assertEquals(1, self.client.put_metric_data.call_count)
+        finally:
+            flusher.shutdown()
+        self.assertEquals(None, flusher._prometheus_server._thread)
+
+    def test_congestion_controller_is_shared_by_cloudwatch_clients(self):
+        self.config_helper.congestion_control = True
+        self.config_helper.sinks = ["cloudwatch", "jsonl"]
+        flusher = Flusher(config_helper=self.config_helper, dataset_resolver=self.dataset_resolver)
+        try:
+            self.assertTrue(isinstance(flusher.congestion_controller, AIMDController))
+            self.assertTrue(flusher.client.sinks[0].client.congestion_controller is flusher.congestion_controller)
+        finally:
+            flusher.client.close(1)
+
+    def test_endpoint_pool_is_shared_by_cloudwatch_clients(self):
+        self.config_helper.failover_endpoints = ["https://monitoring.us-east-1.amazonaws.com/"]
+        self.config_helper.circuit_breaker_failure_threshold = 3
+        self.config_helper.sinks = ["cloudwatch", "jsonl"]
+        flusher = Flusher(config_helper=self.config_helper, dataset_resolver=self.dataset_resolver)
+        try:
+            self.assertEquals([self.config_helper.endpoint, "https://monitoring.us-east-1.amazonaws.com/"], [endpoint.url for endpoint in flusher.endpoint_pool.endpoints])
+            self.assertEquals(3, flusher.endpoint_pool.endpoints[0].circuit_breaker.failure_threshold)
+            self.assertTrue(flusher.client.sinks[0].client.endpoint_pool is flusher.endpoint_pool)
+        finally:
+            flusher.client.close(1)
+
+    def test_congestion_control_is_disabled_by_default(self):
+        self.assertEquals(None, self.flusher.congestion_controller)
+        self.assertEquals(None, Flusher(config_helper=self.config_helper, dataset_resolver=self.dataset_resolver).client.congestion_controller)
+
+    def test_flush_exposes_congestion_window(self):
+        self.config_helper.congestion_control = True
+        self.config_helper.prometheus_listen_address = ("127.0.0.1", 0)
+        flusher = Flusher(config_helper=self.config_helper, dataset_resolver=self.dataset_resolver)
+        flusher.client = self.client
+        try:
+            flusher.congestion_controller.on_congestion()
+            flusher.add_metric(self._get_vl_mock("cpu", "0", "cpu", "user", "host", [10], 0))
+            flusher._flush()
+            lines = flusher.prometheus_exposition.get_buffer().decode("utf-8").splitlines()
+            self.assertTrue("collectd_cloudwatch_put_concurrency_limit 4" in lines)
+            self.assertTrue("collectd_cloudwatch_put_congestion_events 1" in lines)
+        finally:
+            flusher.shutdown()
+
+    def test_unavailable_prometheus_address_does_not_stop_flusher(self):
+        self.config_helper.prometheus_listen_address = ("invalid host name", 9103)
+        flusher = Flusher(config_helper=self.config_helper, dataset_resolver=self.dataset_resolver)
+        self.assertEquals(None, flusher.prometheus_exposition)
+
+    def test_drained_batches_keep_sibling_metrics_together(self):
+        self.flusher.config.push_asg = True
+        self.flusher.config.asg_name = "asg"
+        for i in range(11):
+            self.flusher.add_metric(self._get_vl_mock("plugin" + str(i), "0", "type", "", "host", [i], 0))
+        unsent_entries = self.flusher._drain_metric_map(self.flusher._merge_shards(self.flusher.default_schedule), monotonic() + 5)
+        self.assertEquals([], unsent_entries)
+        self.assertEquals([20, 2], [len(call[0][1]) for call in self.client.put_metric_data.call_args_list])
+
+    def test_restore_snapshot_merges_metrics_with_valid_timestamps(self):
+        self._use_snapshot_directory()
+        current_time = time()
+        AggregationSnapshot(self.config_helper.snapshot_path).save([
+            ("cpu-0-cpu-user", [self._get_metric("cpu.cpu.user", 10, awsutils.get_aws_timestamp(current_time))], None),
+            ("cpu-1-cpu-user", [self._get_metric("cpu.cpu.user", 20, awsutils.get_aws_timestamp(current_time - 3600))], None),
+            ("cpu-2-cpu-user", [self._get_metric("cpu.cpu.user", 30, awsutils.get_aws_timestamp(current_time - 15 * 24 * 3600))], None)])
+        self.flusher.restore_snapshot()
+        self.flusher.add_metric(self._get_vl_mock("cpu", "0", "cpu", "user", "host", [20], 0))
+        self.flusher.add_metric(self._get_vl_mock("cpu", "1", "cpu", "user", "host", [40], 0))
+        self.flusher._flush()
+        metrics = sorted((metric.statistics.sum, metric.statistics.sample_count)
+                         for call in self.client.put_metric_data.call_args_list for metric in call[0][1])
+        self.assertEquals([(20, 1), (30, 2), (40, 1)], metrics)
+
+    def test_series_budget_is_reset_on_flush(self):
+        self.flusher.default_schedule.series_budget = SeriesBudget(default_budget=2)
+        for pid in range(3):
+            self.flusher.add_metric(self._get_vl_mock("processes", str(pid), "ps_rss", "", "host", [pid], 0))
+        self.flusher._flush()
+        self.assertEquals({}, self.flusher.get_series_budget_usage())
+        self.flusher.add_metric(self._get_vl_mock("processes", "0", "ps_rss", "", "host", [1], 0))
+        self.assertEquals({"processes": 1}, self.flusher.get_series_budget_usage())
+
     def test_prepare_batches_respects_the_size_limit(self):
         for i in range(self.flusher._MAX_METRICS_PER_PUT_REQUEST + 1):
             self.flusher._aggregate_metric(self._get_vl_mock("plugin" + str(i), "plugin_instance", "type", "type_instance", "host", [i], 0))
-        batch = self.flusher._prepare_batch().next()
+        batch = next(self.flusher._prepare_batch())
         self.assertEquals(self.flusher._MAX_METRICS_PER_PUT_REQUEST, len(list(batch)))
         batch = self.flusher._prepare_batch()
         self.assertEquals(1, len(list(batch)))
@@ -266,6 +943,15 @@ class FlusherTest(unittest.TestCase):
         self.assertListEqual([value.values for value in expanded_value_list], [[10], [11]])
 
 
+    def _use_snapshot_directory(self):
+        snapshot_directory = mkdtemp()
+        self.addCleanup(rmtree, snapshot_directory)
+        self.config_helper.snapshot_path = os.path.join(snapshot_directory, "aggregation_snapshot")
+
+    def _get_metric(self, metric_name, value, timestamp):
+        return MetricDataStatistic(metric_name=metric_name, statistic_values=MetricDataStatistic.Statistics(value), timestamp=timestamp,
+                                   storage_resolution=MetricDataBuilder.STANDARD_STORAGE_RESOLUTION)
+
     def _assert_statistics(self, metric, min, max, sum, sample_count):
         self.assertEquals(min, metric.statistics.min)
         self.assertEquals(max, metric.statistics.max)
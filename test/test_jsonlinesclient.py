@@ -0,0 +1,50 @@
+import json
+import os
+import unittest
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from mock import MagicMock
+from cloudwatch.modules.client.jsonlinesclient import JSONLinesClient
+from cloudwatch.modules.metricdata import MetricDataStatistic
+
+
+class JSONLinesClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.config_helper = MagicMock()
+        self.config_helper.jsonl_path = os.path.join(self.directory, "published_metrics.jsonl")
+        self.client = JSONLinesClient(self.config_helper)
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def _get_metric(self, name):
+        return MetricDataStatistic(name, dimensions={"Host": "host"}, statistic_values=MetricDataStatistic.Statistics(20),
+                                   timestamp="20171204T120000Z", storage_resolution=60)
+
+    def _read_records(self, path=None):
+        with open(path or self.config_helper.jsonl_path) as jsonl_file:
+            return [json.loads(line) for line in jsonl_file.read().splitlines()]
+
+    def test_put_metric_data_appends_one_record_per_metric(self):
+        self.assertTrue(self.client.put_metric_data(MetricDataStatistic.NAMESPACE, [self._get_metric("metric1"), self._get_metric("metric2")]))
+        self.assertTrue(self.client.put_metric_data(MetricDataStatistic.NAMESPACE, [self._get_metric("metric3")]))
+        records = self._read_records()
+        self.assertEquals(["metric1", "metric2", "metric3"], [record["metric_name"] for record in records])
+        self.assertEquals({"namespace": "collectd", "metric_name": "metric1", "dimensions": {"Host": "host"}, "timestamp": "20171204T120000Z",
+                           "unit": "", "storage_resolution": 60, "statistics": {"min": 20, "max": 20, "sum": 20, "sample_count": 1}}, records[0])
+
+    def test_file_is_rotated_above_max_size(self):
+        self.client.max_file_size = 10
+        self.assertTrue(self.client.put_metric_data(MetricDataStatistic.NAMESPACE, [self._get_metric("metric1")]))
+        self.assertTrue(self.client.put_metric_data(MetricDataStatistic.NAMESPACE, [self._get_metric("metric2")]))
+        self.assertEquals(["metric2"], [record["metric_name"] for record in self._read_records()])
+        self.assertEquals(["metric1"], [record["metric_name"] for record in self._read_records(self.config_helper.jsonl_path + ".1")])
+
+    def test_write_failure_is_reported(self):
+        self.client._LOGGER = MagicMock()
+        self.client.path = os.path.join(self.directory, "missing", "published_metrics.jsonl")
+        self.assertFalse(self.client.put_metric_data(MetricDataStatistic.NAMESPACE, [self._get_metric("metric")]))
+        self.assertTrue(self.client._LOGGER.warning.called)
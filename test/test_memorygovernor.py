@@ -0,0 +1,80 @@
+import unittest
+
+from mock import patch
+from cloudwatch.modules.memorygovernor import GovernedCache, MemoryGovernor
+
+
+class GovernedCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = GovernedCache()
+
+    def test_rotation_evicts_entries_not_used_since_previous_rotation(self):
+        self.cache["used"] = 1
+        self.cache["unused"] = 2
+        self.assertEquals({}, self.cache.rotate())
+        self.assertEquals(1, self.cache["used"])
+        self.assertEquals({"unused": 2}, self.cache.rotate())
+        self.assertEquals(1, self.cache.get_entry_count())
+        self.assertTrue("used" in self.cache)
+        self.assertFalse("unused" in self.cache)
+
+    def test_old_entries_are_moved_back_on_lookup(self):
+        self.cache["key"] = False
+        self.cache.rotate()
+        self.assertEquals(None, self.cache.get("key"))
+        self.assertTrue("key" in self.cache)
+        self.assertEquals(False, self.cache.get("key"))
+        self.assertEquals(GovernedCache.MISSING, self.cache.take_old("key"))
+        with self.assertRaises(KeyError):
+            self.cache["missing"]
+
+    def test_rotation_does_not_reset_the_recent_generation(self):
+        self.cache["key"] = 1
+        with patch.object(GovernedCache, "clear") as clear:
+            self.cache.rotate()
+        self.assertFalse(clear.called)
+        self.assertEquals((0, {"key": 1}), (len(self.cache), self.cache._old))
+
+    def test_approximate_size_grows_with_entries(self):
+        self.assertEquals(0, self.cache.get_approximate_size())
+        self.cache[("plugin", "instance", "type", "type_instance")] = "plugin-instance-type-type_instance"
+        single_size = self.cache.get_approximate_size()
+        self.assertTrue(single_size > 100)
+        for index in range(9):
+            self.cache[("plugin", str(index), "type", "type_instance")] = "plugin-instance-type-type_instance"
+        self.cache.rotate()
+        self.assertTrue(9 * single_size < self.cache.get_approximate_size() < 11 * single_size)
+
+
+class MemoryGovernorTest(unittest.TestCase):
+
+    def test_largest_cache_is_evicted_until_total_size_fits_budget(self):
+        small, large = GovernedCache(), GovernedCache()
+        small["key"] = "value"
+        for index in range(100):
+            large["key" + str(index)] = "value"
+        governor = MemoryGovernor(budget_in_bytes=small.get_approximate_size() * 2)
+        governor.register("small", small)
+        governor.register("large", large)
+        governor.enforce()
+        self.assertEquals(1, small.get_entry_count())
+        self.assertEquals(0, large.get_entry_count())
+        self.assertEquals(100, governor.evicted_entry_count)
+
+    def test_cache_within_budget_is_not_evicted(self):
+        cache = GovernedCache()
+        cache["key"] = "value"
+        governor = MemoryGovernor(budget_in_bytes=1024 * 1024)
+        governor.register("cache", cache)
+        governor.enforce()
+        governor.enforce()
+        self.assertEquals(1, cache.get_entry_count())
+        self.assertEquals(["cache"], list(governor.get_usage().keys()))
+
+    def test_budget_is_disabled_by_default(self):
+        governor = MemoryGovernor()
+        cache = governor.register("cache", GovernedCache())
+        cache["key"] = "value"
+        governor.enforce()
+        self.assertEquals(1, len(cache))
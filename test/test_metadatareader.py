@@ -1,8 +1,8 @@
 import unittest
-import requests
 from helpers.fake_http_server import FakeServer
 from helpers.fake_metadata import FAKE_REGION, FAKE_IDENTITY_DOCUMENT_STRING
 from cloudwatch.modules.configuration.metadatareader import MetadataReader, MetadataRequestException
+from cloudwatch.modules.client.transport import ConnectionException
 
 class MetadataReaderTest(unittest.TestCase):
     FAKE_SERVER = None
@@ -36,7 +36,7 @@ class MetadataReaderTest(unittest.TestCase):
             
     def test_request_timeout(self):
         self.server.set_timeout_delay(MetadataReader._RESPONSE_TIMEOUT_IN_SECONDS * (MetadataReader._TOTAL_RETRIES + 1))
-        with self.assertRaises(requests.exceptions.ConnectionError):
+        with self.assertRaises(ConnectionException):
             self.metadata_reader.get_region()
             
     def test_retry_is_working_on_timeouts(self):
@@ -45,7 +45,7 @@ class MetadataReaderTest(unittest.TestCase):
         
     def test_request_timeout_on_invalid_host(self):
         self.metadata_reader.metadata_server = "http://invalid_server/"
-        with self.assertRaises(requests.exceptions.ConnectionError):
+        with self.assertRaises(ConnectionException):
             self.metadata_reader.get_region()
     
     def test_can_get_iam_role_name(self):
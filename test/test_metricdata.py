@@ -69,6 +69,17 @@ class MetricDataTest(unittest.TestCase):
         metric.add_value(30)
         assert_statistics(metric.statistics, min=-20, max=30, sum=20, sample_count=3)
     
+    def test_metric_data_merges_statistics(self):
+        metric = MetricDataStatistic()
+        other = MetricDataStatistic.Statistics(10)
+        other._add_value(-5)
+        metric.merge_statistics(other)
+        self.assertFalse(metric.statistics is other)
+        assert_statistics(metric.statistics, min=-5, max=10, sum=5, sample_count=2)
+        metric.merge_statistics(MetricDataStatistic.Statistics(20))
+        assert_statistics(metric.statistics, min=-5, max=20, sum=25, sample_count=3)
+        self.assertEquals(2, other.sample_count)
+
     def test_metric_data_gets_current_timestamp(self):
         metric1 = MetricDataStatistic("metric_name", 20)
         sleep(1)
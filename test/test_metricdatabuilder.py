@@ -91,6 +91,24 @@ class MetricDataBuilderTest(unittest.TestCase):
         self.assertEquals("somevalue", metric[2].dimensions['FixedDimension'])
         self.assertEquals("0", metric[2].dimensions['PluginInstance'])
 
+    def test_build_series_keeps_asg_and_constant_dimensions_as_siblings(self):
+        vl = self._get_vl_mock("CPU", "0", "CPU", "Steal")
+        self.config_helper.push_asg = True
+        self.config_helper.asg_name = "MyASG"
+        self.config_helper.push_constant = True
+        self.config_helper.constant_dimension_value = "somevalue"
+        metric = MetricDataBuilder(self.config_helper, vl).build_series()
+        self.assertEquals("valid_host", metric.dimensions['Host'])
+        self.assertEquals(2, len(metric.sibling_dimensions))
+        metric.add_value(10)
+        expanded = metric.expand()
+        self.assertEquals(3, len(expanded))
+        self.assertEquals("MyASG", expanded[1].dimensions['AutoScalingGroup'])
+        self.assertEquals("somevalue", expanded[2].dimensions['FixedDimension'])
+        for expanded_metric in expanded:
+            self.assertEquals("CPU.CPU.Steal", expanded_metric.metric_name)
+            self.assertTrue(expanded_metric.statistics is metric.statistics)
+
     def test_build_with_enable_high_resolution_metrics(self):
         self.config_helper = MagicMock()
         self.config_helper.push_asg = False
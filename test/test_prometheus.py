@@ -0,0 +1,104 @@
+import unittest
+
+from cloudwatch.modules.compat import httplib
+from cloudwatch.modules.metricdata import MetricDataStatistic
+from cloudwatch.modules.prometheus import PrometheusExposition, PrometheusServer
+
+
+class PrometheusExpositionTest(unittest.TestCase):
+
+    TIMESTAMP = "20171204T120000Z"
+
+    def setUp(self):
+        self.exposition = PrometheusExposition()
+
+    def _get_metric(self, name, dimensions=None, values=(20,), timestamp=TIMESTAMP):
+        metric = MetricDataStatistic(name, dimensions=dimensions or {"Host": "host", "PluginInstance": "0"}, timestamp=timestamp)
+        for value in values:
+            metric.add_value(value)
+        return metric
+
+    def _get_lines(self):
+        return self.exposition.get_buffer().decode("utf-8").splitlines()
+
+    def test_metric_is_exposed_as_sum_count_min_and_max_gauges(self):
+        self.exposition.update("schedule", [self._get_metric("cpu.percent.active", values=[10, 20.5])])
+        self.assertEquals(["# TYPE collectd_cpu_percent_active_sum gauge",
+                           "collectd_cpu_percent_active_sum{Host=\"host\",PluginInstance=\"0\"} 30.5",
+                           "# TYPE collectd_cpu_percent_active_count gauge",
+                           "collectd_cpu_percent_active_count{Host=\"host\",PluginInstance=\"0\"} 2",
+                           "# TYPE collectd_cpu_percent_active_min gauge",
+                           "collectd_cpu_percent_active_min{Host=\"host\",PluginInstance=\"0\"} 10",
+                           "# TYPE collectd_cpu_percent_active_max gauge",
+                           "collectd_cpu_percent_active_max{Host=\"host\",PluginInstance=\"0\"} 20.5"], self._get_lines())
+
+    def test_names_and_label_values_are_escaped(self):
+        self.exposition.update("schedule", [self._get_metric("df-root.1", {"Fixed Dimension": "a\"b\\c\nd"}, values=[float("nan")])])
+        lines = self._get_lines()
+        self.assertEquals("collectd_df_root_1_sum{Fixed_Dimension=\"a\\\"b\\\\c\\nd\"} NaN", lines[1])
+
+    def test_series_of_same_metric_share_family(self):
+        self.exposition.update("schedule", [self._get_metric("metric", {"Host": "b"}), self._get_metric("metric", {"Host": "a"})])
+        lines = self._get_lines()
+        self.assertEquals(4, len([line for line in lines if line.startswith("# TYPE")]))
+        self.assertEquals(["collectd_metric_sum{Host=\"a\"} 20", "collectd_metric_sum{Host=\"b\"} 20"], lines[1:3])
+
+    def test_flush_replaces_metrics_of_previous_flush_of_same_schedule(self):
+        self.exposition.update("schedule", [self._get_metric("metric1")])
+        self.exposition.update("other_schedule", [self._get_metric("metric2")])
+        self.exposition.update("schedule", [self._get_metric("metric3")])
+        families = [line.split(" ")[2] for line in self._get_lines() if line.endswith("_sum gauge")]
+        self.assertEquals(["collectd_metric2_sum", "collectd_metric3_sum"], families)
+
+    def test_on_demand_flush_adds_metrics(self):
+        self.exposition.update("schedule", [self._get_metric("metric1")])
+        self.exposition.update("schedule", [self._get_metric("metric2")], replace=False)
+        self.assertEquals(2, len([line for line in self._get_lines() if line.endswith("_sum gauge")]))
+
+    def test_latest_metric_of_series_is_exposed(self):
+        self.exposition.update("schedule", [self._get_metric("metric", values=[2], timestamp="20171204T120001Z"),
+                                            self._get_metric("metric", values=[1], timestamp=self.TIMESTAMP)])
+        self.assertTrue("collectd_metric_sum{Host=\"host\",PluginInstance=\"0\"} 2" in self._get_lines())
+
+    def test_internal_gauges_are_exposed_after_metrics(self):
+        self.exposition.update("schedule", [self._get_metric("metric")])
+        self.exposition.update_internal_gauges({"collectd_cloudwatch_put_request_rate": 12.5, "collectd_cloudwatch_put_concurrency_limit": 4})
+        self.assertEquals(["# TYPE collectd_cloudwatch_put_concurrency_limit gauge", "collectd_cloudwatch_put_concurrency_limit 4",
+                           "# TYPE collectd_cloudwatch_put_request_rate gauge", "collectd_cloudwatch_put_request_rate 12.5"], self._get_lines()[-4:])
+
+    def test_buffer_is_empty_without_metrics(self):
+        self.assertEquals(b"", self.exposition.get_buffer())
+        self.exposition.update("schedule", [MetricDataStatistic("metric", timestamp=self.TIMESTAMP)])
+        self.assertEquals(b"", self.exposition.get_buffer())
+
+
+class PrometheusServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.exposition = PrometheusExposition()
+        self.server = PrometheusServer(("127.0.0.1", 0), self.exposition)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _get(self, path):
+        connection = httplib.HTTPConnection("127.0.0.1", self.server.server_address[1], timeout=5)
+        try:
+            connection.request("GET", path)
+            response = connection.getresponse()
+            return response.status, response.getheader("Content-Type"), response.read()
+        finally:
+            connection.close()
+
+    def test_metrics_are_served_from_buffer(self):
+        metric = MetricDataStatistic("metric", dimensions={"Host": "host"}, timestamp="20171204T120000Z")
+        metric.add_value(1)
+        self.exposition.update("schedule", [metric])
+        status, content_type, body = self._get("/metrics")
+        self.assertEquals(200, status)
+        self.assertEquals(PrometheusExposition.CONTENT_TYPE, content_type)
+        self.assertEquals(self.exposition.get_buffer(), body)
+
+    def test_unknown_path_is_not_found(self):
+        self.assertEquals(404, self._get("/")[0])
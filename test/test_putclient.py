@@ -1,5 +1,8 @@
+import json
+import os
+import shutil
+import tempfile
 import unittest
-import requests
 import time
 
 from mock import Mock, MagicMock
@@ -8,6 +11,11 @@ from cloudwatch.modules.plugininfo import PLUGIN_NAME, PLUGIN_VERSION
 from helpers.fake_http_server import FakeServer
 from cloudwatch.modules.awscredentials import AWSCredentials
 from cloudwatch.modules.metricdata import MetricDataStatistic
+from cloudwatch.modules.client.transport import ConnectionException, Response
+from cloudwatch.modules.client.congestion import AIMDController
+from cloudwatch.modules.client.circuitbreaker import EndpointPool
+from cloudwatch.modules.quarantine import MetricQuarantine
+from cloudwatch.modules.client.requesttracer import RequestTracer
 
 
 class PutClientTest(unittest.TestCase):
@@ -59,7 +67,7 @@ class PutClientTest(unittest.TestCase):
         
     def test_get_request_timeout(self):
         self.server.set_timeout_delay(PutClient._DEFAULT_RESPONSE_TIMEOUT * (PutClient._TOTAL_RETRIES + 1))
-        with self.assertRaises(requests.ConnectionError):
+        with self.assertRaises(ConnectionException):
             self.client._run_request("request")
         self.server_restart()
         
@@ -67,7 +75,7 @@ class PutClientTest(unittest.TestCase):
         metric_name = "test_metric"
         namespace = "testing_namespace"
         metric = MetricDataStatistic(metric_name, statistic_values=MetricDataStatistic.Statistics(20), namespace=namespace)
-        self.client.put_metric_data(namespace, [metric])
+        self.assertTrue(self.client.put_metric_data(namespace, [metric]))
         received_request = self.server_get_received_request()
         self.assertTrue("MetricData.member.1.MetricName=" + metric_name in received_request)
         self.assertTrue("MetricData.member.1.Timestamp=" + metric.timestamp in received_request)
@@ -102,9 +110,15 @@ class PutClientTest(unittest.TestCase):
         self.server.set_timeout_delay(PutClient._DEFAULT_RESPONSE_TIMEOUT * (PutClient._TOTAL_RETRIES + 1))
         metric_name = "test_metric"
         metric = MetricDataStatistic(metric_name, statistic_values=MetricDataStatistic.Statistics(20))
-        self.client.put_metric_data(MetricDataStatistic.NAMESPACE, [metric])
+        self.assertFalse(self.client.put_metric_data(MetricDataStatistic.NAMESPACE, [metric]))
         self.assertTrue(self.logger.warning.called)
         
+    def test_prewarm_opens_connection_used_by_put(self):
+        self.assertTrue(self.client.prewarm())
+        metric = MetricDataStatistic("metric_name", statistic_values=MetricDataStatistic.Statistics(20), namespace="namespace")
+        self.assertTrue(self.client.put_metric_data("namespace", [metric]))
+        self.client.transport.close()
+
     def test_put_metric_data_with_inconsistent_namespaces(self):
         metric1 = MetricDataStatistic("metric_name1", statistic_values=MetricDataStatistic.Statistics(20), namespace="namespace1")
         metric2 = MetricDataStatistic("metric_name2", statistic_values=MetricDataStatistic.Statistics(20))
@@ -142,6 +156,189 @@ class PutClientTest(unittest.TestCase):
         self.server.set_expected_response("Request Throttled", 400)
         self.assert_no_retry_on_error_request("namespace", [metric])
         
+    def test_throttled_request_is_retried_with_congestion_controller(self):
+        metric = MetricDataStatistic("metric_name", statistic_values=MetricDataStatistic.Statistics(20), namespace="namespace")
+        transport = MagicMock()
+        transport.get.side_effect = [Response(400, "Bad Request", {}, b"<Error><Code>Throttling</Code></Error>"), Response(200, "OK", {}, b"OK")]
+        controller = AIMDController(max_concurrency=4, min_rate=100, max_rate=100)
+        client = PutClient(self.config_helper, transport=transport, congestion_controller=controller)
+        self.assertTrue(client.put_metric_data("namespace", [metric]))
+        self.assertEquals(2, transport.get.call_count)
+        self.assertEquals(1, controller.congestion_event_count)
+        self.assertEquals(2, controller.get_concurrency_limit())
+        self.assertFalse(self.logger.warning.called)
+
+    def test_client_error_is_not_retried_with_congestion_controller(self):
+        metric = MetricDataStatistic("metric_name", statistic_values=MetricDataStatistic.Statistics(20), namespace="namespace")
+        transport = MagicMock()
+        transport.get.return_value = Response(403, "Forbidden", {}, b"<Error><Code>InvalidClientTokenId</Code></Error>")
+        controller = AIMDController(min_rate=100, max_rate=100)
+        client = PutClient(self.config_helper, transport=transport, congestion_controller=controller)
+        self.assertFalse(client.put_metric_data("namespace", [metric]))
+        self.assertEquals(1, transport.get.call_count)
+        self.assertEquals(0, controller.congestion_event_count)
+        self.assertTrue(self.logger.warning.called)
+
+    def test_throttled_request_is_retried_a_limited_number_of_times(self):
+        metric = MetricDataStatistic("metric_name", statistic_values=MetricDataStatistic.Statistics(20), namespace="namespace")
+        transport = MagicMock()
+        transport.get.return_value = Response(503, "Service Unavailable", {}, b"")
+        client = PutClient(self.config_helper, transport=transport, congestion_controller=AIMDController(min_rate=100, max_rate=100))
+        self.assertFalse(client.put_metric_data("namespace", [metric]))
+        self.assertEquals(PutClient._MAX_CONGESTION_RETRIES + 1, transport.get.call_count)
+        self.assertTrue(self.logger.warning.called)
+
+    def test_unreachable_endpoint_fails_over_to_next_endpoint(self):
+        metric = MetricDataStatistic("metric_name", statistic_values=MetricDataStatistic.Statistics(20), namespace="namespace")
+        transport = MagicMock()
+        transport.get.side_effect = [ConnectionException("timeout"), Response(200, "OK", {}, b"OK")]
+        pool = EndpointPool(["http://primary:8080/", "http://secondary/"], failure_threshold=1)
+        client = PutClient(self.config_helper, transport=transport, endpoint_pool=pool)
+        self.assertTrue(client.put_metric_data("namespace", [metric]))
+        urls = [call[0][0] for call in transport.get.call_args_list]
+        self.assertTrue(urls[0].startswith("http://primary:8080/?"))
+        self.assertTrue(urls[1].startswith("http://secondary/?"))
+        self.assertEquals("secondary", client.request_builder._get_host())
+        self.assertTrue(pool.select() is pool.endpoints[1])
+
+    def test_open_circuit_breakers_fail_requests_at_once(self):
+        metric = MetricDataStatistic("metric_name", statistic_values=MetricDataStatistic.Statistics(20), namespace="namespace")
+        transport = MagicMock()
+        transport.get.side_effect = ConnectionException("timeout")
+        client = PutClient(self.config_helper, transport=transport, endpoint_pool=EndpointPool([self.config_helper.endpoint], failure_threshold=2))
+        client.endpoint_pool.endpoints[0].circuit_breaker._LOGGER = MagicMock()
+        for _ in range(5):
+            self.assertFalse(client.put_metric_data("namespace", [metric]))
+        self.assertEquals(2, transport.get.call_count)
+        self.assertFalse(client.prewarm())
+        self.assertTrue(self.logger.warning.called)
+
+    def test_requests_are_cut_to_the_timeout(self):
+        metric = MetricDataStatistic("metric_name", statistic_values=MetricDataStatistic.Statistics(20), namespace="namespace")
+        transport = MagicMock()
+        transport.get.return_value = Response(200, "OK", {}, b"OK")
+        client = PutClient(self.config_helper, transport=transport)
+        self.assertTrue(client.put_metric_data("namespace", [metric], timeout=2))
+        connection_timeout, response_timeout = transport.get.call_args[1]["timeout"]
+        self.assertEquals(1, connection_timeout)
+        self.assertTrue(1.5 < response_timeout <= 2)
+        self.assertFalse(client.put_metric_data("namespace", [metric], timeout=0))
+        self.assertEquals(1, transport.get.call_count)
+
+    def test_failover_stops_at_the_deadline(self):
+        metric = MetricDataStatistic("metric_name", statistic_values=MetricDataStatistic.Statistics(20), namespace="namespace")
+        transport = MagicMock()
+        transport.get.side_effect = lambda url, **kwargs: (time.sleep(0.3), Response(503, "Service Unavailable", {}, b""))[1]
+        client = PutClient(self.config_helper, transport=transport, endpoint_pool=EndpointPool(["http://primary/", "http://secondary/"], failure_threshold=5))
+        self.assertFalse(client.put_metric_data("namespace", [metric], timeout=0.2))
+        self.assertEquals(1, transport.get.call_count)
+        self.assertTrue(any("deadline" in call[0][0] for call in self.logger.warning.call_args_list))
+
+    def test_client_error_does_not_fail_over(self):
+        metric = MetricDataStatistic("metric_name", statistic_values=MetricDataStatistic.Statistics(20), namespace="namespace")
+        transport = MagicMock()
+        transport.get.return_value = Response(403, "Forbidden", {}, b"")
+        client = PutClient(self.config_helper, transport=transport, endpoint_pool=EndpointPool(["http://primary/", "http://secondary/"], failure_threshold=1))
+        self.assertFalse(client.put_metric_data("namespace", [metric]))
+        self.assertEquals(1, transport.get.call_count)
+
+    def test_rejected_metric_is_quarantined_and_other_metrics_are_published(self):
+        metrics = [MetricDataStatistic("metric_" + str(index), statistic_values=MetricDataStatistic.Statistics(index), namespace="namespace") for index in range(5)]
+        rejection = Response(400, "Bad Request", {}, b"<Error><Code>InvalidParameterValue</Code>"
+                                                     b"<Message>The value inf for parameter MetricData.member.4.StatisticValues.Maximum is invalid.</Message></Error>")
+        transport = MagicMock()
+        transport.get.side_effect = lambda url, **kwargs: rejection if "MetricName=metric_3&" in url else Response(200, "OK", {}, b"OK")
+        quarantine = MetricQuarantine()
+        quarantine._LOGGER = MagicMock()
+        client = PutClient(self.config_helper, transport=transport, metric_quarantine=quarantine)
+        self.assertTrue(client.put_metric_data("namespace", metrics))
+        self.assertTrue(quarantine.is_quarantined(metrics[3]))
+        self.assertFalse(any(quarantine.is_quarantined(metric) for metric in metrics[:3] + metrics[4:]))
+        self.assertTrue("MetricData.member.4.StatisticValues.Maximum is invalid." in quarantine._LOGGER.warning.call_args[0][0])
+        self.assertEquals(2, transport.get.call_count)
+        self.assertFalse("MetricName=metric_3&" in transport.get.call_args[0][0])
+        self.assertFalse(self.logger.warning.called)
+
+    def test_quarantined_metrics_are_not_sent(self):
+        metrics = [MetricDataStatistic("metric_" + str(index), statistic_values=MetricDataStatistic.Statistics(index), namespace="namespace") for index in range(2)]
+        transport = MagicMock()
+        transport.get.return_value = Response(200, "OK", {}, b"OK")
+        quarantine = MetricQuarantine()
+        quarantine._LOGGER = MagicMock()
+        quarantine.quarantine(metrics[0], "rejected")
+        client = PutClient(self.config_helper, transport=transport, metric_quarantine=quarantine)
+        self.assertTrue(client.put_metric_data("namespace", metrics))
+        self.assertFalse("MetricName=metric_0&" in transport.get.call_args[0][0])
+        self.assertTrue(client.put_metric_data("namespace", metrics[:1]))
+        self.assertEquals(1, transport.get.call_count)
+
+    def test_batch_without_accepted_metric_is_not_published(self):
+        metric = MetricDataStatistic("metric_name", statistic_values=MetricDataStatistic.Statistics(20), namespace="namespace")
+        transport = MagicMock()
+        transport.get.return_value = Response(400, "Bad Request", {}, b"<Error><Code>InvalidParameterValue</Code>"
+                                                                     b"<Message>The value for parameter MetricData.member.1.Value is invalid.</Message></Error>")
+        quarantine = MetricQuarantine()
+        quarantine._LOGGER = MagicMock()
+        client = PutClient(self.config_helper, transport=transport, metric_quarantine=quarantine)
+        self.assertFalse(client.put_metric_data("namespace", [metric]))
+        self.assertTrue(quarantine.is_quarantined(metric))
+        self.assertEquals(1, transport.get.call_count)
+
+    def test_rejection_of_the_whole_request_does_not_quarantine_metrics(self):
+        metrics = [MetricDataStatistic("metric_" + str(index), statistic_values=MetricDataStatistic.Statistics(index), namespace="namespace") for index in range(20)]
+        transport = MagicMock()
+        transport.get.return_value = Response(400, "Bad Request", {}, b"<Error><Code>InvalidParameterValue</Code>"
+                                                                     b"<Message>The value AWS/EC2 for parameter Namespace is invalid.</Message></Error>")
+        quarantine = MetricQuarantine()
+        quarantine._LOGGER = MagicMock()
+        client = PutClient(self.config_helper, transport=transport, metric_quarantine=quarantine)
+        self.assertFalse(client.put_metric_data("namespace", metrics))
+        self.assertEquals(1, transport.get.call_count)
+        self.assertFalse(any(quarantine.is_quarantined(metric) for metric in metrics))
+        self.assertTrue(self.logger.warning.called)
+
+    def test_other_client_errors_do_not_quarantine_metrics(self):
+        metrics = [MetricDataStatistic("metric_" + str(index), statistic_values=MetricDataStatistic.Statistics(index), namespace="namespace") for index in range(2)]
+        transport = MagicMock()
+        transport.get.return_value = Response(400, "Bad Request", {}, b"<Error><Code>MissingAuthenticationToken</Code></Error>")
+        client = PutClient(self.config_helper, transport=transport)
+        self.assertFalse(client.put_metric_data("namespace", metrics))
+        self.assertEquals(1, transport.get.call_count)
+
+    def test_sampled_requests_are_traced_with_transport_timings(self):
+        directory = tempfile.mkdtemp()
+        tracer = RequestTracer(os.path.join(directory, "request_trace.jsonl"), 1)
+        try:
+            metric = MetricDataStatistic("metric_name", statistic_values=MetricDataStatistic.Statistics(20), namespace="namespace")
+            client = PutClient(self.config_helper, request_tracer=tracer)
+            self.assertTrue(client.put_metric_data("namespace", [metric]))
+            client.transport.close()
+            self.assertTrue(tracer.wait_until_empty(5))
+            with open(tracer.path) as trace_file:
+                record = json.loads(trace_file.readline())
+            self.assertEquals((self.config_helper.endpoint, "namespace", 1, 200), (record["endpoint"], record["namespace"], record["batch_size"], record["status"]))
+            self.assertFalse(None in record["timings_ms"].values())
+            self.assertTrue("X-Amz-Signature=REDACTED" in record["request"])
+            self.assertFalse("access%2F" in record["request"])
+        finally:
+            tracer.close(5)
+            shutil.rmtree(directory)
+
+    def test_every_attempt_of_a_sampled_request_is_traced(self):
+        metric = MetricDataStatistic("metric_name", statistic_values=MetricDataStatistic.Statistics(20), namespace="namespace")
+        transport = MagicMock()
+        transport.get.side_effect = [ConnectionException("timeout"), Response(200, "OK", {}, b"OK")]
+        tracer = MagicMock()
+        client = PutClient(self.config_helper, transport=transport, endpoint_pool=EndpointPool(["http://primary/", "http://secondary/"], failure_threshold=1),
+                           request_tracer=tracer)
+        self.assertTrue(client.put_metric_data("namespace", [metric]))
+        self.assertEquals(["http://primary/", "http://secondary/"], [call[0][0] for call in tracer.start_trace.call_args_list])
+        trace = tracer.start_trace.return_value
+        self.assertEquals(["encode", "sign", "encode", "sign"], [call[0][0] for call in trace.mark.call_args_list])
+        failed_attempt, published_attempt = trace.finish.call_args_list
+        self.assertEquals("timeout", str(failed_attempt[1]["error"]))
+        self.assertEquals(200, published_attempt[0][1].status_code)
+
     def test_credentials_are_updated_in_the_put_client(self):
         metric = MetricDataStatistic(metric_name="test_metric", statistic_values=MetricDataStatistic.Statistics(20), namespace="testing_namespace")
         self.client.put_metric_data("testing_namespace", [metric])
@@ -0,0 +1,101 @@
+import os
+import unittest
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from mock import MagicMock, patch
+from cloudwatch.modules.metricdata import MetricDataStatistic
+from cloudwatch.modules.quarantine import MetricQuarantine, MetricValidator
+
+
+def get_metric(name="metric", dimensions=None, value=20):
+    return MetricDataStatistic(name, dimensions=dimensions or {"Host": "host", "PluginInstance": "0"},
+                               statistic_values=MetricDataStatistic.Statistics(value), timestamp="20171204T120000Z")
+
+
+class MetricValidatorTest(unittest.TestCase):
+
+    def test_valid_values(self):
+        self.assertTrue(MetricValidator.is_valid_value(0))
+        self.assertTrue(MetricValidator.is_valid_value("-1.5"))
+        self.assertTrue(MetricValidator.is_valid_value(2.0 ** 360))
+        self.assertFalse(MetricValidator.is_valid_value(2.0 ** 361))
+        self.assertFalse(MetricValidator.is_valid_value(float("inf")))
+        self.assertFalse(MetricValidator.is_valid_value(float("-inf")))
+        self.assertFalse(MetricValidator.is_valid_value(float("nan")))
+        self.assertFalse(MetricValidator.is_valid_value("value"))
+        self.assertFalse(MetricValidator.is_valid_value(None))
+
+    def test_valid_metric_has_no_violation(self):
+        self.assertEquals(None, MetricValidator.get_violation(get_metric()))
+
+    def test_out_of_range_statistics_are_violations(self):
+        metric = get_metric(value=2.0 ** 360)
+        metric.add_value(2.0 ** 360)
+        self.assertTrue(MetricValidator.get_violation(metric).startswith("sum "))
+        self.assertTrue(MetricValidator.get_violation(get_metric(value=float("inf"))).startswith("minimum "))
+
+    def test_dimension_constraints_are_violations(self):
+        self.assertTrue("FixedDimension" in MetricValidator.get_violation(get_metric(dimensions={"FixedDimension": " "})))
+        self.assertTrue("Host" in MetricValidator.get_violation(get_metric(dimensions={"Host": "h" * 1025})))
+        self.assertTrue(MetricValidator.get_violation(get_metric(dimensions={"d" * 256: "value"})) is not None)
+        self.assertTrue(MetricValidator.get_violation(get_metric(dimensions=dict(("d" + str(i), "v") for i in range(31)))) is not None)
+
+    def test_metric_name_and_values_are_required(self):
+        self.assertTrue(MetricValidator.get_violation(get_metric(name="")) is not None)
+        self.assertTrue(MetricValidator.get_violation(get_metric(name="m" * 256)) is not None)
+        self.assertTrue(MetricValidator.get_violation(MetricDataStatistic("metric", dimensions={"Host": "host"})) is not None)
+
+
+class MetricQuarantineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.time = 1000.0
+        patch("cloudwatch.modules.quarantine.clock.monotonic", side_effect=lambda: self.time).start()
+        self.directory = mkdtemp()
+        self.log_path = os.path.join(self.directory, "quarantined_metrics")
+        self.quarantine = MetricQuarantine(self.log_path, quarantine_duration_in_seconds=60)
+        self.quarantine._LOGGER = MagicMock()
+
+    def tearDown(self):
+        patch.stopall()
+        rmtree(self.directory)
+
+    def _read_log(self):
+        with open(self.log_path) as quarantine_file:
+            return [line for line in quarantine_file.read().splitlines() if not line.startswith("#")]
+
+    def test_log_is_created_with_first_reported_metric(self):
+        self.assertTrue(self.quarantine.accepts(get_metric()))
+        self.assertFalse(os.path.exists(self.log_path))
+        self.assertFalse(self.quarantine.accepts(get_metric(value=float("inf"))))
+        self.assertEquals(1, len(self._read_log()))
+        self.assertTrue(self._read_log()[0].startswith("metric{Host=host,PluginInstance=0} minimum inf"))
+
+    def test_quarantined_series_is_not_accepted_until_quarantine_expires(self):
+        self.quarantine.quarantine(get_metric(), "rejected")
+        self.assertFalse(self.quarantine.accepts(get_metric()))
+        self.assertTrue(self.quarantine.accepts(get_metric(dimensions={"Host": "other"})))
+        self.time += 60
+        self.assertTrue(self.quarantine.accepts(get_metric()))
+
+    def test_series_is_reported_once_per_quarantine_duration(self):
+        for _ in range(3):
+            self.quarantine.accepts(get_metric(value=float("inf")))
+        self.assertEquals(1, self.quarantine._LOGGER.warning.call_count)
+        self.time += 60
+        self.quarantine.accepts(get_metric(value=float("inf")))
+        self.assertEquals(2, self.quarantine._LOGGER.warning.call_count)
+        self.assertEquals(2, len(self._read_log()))
+
+    def test_publish_target_is_reported_with_quarantined_series(self):
+        quarantine = MetricQuarantine(target_name="dr")
+        quarantine._LOGGER = MagicMock()
+        quarantine.quarantine(get_metric(), "rejected")
+        self.assertTrue(quarantine._LOGGER.warning.call_args[0][0].startswith("Metric metric{Host=host,PluginInstance=0} is not published to publish target 'dr', "))
+
+    def test_unwritable_log_is_reported(self):
+        quarantine = MetricQuarantine(os.path.join(self.directory, "missing", "quarantined_metrics"))
+        quarantine._LOGGER = MagicMock()
+        quarantine.quarantine(get_metric(), "rejected")
+        self.assertEquals(2, quarantine._LOGGER.warning.call_count)
@@ -1,6 +1,6 @@
 import unittest
 
-from cloudwatch.modules.client.querystringbuilder import QuerystringBuilder
+from cloudwatch.modules.client.querystringbuilder import QuerystringBuilder, EncodedMetricDataCache
 from cloudwatch.modules.metricdata import MetricDataStatistic
 
 class QuerystringBuilderTest(unittest.TestCase):
@@ -35,6 +35,28 @@ class QuerystringBuilderTest(unittest.TestCase):
         metric_map = self.builder._build_metric_map(metric_list)
         assert_metric_map(metric_list, metric_map)
         
+    def test_querystring_from_encoded_metric_data_keeps_keys_sorted(self):
+        metric_list = [MetricDataStatistic("metric " + str(index), statistic_values=MetricDataStatistic.Statistics(index), dimensions={"Host": "a+b"}) for index in range(12)]
+        request_map = get_canonical_map()
+        request_map["Namespace"] = "name space"
+        expected = self.builder.build_querystring(metric_list, dict(request_map))
+        encoded_metric_data = self.builder.encode_metric_data(metric_list)
+        self.assertEquals(expected, self.builder.build_querystring_from_encoded_metric_data(encoded_metric_data, request_map))
+        self.assertEquals(self.builder.build_querystring([], dict(request_map)), self.builder.build_querystring_from_encoded_metric_data("", request_map))
+
+    def test_metric_data_is_encoded_once_per_cached_metric_list(self):
+        cache = EncodedMetricDataCache(max_entries=2)
+        metric_lists = [[MetricDataStatistic("metric", statistic_values=MetricDataStatistic.Statistics(index))] for index in range(3)]
+        encoded_metric_data = cache.get(metric_lists[0], self.builder)
+        self.assertTrue(cache.get(metric_lists[0], self.builder) is encoded_metric_data)
+        self.assertEquals(1, cache.hit_count)
+        self.assertEquals(self.builder.encode_metric_data(list(metric_lists[0])), cache.get(list(metric_lists[0]), self.builder))
+        self.assertEquals(1, cache.hit_count)
+        for metric_list in metric_lists[1:]:
+            cache.get(metric_list, self.builder)
+        cache.get(metric_lists[0], self.builder)
+        self.assertEquals(1, cache.hit_count)
+
     def test_build_querystring_with_no_metrics(self):
         querystring = self.builder.build_querystring([], get_canonical_map())
         assert_querystring(get_canonical_map(), querystring)
@@ -64,6 +86,16 @@ class QuerystringBuilderTest(unittest.TestCase):
         querystring = self.builder.build_querystring([metric1], get_canonical_map())
         self.assertTrue(self.builder._STORAGE_RESOLUTION in querystring)
 
+    def test_build_querystring_with_metric_storage_resolution(self):
+        metric1 = MetricDataStatistic("test_metric", statistic_values=MetricDataStatistic.Statistics(20), storage_resolution=1)
+        metric2 = MetricDataStatistic("test_metric2", statistic_values=MetricDataStatistic.Statistics(20), storage_resolution=60)
+        metric_map = self.builder._build_metric_map([metric1, metric2])
+        self.assertEquals("1", metric_map["MetricData.member.1." + self.builder._STORAGE_RESOLUTION])
+        self.assertFalse("MetricData.member.2." + self.builder._STORAGE_RESOLUTION in metric_map)
+        self.builder = QuerystringBuilder(True)
+        metric_map = self.builder._build_metric_map([metric2])
+        self.assertFalse("MetricData.member.1." + self.builder._STORAGE_RESOLUTION in metric_map)
+
     def test_build_map_with_statistics(self):
         dimensions1 = { "Dimension1": 20, "Dimension2": 30, "Host": "localhost" }
         metric = MetricDataStatistic("test_metric", dimensions=dimensions1)
@@ -1,10 +1,11 @@
 import unittest
 
+from mock import MagicMock
 from cloudwatch.modules.awscredentials import AWSCredentials
 from cloudwatch.modules.awsutils import get_datestamp
 from cloudwatch.modules.client.requestbuilder import RequestBuilder
 from cloudwatch.modules.metricdata import MetricDataStatistic
-from cloudwatch.modules.client.querystringbuilder import QuerystringBuilder#
+from cloudwatch.modules.client.querystringbuilder import QuerystringBuilder, EncodedMetricDataCache#
 
 class RequestBuilderTest(unittest.TestCase):
     
@@ -59,10 +60,30 @@ class RequestBuilderTest(unittest.TestCase):
         request = self.builder.create_signed_request(self.namespace, [metric])
         self.assertTrue("X-Amz-Security-Token" in request)
         
+    def test_encode_and_sign_phases_are_marked_in_the_trace(self):
+        trace = MagicMock()
+        metric = MetricDataStatistic("test_metric", statistic_values=MetricDataStatistic.Statistics(20))
+        self.builder.create_signed_request(self.namespace, [metric], trace=trace)
+        self.assertEquals(["encode", "sign"], [call[0][0] for call in trace.mark.call_args_list])
+
     def test_canonical_querystring_is_directly_created_by_querystring_builder(self):
         self.builder._init_timestamps()
         querystring_builder = QuerystringBuilder("10")
         metric = MetricDataStatistic("test_metric", statistic_values=MetricDataStatistic.Statistics(20))
         original_querystring = querystring_builder.build_querystring([metric], self.builder._get_request_map())
         generated_querystring = self.builder._create_canonical_querystring([metric])
-        self.assertEquals(original_querystring, generated_querystring)
\ No newline at end of file
+        self.assertEquals(original_querystring, generated_querystring)
+
+    def test_querystring_with_cached_metric_data_is_identical(self):
+        metric_list = [MetricDataStatistic("test_metric", statistic_values=MetricDataStatistic.Statistics(20), dimensions={"Host": "host name"}),
+                       MetricDataStatistic("other_metric", statistic_values=MetricDataStatistic.Statistics(10))]
+        cache = EncodedMetricDataCache()
+        cached_builder = RequestBuilder(AWSCredentials("access_key", "secret_key", "token"), self.region, "10", cache)
+        for builder in (self.builder, cached_builder):
+            builder.namespace = self.namespace
+            builder._init_timestamps()
+            builder.aws_timestamp, builder.datestamp = "20261019T120000Z", "20261019"
+        cached_builder.credentials = self.credentials
+        self.assertEquals(self.builder._create_canonical_querystring(metric_list), cached_builder._create_canonical_querystring(metric_list))
+        cached_builder._create_canonical_querystring(metric_list)
+        self.assertEquals(1, cache.hit_count)
@@ -0,0 +1,92 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import MagicMock, patch
+from cloudwatch.modules.client.requesttracer import RequestTracer, RequestTrace
+from cloudwatch.modules.client.transport import HTTPStatusException, Response
+
+
+class RequestTracerTest(unittest.TestCase):
+
+    SIGNED_REQUEST = ("Action=PutMetricData&Namespace=collectd&X-Amz-Credential=access%2F20261019%2Fus-east-1%2Fmonitoring%2Faws4_request"
+                      "&X-Amz-Security-Token=token&X-Amz-SignedHeaders=host&X-Amz-Signature=abcdef")
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "request_trace.jsonl")
+        self.tracer = RequestTracer(self.path, 1)
+        self.tracer._LOGGER = MagicMock()
+
+    def tearDown(self):
+        self.tracer.close(5)
+        shutil.rmtree(self.directory)
+
+    def test_requests_are_sampled_with_the_sample_rate(self):
+        self.assertTrue(isinstance(self.tracer.start_trace("https://monitoring.us-east-1.amazonaws.com/", "collectd", 20), RequestTrace))
+        self.tracer.sample_rate = 0
+        self.assertEquals(None, self.tracer.start_trace("https://monitoring.us-east-1.amazonaws.com/", "collectd", 20))
+        self.tracer.sample_rate = 0.1
+        with patch.object(self.tracer._random, "random", side_effect=[0.05, 0.1]):
+            self.assertFalse(self.tracer.start_trace("https://monitoring.us-east-1.amazonaws.com/", "collectd", 20) is None)
+            self.assertTrue(self.tracer.start_trace("https://monitoring.us-east-1.amazonaws.com/", "collectd", 20) is None)
+
+    def test_trace_is_written_with_timings_and_redacted_credentials(self):
+        trace = self.tracer.start_trace("https://monitoring.us-east-1.amazonaws.com/", "collectd", 20)
+        trace.mark("encode")
+        trace.mark("sign")
+        response = Response(200, "OK", {}, b"")
+        response.connect_time = 0.0125
+        response.first_byte_time = 0.05
+        trace.finish(self.SIGNED_REQUEST, response)
+        record = self._read_records()[0]
+        self.assertEquals(("https://monitoring.us-east-1.amazonaws.com/", "collectd", 20, 200, None),
+                          (record["endpoint"], record["namespace"], record["batch_size"], record["status"], record["error"]))
+        self.assertEquals(["connect", "encode", "sign", "total", "ttfb"], sorted(record["timings_ms"].keys()))
+        self.assertEquals((12.5, 50.0), (record["timings_ms"]["connect"], record["timings_ms"]["ttfb"]))
+        self.assertTrue(record["timings_ms"]["total"] >= record["timings_ms"]["encode"] >= 0)
+        self.assertEquals("Action=PutMetricData&Namespace=collectd&X-Amz-Credential=REDACTED&X-Amz-Security-Token=REDACTED"
+                          "&X-Amz-SignedHeaders=host&X-Amz-Signature=REDACTED", record["request"])
+
+    def test_failed_request_is_traced_with_error_status(self):
+        trace = self.tracer.start_trace("https://monitoring.us-east-1.amazonaws.com/", "collectd", 1)
+        trace.finish(self.SIGNED_REQUEST, error=HTTPStatusException("400 Client Error: Bad Request", Response(400, "Bad Request", {}, b"")))
+        trace = self.tracer.start_trace("https://monitoring.us-east-1.amazonaws.com/", "collectd", 1)
+        trace.finish(self.SIGNED_REQUEST, error=Exception("timeout"))
+        records = self._read_records()
+        self.assertEquals([(400, "400 Client Error: Bad Request"), (None, "timeout")], [(record["status"], record["error"]) for record in records])
+        self.assertEquals((None, None), (records[1]["timings_ms"]["connect"], records[1]["timings_ms"]["encode"]))
+
+    def test_records_are_dropped_when_the_queue_is_full(self):
+        self.tracer.max_queued_records = 1
+        with self.tracer._condition:
+            self.tracer.record({"batch_size": 1})
+            self.tracer.record({"batch_size": 2})
+        self.assertEquals(1, self.tracer.dropped_record_count)
+        self.assertEquals([{"batch_size": 1}], self._read_records())
+
+    def test_trace_file_is_rotated(self):
+        self.tracer.max_file_size = 10
+        self.tracer.record({"batch_size": 1})
+        self.assertTrue(self.tracer.wait_until_empty(5))
+        self.tracer.record({"batch_size": 2})
+        self.assertEquals([{"batch_size": 2}], self._read_records())
+        with open(self.path + ".1") as rotated_file:
+            self.assertEquals({"batch_size": 1}, json.loads(rotated_file.readline()))
+
+    def test_unwritable_file_is_logged(self):
+        self.tracer.path = self.directory
+        self.tracer.record({"batch_size": 1})
+        self.assertTrue(self.tracer.wait_until_empty(5))
+        self.assertTrue(self.tracer._LOGGER.warning.called)
+
+    def test_closed_tracer_does_not_sample_requests(self):
+        self.tracer.close(5)
+        self.assertEquals(None, self.tracer.start_trace("https://monitoring.us-east-1.amazonaws.com/", "collectd", 20))
+
+    def _read_records(self):
+        self.assertTrue(self.tracer.wait_until_empty(5))
+        with open(self.path) as trace_file:
+            return [json.loads(line) for line in trace_file]
@@ -0,0 +1,69 @@
+import unittest
+
+from mock import Mock, MagicMock
+
+from cloudwatch.modules.configuration.rollup import Rollups, RollupRule, RollupConfigReader
+from cloudwatch.modules.memorygovernor import MemoryGovernor
+
+
+class RollupTest(unittest.TestCase):
+    CONFIG_DIR = "./test/config_files/"
+    ROLLUP_CONFIG = CONFIG_DIR + "rollup.conf"
+    MISSING_ROLLUP_CONFIG = CONFIG_DIR + "no_rollup.conf"
+
+    def setUp(self):
+        self.logger = Mock()
+        RollupConfigReader._LOGGER = self.logger
+
+    def test_valid_rules_are_read_from_file(self):
+        rules = RollupConfigReader(self.ROLLUP_CONFIG).get_rules()
+        self.assertEquals(3, len(rules))
+        self.assertTrue(rules[0].collapse_plugin_instance)
+        self.assertFalse(rules[0].collapse_type_instance)
+        self.assertTrue(rules[0].drop_source)
+        self.assertTrue(rules[1].collapse_plugin_instance)
+        self.assertTrue(rules[1].collapse_type_instance)
+        self.assertFalse(rules[1].drop_source)
+        self.assertTrue(rules[2].collapse_plugin_instance)
+        self.assertFalse(rules[2].drop_source)
+
+    def test_invalid_rules_are_logged_and_ignored(self):
+        RollupConfigReader(self.ROLLUP_CONFIG).get_rules()
+        self.assertEquals(2, self.logger.warning.call_count)
+        self.logger.warning.assert_called_with("The rollup rule: 'swap-.* drop_source=maybe' is invalid, reason: 'maybe' does not specify boolean value")
+
+    def test_missing_file_disables_rollups(self):
+        self.assertEquals([], RollupConfigReader(self.MISSING_ROLLUP_CONFIG).get_rules())
+        self.assertFalse(self.logger.warning.called)
+
+    def test_get_rule_returns_first_matching_rule(self):
+        rollups = Rollups(RollupConfigReader(self.ROLLUP_CONFIG).get_rules())
+        self.assertEquals(rollups.rules[0], rollups.get_rule("cpu-0-cpu-user"))
+        self.assertEquals(rollups.rules[1], rollups.get_rule("interface-eth0-if_octets-rx"))
+        self.assertEquals(None, rollups.get_rule("memory--memory-used"))
+
+    def test_evicted_rules_are_matched_again(self):
+        rollups = Rollups(RollupConfigReader(self.ROLLUP_CONFIG).get_rules())
+        governor = MemoryGovernor(budget_in_bytes=1)
+        rollups.register_caches(governor)
+        self.assertEquals(rollups.rules[0], rollups.get_rule("cpu-0-cpu-user"))
+        self.assertEquals(None, rollups.get_rule("memory--memory-used"))
+        self.assertEquals(["rollup_rules"], list(governor.get_usage().keys()))
+        governor.enforce()
+        self.assertEquals(2, governor.evicted_entry_count)
+        self.assertEquals(0, governor.get_usage()["rollup_rules"])
+        self.assertEquals(rollups.rules[0], rollups.get_rule("cpu-0-cpu-user"))
+        self.assertEquals(None, rollups.get_rule("memory--memory-used"))
+
+    def test_build_rollup_value_list_replaces_collapsed_parts(self):
+        vl = MagicMock()
+        vl.plugin, vl.plugin_instance, vl.type, vl.type_instance, vl.values = "interface", "eth0", "if_octets", "rx", [10]
+        rollup_vl = RollupRule("interface-.*", [RollupRule.PLUGIN_INSTANCE]).build_rollup_value_list(vl)
+        self.assertEquals(("interface", "ALL", "if_octets", "rx", [10]),
+                          (rollup_vl.plugin, rollup_vl.plugin_instance, rollup_vl.type, rollup_vl.type_instance, rollup_vl.values))
+        rollup_vl = RollupRule("interface-.*", [RollupRule.PLUGIN_INSTANCE, RollupRule.TYPE_INSTANCE]).build_rollup_value_list(vl)
+        self.assertEquals(("ALL", "ALL"), (rollup_vl.plugin_instance, rollup_vl.type_instance))
+
+    def test_rule_with_unknown_collapse_part_is_invalid(self):
+        with self.assertRaises(ValueError):
+            RollupRule("memory-.*", ["host"])
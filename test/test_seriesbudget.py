@@ -0,0 +1,93 @@
+import unittest
+
+from mock import Mock
+
+from cloudwatch.modules.metricdata import MetricDataStatistic
+from cloudwatch.modules.seriesbudget import SeriesBudget
+
+
+class SeriesBudgetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = Mock()
+        SeriesBudget._LOGGER = self.logger
+        self.budget = SeriesBudget(default_budget=2, plugin_budgets={"processes": 3, "tail": 1})
+
+    def test_budget_is_disabled_by_default(self):
+        budget = SeriesBudget()
+        self.assertFalse(budget.enabled)
+        self.assertEquals(None, budget.admit("processes", "key", self._get_metrics(10), Mock()))
+        self.assertEquals({}, budget.get_usage())
+
+    def test_plugin_budgets_override_default_budget(self):
+        self.assertTrue(self.budget.enabled)
+        self.assertEquals(3, self.budget.get_budget("processes"))
+        self.assertEquals(1, self.budget.get_budget("tail"))
+        self.assertEquals(2, self.budget.get_budget("cpu"))
+
+    def test_series_within_budget_are_admitted(self):
+        self.assertEquals(None, self.budget.admit("cpu", "cpu-0", self._get_metrics(10), Mock()))
+        self.assertEquals(None, self.budget.admit("cpu", "cpu-1", self._get_metrics(10), Mock()))
+        self.assertEquals(None, self.budget.admit("memory", "memory", self._get_metrics(10), Mock()))
+        self.assertEquals({"cpu": 2, "memory": 1}, self.budget.get_usage())
+
+    def test_merged_series_over_budget_are_returned(self):
+        shard_budgets = [self.budget.renew(), self.budget.renew()]
+        value_list = Mock()
+        metric_map = {"cpu-0": self._get_metrics(5), "cpu-1": self._get_metrics(1), "cpu-2": self._get_metrics(2), "tail-0": self._get_metrics(1)}
+        shard_budgets[0].admit("cpu", "cpu-0", self._get_metrics(1), Mock())
+        shard_budgets[0].admit("cpu", "cpu-1", self._get_metrics(1), value_list)
+        shard_budgets[0].admit("tail", "tail-0", self._get_metrics(1), Mock())
+        shard_budgets[1].admit("cpu", "cpu-0", self._get_metrics(4), Mock())
+        shard_budgets[1].admit("cpu", "cpu-2", self._get_metrics(2), Mock())
+        self.assertEquals([("cpu-1", metric_map["cpu-1"], value_list)], self.budget.merge(shard_budgets, metric_map))
+        self.assertEquals({"cpu": 1}, self.budget.folded_series_count)
+
+    def test_lightest_series_is_evicted_when_over_budget(self):
+        value_list = Mock()
+        lightest_metrics = self._get_metrics(-1)
+        self.budget.admit("cpu", "cpu-0", self._get_metrics(10), Mock())
+        self.budget.admit("cpu", "cpu-1", lightest_metrics, value_list)
+        self.assertEquals(("cpu-1", lightest_metrics, value_list), self.budget.admit("cpu", "cpu-2", self._get_metrics(0), Mock()))
+        self.assertEquals({"cpu": 2}, self.budget.get_usage())
+        self.assertEquals({"cpu": 1}, self.budget.folded_series_count)
+
+    def test_new_series_inherits_weight_of_evicted_series(self):
+        self.budget.admit("cpu", "cpu-0", self._get_metrics(5), Mock())
+        self.budget.admit("cpu", "cpu-1", self._get_metrics(3), Mock())
+        self.budget.admit("cpu", "cpu-2", self._get_metrics(3), Mock())  # evicts cpu-1, weight 3 + 3
+        evicted = self.budget.admit("cpu", "cpu-3", self._get_metrics(0), Mock())
+        self.assertEquals("cpu-0", evicted[0])
+
+    def test_weight_aggregated_after_admission_is_used_for_eviction(self):
+        growing_metrics = self._get_metrics(1)
+        self.budget.admit("cpu", "cpu-0", growing_metrics, Mock())
+        self.budget.admit("cpu", "cpu-1", self._get_metrics(5), Mock())
+        growing_metrics[0].add_value(10)
+        self.assertEquals("cpu-1", self.budget.admit("cpu", "cpu-2", self._get_metrics(0), Mock())[0])
+        self.assertEquals("cpu-2", self.budget.admit("cpu", "cpu-3", self._get_metrics(0), Mock())[0])
+
+    def test_exceeded_budget_is_logged_once_per_plugin(self):
+        for index in range(5):
+            self.budget.admit("tail", "tail-" + str(index), self._get_metrics(index), Mock())
+        self.assertEquals(1, self.logger.warning.call_count)
+        self.assertEquals({"tail": 4}, self.budget.folded_series_count)
+
+    def test_renewed_budget_counts_no_series(self):
+        self.budget.admit("cpu", "cpu-0", self._get_metrics(10), Mock())
+        budget = self.budget.renew()
+        self.assertEquals({}, budget.get_usage())
+        self.assertEquals({"cpu": 1}, self.budget.get_usage())
+        self.assertEquals(3, budget.get_budget("processes"))
+
+    def test_renewed_budget_keeps_folded_series_count_and_logs_exceeded_budget_once(self):
+        for index in range(3):
+            self.budget.admit("tail", "tail-" + str(index), self._get_metrics(index), Mock())
+        budget = self.budget.renew()
+        for index in range(3):
+            budget.admit("tail", "tail-" + str(index), self._get_metrics(index), Mock())
+        self.assertEquals({"tail": 4}, budget.folded_series_count)
+        self.assertEquals(1, self.logger.warning.call_count)
+
+    def _get_metrics(self, value):
+        return [MetricDataStatistic("metric", statistic_values=MetricDataStatistic.Statistics(value))]
@@ -0,0 +1,131 @@
+import unittest
+
+from mock import Mock, patch
+
+from cloudwatch.modules import seriesstore
+from cloudwatch.modules.metricdata import MetricDataStatistic
+from cloudwatch.modules.seriesstore import SeriesRegistry, StatisticsColumns, ColumnStatistics
+
+
+class SeriesRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = SeriesRegistry()
+
+    def test_series_id_is_stable(self):
+        first_id = self.registry.get_id(self._get_value_list("cpu", "0", "cpu", "user"))
+        second_id = self.registry.get_id(self._get_value_list("cpu", "1", "cpu", "user"))
+        self.assertEquals(0, first_id)
+        self.assertEquals(1, second_id)
+        self.assertEquals(first_id, self.registry.get_id(self._get_value_list("cpu", "0", "cpu", "user")))
+        self.assertEquals(2, len(self.registry))
+
+    def test_get_key_returns_metric_key(self):
+        series_id = self.registry.get_id(self._get_value_list("df", "root", "df_complex", "free"))
+        self.assertEquals("df-root-df_complex-free", self.registry.get_key(series_id))
+
+    def test_series_with_empty_instances_are_unique(self):
+        first_id = self.registry.get_id(self._get_value_list("plugin", "", "type", "a-b"))
+        second_id = self.registry.get_id(self._get_value_list("plugin", "a", "type", "b"))
+        self.assertNotEquals(first_id, second_id)
+
+    def test_evicted_series_ids_are_reused_after_next_rotation(self):
+        evicted_id = self.registry.get_id(self._get_value_list("processes", "1", "ps_rss", ""))
+        self.registry.rotate()
+        self.assertEquals({("processes", "1", "ps_rss", ""): evicted_id}, self.registry.rotate())
+        self.assertEquals("processes-1-ps_rss-", self.registry.get_key(evicted_id))
+        self.assertEquals(1, self.registry.get_id(self._get_value_list("processes", "2", "ps_rss", "")))
+        self.registry.rotate()
+        self.assertEquals(evicted_id, self.registry.get_id(self._get_value_list("processes", "3", "ps_rss", "")))
+        self.assertEquals("processes-3-ps_rss-", self.registry.get_key(evicted_id))
+
+    def test_series_used_since_rotation_are_kept(self):
+        series_id = self.registry.get_id(self._get_value_list("cpu", "0", "cpu", "user"))
+        self.registry.rotate()
+        self.assertEquals(series_id, self.registry.get_id(self._get_value_list("cpu", "0", "cpu", "user")))
+        self.assertEquals({}, self.registry.rotate())
+        self.assertEquals(1, len(self.registry))
+        self.assertTrue(self.registry.get_approximate_size() > 0)
+
+    def _get_value_list(self, plugin, plugin_instance, type, type_instance):
+        return Mock(plugin=plugin, plugin_instance=plugin_instance, type=type, type_instance=type_instance)
+
+
+class StatisticsColumnsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.columns = StatisticsColumns()
+
+    def test_allocate_appends_empty_slots(self):
+        self.assertEquals(0, self.columns.allocate())
+        self.assertEquals(1, self.columns.allocate())
+        self.assertEquals(2, len(self.columns))
+        self.assertEquals(0, self.columns.get_statistics(1).sample_count)
+
+    def test_released_slot_is_reset_and_reused(self):
+        slot = self.columns.allocate()
+        self.columns.allocate()
+        self.columns.add_value(slot, 10)
+        self.columns.release(slot)
+        self.assertEquals(1, len(self.columns))
+        self.assertEquals(slot, self.columns.allocate())
+        self._assert_statistics(self.columns.get_statistics(slot), float("inf"), float("-inf"), 0, 0)
+        self.assertEquals(2, len(self.columns.count))
+
+    def test_add_value(self):
+        slot = self.columns.allocate()
+        for value in [10, -50, 20, -10]:
+            self.columns.add_value(slot, value)
+        self._assert_statistics(self.columns.get_statistics(slot), -50, 20, -30, 4)
+
+    def test_add_values_without_numpy(self):
+        slot = self.columns.allocate()
+        self.columns.add_value(slot, 5)
+        with patch.object(seriesstore, "numpy", None):
+            self.columns.add_values(slot, range(1, 101))
+        self._assert_statistics(self.columns.get_statistics(slot), 1, 100, 5055, 101)
+
+    def test_add_values_with_numpy_kernel(self):
+        if seriesstore._get_numpy() is None:
+            self.skipTest("NumPy is not installed")
+        slot = self.columns.allocate()
+        self.columns.add_value(slot, 500)
+        self.columns.add_values(slot, range(1, 101))
+        self._assert_statistics(self.columns.get_statistics(slot), 1, 500, 5550, 101)
+
+    def test_add_values_ignores_empty_batch(self):
+        slot = self.columns.allocate()
+        self.columns.add_values(slot, [])
+        self.assertEquals(0, self.columns.get_statistics(slot).sample_count)
+
+    def test_merge(self):
+        slot = self.columns.allocate()
+        self.columns.add_value(slot, 10)
+        statistics = MetricDataStatistic.Statistics(-5)
+        statistics._add_value(30)
+        self.columns.merge(slot, statistics)
+        self._assert_statistics(self.columns.get_statistics(slot), -5, 30, 35, 3)
+
+    def test_detach_copies_statistics_and_releases_slot(self):
+        slot = self.columns.allocate()
+        self.columns.add_values(slot, [3, 1, 2])
+        statistics = self.columns.detach(slot)
+        self.assertTrue(isinstance(statistics, MetricDataStatistic.Statistics))
+        self._assert_statistics(statistics, 1, 3, 6, 3)
+        self.assertEquals(0, len(self.columns))
+
+    def test_detach_empty_slot_returns_none(self):
+        self.assertEquals(None, self.columns.detach(self.columns.allocate()))
+
+    def test_column_statistics_can_be_used_by_metric(self):
+        metric = MetricDataStatistic(metric_name="metric", statistic_values=self.columns.get_statistics(self.columns.allocate()))
+        metric.add_value(10)
+        metric.merge_statistics(MetricDataStatistic.Statistics(20))
+        self.assertTrue(isinstance(metric.statistics, ColumnStatistics))
+        self._assert_statistics(metric.statistics, 10, 20, 30, 2)
+
+    def _assert_statistics(self, statistics, min, max, sum, sample_count):
+        self.assertEquals(min, statistics.min)
+        self.assertEquals(max, statistics.max)
+        self.assertEquals(sum, statistics.sum)
+        self.assertEquals(sample_count, statistics.sample_count)
@@ -0,0 +1,177 @@
+import threading
+import time
+import unittest
+
+from mock import MagicMock
+from cloudwatch.modules.sinks import Sink, SinkFanout
+from cloudwatch.modules.metricdata import MetricDataStatistic
+
+
+class BlockingClient(object):
+    """ Client recording the published batches, blocked until released """
+
+    def __init__(self, blocked=False, result=True):
+        self.batches = []
+        self.prewarm_count = 0
+        self.result = result
+        self.released = threading.Event()
+        if not blocked:
+            self.released.set()
+
+    def put_metric_data(self, namespace, metric_list):
+        self.released.wait(5)
+        self.batches.append(metric_list)
+        return self.result
+
+    def prewarm(self):
+        self.prewarm_count += 1
+        return True
+
+
+class SinkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sinks = []
+
+    def tearDown(self):
+        for sink in self.sinks:
+            sink.client.released.set()
+            sink.close(1)
+
+    def _create_sink(self, client, max_queued_batches=Sink.DEFAULT_MAX_QUEUED_BATCHES):
+        sink = Sink("test", client, max_queued_batches)
+        sink._LOGGER = MagicMock()
+        self.sinks.append(sink)
+        return sink
+
+    def test_queued_batches_are_published_by_worker(self):
+        sink = self._create_sink(BlockingClient())
+        queued_batches = [sink.put(MetricDataStatistic.NAMESPACE, [index]) for index in range(3)]
+        self.assertTrue(sink.wait_until_empty(5))
+        self.assertEquals([[0], [1], [2]], sink.client.batches)
+        self.assertEquals([True] * 3, [queued_batch.wait(0) for queued_batch in queued_batches])
+        self.assertEquals(3, sink.published_batch_count)
+
+    def test_failed_batches_are_counted(self):
+        sink = self._create_sink(BlockingClient(result=False))
+        self.assertFalse(sink.put(MetricDataStatistic.NAMESPACE, [1]).wait(5))
+        self.assertEquals(1, sink.failed_batch_count)
+
+    def test_failure_callback_is_called_with_unpublished_batch(self):
+        failed_batches = []
+        sink = self._create_sink(BlockingClient(result=False))
+        self.assertFalse(sink.put(MetricDataStatistic.NAMESPACE, [1], failed_batches.append).wait(5))
+        sink.client.result = True
+        self.assertTrue(sink.put(MetricDataStatistic.NAMESPACE, [2], failed_batches.append).wait(5))
+        self.assertEquals([[1]], failed_batches)
+
+    def test_client_exception_does_not_stop_worker(self):
+        client = BlockingClient()
+        client.put_metric_data = MagicMock(side_effect=[Exception("failure"), True])
+        sink = self._create_sink(client)
+        self.assertFalse(sink.put(MetricDataStatistic.NAMESPACE, [1]).wait(5))
+        self.assertTrue(sink.put(MetricDataStatistic.NAMESPACE, [2]).wait(5))
+        self.assertTrue(sink._LOGGER.warning.called)
+
+    def test_full_queue_drops_oldest_batch(self):
+        sink = self._create_sink(BlockingClient(blocked=True), max_queued_batches=2)
+        sink.put(MetricDataStatistic.NAMESPACE, [0])
+        self.assertFalse(sink.wait_until_empty(0.1))
+        dropped_batch = sink.put(MetricDataStatistic.NAMESPACE, [1])
+        sink.put(MetricDataStatistic.NAMESPACE, [2])
+        sink.put(MetricDataStatistic.NAMESPACE, [3])
+        self.assertFalse(dropped_batch.wait(0))
+        self.assertEquals(1, sink.dropped_batch_count)
+        sink.client.released.set()
+        self.assertTrue(sink.wait_until_empty(5))
+        self.assertEquals([[0], [2], [3]], sink.client.batches)
+
+    def test_prewarm_is_queued_once(self):
+        sink = self._create_sink(BlockingClient(blocked=True))
+        sink.put(MetricDataStatistic.NAMESPACE, [0])
+        sink.prewarm()
+        sink.prewarm()
+        sink.client.released.set()
+        self.assertTrue(sink.wait_until_empty(5))
+        self.assertEquals(1, sink.client.prewarm_count)
+
+    def test_close_returns_unpublished_batches(self):
+        sink = self._create_sink(BlockingClient(blocked=True))
+        sink.put(MetricDataStatistic.NAMESPACE, [0])
+        queued_batch = sink.put(MetricDataStatistic.NAMESPACE, [1])
+        self.assertEquals([queued_batch], sink.close(0.1))
+        self.assertFalse(queued_batch.wait(0))
+        self.assertFalse(sink.put(MetricDataStatistic.NAMESPACE, [2]).wait(0))
+        self.assertTrue(sink._LOGGER.warning.called)
+
+
+class SinkFanoutTest(unittest.TestCase):
+
+    def setUp(self):
+        self.slow_client = BlockingClient(blocked=True)
+        self.fast_client = BlockingClient()
+        self.fanout = SinkFanout([Sink("slow", self.slow_client), Sink("fast", self.fast_client)])
+
+    def tearDown(self):
+        self.slow_client.released.set()
+        self.fanout.close(1)
+
+    def test_slow_sink_does_not_block_other_sinks(self):
+        start = time.time()
+        self.fanout.put_metric_batches(MetricDataStatistic.NAMESPACE, [[0], [1]])
+        self.assertTrue(time.time() - start < 1)
+        self.assertTrue(self.fanout.sinks[1].wait_until_empty(5))
+        self.assertEquals([[0], [1]], self.fast_client.batches)
+        self.assertFalse(self.fanout.wait_for_pending_flushes(0.1))
+        self.slow_client.released.set()
+        self.assertTrue(self.fanout.wait_for_pending_flushes(5))
+        self.assertEquals([[0], [1]], self.slow_client.batches)
+
+    def test_put_metric_data_waits_for_all_sinks(self):
+        self.slow_client.released.set()
+        self.assertTrue(self.fanout.put_metric_data(MetricDataStatistic.NAMESPACE, [0]))
+        self.slow_client.result = False
+        self.assertFalse(self.fanout.put_metric_data(MetricDataStatistic.NAMESPACE, [1]))
+
+    def test_put_metric_data_to_sinks_returns_sinks_which_did_not_publish(self):
+        self.slow_client.released.set()
+        self.slow_client.result = False
+        self.assertEquals(["slow"], self.fanout.put_metric_data_to_sinks(MetricDataStatistic.NAMESPACE, [0]))
+        self.slow_client.result = True
+        self.assertEquals([], self.fanout.put_metric_data_to_sinks(MetricDataStatistic.NAMESPACE, [1]))
+
+    def test_batches_are_queued_to_named_sinks_only(self):
+        self.slow_client.released.set()
+        self.fanout.put_metric_batches(MetricDataStatistic.NAMESPACE, [[0]], sink_names=["fast"])
+        self.assertTrue(self.fanout.wait_for_pending_flushes(5))
+        self.assertEquals([], self.slow_client.batches)
+        self.assertEquals([[0]], self.fast_client.batches)
+
+    def test_put_metric_data_gives_up_on_slow_sink_after_timeout(self):
+        self.fanout.put_metric_batches(MetricDataStatistic.NAMESPACE, [[0]])
+        start = time.time()
+        self.assertFalse(self.fanout.put_metric_data(MetricDataStatistic.NAMESPACE, [1], timeout=0.2))
+        self.assertTrue(time.time() - start < 1)
+        self.slow_client.released.set()
+        self.assertTrue(self.fanout.wait_for_pending_flushes(5))
+        self.assertEquals([[0]], self.slow_client.batches)
+        self.assertEquals([[0], [1]], self.fast_client.batches)
+
+    def test_close_returns_batches_with_sinks_which_did_not_publish_them(self):
+        self.fanout.sinks[0]._LOGGER = self.fanout.sinks[1]._LOGGER = MagicMock()
+        self.fast_client.released.clear()
+        self.fanout.put_metric_batches(MetricDataStatistic.NAMESPACE, [[0], [1]])
+        self.fast_client.released.set()
+        self.assertTrue(self.fanout.sinks[1].wait_until_empty(5))
+        self.fast_client.released.clear()
+        self.fanout.sinks[1].put(MetricDataStatistic.NAMESPACE, ["busy"])
+        self.fanout.put_metric_batches(MetricDataStatistic.NAMESPACE, [[2]])
+        unsent_batches = sorted(self.fanout.close(0.1), key=lambda unsent_batch: unsent_batch[1])
+        self.fast_client.released.set()
+        self.assertEquals([(MetricDataStatistic.NAMESPACE, [1], ["slow"]), (MetricDataStatistic.NAMESPACE, [2], None)], unsent_batches)
+
+    def test_prewarm_is_handed_to_every_sink(self):
+        self.slow_client.released.set()
+        self.assertTrue(self.fanout.prewarm())
+        self.assertTrue(self.fanout.wait_for_pending_flushes(5))
+        self.assertEquals([1, 1], [self.slow_client.prewarm_count, self.fast_client.prewarm_count])
@@ -0,0 +1,70 @@
+import unittest
+import os
+
+from tempfile import mkdtemp
+from shutil import rmtree
+
+from cloudwatch.modules.metricdata import MetricDataStatistic
+from cloudwatch.modules.snapshot import AggregationSnapshot
+
+
+class AggregationSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.path = os.path.join(self.directory, "aggregation_snapshot")
+        self.snapshot = AggregationSnapshot(self.path)
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def test_saved_metrics_are_loaded(self):
+        statistics = MetricDataStatistic.Statistics(10)
+        statistics._add_value(-5)
+        metric = MetricDataStatistic(metric_name="cpu.cpu.user", dimensions={"Host": "host", "PluginInstance": "0"},
+                                     statistic_values=statistics, timestamp="20170101T000000Z", storage_resolution=60,
+                                     sibling_dimensions=[{"AutoScalingGroup": "asg"}])
+        self.assertEquals(1, self.snapshot.save([("cpu-0-cpu-user", [metric], None)]))
+        entries = self.snapshot.load()
+        self.assertEquals(1, len(entries))
+        key, dimension_metrics, sink_names = entries[0]
+        restored = dimension_metrics[0]
+        self.assertEquals("cpu-0-cpu-user", key)
+        self.assertEquals(None, sink_names)
+        self.assertTrue(isinstance(key, str))
+        self.assertEquals("cpu.cpu.user", restored.metric_name)
+        self.assertEquals({"Host": "host", "PluginInstance": "0"}, restored.dimensions)
+        self.assertEquals([{"AutoScalingGroup": "asg"}], restored.sibling_dimensions)
+        self.assertEquals("20170101T000000Z", restored.timestamp)
+        self.assertEquals(60, restored.storage_resolution)
+        self.assertEquals(MetricDataStatistic.NAMESPACE, restored.namespace)
+        self.assertEquals((-5, 10, 5, 2), (restored.statistics.min, restored.statistics.max, restored.statistics.sum,
+                                           restored.statistics.sample_count))
+
+    def test_rows_without_namespace_are_loaded_without_namespace(self):
+        with open(self.path, "w") as snapshot_file:
+            snapshot_file.write("[[\"key\", \"metric\", {}, [], \"20170101T000000Z\", 60, 1, 1, 1, 1]]")
+        key, dimension_metrics, sink_names = self.snapshot.load()[0]
+        self.assertEquals(None, dimension_metrics[0].namespace)
+        self.assertEquals(None, sink_names)
+
+    def test_sink_names_are_saved_per_entry(self):
+        self.snapshot.save([("key", [MetricDataStatistic(metric_name="metric", statistic_values=MetricDataStatistic.Statistics(1))], ["jsonl"]),
+                            ("key", [MetricDataStatistic(metric_name="metric", statistic_values=MetricDataStatistic.Statistics(2))], None)])
+        entries = sorted((sink_names or [], dimension_metrics[0].statistics.sum) for _, dimension_metrics, sink_names in self.snapshot.load())
+        self.assertEquals([([], 2), (["jsonl"], 1)], entries)
+
+    def test_metrics_without_values_are_not_saved(self):
+        self.assertEquals(0, self.snapshot.save([("key", [MetricDataStatistic(metric_name="metric")], None)]))
+
+    def test_snapshot_is_removed_after_load(self):
+        self.snapshot.save([("key", [MetricDataStatistic(metric_name="metric", statistic_values=MetricDataStatistic.Statistics(1))], None)])
+        self.snapshot.load()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEquals([], self.snapshot.load())
+
+    def test_invalid_snapshot_is_discarded(self):
+        with open(self.path, "w") as snapshot_file:
+            snapshot_file.write("[[\"key\", \"metric\"]")
+        self.assertEquals([], self.snapshot.load())
+        self.assertFalse(os.path.exists(self.path))
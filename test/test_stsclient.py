@@ -0,0 +1,95 @@
+import unittest
+
+from mock import MagicMock, patch
+from cloudwatch.modules.awscredentials import AWSCredentials
+from cloudwatch.modules.client.stsclient import STSClient, AssumedRoleCredentials
+from cloudwatch.modules.client.transport import HTTPStatusException, Response
+
+ASSUME_ROLE_RESPONSE = b"""<AssumeRoleResponse xmlns="https://sts.amazonaws.com/doc/2011-06-15/">
+  <AssumeRoleResult>
+    <Credentials>
+      <AccessKeyId>ROLE_ACCESS_KEY</AccessKeyId>
+      <SecretAccessKey>ROLE_SECRET_KEY</SecretAccessKey>
+      <SessionToken>ROLE_TOKEN</SessionToken>
+      <Expiration>2026-10-19T13:00:00Z</Expiration>
+    </Credentials>
+  </AssumeRoleResult>
+</AssumeRoleResponse>"""
+
+
+class STSClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.transport = MagicMock()
+        self.transport.get.return_value = Response(200, "OK", {}, ASSUME_ROLE_RESPONSE)
+        self.client = STSClient("us-west-2", transport=self.transport)
+        self.credentials = AWSCredentials("access", "secret")
+
+    def test_regional_endpoint(self):
+        self.assertEquals("https://sts.us-west-2.amazonaws.com/", self.client.endpoint)
+        self.assertEquals("https://sts.cn-north-1.amazonaws.com.cn/", STSClient.get_regional_endpoint("cn-north-1"))
+        self.assertEquals("sts.us-west-2.amazonaws.com", self.client.request_builder._get_host())
+
+    def test_assume_role_request_is_signed_with_source_credentials(self):
+        self.client.assume_role(self.credentials, "arn:aws:iam::123456789012:role/collectd", "session", "external")
+        url = self.transport.get.call_args[0][0]
+        self.assertTrue(url.startswith("https://sts.us-west-2.amazonaws.com/?Action=AssumeRole&ExternalId=external&RoleArn=arn%3Aaws%3Aiam"))
+        self.assertTrue("RoleSessionName=session" in url)
+        self.assertTrue("X-Amz-Credential=access%2F" in url)
+        self.assertTrue("X-Amz-Signature=" in url)
+
+    def test_temporary_credentials_and_expiration_are_parsed(self):
+        credentials, expiration = self.client.assume_role(self.credentials, "arn:aws:iam::123456789012:role/collectd", "session")
+        self.assertEquals(("ROLE_ACCESS_KEY", "ROLE_SECRET_KEY", "ROLE_TOKEN"), (credentials.access_key, credentials.secret_key, credentials.token))
+        self.assertEquals(1792414800, expiration)
+        self.assertFalse("ExternalId" in self.transport.get.call_args[0][0])
+
+    def test_failed_request_raises_exception(self):
+        self.transport.get.return_value = Response(403, "Forbidden", {}, b"<Error><Code>AccessDenied</Code></Error>")
+        with self.assertRaises(HTTPStatusException):
+            self.client.assume_role(self.credentials, "arn:aws:iam::123456789012:role/collectd", "session")
+
+    def test_response_without_credentials_raises_exception(self):
+        self.transport.get.return_value = Response(200, "OK", {}, b"<AssumeRoleResponse xmlns=\"https://sts.amazonaws.com/doc/2011-06-15/\"/>")
+        with self.assertRaises(ValueError):
+            self.client.assume_role(self.credentials, "arn:aws:iam::123456789012:role/collectd", "session")
+
+
+class AssumedRoleCredentialsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.monotonic_time = 1000.0
+        self.wall_time = 1792411200.0
+        patch("cloudwatch.modules.client.stsclient.clock.monotonic", side_effect=lambda: self.monotonic_time).start()
+        patch("cloudwatch.modules.client.stsclient.time.time", side_effect=lambda: self.wall_time).start()
+        self.sts_client = MagicMock()
+        self.first_credentials = AWSCredentials("first", "secret", "token")
+        self.second_credentials = AWSCredentials("second", "secret", "token")
+        self.sts_client.assume_role.side_effect = [(self.first_credentials, self.wall_time + 3600), (self.second_credentials, self.wall_time + 7200)]
+        self.source_credentials = AWSCredentials("access", "secret")
+        self.credentials = AssumedRoleCredentials(self.sts_client, "arn:aws:iam::123456789012:role/collectd")
+        self.credentials._LOGGER = MagicMock()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def test_credentials_are_refreshed_before_expiration(self):
+        self.assertTrue(self.credentials.get_credentials(self.source_credentials) is self.first_credentials)
+        self.monotonic_time += 3299
+        self.assertTrue(self.credentials.get_credentials(self.source_credentials) is self.first_credentials)
+        self.monotonic_time += 1
+        self.assertTrue(self.credentials.get_credentials(self.source_credentials) is self.second_credentials)
+        self.assertEquals(2, self.sts_client.assume_role.call_count)
+        self.sts_client.assume_role.assert_called_with(self.source_credentials, "arn:aws:iam::123456789012:role/collectd", AssumedRoleCredentials.SESSION_NAME, None)
+
+    def test_previous_credentials_are_used_until_role_can_be_assumed_again(self):
+        self.sts_client.assume_role.side_effect = [(self.first_credentials, self.wall_time + 3600), Exception("AccessDenied"),
+                                                   (self.second_credentials, self.wall_time + 7200)]
+        self.credentials.get_credentials(self.source_credentials)
+        self.monotonic_time += 3300
+        self.assertTrue(self.credentials.get_credentials(self.source_credentials) is self.first_credentials)
+        self.assertTrue(self.credentials._LOGGER.warning.called)
+        self.monotonic_time += 59
+        self.assertTrue(self.credentials.get_credentials(self.source_credentials) is self.first_credentials)
+        self.monotonic_time += 1
+        self.assertTrue(self.credentials.get_credentials(self.source_credentials) is self.second_credentials)
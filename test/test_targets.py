@@ -0,0 +1,81 @@
+import unittest
+
+from mock import Mock, MagicMock, patch
+
+from cloudwatch.modules.awscredentials import AWSCredentials
+from cloudwatch.modules.configuration.targets import TargetConfigReader, PublishTarget
+from cloudwatch.modules.configuration.credentialsreader import CredentialsReader
+
+
+class TargetConfigReaderTest(unittest.TestCase):
+    CONFIG_DIR = "./test/config_files/"
+    TARGETS_CONFIG = CONFIG_DIR + "targets.conf"
+    MISSING_TARGETS_CONFIG = CONFIG_DIR + "no_targets.conf"
+
+    def setUp(self):
+        self.logger = Mock()
+        TargetConfigReader._LOGGER = self.logger
+        CredentialsReader._LOGGER = Mock()
+        self.config_helper = MagicMock()
+
+    def test_valid_targets_are_read_from_file(self):
+        targets = TargetConfigReader(self.TARGETS_CONFIG, self.config_helper).get_targets()
+        self.assertEquals(["dr", "audit", "vpc", "invalid_endpoint"], [target.name for target in targets])
+        dr, audit, vpc = targets[:3]
+        self.assertEquals("us-west-2", dr.region)
+        self.assertEquals("collectd_dr", dr.namespace)
+        self.assertEquals(None, dr.endpoint)
+        self.assertTrue(dr.uses_plugin_credentials())
+        self.assertEquals(None, dr.role_arn)
+        self.assertEquals("eu-west-1", audit.region)
+        self.assertEquals(None, audit.namespace)
+        self.assertFalse(audit.uses_plugin_credentials())
+        self.assertEquals("valid_access_key", audit.static_credentials.access_key)
+        self.assertEquals("arn:aws:iam::123456789012:role/collectd", audit.role_arn)
+        self.assertEquals("secret", audit.external_id)
+        self.assertEquals("https://vpce-1234.monitoring.us-east-1.vpce.amazonaws.com/", vpc.endpoint)
+
+    def test_invalid_targets_are_logged_and_ignored(self):
+        TargetConfigReader(self.TARGETS_CONFIG, self.config_helper).get_targets()
+        self.assertEquals(9, self.logger.warning.call_count)
+        messages = [call[0][0] for call in self.logger.warning.call_args_list]
+        self.assertTrue("already used" in messages[0])
+        self.assertTrue("unknown option 'profile'" in messages[5])
+        self.assertTrue("cannot be read" in messages[6])
+        self.assertTrue("the namespace 'AWS/EC2' is invalid" in messages[7])
+        self.assertTrue("the namespace 'collectd$dr' is invalid" in messages[8])
+
+    def test_missing_file_disables_targets(self):
+        self.assertEquals([], TargetConfigReader(self.MISSING_TARGETS_CONFIG, self.config_helper).get_targets())
+        self.assertFalse(self.logger.warning.called)
+
+
+class PublishTargetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.config_helper = MagicMock()
+        self.config_helper.credentials = AWSCredentials("plugin_access", "plugin_secret")
+        self.config_helper.proxy_server_name = "proxy"
+        self.config_helper.proxy_server_port = "3128"
+        self.config_helper.enable_high_resolution_metrics = True
+
+    def test_plugin_credentials_are_used_without_static_credentials(self):
+        target = PublishTarget("dr", "us-west-2", self.config_helper)
+        self.assertTrue(target.credentials is self.config_helper.credentials)
+        self.assertTrue(target.enable_high_resolution_metrics)
+
+    def test_static_credentials_are_used(self):
+        credentials = AWSCredentials("access", "secret")
+        target = PublishTarget("dr", "us-west-2", self.config_helper, credentials=credentials)
+        self.assertTrue(target.credentials is credentials)
+
+    @patch("cloudwatch.modules.configuration.targets.STSClient")
+    def test_role_is_assumed_with_source_credentials(self, sts_client_class):
+        role_credentials = AWSCredentials("role_access", "role_secret", "token")
+        sts_client_class.return_value.assume_role.return_value = (role_credentials, 4102444800)
+        target = PublishTarget("dr", "us-west-2", self.config_helper, role_arn="arn:aws:iam::123456789012:role/collectd", external_id="id")
+        self.assertTrue(target.credentials is role_credentials)
+        self.assertTrue(target.credentials is role_credentials)
+        sts_client_class.assert_called_once_with("us-west-2", proxy_server="proxy:3128")
+        sts_client_class.return_value.assume_role.assert_called_once_with(self.config_helper.credentials, "arn:aws:iam::123456789012:role/collectd",
+                                                                          "AmazonCloudWatchCollectdPlugin", "id")
@@ -6,6 +6,7 @@ from mock import mock_open, patch, Mock, call
 
 from cloudwatch.modules.configuration.confighelper import ConfigHelper
 from cloudwatch.modules.configuration.whitelist import Whitelist, WhitelistConfigReader, BlockedMetricLogger
+from cloudwatch.modules.memorygovernor import MemoryGovernor
 
 
 class WhitelistTest(unittest.TestCase):
@@ -16,6 +17,7 @@ class WhitelistTest(unittest.TestCase):
     TEST_REGEX_WHITELIST_FILE = CONFIG_DIR + "regex_whitelist.conf"
     INVALID_REGEX_WHITELIST_FILE = CONFIG_DIR + "invalid_regex_whitelist.conf"
     PASS_THROUGH_WHITELIST_FILE = CONFIG_DIR + "pass_through_whitelist.conf"
+    RULE_OPTIONS_WHITELIST_FILE = CONFIG_DIR + "rule_options_whitelist.conf"
     WHITELISTED_METRICS_IN_LITERAL_WHITELIST_FILE = ["df-root-percent_bytes-free", "df-root-percent_bytes-used",
                                                      "memory--memory-used", "memory--memory-free", "swap--swap-used",
                                                      "swap--swap-free"]
@@ -33,6 +35,26 @@ class WhitelistTest(unittest.TestCase):
         BlockedMetricLogger(self.BLOCKED_METRIC_PATH)
         self.assertTrue(os.path.exists(self.BLOCKED_METRIC_PATH))
 
+    def test_evicted_whitelist_decisions_are_tested_again(self):
+        whitelist = Whitelist(["^cpu-.*$"], self.BLOCKED_METRIC_PATH)
+        governor = MemoryGovernor(budget_in_bytes=1)
+        whitelist.register_caches(governor)
+        self.assertTrue(whitelist.is_whitelisted("cpu-0-cpu-user"))
+        self.assertEquals({}, whitelist.get_metric_options("cpu-0-cpu-user"))
+        self.assertEquals(["whitelist", "whitelist_options"], sorted(governor.get_usage().keys()))
+        governor.enforce()
+        self.assertEquals(2, governor.evicted_entry_count)
+        self.assertTrue(whitelist.is_whitelisted("cpu-0-cpu-user"))
+        self.assertFalse(whitelist.is_whitelisted("memory--memory-free"))
+
+    def test_decision_evicted_while_it_is_made_is_returned(self):
+        whitelist = Whitelist(["^cpu-.*$"], self.BLOCKED_METRIC_PATH)
+        cache = whitelist._allowed_metrics
+        whitelist.blocked_metric_log = Mock()
+        whitelist.blocked_metric_log.log_metric.side_effect = lambda metric_key: (cache.rotate(), cache.rotate())
+        self.assertFalse(whitelist.is_whitelisted("memory--memory-free"))
+        self.assertEquals(0, cache.get_entry_count())
+
     def test_whitelist_file_is_created(self):
         temp_whitelist_file = gettempdir() + "/whitelist.conf"
         logger_mock = Mock()
@@ -108,10 +130,12 @@ class WhitelistTest(unittest.TestCase):
         logger_mock = Mock()
         WhitelistConfigReader._LOGGER = logger_mock
         whitelist = Whitelist(WhitelistConfigReader(self.INVALID_REGEX_WHITELIST_FILE, pass_through_allowed=False).get_regex_list(), self.BLOCKED_METRIC_PATH)
-        expected_logger_calls = [call("The whitelist rule: 'df-.**-percent_bytes-used' is invalid, reason: multiple repeat"),
-                                 call("The whitelist rule: 'swap-*+' is invalid, reason: multiple repeat")]
-        logger_mock.warning.assert_has_calls(expected_logger_calls)
-        self.assertEqual(2, logger_mock.warning.call_count)
+        expected_messages = ["The whitelist rule: 'df-.**-percent_bytes-used' is invalid, reason: multiple repeat",
+                             "The whitelist rule: 'swap-**' is invalid, reason: multiple repeat"]
+        messages = [warning_call[0][0] for warning_call in logger_mock.warning.call_args_list]
+        self.assertEqual(2, len(messages))
+        for expected_message, message in zip(expected_messages, messages):
+            self.assertTrue(message.startswith(expected_message))  # Python 3 appends the position of the error
         self.assertFalse(whitelist.is_whitelisted("swap-swap-free"))
         self.assertFalse(whitelist.is_whitelisted("df-test-percent_bytes-used"))
         self.assertTrue(whitelist.is_whitelisted("memory--memory-free"))
@@ -137,6 +161,44 @@ class WhitelistTest(unittest.TestCase):
         logger_mock.warning.assert_called_with("The unsafe whitelist rule: 'invalid- .+ -invalid' was disabled. Revisit the rule "
                                                "or change whitelist_pass_through option in the plugin configuration.")
 
+    def test_rule_options_are_stripped_from_regexes(self):
+        reader = WhitelistConfigReader(self.RULE_OPTIONS_WHITELIST_FILE, pass_through_allowed=False)
+        whitelist_regexes = reader.get_regex_list()
+        self.assertEquals(["^cpu-.*-cpu-user$", "^disk-.*-disk_octets-.*$", "^load--load-.*$", "^memory--memory-.*$", "^df-.*-percent_bytes-used$",
+                           "^swap--swap-free$"], whitelist_regexes)
+        self.assertEquals({"^cpu-.*-cpu-user$": {"storage_resolution": 1, "flush_interval_in_seconds": 10},
+                           "^disk-.*-disk_octets-.*$": {"namespace": "collectd/disk", "flush_interval_in_seconds": 30},
+                           "^memory--memory-.*$": {"flush_interval_in_seconds": 30}}, reader.get_rule_options())
+
+    def test_invalid_rule_options_are_ignored_and_logged(self):
+        logger_mock = Mock()
+        WhitelistConfigReader._LOGGER = logger_mock
+        reader = WhitelistConfigReader(self.RULE_OPTIONS_WHITELIST_FILE, pass_through_allowed=False)
+        reader.get_regex_list()
+        logger_mock.warning.assert_called_with("The option 'storage_resolution=5' of whitelist rule: 'df-.*-percent_bytes-used' is invalid and will be ignored.")
+        self.assertFalse("^df-.*-percent_bytes-used$" in reader.get_rule_options())
+
+    def test_reserved_or_invalid_namespaces_are_ignored_and_logged(self):
+        logger_mock = Mock()
+        WhitelistConfigReader._LOGGER = logger_mock
+        reader = WhitelistConfigReader(self.RULE_OPTIONS_WHITELIST_FILE, pass_through_allowed=False)
+        reader.get_regex_list()
+        logger_mock.warning.assert_any_call("The option 'namespace=AWS/EC2' of whitelist rule: 'load--load-.*' is invalid and will be ignored.")
+        self.assertFalse("^load--load-.*$" in reader.get_rule_options())
+        self.assertFalse(reader.namespace_regex.match(":collectd"))
+        self.assertFalse(reader.namespace_regex.match("collectd$"))
+        self.assertFalse(reader.namespace_regex.match("x" * 256))
+        self.assertTrue(reader.namespace_regex.match("Team/collectd:prod#1"))
+
+    def test_whitelist_returns_options_of_first_matching_rule(self):
+        reader = WhitelistConfigReader(self.RULE_OPTIONS_WHITELIST_FILE, pass_through_allowed=False)
+        whitelist = Whitelist(reader.get_regex_list(), self.BLOCKED_METRIC_PATH, reader.get_rule_options())
+        self.assertTrue(whitelist.is_whitelisted("cpu-0-cpu-user"))
+        self.assertEquals({"storage_resolution": 1, "flush_interval_in_seconds": 10}, whitelist.get_metric_options("cpu-0-cpu-user"))
+        self.assertEquals({"flush_interval_in_seconds": 30}, whitelist.get_metric_options("memory--memory-used"))
+        self.assertEquals({"namespace": "collectd/disk", "flush_interval_in_seconds": 30}, whitelist.get_metric_options("disk-sda-disk_octets-read"))
+        self.assertEquals({}, whitelist.get_metric_options("swap--swap-free"))
+
     def _get_data_from_blocked_list(self):
         with open(self.BLOCKED_METRIC_PATH) as fd:
             return fd.read()